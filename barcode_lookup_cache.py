@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Persistent cache for Open Food Facts barcode lookups.
+FreeMetadataSystem._free_barcode_lookup reads through this instead of calling
+world.openfoodfacts.org for every extraction. Hits and misses are stored in
+barcode_lookup_cache (schema bootstrap v13) with a TTL, a small in-memory LRU
+sits in front of the table, and a failed request trips a short offline backoff
+so a dead network doesn't cost the full timeout per item.
+
+prefetch() resolves a whole shipment's barcodes up front with bounded
+concurrency. import_off_dump() loads an Open Food Facts export (JSONL or CSV,
+optionally gzipped) so lookups can be served fully offline.
+
+Usage:
+    python barcode_lookup_cache.py import openfoodfacts-products.jsonl.gz
+    python barcode_lookup_cache.py prefetch 012345678905 4006381333931 ...
+"""
+
+import csv
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OFF_BASE_URL = os.getenv('OPENFOODFACTS_BASE_URL', 'https://world.openfoodfacts.org').rstrip('/')
+OFF_TIMEOUT_SECONDS = float(os.getenv('OPENFOODFACTS_TIMEOUT_SECONDS', '3') or 3)
+# BARCODE_LOOKUP_OFFLINE=1 serves only what's cached/imported and never calls the API
+OFFLINE_ONLY = os.getenv('BARCODE_LOOKUP_OFFLINE', '').lower() in ('1', 'true', 'yes')
+FOUND_TTL_DAYS = int(os.getenv('BARCODE_CACHE_FOUND_TTL_DAYS', '30') or 30)
+MISSING_TTL_DAYS = int(os.getenv('BARCODE_CACHE_MISSING_TTL_DAYS', '7') or 7)
+OFFLINE_BACKOFF_SECONDS = 60
+MEMORY_ENTRIES = 5000
+PREFETCH_WORKERS = 4
+USER_AGENT = 'POS-Metadata/1.0 (barcode lookup cache)'
+
+# Only the fields metadata extraction uses are kept
+PRODUCT_FIELDS = ('product_name', 'brands', 'categories_tags', 'quantity', 'packaging')
+
+_MISSING = object()
+
+
+def is_lookup_barcode(barcode: Optional[str]) -> bool:
+    """UPC-A / EAN-13 lengths, the only ones sent to Open Food Facts."""
+    return bool(barcode) and len(barcode) in (12, 13)
+
+
+def _slim_product(product: Dict[str, Any]) -> Dict[str, Any]:
+    slim = {k: product.get(k) for k in PRODUCT_FIELDS if product.get(k) not in (None, '', [])}
+    tags = slim.get('categories_tags')
+    if isinstance(tags, str):
+        slim['categories_tags'] = [t.strip() for t in tags.split(',') if t.strip()]
+    return slim
+
+
+class BarcodeLookupCache:
+    """Read-through cache: memory LRU -> barcode_lookup_cache table -> Open Food Facts API."""
+
+    def __init__(self, base_url: str = OFF_BASE_URL, timeout: float = OFF_TIMEOUT_SECONDS,
+                 offline_only: bool = OFFLINE_ONLY):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.offline_only = offline_only
+        # barcode -> (product or None, monotonic expiry)
+        self._memory: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._session = None
+        self._offline_until = 0.0
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'api_calls': 0, 'api_errors': 0}
+
+    # -- memory layer ------------------------------------------------------
+
+    def _remember(self, barcode: str, product: Optional[Dict[str, Any]]) -> None:
+        # Same TTLs as the table, so a long-lived worker re-checks misses too
+        ttl_days = FOUND_TTL_DAYS if product is not None else MISSING_TTL_DAYS
+        expires_at = time.monotonic() + ttl_days * 86400
+        with self._lock:
+            self._memory[barcode] = (product, expires_at)
+            self._memory.move_to_end(barcode)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def _recall(self, barcode: str):
+        with self._lock:
+            entry = self._memory.get(barcode)
+            if entry is None:
+                return _MISSING
+            product, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._memory[barcode]
+                return _MISSING
+            self._memory.move_to_end(barcode)
+            return product
+
+    # -- table layer -------------------------------------------------------
+
+    def _load_many(self, barcodes: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        from database import get_connection
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT barcode, found, data FROM barcode_lookup_cache
+                WHERE barcode = ANY(%s) AND (expires_at IS NULL OR expires_at > NOW())
+            """, (barcodes,))
+            rows = cursor.fetchall()
+            conn.rollback()
+        finally:
+            conn.close()
+        out = {}
+        for row in rows:
+            barcode, found, data = (row['barcode'], row['found'], row['data']) if isinstance(row, dict) else row
+            if isinstance(data, str):
+                data = json.loads(data)
+            out[barcode] = data if found else None
+        return out
+
+    def _store_many(self, entries: Dict[str, Optional[Dict[str, Any]]], source: str = 'api') -> None:
+        if not entries:
+            return
+        rows = []
+        for barcode, product in entries.items():
+            found = product is not None
+            ttl_days = FOUND_TTL_DAYS if found else MISSING_TTL_DAYS
+            rows.append((barcode, found, json.dumps(product) if found else None, source, ttl_days))
+        try:
+            from database import get_connection
+            from psycopg2.extras import execute_values
+            conn = get_connection()
+        except Exception as e:
+            logger.warning("Could not store barcode lookups: %s", e)
+            return
+        try:
+            cursor = conn.cursor()
+            execute_values(cursor, """
+                INSERT INTO barcode_lookup_cache (barcode, found, data, source, fetched_at, expires_at)
+                VALUES %s
+                ON CONFLICT (barcode) DO UPDATE SET
+                    found = EXCLUDED.found, data = EXCLUDED.data, source = EXCLUDED.source,
+                    fetched_at = EXCLUDED.fetched_at, expires_at = EXCLUDED.expires_at
+            """, rows, template="(%s, %s, %s::jsonb, %s, NOW(), NOW() + %s * INTERVAL '1 day')",
+                page_size=len(rows))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.warning("Could not store barcode lookups: %s", e)
+        finally:
+            conn.close()
+
+    # -- network layer -----------------------------------------------------
+
+    def _get_session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            session.headers['User-Agent'] = USER_AGENT
+            session.mount('http://', HTTPAdapter(pool_maxsize=PREFETCH_WORKERS))
+            session.mount('https://', HTTPAdapter(pool_maxsize=PREFETCH_WORKERS))
+            self._session = session
+        return self._session
+
+    def _network_available(self) -> bool:
+        return not self.offline_only and time.monotonic() >= self._offline_until
+
+    def _fetch(self, barcode: str):
+        """Product dict, None if Open Food Facts doesn't know it, or _MISSING on a network error."""
+        if not self._network_available():
+            return _MISSING
+        self.stats['api_calls'] += 1
+        try:
+            response = self._get_session().get(
+                f"{self.base_url}/api/v0/product/{barcode}.json", timeout=self.timeout
+            )
+            if response.status_code == 404:
+                return None
+            if response.status_code != 200:
+                self.stats['api_errors'] += 1
+                return _MISSING
+            data = response.json()
+            if data.get('status') != 1:
+                return None
+            return _slim_product(data.get('product') or {})
+        except Exception as e:
+            # Treat as transient: don't cache, and stop trying for a while
+            self.stats['api_errors'] += 1
+            self._offline_until = time.monotonic() + OFFLINE_BACKOFF_SECONDS
+            logger.debug("Barcode lookup failed for %s: %s", barcode, e)
+            return _MISSING
+
+    # -- public API --------------------------------------------------------
+
+    def lookup(self, barcode: str) -> Optional[Dict[str, Any]]:
+        """Open Food Facts product fields for a barcode, or None (unknown or unreachable)."""
+        if not is_lookup_barcode(barcode):
+            return None
+        product = self._recall(barcode)
+        if product is not _MISSING:
+            self.stats['memory_hits'] += 1
+            return product
+        try:
+            stored = self._load_many([barcode])
+        except Exception as e:
+            logger.debug("Barcode cache read failed: %s", e)
+            stored = {}
+        if barcode in stored:
+            self.stats['db_hits'] += 1
+            self._remember(barcode, stored[barcode])
+            return stored[barcode]
+        product = self._fetch(barcode)
+        if product is _MISSING:
+            return None
+        self._remember(barcode, product)
+        self._store_many({barcode: product})
+        return product
+
+    def prefetch(self, barcodes: Iterable[str], max_workers: int = PREFETCH_WORKERS) -> Dict[str, int]:
+        """
+        Resolve many barcodes at once: one table read for all, then concurrent API
+        calls (at most max_workers in flight) for the rest, stored in one upsert.
+        Later lookup() calls for these barcodes are memory hits.
+        """
+        wanted = sorted({b for b in barcodes if is_lookup_barcode(b) and self._recall(b) is _MISSING})
+        summary = {'requested': len(wanted), 'cached': 0, 'fetched': 0, 'unresolved': 0}
+        if not wanted:
+            return summary
+        try:
+            stored = self._load_many(wanted)
+        except Exception as e:
+            logger.debug("Barcode cache read failed: %s", e)
+            stored = {}
+        for barcode, product in stored.items():
+            self._remember(barcode, product)
+        summary['cached'] = len(stored)
+        remaining = [b for b in wanted if b not in stored]
+        if not remaining or not self._network_available():
+            summary['unresolved'] = len(remaining)
+            return summary
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            fetched = list(pool.map(self._fetch, remaining))
+        resolved = {}
+        for barcode, product in zip(remaining, fetched):
+            if product is _MISSING:
+                summary['unresolved'] += 1
+                continue
+            resolved[barcode] = product
+            self._remember(barcode, product)
+        self._store_many(resolved)
+        summary['fetched'] = len(resolved)
+        return summary
+
+    def import_off_dump(self, path: str, batch_size: int = 5000) -> int:
+        """
+        Load an Open Food Facts export into the cache (no expiry, source 'off_dump').
+        Accepts the JSONL dump or the tab-separated CSV export, plain or .gz.
+        Returns the number of products imported.
+        """
+        from database import get_connection
+        from psycopg2.extras import execute_values
+        opener = gzip.open if path.endswith('.gz') else open
+        base = path[:-3] if path.endswith('.gz') else path
+        is_csv = base.endswith('.csv') or base.endswith('.tsv')
+        imported = 0
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        def flush(rows):
+            execute_values(cursor, """
+                INSERT INTO barcode_lookup_cache (barcode, found, data, source, fetched_at, expires_at)
+                VALUES %s
+                ON CONFLICT (barcode) DO UPDATE SET
+                    found = TRUE, data = EXCLUDED.data, source = EXCLUDED.source,
+                    fetched_at = EXCLUDED.fetched_at, expires_at = NULL
+            """, rows, template="(%s, TRUE, %s::jsonb, 'off_dump', NOW(), NULL)", page_size=len(rows))
+            conn.commit()
+
+        try:
+            with opener(path, 'rt', encoding='utf-8', errors='replace') as fh:
+                if is_csv:
+                    csv.field_size_limit(sys.maxsize)
+                    records = csv.DictReader(fh, delimiter='\t')
+                else:
+                    records = (json.loads(line) for line in fh if line.strip())
+                batch = {}
+                for record in records:
+                    barcode = str(record.get('code') or '').strip()
+                    if not is_lookup_barcode(barcode):
+                        continue
+                    batch[barcode] = json.dumps(_slim_product(record))
+                    if len(batch) >= batch_size:
+                        flush(list(batch.items()))
+                        imported += len(batch)
+                        batch = {}
+                if batch:
+                    flush(list(batch.items()))
+                    imported += len(batch)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return imported
+
+
+# Global cache instance
+_barcode_lookup_cache: Optional[BarcodeLookupCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_barcode_lookup_cache() -> BarcodeLookupCache:
+    """Get or create the barcode lookup cache singleton"""
+    global _barcode_lookup_cache
+    if _barcode_lookup_cache is None:
+        with _cache_lock:
+            if _barcode_lookup_cache is None:
+                _barcode_lookup_cache = BarcodeLookupCache()
+    return _barcode_lookup_cache
+
+
+def prefetch_barcodes(barcodes: Iterable[str]) -> Dict[str, int]:
+    """Warm the cache for a batch of barcodes (e.g. a whole shipment)."""
+    return get_barcode_lookup_cache().prefetch(barcodes)
+
+
+def main() -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description='Open Food Facts barcode cache')
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help='Import an Open Food Facts dump (JSONL or CSV, optionally .gz)')
+    imp.add_argument('path')
+    imp.add_argument('--batch-size', type=int, default=5000)
+    pre = sub.add_parser('prefetch', help='Resolve and cache barcodes')
+    pre.add_argument('barcodes', nargs='+')
+    args = parser.parse_args()
+    cache = get_barcode_lookup_cache()
+    if args.command == 'import':
+        started = time.perf_counter()
+        count = cache.import_off_dump(args.path, batch_size=args.batch_size)
+        print(f"Imported {count} products in {time.perf_counter() - started:.1f}s")
+    else:
+        print(cache.prefetch(args.barcodes))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
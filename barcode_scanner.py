@@ -2,12 +2,24 @@
 """
 Barcode Scanner Module
 Supports multiple barcode formats (EAN, UPC, Code128, QR codes, etc.)
+
+Images are decoded from memory (cv2.imdecode straight to grayscale, no temp
+files) and scanned with an adaptive ladder: a downscaled copy first, then
+full-resolution crops of barcode-like regions found in that copy, and only on
+a miss the whole full-resolution frame. Multi-image requests are spread over a
+shared, bounded thread pool (OpenCV and zbar release the GIL), and every code
+found is looked up in one query.
 """
 
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 from PIL import Image
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Union, BinaryIO
+from psycopg2.extras import RealDictCursor
 from database import get_connection
 
 try:
@@ -17,6 +29,55 @@ except ImportError:
     PYZBAR_AVAILABLE = False
     print("Warning: pyzbar not installed. Install with: pip install pyzbar")
 
+# Longest side of the first-pass copy; phone photos are 3000-4000px
+BARCODE_SCAN_MAX_SIDE = int(os.getenv('BARCODE_SCAN_MAX_SIDE', '1280') or 1280)
+# Threads shared by all multi-image scans in this process
+BARCODE_SCAN_WORKERS = int(os.getenv('BARCODE_SCAN_WORKERS', '0') or 0) or min(4, os.cpu_count() or 1)
+# Candidate regions tried at full resolution before falling back to the whole frame
+BARCODE_ROI_CANDIDATES = 3
+
+ImageSource = Union[bytes, bytearray, memoryview, BinaryIO]
+
+_scan_pool: Optional[ThreadPoolExecutor] = None
+_scan_pool_lock = threading.Lock()
+
+
+def get_scan_pool() -> ThreadPoolExecutor:
+    """Get or create the shared barcode decode pool"""
+    global _scan_pool
+    if _scan_pool is None:
+        with _scan_pool_lock:
+            if _scan_pool is None:
+                _scan_pool = ThreadPoolExecutor(max_workers=BARCODE_SCAN_WORKERS, thread_name_prefix='barcode-scan')
+    return _scan_pool
+
+
+def decode_image_bytes(source: ImageSource) -> np.ndarray:
+    """Grayscale image from encoded bytes or a readable stream (e.g. an upload)"""
+    data = source if isinstance(source, (bytes, bytearray, memoryview)) else source.read()
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+
+def _barcode_regions(gray: np.ndarray, limit: int = BARCODE_ROI_CANDIDATES) -> List[Tuple[int, int, int, int]]:
+    """
+    (x, y, w, h) boxes of the largest high-gradient, bar-like areas, biggest first.
+    Bars show strong gradient in one direction and little in the other.
+    """
+    grad_x = cv2.convertScaleAbs(cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=-1))
+    grad_y = cv2.convertScaleAbs(cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=-1))
+    gradient = cv2.blur(cv2.absdiff(grad_x, grad_y), (9, 9))
+    _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 21)))
+    mask = cv2.dilate(cv2.erode(mask, None, iterations=4), None, iterations=4)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = gray.shape[0] * gray.shape[1] * 0.002
+    boxes = [cv2.boundingRect(c) for c in sorted(contours, key=cv2.contourArea, reverse=True)[:limit]
+             if cv2.contourArea(c) >= min_area]
+    return boxes
+
 
 class BarcodeScanner:
     """Barcode and QR code scanner using pyzbar"""
@@ -28,6 +89,68 @@ class BarcodeScanner:
                 "Install with: pip install pyzbar"
             )
     
+    def _decode(self, gray: np.ndarray, scale: float = 1.0, offset: Tuple[int, int] = (0, 0)) -> List[Dict[str, Any]]:
+        """pyzbar on one grayscale frame; rects mapped back to full-resolution coordinates"""
+        results = []
+        for barcode in pyzbar.decode(gray):
+            rect = barcode.rect
+            results.append({
+                'data': barcode.data.decode('utf-8'),
+                'type': barcode.type,
+                'rect': {
+                    'left': int(rect.left / scale) + offset[0],
+                    'top': int(rect.top / scale) + offset[1],
+                    'width': int(rect.width / scale),
+                    'height': int(rect.height / scale)
+                },
+                'quality': getattr(barcode, 'quality', None)
+            })
+        return results
+    
+    def scan_array(self, image: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        Scan barcode(s) from a decoded image (grayscale or BGR), cheapest pass first
+        
+        Returns:
+            List of detected barcodes with type and data (duplicates removed)
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        height, width = gray.shape[:2]
+        scale = min(1.0, BARCODE_SCAN_MAX_SIDE / float(max(height, width)))
+        
+        if scale < 1.0:
+            small = cv2.resize(gray, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+            results = self._decode(small, scale=scale)
+            if not results:
+                # Full-resolution crops of likely barcode areas (small codes lose bars when downscaled)
+                for x, y, w, h in _barcode_regions(small):
+                    pad_x, pad_y = int(w * 0.15) + 8, int(h * 0.15) + 8
+                    left = max(0, int((x - pad_x) / scale))
+                    top = max(0, int((y - pad_y) / scale))
+                    right = min(width, int((x + w + pad_x) / scale))
+                    bottom = min(height, int((y + h + pad_y) / scale))
+                    results.extend(self._decode(gray[top:bottom, left:right], offset=(left, top)))
+                    if results:
+                        break
+        else:
+            results = []
+        
+        if not results:
+            results = self._decode(gray)
+        
+        unique = {}
+        for barcode in results:
+            unique.setdefault((barcode['type'], barcode['data']), barcode)
+        return list(unique.values())
+    
+    def scan_bytes(self, source: ImageSource) -> List[Dict[str, Any]]:
+        """Scan barcode(s) from encoded image bytes or an upload stream, without a temp file"""
+        try:
+            return self.scan_array(decode_image_bytes(source))
+        except Exception as e:
+            raise ValueError(f"Error scanning barcode: {str(e)}")
+    
     def scan_image(self, image_path: str) -> List[Dict[str, Any]]:
         """
         Scan barcode(s) from an image file
@@ -40,41 +163,11 @@ class BarcodeScanner:
         """
         try:
             # Read image
-            image = cv2.imread(image_path)
+            image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
             if image is None:
                 raise ValueError(f"Could not read image: {image_path}")
             
-            # Convert to grayscale if needed
-            if len(image.shape) == 3:
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            else:
-                gray = image
-            
-            # Decode barcodes
-            barcodes = pyzbar.decode(gray)
-            
-            results = []
-            for barcode in barcodes:
-                # Extract barcode data
-                barcode_data = barcode.data.decode('utf-8')
-                barcode_type = barcode.type
-                
-                # Get bounding box
-                rect = barcode.rect
-                
-                results.append({
-                    'data': barcode_data,
-                    'type': barcode_type,
-                    'rect': {
-                        'left': rect.left,
-                        'top': rect.top,
-                        'width': rect.width,
-                        'height': rect.height
-                    },
-                    'quality': getattr(barcode, 'quality', None)
-                })
-            
-            return results
+            return self.scan_array(image)
             
         except Exception as e:
             raise ValueError(f"Error scanning barcode: {str(e)}")
@@ -90,37 +183,7 @@ class BarcodeScanner:
             List of detected barcodes
         """
         try:
-            # Convert PIL to numpy array
-            if pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
-            
-            image_array = np.array(pil_image)
-            
-            # Convert RGB to BGR for OpenCV
-            image_bgr = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
-            gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
-            
-            # Decode barcodes
-            barcodes = pyzbar.decode(gray)
-            
-            results = []
-            for barcode in barcodes:
-                barcode_data = barcode.data.decode('utf-8')
-                barcode_type = barcode.type
-                rect = barcode.rect
-                
-                results.append({
-                    'data': barcode_data,
-                    'type': barcode_type,
-                    'rect': {
-                        'left': rect.left,
-                        'top': rect.top,
-                        'width': rect.width,
-                        'height': rect.height
-                    }
-                })
-            
-            return results
+            return self.scan_array(np.array(pil_image.convert('L')))
             
         except Exception as e:
             raise ValueError(f"Error scanning barcode from PIL image: {str(e)}")
@@ -136,7 +199,7 @@ class BarcodeScanner:
             Product dictionary or None if not found
         """
         conn = get_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         # Search by barcode field
         cursor.execute("""
@@ -163,7 +226,7 @@ class BarcodeScanner:
             Product dictionary or None if not found
         """
         conn = get_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         cursor.execute("""
             SELECT * FROM inventory
@@ -178,32 +241,54 @@ class BarcodeScanner:
             return dict(row)
         return None
     
-    def identify_product(self, image_path: str) -> Optional[Dict[str, Any]]:
+    def lookup_products(self, codes: List[str]) -> Dict[str, Dict[str, Any]]:
         """
-        Scan barcode and return product information
+        Look up many scanned codes in one query (barcode match, SKU fallback)
         
         Args:
-            image_path: Path to image containing barcode
+            codes: Barcode values to search for
             
         Returns:
-            Dictionary with product info and barcode details, or None
+            Dictionary of code -> product row for the codes that matched
         """
-        # Scan for barcodes
-        barcodes = self.scan_image(image_path)
+        codes = list(dict.fromkeys(code for code in codes if code))
+        if not codes:
+            return {}
+        
+        conn = get_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT * FROM inventory
+                WHERE barcode = ANY(%s) OR sku = ANY(%s)
+            """, (codes, codes))
+            rows = [dict(row) for row in cursor.fetchall()]
+            cursor.close()
+        finally:
+            conn.close()
+        
+        by_barcode, by_sku = {}, {}
+        for row in rows:
+            by_barcode.setdefault(row.get('barcode'), row)
+            by_sku.setdefault(row.get('sku'), row)
         
+        products = {}
+        for code in codes:
+            product = by_barcode.get(code) or by_sku.get(code)
+            if product:
+                products[code] = product
+        return products
+    
+    def _identification(self, barcodes: List[Dict[str, Any]],
+                        products: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """identify_product result for scanned barcodes, given lookup_products output"""
         if not barcodes:
             return None
         
         # Use first barcode found
         barcode_info = barcodes[0]
         barcode_data = barcode_info['data']
-        
-        # Try to find product by barcode
-        product = self.lookup_product_by_barcode(barcode_data)
-        
-        # Fallback to SKU lookup if barcode not found
-        if not product:
-            product = self.lookup_product_by_sku(barcode_data)
+        product = products.get(barcode_data)
         
         if product:
             return {
@@ -222,6 +307,65 @@ class BarcodeScanner:
             'message': f'Barcode {barcode_data} found but product not in database'
         }
     
+    def identify_product(self, image_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Scan barcode and return product information
+        
+        Args:
+            image_path: Path to image containing barcode
+            
+        Returns:
+            Dictionary with product info and barcode details, or None
+        """
+        barcodes = self.scan_image(image_path)
+        if not barcodes:
+            return None
+        return self._identification(barcodes, self.lookup_products([barcodes[0]['data']]))
+    
+    def identify_bytes(self, source: ImageSource) -> Optional[Dict[str, Any]]:
+        """identify_product for encoded image bytes or an upload stream"""
+        barcodes = self.scan_bytes(source)
+        if not barcodes:
+            return None
+        return self._identification(barcodes, self.lookup_products([barcodes[0]['data']]))
+    
+    def _batch_identify(self, labels: List[str], sources: List[Any], scan) -> List[Dict[str, Any]]:
+        """Scan sources on the shared pool, then resolve every first barcode in one lookup"""
+        def safe_scan(source):
+            try:
+                return scan(source), None
+            except Exception as e:
+                return None, str(e)
+        
+        if len(sources) > 1:
+            scanned = list(get_scan_pool().map(safe_scan, sources))
+        else:
+            scanned = [safe_scan(source) for source in sources]
+        
+        products = {}
+        codes = [barcodes[0]['data'] for barcodes, _ in scanned if barcodes]
+        if codes:
+            products = self.lookup_products(codes)
+        
+        results = []
+        for label, (barcodes, error) in zip(labels, scanned):
+            if error is not None:
+                results.append({'image': label, 'error': error})
+                continue
+            result = self._identification(barcodes, products)
+            if result:
+                result['image'] = label
+            else:
+                result = {
+                    'image': label,
+                    'method': 'barcode',
+                    'barcode': None,
+                    'product': None,
+                    'message': 'No barcode found in image'
+                }
+            results.append(result)
+        return results
+    
     def batch_scan(self, image_paths: List[str]) -> List[Dict[str, Any]]:
         """
         Scan multiple images for barcodes
@@ -232,29 +376,23 @@ class BarcodeScanner:
         Returns:
             List of identification results
         """
-        results = []
-        
-        for image_path in image_paths:
-            try:
-                result = self.identify_product(image_path)
-                if result:
-                    result['image'] = image_path
-                else:
-                    result = {
-                        'image': image_path,
-                        'method': 'barcode',
-                        'barcode': None,
-                        'product': None,
-                        'message': 'No barcode found in image'
-                    }
-                results.append(result)
-            except Exception as e:
-                results.append({
-                    'image': image_path,
-                    'error': str(e)
-                })
+        return self._batch_identify(list(image_paths), list(image_paths), self.scan_image)
+    
+    def batch_scan_bytes(self, sources: List[ImageSource],
+                         labels: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Scan multiple in-memory images for barcodes
         
-        return results
+        Args:
+            sources: Encoded image bytes or readable streams (e.g. uploads)
+            labels: Value reported as 'image' for each source (defaults to its index)
+            
+        Returns:
+            List of identification results, in input order
+        """
+        if labels is None:
+            labels = [str(i) for i in range(len(sources))]
+        return self._batch_identify(list(labels), list(sources), self.scan_bytes)
 
 
 def smart_product_identification(
@@ -341,3 +479,78 @@ def smart_product_identification(
 
 
 
+
+
+def smart_identify_batch(
+    image_paths: List[str],
+    barcode_scanner: Optional[BarcodeScanner] = None,
+    image_matcher=None,
+    prefer_barcode: bool = True,
+    threshold: float = 0.7
+) -> List[Dict[str, Any]]:
+    """
+    smart_product_identification for many photos: barcodes are scanned per
+    image, then every photo without a barcode match is embedded and matched in
+    one batched pass instead of one model call per image.
+    
+    Returns:
+        One result per path, in input order, shaped like smart_product_identification
+    """
+    results = [{
+        'image': image_path,
+        'method': None,
+        'confidence': 0.0,
+        'product': None
+    } for image_path in image_paths]
+    
+    if prefer_barcode:
+        try:
+            if barcode_scanner is None:
+                barcode_scanner = BarcodeScanner()
+            
+            for result, barcode_result in zip(results, barcode_scanner.batch_scan(image_paths)):
+                if barcode_result.get('error'):
+                    result['barcode_error'] = barcode_result['error']
+                elif barcode_result.get('product'):
+                    result.update({
+                        'method': 'barcode',
+                        'confidence': 1.0,
+                        'product': barcode_result['product'],
+                        'barcode': barcode_result.get('barcode')
+                    })
+        except Exception as e:
+            for result in results:
+                result['barcode_error'] = str(e)
+    
+    unresolved = [result for result in results if result['product'] is None]
+    if image_matcher is not None and unresolved:
+        try:
+            matched = image_matcher.identify_products(
+                [result['image'] for result in unresolved],
+                top_k=1,
+                threshold=threshold
+            )
+            for result, match in zip(unresolved, matched):
+                if match['matches']:
+                    best = match['matches'][0]
+                    result.update({
+                        'method': 'image_matching',
+                        'confidence': best['confidence'],
+                        'product': {
+                            'product_id': best['product_id'],
+                            'sku': best['sku'],
+                            'product_name': best['name'],
+                            'category': best['category']
+                        },
+                        'match_details': best
+                    })
+                elif match['error']:
+                    result['image_matching_error'] = match['error']
+        except Exception as e:
+            for result in unresolved:
+                result['image_matching_error'] = str(e)
+    
+    for result in results:
+        if result['product'] is None:
+            result['message'] = 'No product identified'
+    return results
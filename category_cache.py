@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+In-process cache of the category tree.
+Holds every categories row by id, the precomputed "A > B > C" path of each
+category, a (parent_id, name) -> id child index for resolving paths without a
+query per segment, and a bounded LRU of resolved path -> id lookups.
+
+Writes made by this process call invalidate(ids) after commit; only those rows
+are re-read and paths are recomputed in memory. Writes from other processes
+show up as a new inventory_catalog_version.reset_version (the categories
+statement trigger bumps it), checked at most every CATEGORY_CACHE_CHECK_SECONDS,
+and trigger a full reload. A partial reload adopts the current reset_version,
+so a remote write committed at the same moment could be missed; the tree is
+therefore fully reloaded at least every MAX_AGE_SECONDS.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_CACHE_CHECK_SECONDS = float(os.getenv('CATEGORY_CACHE_CHECK_SECONDS', '2') or 0)
+CATEGORY_PATH_CACHE_SIZE = int(os.getenv('CATEGORY_PATH_CACHE_SIZE', '1000') or 0)
+# Without the version table there is nothing to compare; reload on this interval
+UNVERSIONED_RELOAD_SECONDS = 30
+MAX_AGE_SECONDS = 300
+
+
+def _name(row: Dict[str, Any]) -> str:
+    name = row.get('category_name')
+    if isinstance(name, bytes):
+        name = name.decode('utf-8', errors='replace')
+    return str(name)
+
+
+class CategoryTreeCache:
+    """Category rows, paths and path lookups for one process."""
+
+    def __init__(self, check_seconds: float = CATEGORY_CACHE_CHECK_SECONDS,
+                 max_paths: int = CATEGORY_PATH_CACHE_SIZE):
+        self.check_seconds = check_seconds
+        self.max_paths = max_paths
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._paths: Dict[int, str] = {}
+        self._children: Dict[Tuple[Optional[int], str], int] = {}
+        self._sorted_ids: List[int] = []
+        self._active_paths: Dict[int, str] = {}
+        self._path_ids: 'OrderedDict[str, int]' = OrderedDict()
+        self._dirty: set = set()
+        self._reset_version: Optional[int] = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._hits = 0
+        self._misses = 0
+        self._full_loads = 0
+        self._partial_loads = 0
+
+    # -- loading -----------------------------------------------------------
+
+    def _read_reset_version(self, cursor) -> Optional[int]:
+        from schema_registry import has_table
+        if not has_table('inventory_catalog_version'):
+            return None
+        cursor.execute("SELECT reset_version FROM inventory_catalog_version WHERE id = 1")
+        row = cursor.fetchone()
+        return int(row['reset_version']) if row else None
+
+    def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self._loaded and not self._dirty and now - self._checked_at < self.check_seconds:
+            return
+        from psycopg2.extras import RealDictCursor
+        from database_postgres import get_connection
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded and not self._dirty and now - self._checked_at < self.check_seconds:
+                return
+            conn = get_connection()
+            try:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                version = self._read_reset_version(cursor)
+                age = now - self._loaded_at
+                if (not self._loaded or age > MAX_AGE_SECONDS
+                        or (version is None and age > UNVERSIONED_RELOAD_SECONDS)):
+                    self._load_all(cursor)
+                elif self._dirty:
+                    # Our own write moved reset_version; re-read just the rows we touched
+                    self._load_dirty(cursor)
+                elif version != self._reset_version:
+                    self._load_all(cursor)
+                self._reset_version = version
+                self._checked_at = time.monotonic()
+                conn.rollback()
+            finally:
+                conn.close()
+
+    def _load_all(self, cursor) -> None:
+        try:
+            cursor.execute("SELECT * FROM categories")
+            rows = cursor.fetchall()
+        except Exception as e:
+            if 'does not exist' not in str(e).lower():
+                raise
+            cursor.connection.rollback()
+            rows = []
+        self._by_id = {row['category_id']: dict(row) for row in rows}
+        self._dirty.clear()
+        self._loaded = True
+        self._loaded_at = time.monotonic()
+        self._full_loads += 1
+        self._rebuild_derived()
+
+    def _load_dirty(self, cursor) -> None:
+        ids = list(self._dirty)
+        self._dirty.clear()
+        cursor.execute("SELECT * FROM categories WHERE category_id = ANY(%s)", (ids,))
+        for row in cursor.fetchall():
+            self._by_id[row['category_id']] = dict(row)
+            ids.remove(row['category_id'])
+        for category_id in ids:
+            self._by_id.pop(category_id, None)
+        self._partial_loads += 1
+        self._rebuild_derived()
+
+    def _rebuild_derived(self) -> None:
+        """Recompute paths, child index and name order from _by_id (in memory only)."""
+        by_id = self._by_id
+        paths: Dict[int, str] = {}
+
+        def path_of(category_id: int) -> str:
+            if category_id in paths:
+                return paths[category_id]
+            parts, seen, cid = [], set(), category_id
+            while cid and cid in by_id and cid not in seen:
+                seen.add(cid)
+                if cid in paths:
+                    parts.append(paths[cid])
+                    break
+                parts.append(_name(by_id[cid]))
+                cid = by_id[cid].get('parent_category_id')
+            paths[category_id] = ' > '.join(reversed(parts))
+            return paths[category_id]
+
+        children: Dict[Tuple[Optional[int], str], int] = {}
+        for category_id in sorted(by_id):
+            path_of(category_id)
+            row = by_id[category_id]
+            children.setdefault((row.get('parent_category_id'), _name(row)), category_id)
+        self._paths = paths
+        self._children = children
+        self._sorted_ids = sorted(by_id, key=lambda cid: (_name(by_id[cid]), cid))
+        self._active_paths = {cid: paths[cid] for cid in self._sorted_ids if not by_id[cid].get('archived')}
+        # Drop remembered lookups whose category moved, was renamed or deleted
+        for key, category_id in list(self._path_ids.items()):
+            if paths.get(category_id) != key:
+                del self._path_ids[key]
+
+    def invalidate(self, category_ids: Optional[Iterable[int]] = None) -> None:
+        """Call after committing a category write; None reloads the whole tree."""
+        with self._lock:
+            if category_ids is None:
+                self._loaded = False
+                self._path_ids.clear()
+                return
+            self._dirty.update(int(cid) for cid in category_ids if cid is not None)
+
+    # -- reads -------------------------------------------------------------
+
+    def categories(self, archived_only: bool = False, include_path: bool = True) -> List[Dict[str, Any]]:
+        """Copies of the category rows ordered by name (archived rows only, or non-archived rows)."""
+        self._ensure_fresh()
+        with self._lock:
+            out = []
+            for category_id in self._sorted_ids:
+                row = self._by_id[category_id]
+                if bool(row.get('archived')) != archived_only:
+                    continue
+                row = dict(row)
+                if include_path:
+                    row['category_path'] = self._paths.get(category_id, '')
+                out.append(row)
+            return out
+
+    def id_to_path(self) -> Dict[int, str]:
+        """category_id -> full path for non-archived categories. Shared; don't mutate."""
+        self._ensure_fresh()
+        return self._active_paths
+
+    def path_for(self, category_id: int) -> Optional[str]:
+        self._ensure_fresh()
+        return self._paths.get(category_id)
+
+    def resolve_path(self, path_key: str) -> Optional[int]:
+        """category_id for a normalized "A > B" path, or None if a segment doesn't exist."""
+        self._ensure_fresh()
+        with self._lock:
+            category_id = self._path_ids.get(path_key)
+            if category_id is not None:
+                self._path_ids.move_to_end(path_key)
+                self._hits += 1
+                return category_id
+            self._misses += 1
+            parent_id = None
+            for part in path_key.split(' > '):
+                parent_id = self._children.get((parent_id, part))
+                if parent_id is None:
+                    return None
+            if self.max_paths > 0:
+                self._path_ids[path_key] = parent_id
+                while len(self._path_ids) > self.max_paths:
+                    self._path_ids.popitem(last=False)
+            return parent_id
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'categories': len(self._by_id),
+            'reset_version': self._reset_version,
+            'path_lookups_cached': len(self._path_ids),
+            'max_paths': self.max_paths,
+            'hits': self._hits,
+            'misses': self._misses,
+            'full_loads': self._full_loads,
+            'partial_loads': self._partial_loads,
+        }
+
+
+# Global cache instance
+_category_cache: Optional[CategoryTreeCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_category_cache() -> CategoryTreeCache:
+    """Get or create the category tree cache singleton"""
+    global _category_cache
+    if _category_cache is None:
+        with _cache_lock:
+            if _category_cache is None:
+                _category_cache = CategoryTreeCache()
+    return _category_cache
+
+
+def invalidate_categories(category_ids: Optional[Iterable[int]] = None) -> None:
+    """Drop changed categories (all when None) from this process's tree cache."""
+    get_category_cache().invalidate(category_ids)
@@ -7,6 +7,8 @@ import json
 from datetime import datetime
 from decimal import Decimal
 
+from schema_registry import has_table, table_columns, invalidate_schema_registry
+
 class CustomerDisplaySystem:
     
     def __init__(self, _db_path=None):
@@ -65,14 +67,13 @@ class CustomerDisplaySystem:
             # Clamp for DB CHECK (total >= 0); use single var so every INSERT gets same value
             order_total = max(0.0, float(order_total))
             
-            # Generate order number (format: ORD-YYYYMMDD-HHMMSS)
-            order_number = f"ORD-{datetime.now().strftime('%Y%m%d')}-{datetime.now().strftime('%H%M%S')}"
+            # Generate order number from the shared per-day counter (format: ORD-YYYYMMDD-NNNN)
+            from database import generate_order_number
+            order_number = generate_order_number('ORD')
             
             # Create order first to get order_id and order_number
             # Check if tip, order_type, discount, discount_type columns exist
-            cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'orders' AND table_schema = 'public'")
-            columns_result = cursor.fetchall()
-            order_columns = [col['column_name'] if isinstance(col, dict) else col[0] for col in columns_result]
+            order_columns = table_columns('orders')
             has_tip = 'tip' in order_columns
             has_order_type = 'order_type' in order_columns
             has_tax_rate = 'tax_rate' in order_columns
@@ -119,11 +120,7 @@ class CustomerDisplaySystem:
                 order_number = order_result[1] if len(order_result) > 1 else order_number
             
             # Ensure transactions table exists and has establishment_id (migrate if missing)
-            cursor.execute("""
-                SELECT 1 FROM information_schema.tables
-                WHERE table_schema = 'public' AND table_name = 'transactions'
-            """)
-            if cursor.fetchone() is None:
+            if not has_table('transactions'):
                 cursor.execute("""
                     CREATE TABLE public.transactions (
                         transaction_id SERIAL PRIMARY KEY,
@@ -147,6 +144,7 @@ class CustomerDisplaySystem:
                 """)
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_establishment ON public.transactions(establishment_id)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_order_id ON public.transactions(order_id)")
+                invalidate_schema_registry()
             else:
                 # Ensure all columns required for INSERT exist (add any missing)
                 required_columns = [
@@ -159,11 +157,9 @@ class CustomerDisplaySystem:
                     ('total', 'NUMERIC(10,2) DEFAULT 0'),
                     ('status', 'TEXT DEFAULT \'pending\''),
                 ]
-                cursor.execute("""
-                    SELECT column_name FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'transactions'
-                """)
-                existing = {row['column_name'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()}
+                existing = table_columns('transactions')
+                if any(col_name not in existing for col_name, _ in required_columns):
+                    invalidate_schema_registry()
                 for col_name, col_type in required_columns:
                     if col_name not in existing:
                         cursor.execute(
@@ -223,8 +219,7 @@ class CustomerDisplaySystem:
                 if available < total_qty:
                     raise Exception(f'Insufficient inventory for product_id {product_id}. Available: {available}, Requested: {total_qty}')
             # Create order_items for the order (required for returns and order history)
-            cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'order_items'")
-            oi_cols = [row['column_name'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+            oi_cols = table_columns('order_items')
             has_oi_variant = 'variant_id' in oi_cols
             has_oi_notes = 'notes' in oi_cols
             print(f"Creating order_items for order_id {order_id}, {len(items)} items")
@@ -530,9 +525,7 @@ class CustomerDisplaySystem:
                         pass
                 
                 # Check if order has tip column
-                cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'orders' AND table_schema = 'public'")
-                columns_result = cursor.fetchall()
-                order_columns = [col['column_name'] if isinstance(col, dict) else col[0] for col in columns_result]
+                order_columns = table_columns('orders')
                 has_tip = 'tip' in order_columns
                 
                 # Use order_payment_status for orders table (allowed: pending, completed, refunded, partially_refunded)
@@ -759,11 +752,7 @@ class CustomerDisplaySystem:
                 raise ValueError('No establishment found')
             
             # Only update columns that exist in the table (schema may vary)
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = 'customer_display_settings'
-            """)
-            existing_columns = {r['column_name'] if isinstance(r, dict) else r[0] for r in cursor.fetchall()}
+            existing_columns = table_columns('customer_display_settings')
             
             allowed_fields = [
                 'store_location', 'show_promotions', 'show_survey_prompt',
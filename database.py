@@ -4,21 +4,18 @@ Database utility functions for inventory management
 PostgreSQL ONLY - All SQLite code has been removed
 """
 
+import base64
 import hashlib
 import logging
 import secrets
 import json
 import re
 import os
-import threading
+import time
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 
 logger = logging.getLogger(__name__)
-_ensure_metadata_lock = threading.Lock()
-_category_path_cache: Dict[str, int] = {}
-_category_cache_max_size = 1000
-_ensure_shipment_lock = threading.Lock()
 
 # Import local PostgreSQL connection - this is the ONLY database backend
 try:
@@ -33,6 +30,11 @@ except ImportError:
         "This system requires PostgreSQL. Install: pip3 install psycopg2-binary python-dotenv"
     )
 
+from schema_registry import has_table, has_column, table_columns
+from schema_bootstrap import ensure_schema_bootstrapped, INVENTORY_SEARCH_TSV, METADATA_SEARCH_TSV
+from session_cache import get_session_cache, invalidate_session_token, invalidate_employee_sessions
+from category_cache import get_category_cache, invalidate_categories
+
 def generate_unique_barcode(pending_shipment_id: int, line_number: int, product_sku: str = '') -> str:
     """
     Generate a unique 12-digit barcode for a shipment item
@@ -104,233 +106,18 @@ def set_connection_override(connection_func):
     pass
 
 def ensure_metadata_tables(conn=None):
-    """Ensure metadata extraction tables exist in PostgreSQL."""
-    with _ensure_metadata_lock:
-        should_close = False
-        if conn is None:
-            conn = get_connection()
-            should_close = True
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = 'product_metadata'")
-            if cursor.fetchone():
-                if should_close:
-                    try:
-                        conn.close()
-                    except Exception:
-                        pass
-                return
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS categories (
-                    category_id SERIAL PRIMARY KEY,
-                    establishment_id INTEGER NOT NULL DEFAULT 1 REFERENCES establishments(establishment_id) ON DELETE CASCADE,
-                    category_name TEXT NOT NULL,
-                    description TEXT,
-                    parent_category_id INTEGER REFERENCES categories(category_id),
-                    is_auto_generated INTEGER DEFAULT 0 CHECK(is_auto_generated IN (0, 1)),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("""
-                CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_root_name
-                ON categories (establishment_id, category_name) WHERE parent_category_id IS NULL
-            """)
-            cursor.execute("""
-                CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_name_parent
-                ON categories (establishment_id, category_name, parent_category_id) WHERE parent_category_id IS NOT NULL
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_categories_establishment ON categories(establishment_id)")
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS product_metadata (
-                    metadata_id SERIAL PRIMARY KEY,
-                    product_id INTEGER NOT NULL UNIQUE REFERENCES inventory(product_id) ON DELETE CASCADE,
-                    brand TEXT,
-                    color TEXT,
-                    size TEXT,
-                    tags TEXT,
-                    keywords TEXT,
-                    attributes TEXT,
-                    search_vector TEXT,
-                    category_id INTEGER REFERENCES categories(category_id),
-                    category_confidence REAL DEFAULT 0 CHECK(category_confidence >= 0 AND category_confidence <= 1),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS metadata_extraction_log (
-                    log_id SERIAL PRIMARY KEY,
-                    product_id INTEGER NOT NULL REFERENCES inventory(product_id) ON DELETE CASCADE,
-                    extraction_method TEXT NOT NULL,
-                    data_extracted TEXT,
-                    execution_time_ms INTEGER,
-                    success INTEGER DEFAULT 1 CHECK(success IN (0, 1)),
-                    error_message TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS search_history (
-                    search_id SERIAL PRIMARY KEY,
-                    search_query TEXT NOT NULL,
-                    results_count INTEGER DEFAULT 0,
-                    filters TEXT,
-                    user_id INTEGER REFERENCES employees(employee_id),
-                    search_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_metadata_product ON product_metadata(product_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_metadata_category ON product_metadata(category_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_metadata_brand ON product_metadata(brand)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_metadata_log_product ON metadata_extraction_log(product_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_history_timestamp ON search_history(search_timestamp)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_categories_name ON categories(category_name)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_categories_parent ON categories(parent_category_id)")
-            conn.commit()
-        except Exception:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-            raise
-        finally:
-            if should_close:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
+    """
+    Metadata tables are created by the schema bootstrap (schema_bootstrap.py) at
+    startup. Kept for scripts that import this module without running the app;
+    only falls back to the bootstrap when the tables are missing.
+    """
+    if not has_table('product_metadata'):
+        ensure_schema_bootstrapped()
 
 def ensure_shipment_verification_tables(conn=None):
-    """Ensure shipment verification tables and columns exist."""
-    with _ensure_shipment_lock:
-        should_close = False
-        if conn is None:
-            conn = get_connection()
-            should_close = True
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = 'shipment_verification_settings'")
-            if cursor.fetchone():
-                if should_close:
-                    try:
-                        conn.close()
-                    except Exception:
-                        pass
-                return
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS shipment_verification_settings (
-                    setting_key TEXT PRIMARY KEY,
-                    setting_value TEXT NOT NULL,
-                    description TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("""
-                INSERT INTO shipment_verification_settings (setting_key, setting_value, description)
-                VALUES
-                    ('workflow_mode', 'simple', 'Verification workflow mode: simple or three_step'),
-                    ('auto_add_to_inventory', 'true', 'Automatically add verified items to inventory')
-                ON CONFLICT (setting_key) DO NOTHING
-            """)
-            cursor.execute("ALTER TABLE pending_shipments ADD COLUMN IF NOT EXISTS workflow_step TEXT")
-            cursor.execute("ALTER TABLE pending_shipments ADD COLUMN IF NOT EXISTS added_to_inventory INTEGER DEFAULT 0 CHECK(added_to_inventory IN (0, 1))")
-            cursor.execute("ALTER TABLE pending_shipment_items ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'pending'")
-            cursor.execute("ALTER TABLE pending_shipment_items ADD COLUMN IF NOT EXISTS verified_by INTEGER")
-            cursor.execute("ALTER TABLE pending_shipment_items ADD COLUMN IF NOT EXISTS verified_at TIMESTAMP")
-            cursor.execute("ALTER TABLE pending_shipment_items ADD COLUMN IF NOT EXISTS barcode TEXT")
-            cursor.execute("ALTER TABLE pending_shipment_items ADD COLUMN IF NOT EXISTS line_number INTEGER")
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS shipment_issues (
-                    issue_id SERIAL PRIMARY KEY,
-                    pending_shipment_id INTEGER NOT NULL REFERENCES pending_shipments(pending_shipment_id),
-                    pending_item_id INTEGER REFERENCES pending_shipment_items(pending_item_id),
-                    issue_type TEXT NOT NULL CHECK(issue_type IN ('missing', 'damaged', 'wrong_item', 'quantity_mismatch', 'expired', 'quality', 'other')),
-                    severity TEXT DEFAULT 'minor' CHECK(severity IN ('minor', 'major', 'critical')),
-                    quantity_affected INTEGER DEFAULT 1,
-                    reported_by INTEGER NOT NULL REFERENCES employees(employee_id),
-                    reported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    description TEXT,
-                    photo_path TEXT,
-                    resolution_status TEXT DEFAULT 'open' CHECK(resolution_status IN ('open', 'resolved', 'vendor_contacted', 'credit_issued')),
-                    resolved_by INTEGER REFERENCES employees(employee_id),
-                    resolved_at TIMESTAMP,
-                    resolution_notes TEXT
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS shipment_scan_log (
-                    scan_id SERIAL PRIMARY KEY,
-                    pending_shipment_id INTEGER NOT NULL REFERENCES pending_shipments(pending_shipment_id),
-                    pending_item_id INTEGER REFERENCES pending_shipment_items(pending_item_id),
-                    scanned_barcode TEXT NOT NULL,
-                    scanned_by INTEGER NOT NULL REFERENCES employees(employee_id),
-                    scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    scan_result TEXT DEFAULT 'match' CHECK(scan_result IN ('match', 'mismatch', 'unknown', 'duplicate')),
-                    device_id TEXT,
-                    location TEXT
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS verification_sessions (
-                    session_id SERIAL PRIMARY KEY,
-                    pending_shipment_id INTEGER NOT NULL REFERENCES pending_shipments(pending_shipment_id),
-                    employee_id INTEGER NOT NULL REFERENCES employees(employee_id),
-                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    ended_at TIMESTAMP,
-                    total_scans INTEGER DEFAULT 0,
-                    items_verified INTEGER DEFAULT 0,
-                    issues_reported INTEGER DEFAULT 0,
-                    device_id TEXT
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS approved_shipments (
-                    shipment_id SERIAL PRIMARY KEY,
-                    pending_shipment_id INTEGER REFERENCES pending_shipments(pending_shipment_id),
-                    vendor_id INTEGER NOT NULL REFERENCES vendors(vendor_id),
-                    purchase_order_number TEXT,
-                    received_date DATE,
-                    approved_by INTEGER NOT NULL REFERENCES employees(employee_id),
-                    approved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    total_items_received INTEGER DEFAULT 0,
-                    total_cost NUMERIC DEFAULT 0,
-                    has_issues INTEGER DEFAULT 0 CHECK(has_issues IN (0, 1)),
-                    issue_count INTEGER DEFAULT 0
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS approved_shipment_items (
-                    approved_item_id SERIAL PRIMARY KEY,
-                    shipment_id INTEGER NOT NULL REFERENCES approved_shipments(shipment_id),
-                    product_id INTEGER NOT NULL REFERENCES inventory(product_id),
-                    quantity_received INTEGER NOT NULL CHECK(quantity_received > 0),
-                    unit_cost NUMERIC NOT NULL CHECK(unit_cost >= 0),
-                    lot_number TEXT,
-                    expiration_date DATE,
-                    received_by INTEGER NOT NULL REFERENCES employees(employee_id),
-                    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_shipment_issues_shipment ON shipment_issues(pending_shipment_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_shipment_issues_item ON shipment_issues(pending_item_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_shipment_scan_log_shipment ON shipment_scan_log(pending_shipment_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_shipment_scan_log_item ON shipment_scan_log(pending_item_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_verification_sessions_shipment ON verification_sessions(pending_shipment_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_approved_shipments_pending ON approved_shipments(pending_shipment_id)")
-            conn.commit()
-        except Exception:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-            raise
-        finally:
-            if should_close:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
+    """Shipment verification tables come from the schema bootstrap; fallback for scripts."""
+    if not has_table('shipment_verification_settings'):
+        ensure_schema_bootstrapped()
 
 def _normalize_category_path(category_path: str) -> List[str]:
     """Normalize and split category path. Returns list of segments, or empty if invalid."""
@@ -342,6 +129,15 @@ def _normalize_category_path(category_path: str) -> List[str]:
     return parts
 
 
+def _cached_category_id(path_key: str) -> Optional[int]:
+    """Resolve a normalized path from the category tree cache (None on miss or cache error)."""
+    try:
+        return get_category_cache().resolve_path(path_key)
+    except Exception as e:
+        logger.debug("Category cache lookup failed for %r: %s", path_key, e)
+        return None
+
+
 def get_category_by_path(category_path: str, conn=None) -> Optional[int]:
     """
     Look up category_id by path (read-only). Does not create.
@@ -351,8 +147,10 @@ def get_category_by_path(category_path: str, conn=None) -> Optional[int]:
     if not parts:
         return None
     path_key = " > ".join(parts)
-    if path_key in _category_path_cache:
-        return _category_path_cache[path_key]
+    cached_id = _cached_category_id(path_key)
+    if cached_id is not None:
+        return cached_id
+    # Not in the committed tree; the caller's transaction may still see it
     if conn is None:
         conn = get_connection()
         should_close = True
@@ -376,8 +174,6 @@ def get_category_by_path(category_path: str, conn=None) -> Optional[int]:
             if not row:
                 return None
             parent_id = row[0]
-        if len(_category_path_cache) < _category_cache_max_size:
-            _category_path_cache[path_key] = parent_id
         return parent_id
     except Exception as e:
         logger.warning("get_category_by_path failed: %s", e)
@@ -405,13 +201,15 @@ def create_or_get_category_with_hierarchy(category_path: str, conn=None) -> Opti
         logger.debug("create_or_get_category: empty or invalid path %r", category_path)
         return None
     path_key = " > ".join(parts)
-    if path_key in _category_path_cache:
-        return _category_path_cache[path_key]
+    cached_id = _cached_category_id(path_key)
+    if cached_id is not None:
+        return cached_id
     if conn is None:
         conn = get_connection()
         should_close = True
     else:
         should_close = False
+    created_ids = []
     try:
         cursor = conn.cursor()
         parent_id = None
@@ -438,6 +236,7 @@ def create_or_get_category_with_hierarchy(category_path: str, conn=None) -> Opti
                     """, (category_name, parent_id))
                     r = cursor.fetchone()
                     category_id = r[0] if r else None
+                    created_ids.append(category_id)
                 except psycopg2.IntegrityError:
                     conn.rollback()
                     if parent_id is not None:
@@ -457,8 +256,8 @@ def create_or_get_category_with_hierarchy(category_path: str, conn=None) -> Opti
                     return None
             parent_id = category_id
         conn.commit()
-        if len(_category_path_cache) < _category_cache_max_size:
-            _category_path_cache[path_key] = parent_id
+        if created_ids:
+            invalidate_categories(created_ids)
         return parent_id
     except Exception as e:
         logger.warning("create_or_get_category_with_hierarchy failed: %s", e)
@@ -491,8 +290,13 @@ def _build_category_path(category_id: int, by_id: Dict[int, Dict]) -> str:
 
 
 def list_categories(include_path: bool = True, archived_only: bool = False) -> List[Dict[str, Any]]:
-    """List categories. Optionally include category_path. Set archived_only=True to list only archived."""
+    """List categories. Optionally include category_path. Set archived_only=True to list only archived.
+    Served from the category tree cache; reads the table directly if the cache can't load."""
     from psycopg2.extras import RealDictCursor
+    try:
+        return get_category_cache().categories(archived_only=archived_only, include_path=include_path)
+    except Exception as e:
+        logger.warning("Category cache unavailable, reading categories directly: %s", e)
     conn = None
     try:
         conn = get_connection()
@@ -558,8 +362,10 @@ def delete_category(category_id: int) -> bool:
             raise ValueError("Cannot delete category that has subcategories")
         cursor.execute("UPDATE product_metadata SET category_id = NULL WHERE category_id = %s", (category_id,))
         cursor.execute("DELETE FROM categories WHERE category_id = %s", (category_id,))
+        deleted = cursor.rowcount > 0
         conn.commit()
-        return cursor.rowcount > 0
+        invalidate_categories([category_id])
+        return deleted
     finally:
         conn.close()
 
@@ -567,8 +373,8 @@ def delete_category(category_id: int) -> bool:
 def suggest_categories_for_product(product_name: str, barcode: Optional[str] = None) -> List[Dict[str, Any]]:
     """Return category suggestions for a product (no DB write)."""
     try:
-        from metadata_extraction import FreeMetadataSystem
-        system = FreeMetadataSystem()
+        from metadata_extraction import get_metadata_system
+        system = get_metadata_system()
         metadata = system.extract_metadata_from_product(
             product_name=product_name,
             barcode=barcode,
@@ -630,20 +436,21 @@ def assign_category_to_product(
         conn.close()
 
 
-def extract_metadata_for_product(product_id: int, auto_sync_category: bool = True):
+def extract_metadata_for_product(product_id: int, auto_sync_category: bool = True, metadata_system=None):
     """
-    Automatically extract metadata for a product
-    Called automatically when products are created or updated
+    Extract and save metadata for a product (runs synchronously).
+    Product writes call enqueue_metadata_extraction instead; metadata_worker runs this.
     
     Args:
         product_id: ID of the product to extract metadata for
         auto_sync_category: If True, sync category to inventory.category field
+        metadata_system: FreeMetadataSystem to use (defaults to the shared instance)
     """
     print(f"  [extract_metadata_for_product] Starting for product_id={product_id}, auto_sync_category={auto_sync_category}")
     try:
-        print(f"  [extract_metadata_for_product] Importing FreeMetadataSystem...")
-        from metadata_extraction import FreeMetadataSystem
-        print(f"  [extract_metadata_for_product] Import successful")
+        if metadata_system is None:
+            from metadata_extraction import get_metadata_system
+            metadata_system = get_metadata_system()
         
         # Get product
         print(f"  [extract_metadata_for_product] Getting product {product_id}...")
@@ -656,7 +463,6 @@ def extract_metadata_for_product(product_id: int, auto_sync_category: bool = Tru
         
         # Extract metadata
         print(f"  Extracting metadata for: {product.get('product_name')} (SKU: {product.get('sku')}, Barcode: {product.get('barcode')})")
-        metadata_system = FreeMetadataSystem()
         metadata = metadata_system.extract_metadata_from_product(
             product_name=product['product_name'],
             barcode=product.get('barcode'),
@@ -762,6 +568,99 @@ def extract_metadata_for_product(product_id: int, auto_sync_category: bool = Tru
         logger.debug("Metadata extraction failed for product_id=%s: %s", product_id, e)
         return False
 
+def enqueue_metadata_extraction(product_ids, auto_sync_category: bool = True, cursor=None) -> int:
+    """
+    Queue metadata extraction for one product id or a list of them; metadata_worker
+    fills product_metadata in the background. With a cursor the jobs join the
+    caller's transaction (visible to the worker once it commits), and the caller
+    calls wake_metadata_worker() after committing. Products that already have a
+    pending job are skipped. Returns the number of jobs queued.
+    Falls back to extracting inline if the job table hasn't been bootstrapped.
+    """
+    if isinstance(product_ids, int):
+        product_ids = [product_ids]
+    product_ids = sorted({int(pid) for pid in (product_ids or []) if pid is not None})
+    if not product_ids:
+        return 0
+    if not has_table('metadata_extraction_jobs'):
+        for pid in product_ids:
+            extract_metadata_for_product(pid, auto_sync_category=auto_sync_category)
+        return len(product_ids)
+    from psycopg2.extras import execute_values
+    own_conn = None
+    if cursor is None:
+        own_conn = get_connection()
+        cursor = own_conn.cursor()
+    try:
+        execute_values(cursor, """
+            INSERT INTO metadata_extraction_jobs (product_id, auto_sync_category)
+            VALUES %s
+            ON CONFLICT (product_id) WHERE status = 'pending' DO NOTHING
+        """, [(pid, auto_sync_category) for pid in product_ids], page_size=len(product_ids))
+        queued = cursor.rowcount
+        if own_conn is not None:
+            own_conn.commit()
+    except Exception:
+        if own_conn is not None:
+            own_conn.rollback()
+        raise
+    finally:
+        if own_conn is not None:
+            own_conn.close()
+    # A caller's transaction isn't committed yet; waking now would find nothing
+    if own_conn is not None and queued:
+        wake_metadata_worker()
+    return queued
+
+
+def wake_metadata_worker() -> None:
+    """Nudge the metadata worker; call after committing jobs queued with a cursor."""
+    try:
+        from metadata_worker import wake_metadata_worker as _wake
+        _wake()
+    except Exception:
+        pass
+
+def enqueue_notification(kind: str, dedup_key: str, payload: Dict[str, Any], store_id: int = 1,
+                         cursor=None) -> Optional[bool]:
+    """
+    Queue a notification in notification_outbox for the notification_outbox
+    dispatchers. With a cursor the row joins the caller's transaction, so the
+    notification exists exactly when the order does; call
+    notification_outbox.notification_committed after committing. Returns True if
+    queued, False if dedup_key was already queued, None if the outbox table
+    hasn't been bootstrapped.
+    """
+    if not has_table('notification_outbox'):
+        return None
+    own_conn = None
+    if cursor is None:
+        own_conn = get_connection()
+        cursor = own_conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO notification_outbox (dedup_key, kind, store_id, payload)
+            VALUES (%s, %s, %s, %s::jsonb)
+            ON CONFLICT (dedup_key) DO NOTHING
+        """, (dedup_key, kind, store_id, json.dumps(payload, default=str)))
+        queued = cursor.rowcount > 0
+        if own_conn is not None:
+            own_conn.commit()
+    except Exception:
+        if own_conn is not None:
+            own_conn.rollback()
+        raise
+    finally:
+        if own_conn is not None:
+            own_conn.close()
+    if own_conn is not None and queued:
+        try:
+            from notification_outbox import wake_notification_dispatcher
+            wake_notification_dispatcher()
+        except Exception:
+            pass
+    return queued
+
 def add_product(
     product_name: str,
     sku: str,
@@ -820,9 +719,9 @@ def add_product(
             raise ValueError("Insert did not return product_id")
         if item_type == "product" and auto_extract_metadata:
             try:
-                extract_metadata_for_product(product_id, auto_sync_category=True)
-            except Exception:
-                pass
+                enqueue_metadata_extraction(product_id)
+            except Exception as e:
+                print(f"Warning: could not queue metadata extraction for product {product_id}: {e}")
         return product_id
     except Exception as e:
         import psycopg2
@@ -980,13 +879,9 @@ def get_product_variants(product_id: int) -> List[Dict[str, Any]]:
     conn = get_connection()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'product_variants'
-            AND column_name IN ('photo', 'doordash_default_quantity', 'doordash_charge_above', 'doordash_recipe_default',
-                'doordash_calorific_display_type', 'doordash_calorific_lower_range', 'doordash_calorific_higher_range', 'doordash_classification_tags')
-        """)
-        extra_cols = [r[0] for r in cursor.fetchall()]
+        extra_cols = [c for c in ('photo', 'doordash_default_quantity', 'doordash_charge_above', 'doordash_recipe_default',
+                                  'doordash_calorific_display_type', 'doordash_calorific_lower_range', 'doordash_calorific_higher_range',
+                                  'doordash_classification_tags') if has_column('product_variants', c)]
         cols = "variant_id, product_id, variant_name, price, cost, sort_order, created_at"
         if extra_cols:
             cols += ", " + ", ".join(extra_cols)
@@ -1046,11 +941,7 @@ def update_product_variant(variant_id: int, variant_name: Optional[str] = None,
         updates.append("sort_order = %s")
         values.append(sort_order)
     if photo is not None:
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'product_variants' AND column_name = 'photo'
-        """)
-        if cursor.fetchone():
+        if has_column('product_variants', 'photo'):
             updates.append("photo = %s")
             values.append(photo.strip() if isinstance(photo, str) else None)
     for col, val in (
@@ -1060,11 +951,7 @@ def update_product_variant(variant_id: int, variant_name: Optional[str] = None,
     ):
         if val is None:
             continue
-        cursor.execute("""
-            SELECT 1 FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'product_variants' AND column_name = %s
-        """, (col,))
-        if cursor.fetchone():
+        if has_column('product_variants', col):
             if col == "doordash_recipe_default":
                 updates.append(f"{col} = %s")
                 values.append(bool(val))
@@ -1081,11 +968,7 @@ def update_product_variant(variant_id: int, variant_name: Optional[str] = None,
             continue
         if col == "doordash_calorific_display_type" and val is None:
             continue
-        cursor.execute("""
-            SELECT 1 FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'product_variants' AND column_name = %s
-        """, (col,))
-        if cursor.fetchone():
+        if has_column('product_variants', col):
             if col == "doordash_classification_tags":
                 updates.append(f"{col} = %s::jsonb")
                 values.append(json.dumps(val) if val is not None and isinstance(val, list) else None)
@@ -1225,16 +1108,8 @@ def update_product(product_id: int, employee_id: Optional[int] = None, auto_extr
     values = []
     new_values = {}
     
-    cursor.execute("""
-        SELECT column_name FROM information_schema.columns
-        WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'doordash_operation_context'
-    """)
-    has_doordash_operation_context = cursor.fetchone() is not None
-    cursor.execute("""
-        SELECT column_name FROM information_schema.columns
-        WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'doordash_calorific_lower_range'
-    """)
-    has_doordash_nutrition = cursor.fetchone() is not None
+    has_doordash_operation_context = has_column('inventory', 'doordash_operation_context')
+    has_doordash_nutrition = has_column('inventory', 'doordash_calorific_lower_range')
 
     for field, value in kwargs.items():
         if field in allowed_fields:
@@ -1305,12 +1180,12 @@ def update_product(product_id: int, employee_id: Optional[int] = None, auto_extr
         
         conn.close()
         
-        # Automatically extract metadata if enabled and product name changed
+        # Re-extract metadata in the background if enabled and product name changed
         if auto_extract_metadata and 'product_name' in kwargs:
             try:
-                extract_metadata_for_product(product_id, auto_sync_category=True)
+                enqueue_metadata_extraction(product_id)
             except Exception:
-                pass  # Don't fail update if metadata extraction fails
+                pass  # Don't fail update if metadata extraction can't be queued
         
         return success
     except Exception as e:
@@ -1365,6 +1240,151 @@ def list_products(
     
     return [dict(row) for row in rows]
 
+# Each match branch of search_inventory stops after this many products, so a
+# one-letter prefix can't drag the whole catalog into ranking
+INVENTORY_SEARCH_CANDIDATES = 1000
+_pg_trgm_available: Optional[bool] = None
+
+
+def _has_pg_trgm(cursor) -> bool:
+    global _pg_trgm_available
+    if _pg_trgm_available is None:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        _pg_trgm_available = cursor.fetchone() is not None
+    return _pg_trgm_available
+
+
+def encode_inventory_search_cursor(score: Any, product_id: int) -> str:
+    """Opaque keyset cursor for the row after (score, product_id) in search_inventory."""
+    raw = json.dumps([str(score), int(product_id)]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_inventory_search_cursor(token: str) -> Tuple[str, int]:
+    """Inverse of encode_inventory_search_cursor. Raises ValueError for malformed tokens."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        score, product_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        float(score)
+        return str(score), int(product_id)
+    except Exception as e:
+        raise ValueError(f"Invalid search cursor: {e}") from e
+
+
+def search_inventory(
+    query: str,
+    limit: int = 20,
+    after_cursor: Optional[str] = None,
+    item_type: str = '',
+    sell_at_pos_only: bool = False,
+    include_archived: bool = False
+) -> Dict[str, Any]:
+    """
+    Typeahead product search. Words match as prefixes of product name, SKU, barcode,
+    brand and keywords (full-text GIN indexes); with pg_trgm, misspelled names/brands
+    and partial SKUs/barcodes match too. Ranked by ts_rank + trigram similarity, best
+    first. Returns {'data': [...], 'next_cursor': str|None}; pass next_cursor back as
+    after_cursor for the next page. Raises ValueError for a malformed cursor.
+    """
+    from psycopg2.extras import RealDictCursor
+    text = (query or '').strip()[:200]
+    terms = re.findall(r'[^\W_]+', text.lower())
+    if not terms:
+        return {'data': [], 'next_cursor': None}
+    after = decode_inventory_search_cursor(after_cursor) if after_cursor else None
+    like_prefix = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    params: Dict[str, Any] = {
+        'tsq': ' & '.join(f"{term}:*" for term in terms[:10]),
+        'q': text,
+        'prefix': like_prefix,
+        'cap': INVENTORY_SEARCH_CANDIDATES,
+        'limit': max(1, min(int(limit or 20), 100)),
+    }
+
+    conn = get_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        trgm = _has_pg_trgm(cursor)
+        branches = [
+            f"SELECT product_id FROM inventory WHERE ({INVENTORY_SEARCH_TSV}) @@ to_tsquery('simple', %(tsq)s) LIMIT %(cap)s",
+            f"SELECT product_id FROM product_metadata WHERE ({METADATA_SEARCH_TSV}) @@ to_tsquery('simple', %(tsq)s) LIMIT %(cap)s",
+        ]
+        if trgm:
+            branches += [
+                "SELECT product_id FROM inventory WHERE %(q)s <%% product_name LIMIT %(cap)s",
+                "SELECT product_id FROM inventory WHERE sku ILIKE %(prefix)s OR barcode LIKE %(prefix)s LIMIT %(cap)s",
+                "SELECT product_id FROM product_metadata WHERE %(q)s <%% brand LIMIT %(cap)s",
+            ]
+            similarity = """
+                + word_similarity(%(q)s, i.product_name)
+                + 0.5 * COALESCE(word_similarity(%(q)s, pm.brand), 0)"""
+        else:
+            branches.append(
+                "SELECT product_id FROM inventory WHERE sku ILIKE %(prefix)s OR barcode LIKE %(prefix)s LIMIT %(cap)s"
+            )
+            similarity = ""
+
+        filters = []
+        if not include_archived and has_column('inventory', 'archived'):
+            filters.append("(i.archived IS NULL OR i.archived = FALSE)")
+        if has_column('inventory', 'item_type'):
+            if item_type == 'product':
+                filters.append("(i.item_type = 'product' OR i.item_type IS NULL)")
+            elif item_type == 'ingredient':
+                filters.append("i.item_type = 'ingredient'")
+        if sell_at_pos_only and has_column('inventory', 'sell_at_pos'):
+            filters.append("i.sell_at_pos IS TRUE")
+
+        sql = f"""
+            WITH candidates AS (
+                {' UNION '.join(f'({branch})' for branch in branches)}
+            ),
+            ranked AS (
+                SELECT
+                    i.product_id,
+                    i.product_name,
+                    i.sku,
+                    i.barcode,
+                    i.product_price,
+                    i.current_quantity,
+                    pm.brand,
+                    pm.category_id,
+                    c.category_name,
+                    ROUND((
+                        ts_rank(idoc.doc || mdoc.doc, to_tsquery('simple', %(tsq)s))
+                        + CASE WHEN i.sku ILIKE %(prefix)s OR i.barcode LIKE %(prefix)s THEN 1 ELSE 0 END{similarity}
+                    )::numeric, 6) AS score
+                FROM candidates cd
+                JOIN inventory i ON i.product_id = cd.product_id
+                LEFT JOIN product_metadata pm ON pm.product_id = i.product_id
+                LEFT JOIN categories c ON c.category_id = pm.category_id
+                CROSS JOIN LATERAL (
+                    SELECT {INVENTORY_SEARCH_TSV} AS doc FROM (SELECT i.product_name, i.sku, i.barcode) s
+                ) idoc
+                CROSS JOIN LATERAL (
+                    SELECT {METADATA_SEARCH_TSV} AS doc FROM (SELECT pm.brand, pm.keywords) s
+                ) mdoc
+                {('WHERE ' + ' AND '.join(filters)) if filters else ''}
+            )
+            SELECT * FROM ranked
+        """
+        if after:
+            sql += " WHERE (score, product_id) < (%(after_score)s::numeric, %(after_id)s)"
+            params['after_score'], params['after_id'] = after
+        sql += " ORDER BY score DESC, product_id DESC LIMIT %(limit)s"
+        cursor.execute(sql, params)
+        rows = [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    next_cursor = None
+    if len(rows) == params['limit']:
+        next_cursor = encode_inventory_search_cursor(rows[-1]['score'], rows[-1]['product_id'])
+    for row in rows:
+        row['score'] = float(row['score'])
+    return {'data': rows, 'next_cursor': next_cursor}
+
+
 def update_quantity(product_id: int, quantity_change: int) -> bool:
     """Update product quantity (add or subtract)"""
     conn = get_connection()
@@ -1418,42 +1438,6 @@ def _get_or_create_default_establishment(conn=None) -> int:
         except:
             pass  # Ignore if already rolled back or no transaction
         
-        # Check if establishments table exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'establishments'
-            )
-        """)
-        table_exists_result = cursor.fetchone()
-        if isinstance(table_exists_result, dict):
-            table_exists = table_exists_result.get('exists', False)
-        else:
-            table_exists = table_exists_result[0] if table_exists_result else False
-        
-        if not table_exists:
-            # Create the establishments table if it doesn't exist
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS establishments (
-                    establishment_id SERIAL PRIMARY KEY,
-                    establishment_name TEXT NOT NULL,
-                    establishment_code TEXT UNIQUE NOT NULL,
-                    subdomain TEXT UNIQUE,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    is_active BOOLEAN DEFAULT TRUE,
-                    settings JSONB DEFAULT '{}'::jsonb
-                )
-            """)
-            # Commit table creation
-            if should_close:
-                conn.commit()
-            else:
-                # If using shared connection, commit the table creation
-                conn.commit()
-                # Then rollback to start fresh for caller
-                conn.rollback()
-        
         # Try to get the first establishment
         cursor.execute("SELECT establishment_id FROM establishments LIMIT 1")
         result = cursor.fetchone()
@@ -1900,6 +1884,7 @@ def set_archived_category(category_id: int, archived: bool = True) -> bool:
     try:
         cursor.execute("UPDATE categories SET archived = %s WHERE category_id = %s", (archived, category_id))
         conn.commit()
+        invalidate_categories([category_id])
         return cursor.rowcount > 0
     except Exception as e:
         if "archived" in str(e).lower() and "does not exist" in str(e).lower():
@@ -2397,218 +2382,6 @@ def create_pending_shipment(
         except:
             pass
         
-        # Check if vendors table exists (required for foreign key)
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'vendors'
-            )
-        """)
-        vendors_exists_result = cursor.fetchone()
-        if isinstance(vendors_exists_result, dict):
-            vendors_exists = vendors_exists_result.get('exists', False)
-        else:
-            vendors_exists = vendors_exists_result[0] if vendors_exists_result else False
-        
-        if not vendors_exists:
-            # Create vendors table if it doesn't exist
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS vendors (
-                    vendor_id SERIAL PRIMARY KEY,
-                    establishment_id INTEGER NOT NULL REFERENCES establishments(establishment_id) ON DELETE CASCADE,
-                    vendor_name TEXT NOT NULL,
-                    contact_person TEXT,
-                    email TEXT,
-                    phone TEXT,
-                    address TEXT,
-                    created_at TIMESTAMP DEFAULT NOW()
-                )
-            """)
-            conn.commit()
-            conn.rollback()
-        
-        # Check if pending_shipments table exists, create if not
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'pending_shipments'
-            )
-        """)
-        table_exists_result = cursor.fetchone()
-        if isinstance(table_exists_result, dict):
-            table_exists = table_exists_result.get('exists', False)
-        else:
-            table_exists = table_exists_result[0] if table_exists_result else False
-        
-        if not table_exists:
-            # Create pending_shipments table
-            try:
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS pending_shipments (
-                        pending_shipment_id SERIAL PRIMARY KEY,
-                        establishment_id INTEGER NOT NULL REFERENCES establishments(establishment_id) ON DELETE CASCADE,
-                        vendor_id INTEGER NOT NULL REFERENCES vendors(vendor_id),
-                        expected_date TEXT,
-                        upload_timestamp TIMESTAMP DEFAULT NOW(),
-                        file_path TEXT,
-                        purchase_order_number TEXT,
-                        tracking_number TEXT,
-                        status TEXT DEFAULT 'in_progress' CHECK(status IN ('pending_review', 'in_progress', 'approved', 'rejected', 'completed_with_issues')),
-                        uploaded_by INTEGER,
-                        approved_by INTEGER,
-                        approved_date TIMESTAMP,
-                        reviewed_by TEXT,
-                        reviewed_date TIMESTAMP,
-                        notes TEXT,
-                        started_by INTEGER,
-                        started_at TIMESTAMP,
-                        completed_by INTEGER,
-                        completed_at TIMESTAMP,
-                        verification_mode TEXT DEFAULT 'verify_whole_shipment'
-                    )
-                """)
-                conn.commit()
-                conn.rollback()
-            except Exception as create_err:
-                # If creation fails, rollback and check if table was created anyway
-                try:
-                    conn.rollback()
-                    # Check again if table exists
-                    cursor.execute("""
-                        SELECT EXISTS (
-                            SELECT FROM information_schema.tables 
-                            WHERE table_schema = 'public' 
-                            AND table_name = 'pending_shipments'
-                        )
-                    """)
-                    check_result = cursor.fetchone()
-                    if isinstance(check_result, dict):
-                        table_exists = check_result.get('exists', False)
-                    else:
-                        table_exists = check_result[0] if check_result else False
-                    if not table_exists:
-                        # Table still doesn't exist, raise the error
-                        import traceback
-                        traceback.print_exc()
-                        raise ValueError(f"Failed to create pending_shipments table: {create_err}") from create_err
-                except Exception as check_err:
-                    import traceback
-                    traceback.print_exc()
-                    raise
-        
-        # Check if pending_shipment_items table exists, create if not
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'pending_shipment_items'
-            )
-        """)
-        items_table_exists_result = cursor.fetchone()
-        if isinstance(items_table_exists_result, dict):
-            items_table_exists = items_table_exists_result.get('exists', False)
-        else:
-            items_table_exists = items_table_exists_result[0] if items_table_exists_result else False
-        
-        if not items_table_exists:
-            # Create pending_shipment_items table
-            try:
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS pending_shipment_items (
-                        pending_item_id SERIAL PRIMARY KEY,
-                        establishment_id INTEGER NOT NULL REFERENCES establishments(establishment_id) ON DELETE CASCADE,
-                        pending_shipment_id INTEGER NOT NULL REFERENCES pending_shipments(pending_shipment_id) ON DELETE CASCADE,
-                        product_sku TEXT,
-                        product_name TEXT,
-                        quantity_expected INTEGER NOT NULL CHECK(quantity_expected > 0),
-                        quantity_verified INTEGER,
-                        unit_cost NUMERIC(10,2) NOT NULL CHECK(unit_cost >= 0),
-                        lot_number TEXT,
-                        expiration_date TEXT,
-                        discrepancy_notes TEXT,
-                        product_id INTEGER REFERENCES inventory(product_id),
-                        barcode TEXT,
-                        line_number INTEGER
-                    )
-                """)
-                conn.commit()
-                conn.rollback()
-            except Exception as create_err:
-                # If creation fails, rollback and check if table was created anyway
-                try:
-                    conn.rollback()
-                    # Check again if table exists
-                    cursor.execute("""
-                        SELECT EXISTS (
-                            SELECT FROM information_schema.tables 
-                            WHERE table_schema = 'public' 
-                            AND table_name = 'pending_shipment_items'
-                        )
-                    """)
-                    check_result = cursor.fetchone()
-                    if isinstance(check_result, dict):
-                        items_table_exists = check_result.get('exists', False)
-                    else:
-                        items_table_exists = check_result[0] if check_result else False
-                    if not items_table_exists:
-                        # Table still doesn't exist, raise the error
-                        import traceback
-                        traceback.print_exc()
-                        raise ValueError(f"Failed to create pending_shipment_items table: {create_err}") from create_err
-                except Exception as check_err:
-                    import traceback
-                    traceback.print_exc()
-                    raise
-        
-        # Ensure verification tracking columns exist
-        try:
-            cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'pending_shipments' AND table_schema = 'public'")
-            columns = [col[0] for col in cursor.fetchall()]
-            if 'verification_mode' not in columns:
-                cursor.execute("""
-                    ALTER TABLE pending_shipments 
-                    ADD COLUMN verification_mode TEXT DEFAULT 'verify_whole_shipment'
-                """)
-                conn.commit()
-                conn.rollback()
-            if 'started_by' not in columns:
-                cursor.execute("""
-                    ALTER TABLE pending_shipments 
-                    ADD COLUMN started_by INTEGER
-                """)
-                conn.commit()
-                conn.rollback()
-            if 'started_at' not in columns:
-                cursor.execute("""
-                    ALTER TABLE pending_shipments 
-                    ADD COLUMN started_at TIMESTAMP
-                """)
-                conn.commit()
-                conn.rollback()
-            if 'completed_by' not in columns:
-                cursor.execute("""
-                    ALTER TABLE pending_shipments 
-                    ADD COLUMN completed_by INTEGER
-                """)
-                conn.commit()
-                conn.rollback()
-            if 'completed_at' not in columns:
-                cursor.execute("""
-                    ALTER TABLE pending_shipments 
-                    ADD COLUMN completed_at TIMESTAMP
-                """)
-                conn.commit()
-                conn.rollback()
-        except Exception as e:
-            # Rollback on error and continue
-            try:
-                conn.rollback()
-            except:
-                pass
-            # Column might already exist, continue
-        
         if expected_date is None:
             expected_date = datetime.now().date().isoformat()
         
@@ -2684,13 +2457,7 @@ def add_pending_shipment_item(
             product_id = product_row[0] if product_row else None
         
         # Check if barcode and line_number columns exist
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'pending_shipment_items' AND table_schema = 'public'")
-        column_rows = cursor.fetchall()
-        # Handle both dict (RealDictCursor) and tuple results
-        if column_rows and isinstance(column_rows[0], dict):
-            columns = [row.get('column_name') for row in column_rows]
-        else:
-            columns = [row[0] for row in column_rows]
+        columns = table_columns('pending_shipment_items')
         has_barcode = 'barcode' in columns
         has_line_number = 'line_number' in columns
         
@@ -2962,12 +2729,7 @@ def save_shipment_draft(
                 product_id = product_row[0] if product_row else None
             
             # Check if barcode and line_number columns exist
-            cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'pending_shipment_items' AND table_schema = 'public'")
-            column_rows = cursor.fetchall()
-            if column_rows and isinstance(column_rows[0], dict):
-                columns = [row.get('column_name') for row in column_rows]
-            else:
-                columns = [row[0] for row in column_rows]
+            columns = table_columns('pending_shipment_items')
             has_barcode = 'barcode' in columns
             has_line_number = 'line_number' in columns
             
@@ -3057,6 +2819,7 @@ def add_item_to_inventory_immediately(
     """
     conn = get_connection()
     cursor = conn.cursor()
+    metadata_queued = 0
 
     try:
         establishment_id = _get_or_create_default_establishment(conn)
@@ -3145,8 +2908,8 @@ def add_item_to_inventory_immediately(
                 cursor.execute("SELECT metadata_id FROM product_metadata WHERE product_id = %s", (product_id,))
                 has_metadata = cursor.fetchone()
                 if not has_metadata:
-                    # Product exists but has no metadata - extract it
-                    extract_metadata_for_product(product_id, auto_sync_category=True)
+                    # Product exists but has no metadata - queue it (commits with this transaction)
+                    metadata_queued += enqueue_metadata_extraction(product_id, cursor=cursor)
             except Exception as e:
                 print(f"Warning: Metadata check/extraction failed for existing product {product_id}: {e}")
         
@@ -3238,32 +3001,16 @@ def add_item_to_inventory_immediately(
         
         conn.commit()
         conn.close()
+        if metadata_queued:
+            wake_metadata_worker()
 
-        # Run metadata extraction + category assignment after commit so get_product sees the row.
-        # For new products always run; for existing we already ran in !has_metadata branch.
+        # Queue metadata extraction + category assignment for new products (worker runs it after commit).
+        # Existing products without metadata were queued in the !has_metadata branch.
         if created_new_product and product_id:
-            print(f"\n{'='*60}")
-            print(f"Starting metadata extraction for new product {product_id}")
-            print(f"{'='*60}")
             try:
-                result = extract_metadata_for_product(product_id, auto_sync_category=True)
-                if result:
-                    print(f"✓ Successfully extracted metadata and category for new product {product_id}")
-                else:
-                    print(f"⚠ Metadata extraction returned False for product {product_id}")
-                    # Try to get product info to debug
-                    try:
-                        product = get_product(product_id)
-                        if product:
-                            print(f"  Product exists: {product.get('product_name')} (SKU: {product.get('sku')})")
-                        else:
-                            print(f"  ⚠ Product {product_id} not found in database!")
-                    except Exception as debug_err:
-                        print(f"  ⚠ Error getting product for debug: {debug_err}")
+                enqueue_metadata_extraction(product_id)
             except Exception as e:
-                print(f"⚠ ERROR: Metadata extraction exception for product {product_id}: {e}")
-                import traceback
-                traceback.print_exc()
+                print(f"⚠ Could not queue metadata extraction for product {product_id}: {e}")
 
         return {
             'success': True,
@@ -3374,8 +3121,8 @@ def update_pending_item_verification(
                     cursor.execute("SELECT metadata_id FROM product_metadata WHERE product_id = %s", (product_id,))
                     has_metadata = cursor.fetchone()
                     if not has_metadata:
-                        # Extract metadata for newly matched product
-                        extract_metadata_for_product(product_id, auto_sync_category=True)
+                        # Queue metadata extraction for newly matched product
+                        enqueue_metadata_extraction(product_id)
                 except Exception as e:
                     print(f"Warning: Metadata extraction failed for product {product_id}: {e}")
             
@@ -3521,14 +3268,10 @@ def approve_pending_shipment(
             
             products_needing_metadata = cursor.fetchall()
             
-            # Extract metadata for each product
-            for product_row in products_needing_metadata:
-                try:
-                    extract_metadata_for_product(product_row['product_id'], auto_sync_category=True)
-                except Exception:
-                    pass  # Continue with other products if one fails
+            # Queue them all in one insert; the metadata worker fills them in
+            enqueue_metadata_extraction([row['product_id'] for row in products_needing_metadata])
         except Exception:
-            pass  # Don't fail shipment approval if metadata extraction fails
+            pass  # Don't fail shipment approval if metadata extraction can't be queued
         
         # Log audit action
         try:
@@ -3718,13 +3461,7 @@ def add_employee(
             raise ValueError("establishment_id is required. Set establishment context first.")
         
         # Check if table has username column (RBAC migration)
-        # Check columns using PostgreSQL information_schema
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'employees' AND table_schema = 'public'
-        """)
-        columns = [row[0] for row in cursor.fetchall()]
+        columns = table_columns('employees')
         
         has_username = 'username' in columns
         has_employee_code = 'employee_code' in columns
@@ -3733,34 +3470,6 @@ def add_employee(
         has_clerk_user_id = 'clerk_user_id' in columns
         has_establishment_id = 'establishment_id' in columns
         
-        # Add missing columns if needed (only if we're providing values for them)
-        if pin_code and not has_pin_code:
-            try:
-                cursor.execute("ALTER TABLE employees ADD COLUMN pin_code TEXT")
-                has_pin_code = True
-                conn.commit()
-                print("[DEBUG] Added pin_code column to employees table")
-            except Exception as e:
-                print(f"[DEBUG] Could not add pin_code column: {e}")
-        
-        if clerk_user_id and not has_clerk_user_id:
-            try:
-                cursor.execute("ALTER TABLE employees ADD COLUMN clerk_user_id TEXT")
-                has_clerk_user_id = True
-                conn.commit()
-                print("[DEBUG] Added clerk_user_id column to employees table")
-            except Exception as e:
-                print(f"[DEBUG] Could not add clerk_user_id column: {e}")
-        
-        if role_id and not has_role_id:
-            try:
-                cursor.execute("ALTER TABLE employees ADD COLUMN role_id INTEGER")
-                has_role_id = True
-                conn.commit()
-                print("[DEBUG] Added role_id column to employees table")
-            except Exception as e:
-                print(f"[DEBUG] Could not add role_id column: {e}")
-        
         # Generate PIN if not provided
         if not pin_code:
             pin_code = generate_pin()
@@ -3869,16 +3578,7 @@ def get_employee_by_clerk_user_id(clerk_user_id: str) -> Optional[Dict[str, Any]
         
         cursor = conn.cursor()
         
-        # Check if column exists using PostgreSQL information_schema
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'employees' AND table_schema = 'public'
-            AND column_name = 'clerk_user_id'
-        """)
-        has_column = cursor.fetchone() is not None
-        
-        if not has_column:
+        if not has_column('employees', 'clerk_user_id'):
             return None
         
         # Use PostgreSQL placeholder
@@ -3919,13 +3619,6 @@ def link_clerk_user_to_employee(employee_id: int, clerk_user_id: str) -> bool:
     cursor = conn.cursor()
     
     try:
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = \'employees\' AND table_schema = 'public'")
-        columns = [col[0] for col in cursor.fetchall()]
-        
-        if 'clerk_user_id' not in columns:
-            # Add column if it doesn't exist
-            cursor.execute("ALTER TABLE employees ADD COLUMN clerk_user_id TEXT UNIQUE")
-        
         cursor.execute("UPDATE employees SET clerk_user_id = %s WHERE employee_id = %s", (clerk_user_id, employee_id))
         conn.commit()
         conn.close()
@@ -3942,14 +3635,7 @@ def verify_pin_login(clerk_user_id: str, pin_code: str) -> Optional[Dict[str, An
     cursor = conn.cursor()
     
     try:
-        # Check if columns exist using PostgreSQL information_schema
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'employees' AND table_schema = 'public'
-            AND column_name IN ('clerk_user_id', 'pin_code')
-        """)
-        columns = [row[0] for row in cursor.fetchall()]
+        columns = table_columns('employees')
         
         if 'clerk_user_id' not in columns or 'pin_code' not in columns:
             conn.close()
@@ -4005,10 +3691,7 @@ def get_employee(employee_id: int) -> Optional[Dict[str, Any]]:
     employee = dict(row)
     
     # Get tip summary if employee_tips table exists
-    cursor.execute("""
-        SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name = 'employee_tips'
-    """)
-    if cursor.fetchone():
+    if has_table('employee_tips'):
         cursor.execute("""
             SELECT 
                 COUNT(*) as total_tip_transactions,
@@ -4049,19 +3732,7 @@ def list_employees(active_only: bool = True) -> List[Dict[str, Any]]:
         except:
             pass
         
-        # Check if employee_tips table exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'employee_tips'
-            )
-        """)
-        tips_table_result = cursor.fetchone()
-        if isinstance(tips_table_result, dict):
-            has_tips_table = tips_table_result.get('exists', False)
-        else:
-            has_tips_table = tips_table_result[0] if tips_table_result else False
+        has_tips_table = has_table('employee_tips')
         
         if active_only:
             if has_tips_table:
@@ -4148,18 +3819,22 @@ def list_employees(active_only: bool = True) -> List[Dict[str, Any]]:
             except:
                 pass
 
+def _invalidate_employee_caches(employee_id: int) -> None:
+    """Drop cached sessions, permission sets and face index entry after an employee change is committed."""
+    invalidate_employee_sessions(employee_id)
+    from permission_manager import invalidate_employee_permissions
+    invalidate_employee_permissions(employee_id)
+    # Deactivated/deleted employees must stop matching at the face kiosk
+    from face_index import refresh_face_employee
+    refresh_face_employee(employee_id)
+
 def update_employee(employee_id: int, **kwargs) -> bool:
     """Update employee information"""
     conn = get_connection()
     cursor = conn.cursor()
     
     # Check if table has RBAC columns
-    cursor.execute("""
-        SELECT column_name 
-        FROM information_schema.columns 
-        WHERE table_name = 'employees' AND table_schema = 'public'
-    """)
-    columns = [row[0] for row in cursor.fetchall()]
+    columns = table_columns('employees')
     has_role_id = 'role_id' in columns
     has_pin_code = 'pin_code' in columns
     has_username = 'username' in columns
@@ -4210,6 +3885,10 @@ def update_employee(employee_id: int, **kwargs) -> bool:
     success = cursor.rowcount > 0
     conn.close()
     
+    # Cached sessions carry name/position and assume the employee is active
+    if success:
+        _invalidate_employee_caches(employee_id)
+    
     return success
 
 def delete_employee(employee_id: int) -> bool:
@@ -4230,6 +3909,9 @@ def delete_employee(employee_id: int) -> bool:
     success = cursor.rowcount > 0
     conn.close()
     
+    if success:
+        _invalidate_employee_caches(employee_id)
+    
     return success
 
 
@@ -4246,6 +3928,8 @@ def permanently_delete_employee(employee_id: int) -> tuple[bool, str]:
         cursor.execute("DELETE FROM employees WHERE employee_id = %s", (employee_id,))
         conn.commit()
         success = cursor.rowcount > 0
+        if success:
+            _invalidate_employee_caches(employee_id)
         return (success, "" if success else "Employee not found")
     except Exception as e:
         conn.rollback()
@@ -4277,11 +3961,7 @@ def add_customer(
             establishment_id = get_current_establishment()
         if establishment_id is None:
             establishment_id = _get_or_create_default_establishment(conn)
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'customers' AND column_name = 'address'
-        """)
-        has_address = cursor.fetchone() is not None
+        has_address = has_column('customers', 'address')
         if has_address and address is not None:
             cursor.execute("""
                 INSERT INTO customers (establishment_id, customer_name, email, phone, address)
@@ -4316,11 +3996,7 @@ def update_customer(
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'customers'
-        """)
-        allowed_cols = {r[0] for r in cursor.fetchall()}
+        allowed_cols = table_columns('customers')
         updates = []
         params = []
         if customer_name is not None and 'customer_name' in allowed_cols:
@@ -4401,11 +4077,7 @@ def search_customers(establishment_id: Optional[int], q: str, limit: int = 20) -
         if establishment_id is None:
             establishment_id = _get_or_create_default_establishment(conn)
         term = f"%{(q or '').strip()}%"
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'customers' AND column_name = 'address'
-        """)
-        has_address_col = cursor.fetchone() is not None
+        has_address_col = has_column('customers', 'address')
         if has_address_col:
             cursor.execute("""
                 SELECT customer_id, establishment_id, customer_name, email, phone, COALESCE(address, '') AS address, loyalty_points, created_date
@@ -4534,20 +4206,49 @@ def get_customer(customer_id: int) -> Optional[Dict[str, Any]]:
 # ============================================================================
 
 def generate_order_number(prefix: str = "ORD") -> str:
-    """Generate a unique order number. Use prefix ORD (default), DD (DoorDash), SH (Shopify), UE (Uber Eats)."""
+    """
+    Generate a unique order number. Use prefix ORD (default), DD (DoorDash), SH (Shopify), UE (Uber Eats).
+    Numbers come from order_number_counters (one row per prefix per day), bumped atomically with a
+    single UPDATE ... RETURNING, so concurrent registers never get the same number.
+    """
+    safe_prefix = (prefix or "ORD").strip().upper()[:10]
+    now = datetime.now()
+    today = now.strftime('%Y%m%d')
     conn = get_connection()
     cursor = conn.cursor()
-    safe_prefix = (prefix or "ORD").strip().upper()[:10]
-    today = datetime.now().strftime('%Y%m%d')
-    cursor.execute("""
-        SELECT COUNT(*) FROM orders
-        WHERE DATE(order_date) = CURRENT_DATE
-        AND order_number::text LIKE %s
-    """, (f"{safe_prefix}-%",))
-    count = cursor.fetchone()[0]
-    order_number = f"{safe_prefix}-{today}-{count + 1:04d}"
-    conn.close()
-    return order_number
+    try:
+        if not has_table('order_number_counters'):
+            # Schema bootstrap hasn't run (standalone script): fall back to counting today's orders
+            cursor.execute("""
+                SELECT COUNT(*) FROM orders
+                WHERE DATE(order_date) = CURRENT_DATE
+                AND order_number::text LIKE %s
+            """, (f"{safe_prefix}-%",))
+            return f"{safe_prefix}-{today}-{cursor.fetchone()[0] + 1:04d}"
+        cursor.execute("""
+            UPDATE order_number_counters SET last_value = last_value + 1
+            WHERE prefix = %s AND day = %s
+            RETURNING last_value
+        """, (safe_prefix, now.date()))
+        row = cursor.fetchone()
+        if row is None:
+            # First order of the day for this prefix: seed from NNNN numbers already issued today
+            # (e.g. before this counter existed; older HHMMSS-style numbers are ignored), and let
+            # concurrent seeders fall through to +1
+            cursor.execute("""
+                INSERT INTO order_number_counters (prefix, day, last_value)
+                SELECT %s, %s, COALESCE(MAX(split_part(order_number, '-', 3)::integer), 0) + 1
+                FROM orders
+                WHERE order_number LIKE %s AND split_part(order_number, '-', 3) ~ '^[0-9]{1,5}$'
+                ON CONFLICT (prefix, day) DO UPDATE SET last_value = order_number_counters.last_value + 1
+                RETURNING last_value
+            """, (safe_prefix, now.date(), f"{safe_prefix}-{today}-%"))
+            row = cursor.fetchone()
+        conn.commit()
+        next_value = row['last_value'] if isinstance(row, dict) else row[0]
+        return f"{safe_prefix}-{today}-{next_value:04d}"
+    finally:
+        conn.close()
 
 def _apply_pos_settings_fee_mode(cursor, fee_rates: Optional[Dict[str, float]]) -> Optional[Dict[str, float]]:
     """Apply pos_settings transaction_fee_mode and transaction_fee_charge_cash to fee_rates. Returns adjusted copy or None to use as-is."""
@@ -4627,6 +4328,7 @@ def create_order(
     doordash_total_merchant_funded_discount_cents: Optional[int] = None,
     doordash_total_doordash_funded_discount_cents: Optional[int] = None,
     scheduled_time: Optional[str] = None,
+    notify: bool = False,
 ) -> Dict[str, Any]:
     """
     Create a new order and process payment
@@ -4638,7 +4340,9 @@ def create_order(
     order_type: \'pickup\' or \'delivery\' (optional)
     customer_info: Dict with \'name\', \'phone\', and optionally \'address\' (for delivery)
     establishment_id_override: When set (e.g. from webhooks), use this establishment instead of current context.
+    notify: Queue the new-order email/SMS in notification_outbox in the same transaction as the order.
     """
+    from psycopg2.extras import execute_values
     conn = get_connection()
     cursor = conn.cursor()
     
@@ -4658,18 +4362,27 @@ def create_order(
         product_quantity_requested = {}  # Sum quantity per product (same product can appear in multiple lines)
 
         for item in items:
-            product_id = item['product_id']
+            product_id = int(item['product_id'])
             quantity = int(item['quantity'])
             product_quantity_requested[product_id] = product_quantity_requested.get(product_id, 0) + quantity
 
-        for product_id, total_quantity in product_quantity_requested.items():
-            cursor.execute(
-                "SELECT current_quantity, establishment_id FROM inventory WHERE product_id = %s AND establishment_id = %s",
-                (product_id, establishment_id)
-            )
-            row = cursor.fetchone()
+        # One statement validates and row-locks every product on the order. Locks are taken in
+        # product_id order so two registers selling the same items can't deadlock.
+        cursor.execute("""
+            SELECT product_id, current_quantity, establishment_id FROM inventory
+            WHERE establishment_id = %s AND product_id = ANY(%s)
+            ORDER BY product_id
+            FOR UPDATE
+        """, (establishment_id, list(product_quantity_requested)))
+        stock_rows = {}
+        for row in cursor.fetchall():
+            if isinstance(row, dict):
+                stock_rows[row['product_id']] = (row.get('current_quantity') or 0, row.get('establishment_id'))
+            else:
+                stock_rows[row[0]] = (row[1] or 0, row[2])
 
-            if not row:
+        for product_id, total_quantity in product_quantity_requested.items():
+            if product_id not in stock_rows:
                 conn.rollback()
                 conn.close()
                 return {
@@ -4678,13 +4391,7 @@ def create_order(
                     'order_id': None
                 }
 
-            if isinstance(row, dict):
-                available_qty = row.get('current_quantity', 0)
-                product_establishment_id = row.get('establishment_id')
-            else:
-                available_qty = row[0] if row else 0
-                product_establishment_id = row[1] if len(row) > 1 else None
-
+            available_qty, product_establishment_id = stock_rows[product_id]
             product_establishment_map[product_id] = product_establishment_id or establishment_id
 
             if available_qty < total_quantity:
@@ -4716,11 +4423,7 @@ def create_order(
             if existing_customer:
                 customer_id = existing_customer['customer_id'] if isinstance(existing_customer, dict) else existing_customer[0]
                 # Update customer info if provided (only include address if column exists)
-                cursor.execute("""
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'customers' AND column_name = 'address'
-                """)
-                has_address_col = cursor.fetchone() is not None
+                has_address_col = has_column('customers', 'address')
                 update_fields = []
                 update_values = []
                 if customer_name:
@@ -4744,11 +4447,7 @@ def create_order(
                     """, update_values)
             else:
                 # Create new customer (include establishment_id)
-                cursor.execute("""
-                    SELECT column_name FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'customers' AND column_name = 'address'
-                """)
-                has_addr = cursor.fetchone() is not None
+                has_addr = has_column('customers', 'address')
                 if has_addr and customer_address is not None:
                     cursor.execute("""
                         INSERT INTO customers (establishment_id, customer_name, email, phone, address)
@@ -4792,11 +4491,7 @@ def create_order(
                     order_customer_name = (cust_row[0] or '').strip() or None if len(cust_row) > 0 else None
                     order_customer_phone = (cust_row[1] or '').strip() or None if len(cust_row) > 1 else None
                     order_customer_email = (cust_row[2] or '').strip() or None if len(cust_row) > 2 else None
-            cursor.execute("""
-                SELECT 1 FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = 'customers' AND column_name = 'address'
-            """)
-            if cursor.fetchone() and customer_id:
+            if has_column('customers', 'address') and customer_id:
                 cursor.execute("SELECT address FROM customers WHERE customer_id = %s", (customer_id,))
                 addr_row = cursor.fetchone()
                 if addr_row:
@@ -4862,8 +4557,7 @@ def create_order(
         total = pre_fee_total + transaction_fee + tip
         
         # Create order - check if tip, order_type, and customer snapshot columns exist
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = \'orders\' AND table_schema = 'public'")
-        columns = [col[0] for col in cursor.fetchall()]
+        columns = table_columns('orders')
         has_tip = 'tip' in columns
         has_order_type = 'order_type' in columns
         has_discount_type = 'discount_type' in columns
@@ -4932,8 +4626,7 @@ def create_order(
 
         # Set order_source, prepare_by, external_order_id, integration_experience, DoorDash promo columns for integration orders (columns added by migration)
         if order_id and (order_source is not None or prepare_by is not None or external_order_id is not None or integration_experience is not None or doordash_promo_details is not None or doordash_total_merchant_funded_discount_cents is not None or doordash_total_doordash_funded_discount_cents is not None):
-            cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'orders' AND table_schema = 'public'")
-            ocols = [r[0] if isinstance(r, tuple) else r.get('column_name') for r in cursor.fetchall()]
+            ocols = table_columns('orders')
             if order_source is not None and 'order_source' in ocols:
                 cursor.execute("UPDATE orders SET order_source = %s WHERE order_id = %s", (order_source.strip().lower(), order_id))
             if prepare_by is not None and 'prepare_by' in ocols:
@@ -4952,110 +4645,87 @@ def create_order(
         
         # Add order items (triggers will update inventory)
         # Check if order_items has variant_id and notes columns (optional migrations)
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'order_items'")
-        oi_columns = [row[0] if isinstance(row, tuple) else row.get('column_name') for row in cursor.fetchall()]
+        oi_columns = table_columns('order_items')
         has_order_items_variant_id = 'variant_id' in oi_columns
         has_order_items_notes = 'notes' in oi_columns
 
-        print(f"Creating order_items for order_id {order_id}, {len(items)} items")
-        for idx, item in enumerate(items):
-            print(f"Processing item {idx + 1}/{len(items)}: {item}")
-            product_id = item['product_id']
+        item_cols = [
+            'establishment_id', 'order_id', 'product_id', 'quantity', 'unit_price', 'discount', 'subtotal',
+            'tax_rate', 'tax_amount'
+        ]
+        if has_order_items_variant_id:
+            item_cols.append('variant_id')
+        if has_order_items_notes:
+            item_cols.append('notes')
+        item_rows = []
+        for item in items:
+            product_id = int(item['product_id'])
             quantity = int(item['quantity'])
             unit_price = float(item['unit_price'])  # Ensure it's a float
-            item_discount = float(item.get('discount', 0.0))
-            item_tax_rate = float(item.get('tax_rate', tax_rate))
-            item_subtotal = (quantity * unit_price) - item_discount
-            item_tax = item_subtotal * item_tax_rate
-            item_notes = (item.get('notes') or '').strip() or None
-
-            # Use the product's establishment_id for the order_item
-            item_establishment_id = product_establishment_map.get(product_id, establishment_id)
-
-            # Verify product exists before inserting
-            cursor.execute("SELECT product_id FROM inventory WHERE product_id = %s", (product_id,))
-            product_check = cursor.fetchone()
-            if not product_check:
-                conn.rollback()
-                conn.close()
-                return {
-                    'success': False,
-                    'message': f'Product ID {product_id} does not exist in inventory',
-                    'order_id': None
-                }
-
-            try:
-                variant_id = item.get('variant_id')
-                if has_order_items_variant_id and has_order_items_notes:
-                    cursor.execute("""
-                        INSERT INTO order_items (
-                            establishment_id, order_id, product_id, quantity, unit_price, discount, subtotal,
-                            tax_rate, tax_amount, variant_id, notes
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (item_establishment_id, order_id, product_id, quantity, unit_price, item_discount, item_subtotal,
-                          item_tax_rate, item_tax, variant_id, item_notes))
-                elif has_order_items_variant_id:
-                    cursor.execute("""
-                        INSERT INTO order_items (
-                            establishment_id, order_id, product_id, quantity, unit_price, discount, subtotal,
-                            tax_rate, tax_amount, variant_id
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (item_establishment_id, order_id, product_id, quantity, unit_price, item_discount, item_subtotal,
-                          item_tax_rate, item_tax, variant_id))
-                elif has_order_items_notes:
-                    cursor.execute("""
-                        INSERT INTO order_items (
-                            establishment_id, order_id, product_id, quantity, unit_price, discount, subtotal,
-                            tax_rate, tax_amount, notes
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (item_establishment_id, order_id, product_id, quantity, unit_price, item_discount, item_subtotal,
-                          item_tax_rate, item_tax, item_notes))
-                else:
-                    cursor.execute("""
-                        INSERT INTO order_items (
-                            establishment_id, order_id, product_id, quantity, unit_price, discount, subtotal,
-                            tax_rate, tax_amount
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (item_establishment_id, order_id, product_id, quantity, unit_price, item_discount, item_subtotal,
-                          item_tax_rate, item_tax))
-                
-                # Verify the insert succeeded
-                if cursor.rowcount == 0:
-                    raise Exception(f"Failed to insert order_item for product_id {product_id}")
-                
-                print(f"Successfully inserted order_item: order_id={order_id}, product_id={product_id}, quantity={quantity}")
-                # Inventory update is done once per product below (after all order_items inserted)
-                    
-            except Exception as item_error:
-                # If order_item insertion fails, rollback the entire transaction
-                import traceback
-                print(f"Error inserting order_item for product_id {product_id}: {str(item_error)}")
-                traceback.print_exc()
-                conn.rollback()
-                conn.close()
-                return {
-                    'success': False,
-                    'message': f'Error inserting order item for product_id {product_id}: {str(item_error)}',
-                    'order_id': None
-                }
+            item_discount = float(item.get('discount', 0.0))
+            item_tax_rate = float(item.get('tax_rate', tax_rate))
+            item_subtotal = (quantity * unit_price) - item_discount
+            item_tax = item_subtotal * item_tax_rate
+            # Use the product's establishment_id for the order_item
+            row = [product_establishment_map.get(product_id, establishment_id), order_id, product_id, quantity,
+                   unit_price, item_discount, item_subtotal, item_tax_rate, item_tax]
+            if has_order_items_variant_id:
+                row.append(item.get('variant_id'))
+            if has_order_items_notes:
+                row.append((item.get('notes') or '').strip() or None)
+            item_rows.append(tuple(row))
+
+        # All order_items in one multi-row INSERT (page_size covers every row -> single statement)
+        print(f"Creating order_items for order_id {order_id}, {len(items)} items")
+        items_count = 0
+        try:
+            if item_rows:
+                execute_values(
+                    cursor,
+                    f"INSERT INTO order_items ({', '.join(item_cols)}) VALUES %s",
+                    item_rows,
+                    page_size=len(item_rows)
+                )
+                items_count = cursor.rowcount
+        except Exception as item_error:
+            # If order_item insertion fails, rollback the entire transaction
+            import traceback
+            print(f"Error inserting order_items for order_id {order_id}: {str(item_error)}")
+            traceback.print_exc()
+            conn.rollback()
+            conn.close()
+            return {
+                'success': False,
+                'message': f'Error inserting order items: {str(item_error)}',
+                'order_id': None
+            }
 
-        # Update inventory once per product (total quantity) to avoid multiple decrements for same product
-        for product_id, total_qty in product_quantity_requested.items():
-            item_establishment_id = product_establishment_map.get(product_id, establishment_id)
-            cursor.execute("""
-                UPDATE inventory
-                SET current_quantity = current_quantity - %s,
+        # Decrement inventory for every product in one statement (quantities already summed per product)
+        stock_updates = [
+            (product_id, product_establishment_map.get(product_id, establishment_id), total_qty)
+            for product_id, total_qty in product_quantity_requested.items()
+        ]
+        if stock_updates:
+            execute_values(
+                cursor,
+                """
+                UPDATE inventory AS i
+                SET current_quantity = i.current_quantity - v.qty,
                     updated_at = NOW()
-                WHERE product_id = %s AND establishment_id = %s
-            """, (total_qty, product_id, item_establishment_id))
-            if cursor.rowcount == 0:
-                print(f"Warning: Inventory update affected 0 rows for product_id {product_id}, establishment_id {item_establishment_id}")
+                FROM (VALUES %s) AS v(product_id, establishment_id, qty)
+                WHERE i.product_id = v.product_id AND i.establishment_id = v.establishment_id
+                """,
+                stock_updates,
+                template='(%s::integer, %s::integer, %s::integer)',
+                page_size=len(stock_updates)
+            )
+            if cursor.rowcount != len(stock_updates):
+                print(f"Warning: Inventory update affected {cursor.rowcount} of {len(stock_updates)} products for order_id {order_id}")
         
         # Record payment transaction only when payment is completed (skip for pay-at-pickup/delivery)
         transaction_id = None
         if pstatus == 'completed':
-            cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = \'payment_transactions\' AND table_schema = 'public'")
-            columns = [col[0] for col in cursor.fetchall()]
+            columns = table_columns('payment_transactions')
             has_tip = 'tip' in columns
             has_employee_id = 'employee_id' in columns
             
@@ -5085,10 +4755,7 @@ def create_order(
                 transaction_id = result[0] if result else None
             
             if tip > 0 and transaction_id is not None:
-                cursor.execute("""
-                    SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name = 'employee_tips'
-                """)
-                if cursor.fetchone():
+                if has_table('employee_tips'):
                     cursor.execute("""
                         INSERT INTO employee_tips (
                             employee_id, order_id, transaction_id, tip_amount, payment_method
@@ -5146,11 +4813,7 @@ def create_order(
                 import traceback
                 traceback.print_exc()
         
-        # Verify order_items were inserted before committing
-        cursor.execute("SELECT COUNT(*) FROM order_items WHERE order_id = %s", (order_id,))
-        items_count_result = cursor.fetchone()
-        items_count = items_count_result[0] if items_count_result else 0
-        
+        # Verify every order_item was inserted before committing (rowcount of the multi-row INSERT)
         if items_count != len(items):
             conn.rollback()
             conn.close()
@@ -5162,8 +4825,20 @@ def create_order(
         
         print(f"Order {order_number} (ID: {order_id}) created successfully with {items_count} items")
         
+        if notify:
+            notification = {'order_id': order_id, 'order_number': order_number, 'total': total,
+                            'order_source': order_source}
+            notification_queued = enqueue_notification('order', f'order:{order_id}', notification, cursor=cursor)
+
         conn.commit()
         conn.close()
+
+        if notify:
+            try:
+                from notification_outbox import notification_committed
+                notification_committed(notification_queued, 'order', notification)
+            except Exception as e:
+                print(f"Order {order_number}: could not dispatch notification: {e}")
         
         return {
             'success': True,
@@ -5302,10 +4977,7 @@ def update_order_status(
                 UPDATE orders SET transaction_fee = %s, total = %s, payment_method = %s
                 WHERE order_id = %s
             """, (transaction_fee, new_total, pay_method, order_id))
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns WHERE table_name = 'payment_transactions' AND table_schema = 'public'
-            """)
-            cols = [c[0] for c in cursor.fetchall()]
+            cols = table_columns('payment_transactions')
             has_tip = 'tip' in cols
             has_employee_id = 'employee_id' in cols
             if has_tip and has_employee_id and emp_id:
@@ -6401,11 +6073,7 @@ def get_integrations(establishment_id: int) -> List[Dict[str, Any]]:
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT table_name FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_name = 'pos_integrations'
-        """)
-        if not cursor.fetchone():
+        if not has_table('pos_integrations'):
             conn.close()
             return []
         from psycopg2.extras import RealDictCursor
@@ -6431,11 +6099,7 @@ def upsert_integration(
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT table_name FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_name = 'pos_integrations'
-        """)
-        if not cursor.fetchone():
+        if not has_table('pos_integrations'):
             conn.close()
             return {'success': False, 'message': 'pos_integrations table not found'}
         import json
@@ -6483,11 +6147,7 @@ def save_doordash_order_lines(order_id: int, lines: List[Dict[str, Any]]) -> boo
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT 1 FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_name = 'doordash_order_lines'
-        """)
-        if not cursor.fetchone():
+        if not has_table('doordash_order_lines'):
             conn.close()
             return False
         for row in lines:
@@ -6516,11 +6176,7 @@ def get_doordash_order_lines(order_id: int) -> List[Dict[str, Any]]:
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT 1 FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_name = 'doordash_order_lines'
-        """)
-        if not cursor.fetchone():
+        if not has_table('doordash_order_lines'):
             return []
         from psycopg2.extras import RealDictCursor
         cursor.close()
@@ -6542,11 +6198,7 @@ def get_order_by_external_order_id(external_order_id: str) -> Optional[Dict[str,
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'orders' AND column_name = 'external_order_id'
-        """)
-        if not cursor.fetchone():
+        if not has_column('orders', 'external_order_id'):
             return None
         from psycopg2.extras import RealDictCursor
         cursor.close()
@@ -6578,11 +6230,7 @@ def update_order_dasher_status(
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'orders' AND column_name = 'dasher_status'
-        """)
-        if not cursor.fetchone():
+        if not has_column('orders', 'dasher_status'):
             return False
         if external_order_id and str(external_order_id).strip():
             cursor.execute(
@@ -6627,11 +6275,7 @@ def replace_doordash_order_lines(order_id: int, lines: List[Dict[str, Any]]) ->
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT 1 FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_name = 'doordash_order_lines'
-        """)
-        if not cursor.fetchone():
+        if not has_table('doordash_order_lines'):
             conn.close()
             return False
         cursor.execute("DELETE FROM doordash_order_lines WHERE order_id = %s", (order_id,))
@@ -6704,11 +6348,7 @@ def insert_doordash_store_deactivation_event(
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT 1 FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_name = 'doordash_store_deactivation_events'
-        """)
-        if not cursor.fetchone():
+        if not has_table('doordash_store_deactivation_events'):
             return False
         msid = (merchant_supplied_id or "").strip() or None
         reason_str = (reason or "").strip() or None
@@ -6737,11 +6377,7 @@ def get_latest_doordash_store_deactivation(establishment_id: int) -> Optional[Di
     conn = get_connection()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        cursor.execute("""
-            SELECT 1 FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_name = 'doordash_store_deactivation_events'
-        """)
-        if not cursor.fetchone():
+        if not has_table('doordash_store_deactivation_events'):
             return None
         cursor.execute("""
             SELECT id, establishment_id, doordash_store_id, merchant_supplied_id, reason_id, reason, notes, start_time, end_time, created_at
@@ -6756,6 +6392,73 @@ def get_latest_doordash_store_deactivation(establishment_id: int) -> Optional[Di
         conn.close()
 
 
+def _orders_filter_sql(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    employee_id: Optional[int] = None,
+    order_status: Optional[str] = None,
+    order_status_in: Optional[List[str]] = None,
+    order_type_in: Optional[List[str]] = None
+) -> Tuple[str, List[Any]]:
+    """WHERE fragment (starting with AND) + params shared by list_orders and count_orders.
+    Dates are half-open timestamp ranges so the order_date index is usable."""
+    query = ""
+    params: List[Any] = []
+    if start_date:
+        query += " AND o.order_date >= %s::date"
+        params.append(start_date)
+    if end_date:
+        query += " AND o.order_date < %s::date + INTERVAL '1 day'"
+        params.append(end_date)
+    if employee_id:
+        query += " AND o.employee_id = %s"
+        params.append(employee_id)
+    if order_status:
+        query += " AND o.order_status = %s"
+        params.append(order_status)
+    if order_status_in:
+        placeholders = ', '.join(['%s'] * len(order_status_in))
+        query += " AND LOWER(COALESCE(o.order_status, '')) IN (" + placeholders + ")"
+        params.extend([s.lower() for s in order_status_in])
+    if order_type_in:
+        in_person = 'in-person' in [t.lower() for t in order_type_in]
+        others = [t for t in order_type_in if (t or '').lower() != 'in-person']
+        in_person_cond = "(o.order_type IS NULL OR TRIM(COALESCE(o.order_type, '')) = '' OR LOWER(o.order_type) = 'in-person')"
+        if in_person and others:
+            placeholders = ', '.join(['%s'] * len(others))
+            query += " AND (" + in_person_cond + " OR LOWER(COALESCE(o.order_type, '')) IN (" + placeholders + "))"
+            params.extend([o.lower() for o in others])
+        elif in_person:
+            query += " AND " + in_person_cond
+        else:
+            placeholders = ', '.join(['%s'] * len(others))
+            query += " AND LOWER(COALESCE(o.order_type, '')) IN (" + placeholders + ")"
+            params.extend([o.lower() for o in others])
+    return query, params
+
+
+def encode_orders_cursor(order: Dict[str, Any]) -> Optional[str]:
+    """Opaque keyset cursor for the row after `order` in list_orders (order_date DESC, order_id DESC)."""
+    order_date = order.get('order_date')
+    order_id = order.get('order_id')
+    if order_date is None or order_id is None:
+        return None
+    if isinstance(order_date, datetime):
+        order_date = order_date.isoformat()
+    raw = json.dumps([str(order_date), int(order_id)]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_orders_cursor(token: str) -> Tuple[str, int]:
+    """Inverse of encode_orders_cursor. Raises ValueError for malformed tokens."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        order_date, order_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return str(order_date), int(order_id)
+    except Exception as e:
+        raise ValueError(f"Invalid orders cursor: {e}") from e
+
+
 def list_orders(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -6764,11 +6467,13 @@ def list_orders(
     order_status_in: Optional[List[str]] = None,
     order_type_in: Optional[List[str]] = None,
     limit: Optional[int] = None,
-    offset: Optional[int] = None
+    offset: Optional[int] = None,
+    after_cursor: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """List orders with optional filters, including receipt preferences.
     order_status_in: e.g. ['returned', 'voided', 'out_for_delivery'] (OR).
     order_type_in: e.g. ['pickup', 'delivery'] or include 'in-person' for null/empty order_type (OR).
+    after_cursor: keyset cursor from encode_orders_cursor(last row of previous page); preferred over offset.
     """
     from psycopg2.extras import RealDictCursor
     
@@ -6776,30 +6481,27 @@ def list_orders(
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        # Check if receipt_preferences table exists
-        check_cursor = conn.cursor()
-        check_cursor.execute("""
-            SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name = 'receipt_preferences'
-        """)
-        has_receipt_prefs = check_cursor.fetchone() is not None
-        check_cursor.close()
-        
-        if has_receipt_prefs:
-            # Join with receipt preferences through payment_transactions
-            # Note: If multiple transactions exist, this will get the first matching receipt preference
+        if has_table('receipt_preferences'):
+            # Receipt preference of the order's first transaction (one row per order, no DISTINCT fan-out)
             query = """
-                SELECT DISTINCT
+                SELECT
                     o.*,
                     e.first_name || ' ' || e.last_name as employee_name,
                     c.customer_name,
                     rp.receipt_type,
-                    rp.email_address as receipt_email,
-                    rp.phone_number as receipt_phone
+                    rp.receipt_email,
+                    rp.receipt_phone
                 FROM orders o
                 LEFT JOIN employees e ON o.employee_id = e.employee_id
                 LEFT JOIN customers c ON o.customer_id = c.customer_id
-                LEFT JOIN payment_transactions pt ON o.order_id = pt.order_id
-                LEFT JOIN receipt_preferences rp ON pt.transaction_id = rp.transaction_id
+                LEFT JOIN LATERAL (
+                    SELECT r.receipt_type, r.email_address AS receipt_email, r.phone_number AS receipt_phone
+                    FROM payment_transactions pt
+                    JOIN receipt_preferences r ON r.transaction_id = pt.transaction_id
+                    WHERE pt.order_id = o.order_id
+                    ORDER BY pt.transaction_id
+                    LIMIT 1
+                ) rp ON TRUE
                 WHERE 1=1
             """
         else:
@@ -6814,49 +6516,21 @@ def list_orders(
                 WHERE 1=1
             """
         
-        params = []
-        
-        if start_date:
-            query += " AND DATE(o.order_date) >= %s"
-            params.append(start_date)
-        
-        if end_date:
-            query += " AND DATE(o.order_date) <= %s"
-            params.append(end_date)
-        
-        if employee_id:
-            query += " AND o.employee_id = %s"
-            params.append(employee_id)
+        filter_sql, params = _orders_filter_sql(
+            start_date, end_date, employee_id, order_status, order_status_in, order_type_in
+        )
+        query += filter_sql
         
-        if order_status:
-            query += " AND o.order_status = %s"
-            params.append(order_status)
-        
-        if order_status_in:
-            placeholders = ', '.join(['%s'] * len(order_status_in))
-            query += " AND LOWER(COALESCE(o.order_status, '')) IN (" + placeholders + ")"
-            params.extend([s.lower() for s in order_status_in])
-        
-        if order_type_in:
-            in_person = 'in-person' in [t.lower() for t in order_type_in]
-            others = [t for t in order_type_in if (t or '').lower() != 'in-person']
-            in_person_cond = "(o.order_type IS NULL OR TRIM(COALESCE(o.order_type, '')) = '' OR LOWER(o.order_type) = 'in-person')"
-            if in_person and others:
-                placeholders = ', '.join(['%s'] * len(others))
-                query += " AND (" + in_person_cond + " OR LOWER(COALESCE(o.order_type, '')) IN (" + placeholders + "))"
-                params.extend([o.lower() for o in others])
-            elif in_person:
-                query += " AND " + in_person_cond
-            else:
-                placeholders = ', '.join(['%s'] * len(others))
-                query += " AND LOWER(COALESCE(o.order_type, '')) IN (" + placeholders + ")"
-                params.extend([o.lower() for o in others])
+        if after_cursor:
+            cursor_date, cursor_id = decode_orders_cursor(after_cursor)
+            query += " AND (o.order_date, o.order_id) < (%s::timestamp, %s)"
+            params.extend([cursor_date, cursor_id])
         
-        query += " ORDER BY o.order_date DESC"
+        query += " ORDER BY o.order_date DESC, o.order_id DESC"
         if limit is not None:
             query += " LIMIT %s"
             params.append(limit)
-        if offset is not None:
+        if offset is not None and not after_cursor:
             query += " OFFSET %s"
             params.append(offset)
         
@@ -6881,45 +6555,36 @@ def count_orders(
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        query = "SELECT COUNT(*) AS c FROM orders o WHERE 1=1"
-        params = []
-        if start_date:
-            query += " AND DATE(o.order_date) >= %s"
-            params.append(start_date)
-        if end_date:
-            query += " AND DATE(o.order_date) <= %s"
-            params.append(end_date)
-        if employee_id:
-            query += " AND o.employee_id = %s"
-            params.append(employee_id)
-        if order_status:
-            query += " AND o.order_status = %s"
-            params.append(order_status)
-        if order_status_in:
-            placeholders = ', '.join(['%s'] * len(order_status_in))
-            query += " AND LOWER(COALESCE(o.order_status, '')) IN (" + placeholders + ")"
-            params.extend([s.lower() for s in order_status_in])
-        if order_type_in:
-            in_person = 'in-person' in [t.lower() for t in order_type_in]
-            others = [t for t in order_type_in if (t or '').lower() != 'in-person']
-            in_person_cond = "(o.order_type IS NULL OR TRIM(COALESCE(o.order_type, '')) = '' OR LOWER(o.order_type) = 'in-person')"
-            if in_person and others:
-                placeholders = ', '.join(['%s'] * len(others))
-                query += " AND (" + in_person_cond + " OR LOWER(COALESCE(o.order_type, '')) IN (" + placeholders + "))"
-                params.extend([o.lower() for o in others])
-            elif in_person:
-                query += " AND " + in_person_cond
-            else:
-                placeholders = ', '.join(['%s'] * len(others))
-                query += " AND LOWER(COALESCE(o.order_type, '')) IN (" + placeholders + ")"
-                params.extend([o.lower() for o in others])
-        cursor.execute(query, params)
+        filter_sql, params = _orders_filter_sql(
+            start_date, end_date, employee_id, order_status, order_status_in, order_type_in
+        )
+        cursor.execute("SELECT COUNT(*) AS c FROM orders o WHERE 1=1" + filter_sql, params)
         row = cursor.fetchone()
         return row[0] if row else 0
     finally:
         conn.close()
 
 
+# Cached order counts for paginated lists: key -> (computed_at, count)
+_orders_count_cache: Dict[Tuple, Tuple[float, int]] = {}
+_ORDERS_COUNT_CACHE_TTL = 60.0
+
+
+def count_orders_cached(max_age: float = _ORDERS_COUNT_CACHE_TTL, **filters) -> Tuple[int, bool]:
+    """count_orders served from a short-lived per-filter cache.
+    Returns (count, is_estimate); is_estimate is True when the value came from the cache."""
+    key = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in filters.items()))
+    cached = _orders_count_cache.get(key)
+    now = time.monotonic()
+    if cached and now - cached[0] < max_age:
+        return cached[1], True
+    count = count_orders(**filters)
+    if len(_orders_count_cache) > 256:
+        _orders_count_cache.clear()
+    _orders_count_cache[key] = (now, count)
+    return count, False
+
+
 def get_tips_by_employee(
     employee_id: Optional[int] = None,
     start_date: Optional[str] = None,
@@ -6930,10 +6595,7 @@ def get_tips_by_employee(
     cursor = conn.cursor()
     
     # Check if employee_tips table exists
-    cursor.execute("""
-        SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name = 'employee_tips'
-    """)
-    has_tips_table = cursor.fetchone() is not None
+    has_tips_table = has_table('employee_tips')
     
     if has_tips_table:
         # Use employee_tips table
@@ -7011,10 +6673,7 @@ def get_employee_tip_summary(
     cursor = conn.cursor()
     
     # Check if employee_tips table exists
-    cursor.execute("""
-        SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name = 'employee_tips'
-    """)
-    has_tips_table = cursor.fetchone() is not None
+    has_tips_table = has_table('employee_tips')
     
     if has_tips_table:
         query = """
@@ -7085,10 +6744,7 @@ def get_employee_tips(
     cursor = conn.cursor()
     
     # Check if employee_tips table exists
-    cursor.execute("""
-        SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name = 'employee_tips'
-    """)
-    has_tips_table = cursor.fetchone() is not None
+    has_tips_table = has_table('employee_tips')
     
     if has_tips_table:
         query = """
@@ -7602,13 +7258,7 @@ def employee_login(
     password_hash = hash_password(password)
     
     # Check if table has username column (RBAC migration)
-    cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'employees' AND table_schema = 'public'")
-    column_rows = cursor.fetchall()
-    # Handle both RealDictRow and tuple results
-    if column_rows and isinstance(column_rows[0], dict):
-        columns = [row.get('column_name') for row in column_rows]
-    else:
-        columns = [row[0] if isinstance(row, (tuple, list)) else row.get('column_name', row) for row in column_rows]
+    columns = table_columns('employees')
     has_username = 'username' in columns
     
     # Verify credentials - try username first if available, then employee_code
@@ -7666,11 +7316,7 @@ def employee_login(
             establishment_id = est_row.get('establishment_id') if isinstance(est_row, dict) else est_row[0]
     
     # Create session record - check if establishment_id column exists
-    cursor.execute("""
-        SELECT column_name FROM information_schema.columns 
-        WHERE table_name = 'employee_sessions' AND table_schema = 'public' AND column_name = 'establishment_id'
-    """)
-    has_establishment_id = cursor.fetchone() is not None
+    has_establishment_id = has_column('employee_sessions', 'establishment_id')
     
     if has_establishment_id and establishment_id:
         cursor.execute("""
@@ -7750,6 +7396,8 @@ def assign_role_to_employee(employee_id: int, role_id: int) -> bool:
         """, (role_id, employee_id))
         
         conn.commit()
+        from permission_manager import invalidate_employee_permissions
+        invalidate_employee_permissions(employee_id)
         return cursor.rowcount > 0
     except Exception as e:
         conn.rollback()
@@ -7763,6 +7411,13 @@ def verify_session(session_token: str) -> Dict[str, Any]:
     if not session_token:
         return {'valid': False, 'message': 'Session token is required'}
     
+    # Common path: token already validated recently in this process
+    session_cache = get_session_cache()
+    cached = session_cache.get(session_token)
+    if cached is not None:
+        return cached
+    generation = session_cache.generation
+    
     conn = None
     try:
         conn = get_connection()
@@ -7806,13 +7461,16 @@ def verify_session(session_token: str) -> Dict[str, Any]:
                     # Fallback: convert manually
                     session_dict = {str(i): val for i, val in enumerate(session)} if hasattr(session, '__iter__') and not isinstance(session, str) else {}
             
-            return {
+            result = {
                 'valid': True,
                 'employee_id': session_dict.get('employee_id'),
                 'employee_name': f"{session_dict.get('first_name', '')} {session_dict.get('last_name', '')}".strip(),
                 'position': session_dict.get('position', ''),
                 'email': session_dict.get('email', '')
             }
+            # Never serve a session from cache past its own expiry (where the column exists)
+            session_cache.put(session_token, result, generation, expires_at=session_dict.get('expires_at'))
+            return result
         
         return {'valid': False}
     except Exception as e:
@@ -7876,6 +7534,7 @@ def employee_logout(session_token: str) -> Dict[str, Any]:
                 """, (session_token,))
                 
                 conn.commit()
+                invalidate_session_token(session_token)
                 
                 # Log logout action (don't fail logout if audit logging fails)
                 try:
@@ -8163,11 +7822,7 @@ def log_audit_action(
     
     # Get establishment_id if needed
     establishment_id = None
-    cursor.execute("""
-        SELECT column_name FROM information_schema.columns 
-        WHERE table_name = 'audit_log' AND table_schema = 'public' AND column_name = 'establishment_id'
-    """)
-    has_establishment_id = cursor.fetchone() is not None
+    has_establishment_id = has_column('audit_log', 'establishment_id')
     
     if has_establishment_id:
         # Try to get establishment_id from employee
@@ -9023,83 +8678,6 @@ def start_verification_session(pending_shipment_id: int, employee_id: int, devic
     try:
         conn = get_connection()
         cursor = conn.cursor()
-
-        ensure_shipment_verification_tables(conn)
-        
-        # Ensure verification columns exist for pending_shipments
-        try:
-            cursor.execute("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_name = 'pending_shipments' AND table_schema = 'public'
-            """)
-            columns = [col[0] for col in cursor.fetchall()]
-            if 'started_by' not in columns:
-                cursor.execute("""
-                    ALTER TABLE pending_shipments
-                    ADD COLUMN started_by INTEGER
-                """)
-                conn.commit()
-                conn.rollback()
-            if 'started_at' not in columns:
-                cursor.execute("""
-                    ALTER TABLE pending_shipments
-                    ADD COLUMN started_at TIMESTAMP
-                """)
-                conn.commit()
-                conn.rollback()
-            if 'completed_by' not in columns:
-                cursor.execute("""
-                    ALTER TABLE pending_shipments
-                    ADD COLUMN completed_by INTEGER
-                """)
-                conn.commit()
-                conn.rollback()
-            if 'completed_at' not in columns:
-                cursor.execute("""
-                    ALTER TABLE pending_shipments
-                    ADD COLUMN completed_at TIMESTAMP
-                """)
-                conn.commit()
-                conn.rollback()
-            # Ensure status constraint allows in_progress
-            cursor.execute("""
-                SELECT conname, pg_get_constraintdef(c.oid)
-                FROM pg_constraint c
-                JOIN pg_class t ON c.conrelid = t.oid
-                WHERE t.relname = 'pending_shipments' AND c.contype = 'c'
-            """)
-            constraints = cursor.fetchall()
-            status_constraint = None
-            status_definition = None
-            for constraint in constraints:
-                if isinstance(constraint, dict):
-                    name = constraint.get('conname')
-                    definition = constraint.get('pg_get_constraintdef')
-                else:
-                    name = constraint[0] if constraint else None
-                    definition = constraint[1] if constraint and len(constraint) > 1 else None
-                if definition and 'status' in definition:
-                    status_constraint = name
-                    status_definition = definition
-                    break
-            if status_definition and "'in_progress'" not in status_definition:
-                cursor.execute(
-                    f'ALTER TABLE pending_shipments DROP CONSTRAINT IF EXISTS "{status_constraint}"'
-                )
-                cursor.execute("""
-                    ALTER TABLE pending_shipments
-                    ADD CONSTRAINT pending_shipments_status_check
-                    CHECK (status IN ('pending_review', 'in_progress', 'approved', 'rejected', 'completed_with_issues'))
-                """)
-                conn.commit()
-                conn.rollback()
-        except Exception:
-            try:
-                conn.rollback()
-            except:
-                pass
-            # Best effort; continue and rely on fallback update below
         
         # Update shipment status (try with started_by/started_at if columns exist, otherwise just status)
         try:
@@ -9164,91 +8742,91 @@ def scan_item(pending_shipment_id: int, barcode: str, employee_id: int,
               location: Optional[str] = None) -> Dict[str, Any]:
     """Process a scanned barcode during verification"""
     conn = get_connection()
-    cursor = conn.cursor()
-
-    ensure_shipment_verification_tables(conn)
-    
-    # Find matching item in pending shipment
-    cursor.execute("""
-        SELECT psi.*, i.product_id, i.product_name as inventory_name
-        FROM pending_shipment_items psi
-        LEFT JOIN inventory i ON (psi.product_sku = i.sku OR psi.barcode = i.barcode OR i.barcode = %s)
-        WHERE psi.pending_shipment_id = %s 
-        AND (psi.barcode = %s OR psi.product_sku = %s OR i.barcode = %s)
-        AND psi.status != 'verified'
-    """, (barcode, pending_shipment_id, barcode, barcode, barcode))
-    row = cursor.fetchone()
-    item = dict(zip([c[0] for c in cursor.description], row)) if row and cursor.description else None
-
-    scan_result = 'unknown'
-    response = {}
-    pending_item_id = None
+    try:
+        cursor = conn.cursor()
 
-    if item:
-        pending_item_id = item['pending_item_id']
-        
-        # Check if already fully verified
-        if item.get('quantity_verified', 0) >= item.get('quantity_expected', 0):
-            scan_result = 'duplicate'
-            response = {
-                'status': 'duplicate',
-                'message': f"Item already fully verified ({item.get('quantity_expected', 0)} units)",
-                'item': item
-            }
-        else:
-            # Increment verified quantity
-            new_quantity = item.get('quantity_verified', 0) + 1
-            scan_result = 'match'
+        # Find matching item in pending shipment
+        cursor.execute("""
+            SELECT psi.*, i.product_id, i.product_name as inventory_name
+            FROM pending_shipment_items psi
+            LEFT JOIN inventory i ON (psi.product_sku = i.sku OR psi.barcode = i.barcode OR i.barcode = %s)
+            WHERE psi.pending_shipment_id = %s 
+            AND (psi.barcode = %s OR psi.product_sku = %s OR i.barcode = %s)
+            AND psi.status != 'verified'
+        """, (barcode, pending_shipment_id, barcode, barcode, barcode))
+        row = cursor.fetchone()
+        item = dict(zip([c[0] for c in cursor.description], row)) if row and cursor.description else None
+
+        scan_result = 'unknown'
+        response = {}
+        pending_item_id = None
+
+        if item:
+            pending_item_id = item['pending_item_id']
+        
+            # Check if already fully verified
+            if item.get('quantity_verified', 0) >= item.get('quantity_expected', 0):
+                scan_result = 'duplicate'
+                response = {
+                    'status': 'duplicate',
+                    'message': f"Item already fully verified ({item.get('quantity_expected', 0)} units)",
+                    'item': item
+                }
+            else:
+                # Increment verified quantity
+                new_quantity = item.get('quantity_verified', 0) + 1
+                scan_result = 'match'
             
-            # Determine new status
-            new_status = 'verified' if new_quantity >= item.get('quantity_expected', 0) else 'pending'
+                # Determine new status
+                new_status = 'verified' if new_quantity >= item.get('quantity_expected', 0) else 'pending'
             
-            cursor.execute("""
-                UPDATE pending_shipment_items
-                SET quantity_verified = %s,
-                    verified_by = %s,
-                    verified_at = CURRENT_TIMESTAMP,
-                    status = %s
-                WHERE pending_item_id = %s
-            """, (new_quantity, employee_id, new_status, item['pending_item_id']))
+                cursor.execute("""
+                    UPDATE pending_shipment_items
+                    SET quantity_verified = %s,
+                        verified_by = %s,
+                        verified_at = CURRENT_TIMESTAMP,
+                        status = %s
+                    WHERE pending_item_id = %s
+                """, (new_quantity, employee_id, new_status, item['pending_item_id']))
+            
+                response = {
+                    'status': 'success',
+                    'item': item,
+                    'quantity_verified': new_quantity,
+                    'quantity_expected': item.get('quantity_expected', 0),
+                    'remaining': item.get('quantity_expected', 0) - new_quantity,
+                    'fully_verified': new_quantity >= item.get('quantity_expected', 0)
+                }
             
+                # Update session stats if session_id provided
+                if session_id:
+                    cursor.execute("""
+                        UPDATE verification_sessions
+                        SET total_scans = total_scans + 1,
+                            items_verified = items_verified + 1
+                        WHERE session_id = %s
+                    """, (session_id,))
+        else:
+            # Unknown item scanned
+            scan_result = 'mismatch'
             response = {
-                'status': 'success',
-                'item': item,
-                'quantity_verified': new_quantity,
-                'quantity_expected': item.get('quantity_expected', 0),
-                'remaining': item.get('quantity_expected', 0) - new_quantity,
-                'fully_verified': new_quantity >= item.get('quantity_expected', 0)
+                'status': 'unknown',
+                'message': 'Item not found in this shipment',
+                'barcode': barcode,
+                'suggest_issue': True
             }
-            
-            # Update session stats if session_id provided
-            if session_id:
-                cursor.execute("""
-                    UPDATE verification_sessions
-                    SET total_scans = total_scans + 1,
-                        items_verified = items_verified + 1
-                    WHERE session_id = %s
-                """, (session_id,))
-    else:
-        # Unknown item scanned
-        scan_result = 'mismatch'
-        response = {
-            'status': 'unknown',
-            'message': 'Item not found in this shipment',
-            'barcode': barcode,
-            'suggest_issue': True
-        }
     
-    # Log the scan
-    cursor.execute("""
-        INSERT INTO shipment_scan_log
-        (pending_shipment_id, pending_item_id, scanned_barcode, 
-         scanned_by, scan_result, device_id, location)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-    """, (pending_shipment_id, pending_item_id, barcode, employee_id, scan_result, device_id, location))
+        # Log the scan
+        cursor.execute("""
+            INSERT INTO shipment_scan_log
+            (pending_shipment_id, pending_item_id, scanned_barcode, 
+             scanned_by, scan_result, device_id, location)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (pending_shipment_id, pending_item_id, barcode, employee_id, scan_result, device_id, location))
     
-    conn.commit()
-    conn.close()
+        conn.commit()
+    finally:
+        conn.close()
     
     return response
 
@@ -9260,8 +8838,6 @@ def report_shipment_issue(pending_shipment_id: int, pending_item_id: Optional[in
     conn = get_connection()
     cursor = conn.cursor()
 
-    ensure_shipment_verification_tables(conn)
-    
     # Create issue record
     cursor.execute("""
         INSERT INTO shipment_issues
@@ -9573,6 +9149,7 @@ def complete_verification(pending_shipment_id: int, employee_id: int, notes: Opt
     
     conn = get_connection()
     cursor = conn.cursor()
+    metadata_queued = 0
     
     # Get establishment_id for product creation
     establishment_id = _get_or_create_default_establishment(conn)
@@ -9687,11 +9264,8 @@ def complete_verification(pending_shipment_id: int, employee_id: int, notes: Opt
             AND pm.metadata_id IS NULL
         """, (pending_shipment_id,))
         newly_matched_products = cursor.fetchall()
-        for product_row in newly_matched_products:
-            try:
-                extract_metadata_for_product(product_row['product_id'], auto_sync_category=True)
-            except Exception as e:
-                print(f"Warning: Metadata extraction failed for matched product {product_row['product_id']}: {e}")
+        # Jobs commit with this transaction
+        metadata_queued += enqueue_metadata_extraction([row['product_id'] for row in newly_matched_products], cursor=cursor)
     except Exception as e:
         print(f"Warning: Error checking metadata for matched products: {e}")
     
@@ -9763,8 +9337,8 @@ def complete_verification(pending_shipment_id: int, employee_id: int, notes: Opt
                     cursor.execute("SELECT metadata_id FROM product_metadata WHERE product_id = %s", (new_product_id,))
                     has_metadata = cursor.fetchone()
                     if not has_metadata:
-                        # Product exists but has no metadata - extract it
-                        extract_metadata_for_product(new_product_id, auto_sync_category=True)
+                        # Product exists but has no metadata - queue it with this transaction
+                        metadata_queued += enqueue_metadata_extraction(new_product_id, cursor=cursor)
                 except Exception as e:
                     print(f"Warning: Metadata check/extraction failed for existing product {new_product_id}: {e}")
             else:
@@ -9788,15 +9362,12 @@ def complete_verification(pending_shipment_id: int, employee_id: int, notes: Opt
                 
                 print(f"✓ Created new product {new_product_id} for SKU {sku} ({product_name})")
                 
-                # Automatically extract metadata and assign category with hierarchy
+                # Queue metadata extraction and category assignment; the product row is only
+                # visible to the worker once this transaction commits
                 try:
-                    extract_metadata_for_product(new_product_id, auto_sync_category=True)
-                    print(f"✓ Extracted metadata for new product {new_product_id} ({product_name})")
+                    metadata_queued += enqueue_metadata_extraction(new_product_id, cursor=cursor)
                 except Exception as e:
-                    print(f"⚠ Warning: Metadata extraction failed for product {new_product_id} (SKU: {sku}): {e}")
-                    import traceback
-                    traceback.print_exc()
-                    # Continue even if metadata extraction fails
+                    print(f"⚠ Warning: Could not queue metadata extraction for product {new_product_id} (SKU: {sku}): {e}")
             
             # Update pending_shipment_items with the new product_id
             cursor.execute("""
@@ -9935,6 +9506,8 @@ def complete_verification(pending_shipment_id: int, employee_id: int, notes: Opt
     
     conn.commit()
     conn.close()
+    if metadata_queued:
+        wake_metadata_worker()
     
     print(f"✓ Shipment {pending_shipment_id} completed successfully!")
     print(f"  - Approved shipment ID: {approved_shipment_id}")
@@ -9965,18 +9538,7 @@ def get_pending_shipments_with_progress(status: Optional[str] = None) -> List[Di
             pass  # Ignore if already rolled back or no transaction
         
         # Check if pending_shipments table exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'pending_shipments'
-            )
-        """)
-        table_exists = cursor.fetchone()
-        if isinstance(table_exists, dict):
-            table_exists = table_exists.get('exists', False)
-        else:
-            table_exists = table_exists[0] if table_exists else False
+        table_exists = has_table('pending_shipments')
         
         if not table_exists:
             # Table doesn't exist, return empty list
@@ -10217,12 +9779,7 @@ def create_shipment_from_document(
             pass
         
         # Check which columns exist
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'pending_shipments' AND table_schema = 'public'")
-        column_rows = cursor.fetchall()
-        if column_rows and isinstance(column_rows[0], dict):
-            columns = [row.get('column_name') for row in column_rows]
-        else:
-            columns = [row[0] for row in column_rows]
+        columns = table_columns('pending_shipments')
         
         # Build UPDATE query with only existing columns
         updates = []
@@ -10367,11 +9924,7 @@ def update_store_location_settings(
             ))
         else:
             # Only update extended columns if they exist (migration add_store_location_settings_extended may not have been run)
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = 'store_location_settings'
-            """)
-            existing_columns = {row[0] for row in cursor.fetchall()}
+            existing_columns = table_columns('store_location_settings')
 
             updates = []
             params = []
@@ -10495,26 +10048,6 @@ def get_customer_rewards_settings() -> Optional[Dict[str, Any]]:
     conn = get_connection()
     cursor = conn.cursor()
     
-    # Create table if it doesn't exist
-    cursor.execute("""
-            CREATE TABLE IF NOT EXISTS customer_rewards_settings (
-            id SERIAL PRIMARY KEY,
-            enabled INTEGER DEFAULT 0 CHECK(enabled IN (0, 1)),
-            require_email INTEGER DEFAULT 0 CHECK(require_email IN (0, 1)),
-            require_phone INTEGER DEFAULT 0 CHECK(require_phone IN (0, 1)),
-            require_both INTEGER DEFAULT 0 CHECK(require_both IN (0, 1)),
-            reward_type TEXT DEFAULT 'points' CHECK(reward_type IN ('points', 'percentage', 'fixed')),
-            points_per_dollar REAL DEFAULT 1.0 CHECK(points_per_dollar >= 0),
-            points_redemption_value REAL DEFAULT 0.01 CHECK(points_redemption_value >= 0),
-            percentage_discount REAL DEFAULT 0.0 CHECK(percentage_discount >= 0 AND percentage_discount <= 100),
-            fixed_discount REAL DEFAULT 0.0 CHECK(fixed_discount >= 0),
-            minimum_spend REAL DEFAULT 0.0 CHECK(minimum_spend >= 0),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    
     cursor.execute("""
         SELECT * FROM customer_rewards_settings 
         ORDER BY id DESC 
@@ -10579,47 +10112,10 @@ def update_customer_rewards_settings(**kwargs) -> bool:
     cursor = conn.cursor()
     
     try:
-        # Create table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS customer_rewards_settings (
-            id SERIAL PRIMARY KEY,
-                enabled INTEGER DEFAULT 0 CHECK(enabled IN (0, 1)),
-                require_email INTEGER DEFAULT 0 CHECK(require_email IN (0, 1)),
-                require_phone INTEGER DEFAULT 0 CHECK(require_phone IN (0, 1)),
-                require_both INTEGER DEFAULT 0 CHECK(require_both IN (0, 1)),
-                reward_type TEXT DEFAULT 'points' CHECK(reward_type IN ('points', 'percentage', 'fixed')),
-                points_per_dollar REAL DEFAULT 1.0 CHECK(points_per_dollar >= 0),
-                points_redemption_value REAL DEFAULT 0.01 CHECK(points_redemption_value >= 0),
-                percentage_discount REAL DEFAULT 0.0 CHECK(percentage_discount >= 0 AND percentage_discount <= 100),
-                fixed_discount REAL DEFAULT 0.0 CHECK(fixed_discount >= 0),
-                minimum_spend REAL DEFAULT 0.0 CHECK(minimum_spend >= 0),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        
-        # Ensure optional columns exist (some callers may send points_enabled, percentage_enabled, fixed_enabled)
-        for col, typ in [('points_enabled', 'INTEGER DEFAULT 1'), ('percentage_enabled', 'INTEGER DEFAULT 0'), ('fixed_enabled', 'INTEGER DEFAULT 0')]:
-            try:
-                cursor.execute(f"""
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'customer_rewards_settings' AND column_name = %s
-                """, (col,))
-                if cursor.fetchone() is None:
-                    cursor.execute(f"ALTER TABLE customer_rewards_settings ADD COLUMN {col} {typ}")
-                    conn.commit()
-            except Exception:
-                conn.rollback()
-        
         # Check if settings exist
         cursor.execute("SELECT COUNT(*) FROM customer_rewards_settings")
         count = cursor.fetchone()[0]
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'customer_rewards_settings'
-        """)
-        existing_cols = {r[0] for r in cursor.fetchall()}
+        existing_cols = table_columns('customer_rewards_settings')
         
         if count == 0:
             # Create new settings with defaults - only columns that exist in table
@@ -10650,11 +10146,7 @@ def update_customer_rewards_settings(**kwargs) -> bool:
             """, insert_values)
         else:
             # Update existing - only set columns that exist in the table (query schema)
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = 'customer_rewards_settings'
-            """)
-            existing_cols = {r[0] for r in cursor.fetchall()}
+            existing_cols = table_columns('customer_rewards_settings')
             allowed_fields = [f for f in SAFE_COLUMNS if f in kwargs and f in existing_cols]
             if not allowed_fields:
                 conn.commit()
@@ -10675,11 +10167,7 @@ def update_customer_rewards_settings(**kwargs) -> bool:
         if 'points_enabled' in err_msg or 'UndefinedColumn' in err_msg or 'does not exist' in err_msg:
             conn.rollback()
             try:
-                cursor.execute("""
-                    SELECT column_name FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'customer_rewards_settings'
-                """)
-                existing_cols = {r[0] for r in cursor.fetchall()}
+                existing_cols = table_columns('customer_rewards_settings')
                 base_only = [
                     'enabled', 'require_email', 'require_phone', 'require_both',
                     'reward_type', 'points_per_dollar', 'points_redemption_value',
@@ -10808,27 +10296,6 @@ def update_payment_settings(
     cursor = conn.cursor()
     
     try:
-        # Create payment_settings table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS payment_settings (
-                setting_id SERIAL PRIMARY KEY,
-                store_id INTEGER,
-                payment_processor TEXT DEFAULT 'cash_only',
-                stripe_account_id INTEGER,
-                stripe_credential_id INTEGER,
-                default_currency TEXT DEFAULT 'usd',
-                transaction_fee_rate REAL DEFAULT 0.029,
-                transaction_fee_fixed REAL DEFAULT 0.30,
-                enabled_payment_methods TEXT DEFAULT '["cash"]',
-                require_cvv INTEGER DEFAULT 1 CHECK(require_cvv IN (0, 1)),
-                require_zip INTEGER DEFAULT 0 CHECK(require_zip IN (0, 1)),
-                auto_capture INTEGER DEFAULT 1 CHECK(auto_capture IN (0, 1)),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        
         # Check if settings exist
         if store_id:
             cursor.execute("SELECT COUNT(*) FROM payment_settings WHERE store_id = %s", (store_id,))
@@ -11222,14 +10689,7 @@ def get_onboarding_status() -> Dict[str, Any]:
         cursor = conn.cursor()
         
         # Check if table exists (PostgreSQL)
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'store_setup'
-            )
-        """)
-        table_exists = cursor.fetchone()[0]
+        table_exists = has_table('store_setup')
         
         if not table_exists:
             # Table doesn't exist - onboarding not started
@@ -11299,19 +10759,6 @@ def update_onboarding_step(step: int) -> bool:
     cursor = conn.cursor()
     
     try:
-        # Create store_setup table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS store_setup (
-                setup_id SERIAL PRIMARY KEY,
-                setup_completed INTEGER DEFAULT 0 CHECK(setup_completed IN (0, 1)),
-                setup_step INTEGER DEFAULT 1,
-                completed_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        
         cursor.execute("SELECT COUNT(*) FROM store_setup")
         count = cursor.fetchone()[0]
         
@@ -11351,19 +10798,6 @@ def complete_onboarding() -> bool:
     cursor = conn.cursor()
     
     try:
-        # Create store_setup table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS store_setup (
-                setup_id SERIAL PRIMARY KEY,
-                setup_completed INTEGER DEFAULT 0 CHECK(setup_completed IN (0, 1)),
-                setup_step INTEGER DEFAULT 1,
-                completed_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        
         # Check if store_setup table exists and has rows
         cursor.execute("SELECT COUNT(*) FROM store_setup")
         count = cursor.fetchone()[0]
@@ -11408,21 +10842,6 @@ def save_onboarding_progress(step_name: str, data: Optional[Dict[str, Any]] = No
     cursor = conn.cursor()
     
     try:
-        # Create onboarding_progress table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS onboarding_progress (
-                progress_id SERIAL PRIMARY KEY,
-                step_name TEXT NOT NULL,
-                completed INTEGER DEFAULT 0,
-                data TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(step_name)
-            )
-        """)
-        conn.commit()
-        
         # Check if progress exists
         cursor.execute("""
             SELECT progress_id FROM onboarding_progress 
@@ -12816,11 +12235,7 @@ def get_employee_activity_summary(
                     out['by_employee'][eid]['returns']['total_amount'] = float(row['total_amt'] or 0)
             # Exchanges: count where exchange_transaction_id IS NOT NULL (if column exists)
             try:
-                cursor.execute("""
-                    SELECT column_name FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'pending_returns' AND column_name = 'exchange_transaction_id'
-                """)
-                has_exchange_col = cursor.fetchone() is not None
+                has_exchange_col = has_column('pending_returns', 'exchange_transaction_id')
                 if has_exchange_col:
                     cursor.execute("""
                         SELECT employee_id,
@@ -13177,11 +12592,7 @@ def get_employee_activity_detail(
                 ret_date += " AND COALESCE(pr.approved_date, pr.return_date)::date <= %s"
                 ret_params.append(end_date)
             try:
-                cursor.execute("""
-                    SELECT column_name FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'pending_returns' AND column_name = 'exchange_transaction_id'
-                """)
-                has_exc = cursor.fetchone() is not None
+                has_exc = has_column('pending_returns', 'exchange_transaction_id')
             except Exception:
                 has_exc = False
             if has_exc:
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Database Migration Runner
-Executes SQL migration files in order to set up the accounting database
+Executes SQL migration files in order to set up the accounting database,
+then applies the versioned POS schema bootstrap (schema_bootstrap.py)
 """
 
 import os
@@ -121,6 +122,14 @@ def run_migration():
                     print(f"   File: {file_path}")
                     raise
         
+        # Versioned bootstrap for tables the app used to create from request handlers
+        from schema_bootstrap import run_schema_bootstrap, LATEST_VERSION
+        print("📄 Running schema bootstrap")
+        version = run_schema_bootstrap(conn, verbose=True)
+        if version < LATEST_VERSION:
+            raise RuntimeError(f"Schema bootstrap stopped at v{version} (latest v{LATEST_VERSION})")
+        print(f"✅ Schema bootstrap at v{version}\n")
+        
         print("🎉 All migrations completed successfully!")
         
     except Exception as e:
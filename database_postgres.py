@@ -7,12 +7,17 @@ Uses a connection pool so each request reuses connections (faster for remote DBs
 
 import os
 import atexit
-from typing import Optional
+import logging
+import time
+import traceback
+from typing import Optional, Dict, Any
 import psycopg2
 from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 import threading
 
+logger = logging.getLogger(__name__)
+
 # Connection pool (lazily created)
 _pg_pool: Optional[pool.ThreadedConnectionPool] = None
 _pool_lock = threading.Lock()
@@ -34,20 +39,94 @@ _default_pool_max = 25 if _is_local_db else 3
 POOL_MIN_CONN = int(os.getenv('DB_POOL_MIN', '1'))
 POOL_MAX_CONN = int(os.getenv('DB_POOL_MAX', str(_default_pool_max)))
 
+# Leak detector: log the acquiring stack of any connection held longer than this (0 = off).
+# Capturing stacks costs a little per checkout, so leave it off unless chasing pool exhaustion.
+LEAK_DETECT_SECONDS = float(os.getenv('DB_LEAK_DETECT_SECONDS', '0') or 0)
+
+
+class _PoolStats:
+    """Checkout/hold counters for the connection pool (exposed via get_pool_stats)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active: Dict[int, '_PooledConnectionWrapper'] = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.returns = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.hold_total = 0.0
+            self.hold_max = 0.0
+            self.peak_in_use = 0
+            self.request_reuses = 0
+            self.leak_warnings = 0
+            self.last_failure: Optional[str] = None
+
+    def record_checkout(self, wait: float, wrapper: '_PooledConnectionWrapper'):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            if wait > self.wait_max:
+                self.wait_max = wait
+            self.active[id(wrapper)] = wrapper
+            if len(self.active) > self.peak_in_use:
+                self.peak_in_use = len(self.active)
+
+    def record_failure(self, wait: float, error: Exception):
+        with self._lock:
+            self.checkout_failures += 1
+            self.wait_total += wait
+            self.last_failure = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {error}"
+        logger.warning("DB pool checkout failed after %.1fms (%d in use): %s",
+                       wait * 1000, len(self.active), error)
+
+    def record_request_reuse(self):
+        with self._lock:
+            self.request_reuses += 1
+
+    def record_return(self, wrapper: '_PooledConnectionWrapper'):
+        held = time.monotonic() - wrapper._acquired_at
+        with self._lock:
+            self.returns += 1
+            self.hold_total += held
+            if held > self.hold_max:
+                self.hold_max = held
+            self.active.pop(id(wrapper), None)
+
+    def held_connections(self):
+        """Currently checked-out connections, longest-held first."""
+        now = time.monotonic()
+        with self._lock:
+            items = list(self.active.values())
+        return sorted(((now - w._acquired_at, w) for w in items), key=lambda t: -t[0])
+
+
+_pool_stats = _PoolStats()
+
 
 class _PooledConnectionWrapper:
     """Wraps a pooled connection so .close() returns it to the pool instead of closing."""
-    __slots__ = ('_pool', '_conn', '_returned')
+    __slots__ = ('_pool', '_conn', '_returned', '_acquired_at', '_thread', '_stack', '_leak_logged')
 
     def __init__(self, pg_pool: pool.ThreadedConnectionPool, conn):
         self._pool = pg_pool
         self._conn = conn
         self._returned = False
+        self._acquired_at = time.monotonic()
+        self._thread = threading.current_thread().name
+        # Drop this frame and _checkout_connection from the recorded stack
+        self._stack = traceback.format_stack()[:-2] if LEAK_DETECT_SECONDS > 0 else None
+        self._leak_logged = False
 
     def close(self):
         if self._returned:
             return
         self._returned = True
+        _pool_stats.record_return(self)
         try:
             self._conn.rollback()
         except Exception:
@@ -97,26 +176,224 @@ def _get_pool() -> pool.ThreadedConnectionPool:
                 f"Failed to create database pool: {str(e)}. "
                 "Check your database connection settings (DATABASE_URL or DB_* variables)."
             ) from e
+        if LEAK_DETECT_SECONDS > 0:
+            _start_leak_detector()
         return _pg_pool
 
 
-def get_connection():
-    """
-    Get a connection from the pool. Call conn.close() when done; the connection
-    is returned to the pool for reuse (faster for remote DBs like Supabase).
-    """
+def _checkout_connection() -> _PooledConnectionWrapper:
     p = _get_pool()
+    started = time.monotonic()
     try:
         conn = p.getconn()
         conn.set_session(autocommit=False)
-        return _PooledConnectionWrapper(p, conn)
+        wrapper = _PooledConnectionWrapper(p, conn)
+        _pool_stats.record_checkout(time.monotonic() - started, wrapper)
+        return wrapper
     except Exception as e:
+        _pool_stats.record_failure(time.monotonic() - started, e)
         raise ConnectionError(
             f"Failed to connect to PostgreSQL: {str(e)}. "
             "Check your database connection settings (DATABASE_URL or DB_* variables)."
         ) from e
 
 
+# ---------------------------------------------------------------------------
+# Request-scoped connection (Flask)
+# Inside a request, the first get_connection() checks a connection out of the
+# pool and binds it to flask.g; later get_connection() calls in the same request
+# reuse it once the previous user has closed it. Nested use (a caller still holds
+# it open) gets a separate pooled connection, so transactions never interleave.
+# teardown_request returns the bound connection to the pool.
+# ---------------------------------------------------------------------------
+
+_request_scope_enabled = False
+_REQUEST_CONN_ATTR = '_pos_request_db_conn'
+
+
+class _RequestConnection:
+    """Pooled connection bound to one Flask request."""
+    __slots__ = ('pooled', 'leased', 'uses')
+
+    def __init__(self, pooled: _PooledConnectionWrapper):
+        self.pooled = pooled
+        self.leased = False
+        self.uses = 0
+
+
+class _RequestConnectionHandle:
+    """What callers get inside a request. .close() rolls back and frees the
+    request connection for the next caller instead of returning it to the pool."""
+    __slots__ = ('_state', '_released')
+
+    def __init__(self, state: _RequestConnection):
+        self._state = state
+        self._released = False
+        state.leased = True
+        state.uses += 1
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        try:
+            self._state.pooled._conn.rollback()
+        except Exception:
+            pass
+        self._state.leased = False
+
+    @property
+    def closed(self):
+        return self._released or self._state.pooled.closed
+
+    def __getattr__(self, name):
+        if self._released:
+            raise psycopg2.InterfaceError("connection already closed")
+        return getattr(self._state.pooled._conn, name)
+
+
+def init_request_connection_scope(app) -> None:
+    """Enable per-request connection reuse for a Flask app (call once at startup)."""
+    global _request_scope_enabled
+    app.teardown_request(release_request_connection)
+    _request_scope_enabled = True
+
+
+def release_request_connection(exc=None) -> None:
+    """teardown_request hook: return the request's bound connection to the pool."""
+    from flask import g
+    state = g.pop(_REQUEST_CONN_ATTR, None)
+    if state is not None:
+        state.leased = False
+        state.pooled.close()
+
+
+def _get_request_connection():
+    """Leased request connection, or None when not in a request / already in use."""
+    from flask import g, has_request_context
+    if not has_request_context():
+        return None
+    state = g.get(_REQUEST_CONN_ATTR)
+    if state is not None and state.pooled.closed:
+        # Broken (server closed it) - drop it and bind a fresh one
+        state.pooled.close()
+        state = None
+    if state is None:
+        state = _RequestConnection(_checkout_connection())
+        setattr(g, _REQUEST_CONN_ATTR, state)
+    elif state.leased:
+        return None
+    else:
+        try:
+            state.pooled._conn.set_session(autocommit=False)
+        except Exception:
+            pass
+        _pool_stats.record_request_reuse()
+    return _RequestConnectionHandle(state)
+
+
+def get_connection():
+    """
+    Get a connection from the pool. Call conn.close() when done; the connection
+    is returned to the pool for reuse (faster for remote DBs like Supabase).
+    Inside a Flask request (after init_request_connection_scope) sequential calls
+    share one pooled connection for the whole request.
+    """
+    if _request_scope_enabled:
+        handle = _get_request_connection()
+        if handle is not None:
+            return handle
+    return _checkout_connection()
+
+
+# ---------------------------------------------------------------------------
+# Pool telemetry / leak detection
+# ---------------------------------------------------------------------------
+
+_leak_thread: Optional[threading.Thread] = None
+
+
+def _check_for_leaks(threshold: float) -> int:
+    """Log (once per checkout) every connection held longer than threshold seconds."""
+    logged = 0
+    for held, wrapper in _pool_stats.held_connections():
+        if held < threshold:
+            break
+        if wrapper._leak_logged:
+            continue
+        wrapper._leak_logged = True
+        _pool_stats.leak_warnings += 1
+        logged += 1
+        logger.warning(
+            "DB connection held for %.1fs by thread %s (possible leak). Acquired at:\n%s",
+            held, wrapper._thread, ''.join(wrapper._stack or ['  (stack not captured)\n'])
+        )
+    return logged
+
+
+def _leak_detector_loop(threshold: float):
+    interval = max(1.0, threshold / 2)
+    while True:
+        time.sleep(interval)
+        try:
+            _check_for_leaks(threshold)
+        except Exception as e:
+            logger.debug("Leak detector check failed: %s", e)
+
+
+def _start_leak_detector():
+    global _leak_thread
+    if _leak_thread is not None:
+        return
+    _leak_thread = threading.Thread(
+        target=_leak_detector_loop, args=(LEAK_DETECT_SECONDS,),
+        name='db-leak-detector', daemon=True
+    )
+    _leak_thread.start()
+
+
+def get_pool_stats(include_stacks: bool = False, top: int = 5) -> Dict[str, Any]:
+    """Pool pressure snapshot: sizes, checkout wait, hold time, failures, longest-held connections."""
+    s = _pool_stats
+    p = _pg_pool
+    idle = in_use = None
+    if p is not None:
+        # ThreadedConnectionPool keeps idle connections in _pool and checked-out ones in _used
+        idle = len(getattr(p, '_pool', []))
+        in_use = len(getattr(p, '_used', {}))
+    held = []
+    for seconds, wrapper in s.held_connections()[:top]:
+        entry = {'held_seconds': round(seconds, 3), 'thread': wrapper._thread}
+        if include_stacks and wrapper._stack:
+            entry['stack'] = ''.join(wrapper._stack[-8:])
+        held.append(entry)
+    return {
+        'pool_created': p is not None,
+        'min_conn': POOL_MIN_CONN,
+        'max_conn': POOL_MAX_CONN,
+        'in_use': in_use if in_use is not None else len(s.active),
+        'idle': idle,
+        'peak_in_use': s.peak_in_use,
+        'checkouts': s.checkouts,
+        'returns': s.returns,
+        'checkout_failures': s.checkout_failures,
+        'last_failure': s.last_failure,
+        'request_reuses': s.request_reuses,
+        'avg_wait_ms': round(s.wait_total / max(1, s.checkouts + s.checkout_failures) * 1000, 3),
+        'max_wait_ms': round(s.wait_max * 1000, 3),
+        'avg_hold_ms': round(s.hold_total / max(1, s.returns) * 1000, 3),
+        'max_hold_ms': round(s.hold_max * 1000, 3),
+        'leak_detect_seconds': LEAK_DETECT_SECONDS,
+        'leak_warnings': s.leak_warnings,
+        'longest_held': held,
+    }
+
+
+def reset_pool_stats():
+    """Zero the counters (currently checked-out connections stay tracked)."""
+    _pool_stats.reset()
+
+
 class _PooledCursorWrapper:
     """Wraps a cursor so closing it also returns the connection to the pool."""
     __slots__ = ('_conn', '_cursor', '_closed')
@@ -151,6 +428,13 @@ def get_cursor():
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     return _PooledCursorWrapper(conn, cursor)
 
+
+def get_dedicated_connection(autocommit: bool = True):
+    """Unpooled connection for long-lived work (LISTEN loops); caller must close it."""
+    conn = psycopg2.connect(_build_connection_string())
+    conn.autocommit = autocommit
+    return conn
+
 def close_connection():
     """Close the connection pool (all connections)."""
     global _pg_pool
@@ -168,6 +452,30 @@ def reset_connection():
     close_connection()
 
 
+# Pools inherited across fork(). Their sockets belong to the parent: closing them
+# (or letting them be garbage-collected, which also closes) would send Terminate
+# on the parent's sessions, so the child keeps them referenced and never uses them.
+_inherited_pools = []
+
+
+def reset_pool_after_fork():
+    """
+    Call first thing in a forked child (e.g. a multiprocessing.Pool initializer).
+    Drops the parent's pool without closing its connections; the next
+    get_connection() opens a pool owned by this process.
+    """
+    global _pg_pool, _pool_lock, _pool_stats, _leak_thread, _request_scope_enabled
+    if _pg_pool is not None:
+        _inherited_pools.append(_pg_pool)
+    _pg_pool = None
+    # The parent may have held these locks mid-checkout when it forked
+    _pool_lock = threading.Lock()
+    _pool_stats = _PoolStats()
+    # Threads don't survive fork; let _get_pool() start a new detector
+    _leak_thread = None
+    _request_scope_enabled = False
+
+
 def _close_pool_on_exit():
     """Ensure pool is closed when the process exits."""
     close_connection()
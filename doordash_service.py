@@ -146,32 +146,16 @@ def build_doordash_menu_pull_response(
     """
     from database import get_connection
     from psycopg2.extras import RealDictCursor
+    from schema_registry import has_table, has_column, table_columns
 
     conn = get_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     has_item_special_hours = False
     try:
-        cur.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'item_special_hours'
-        """)
-        has_item_special_hours = cur.fetchone() is not None
-        cur.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'photo'
-        """)
-        has_photo = cur.fetchone() is not None
-        cur.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'doordash_operation_context'
-        """)
-        has_operation_context = cur.fetchone() is not None
-        cur.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'inventory'
-            AND column_name IN ('doordash_calorific_display_type', 'doordash_calorific_lower_range', 'doordash_calorific_higher_range', 'doordash_classification_tags')
-        """)
-        nutrition_cols = {row["column_name"] for row in cur.fetchall()}
+        has_item_special_hours = has_column('inventory', 'item_special_hours')
+        has_photo = has_column('inventory', 'photo')
+        has_operation_context = has_column('inventory', 'doordash_operation_context')
+        nutrition_cols = table_columns('inventory')
         cols = "product_id, product_name, sku, product_price, category"
         if has_item_special_hours:
             cols += ", item_special_hours"
@@ -192,28 +176,10 @@ def build_doordash_menu_pull_response(
         product_ids = [r["product_id"] for r in rows]
         variants_by_product: Dict[int, List[Dict]] = {}
         if product_ids:
-            cur.execute("""
-                SELECT 1 FROM information_schema.tables
-                WHERE table_schema = 'public' AND table_name = 'product_variants'
-            """)
-            if cur.fetchone():
-                cur.execute("""
-                    SELECT column_name FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'product_variants' AND column_name = 'photo'
-                """)
-                has_variant_photo = cur.fetchone() is not None
-                cur.execute("""
-                    SELECT column_name FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'product_variants'
-                    AND column_name IN ('doordash_default_quantity', 'doordash_charge_above', 'doordash_recipe_default')
-                """)
-                recipe_cols = {row["column_name"] for row in cur.fetchall()}
-                cur.execute("""
-                    SELECT column_name FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'product_variants'
-                    AND column_name IN ('doordash_calorific_display_type', 'doordash_calorific_lower_range', 'doordash_calorific_higher_range', 'doordash_classification_tags')
-                """)
-                variant_nutrition_cols = {row["column_name"] for row in cur.fetchall()}
+            if has_table('product_variants'):
+                has_variant_photo = has_column('product_variants', 'photo')
+                recipe_cols = table_columns('product_variants')
+                variant_nutrition_cols = table_columns('product_variants')
                 vcols = "variant_id, product_id, variant_name, price, sort_order"
                 if has_variant_photo:
                     vcols += ", photo"
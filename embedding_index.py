@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+In-memory nearest-neighbour index over L2-normalized embeddings.
+Vectors live in one contiguous float32 matrix with a parallel id array, so a
+query is a single matrix-vector product (matrix-matrix for a batch) followed
+by argpartition top-k instead of a Python loop over every item. Rows are
+added/replaced/removed in place; the matrix grows by doubling. An index can
+also wrap a read-only (e.g. memory-mapped) matrix, which is copied on the
+first write.
+"""
+
+import threading
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Query rows per matrix-matrix product in search_many (bounds the score matrix)
+SEARCH_CHUNK_ROWS = 256
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """float32 copy of vectors with each row scaled to unit length (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores along the last axis, best first."""
+    n = scores.shape[-1]
+    if k >= n:
+        return np.argsort(-scores, axis=-1, kind='stable')
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1, kind='stable')
+    return np.take_along_axis(part, order, axis=-1)
+
+
+class EmbeddingIndex:
+    """Cosine-similarity index: contiguous normalized float32 rows + parallel ids."""
+
+    def __init__(self, dim: Optional[int] = None, capacity: int = 1024):
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32) if dim else None
+        self._ids: List[Hashable] = []
+        self._rows: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, item_id) -> bool:
+        return item_id in self._rows
+
+    @property
+    def ids(self) -> List[Hashable]:
+        return list(self._ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The live rows (a view; don't mutate)."""
+        if self._matrix is None:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:len(self._ids)]
+
+    def _reserve(self, rows: int) -> None:
+        if self._matrix is None:
+            self._matrix = np.zeros((max(rows, 1024), self.dim), dtype=np.float32)
+        elif rows > self._matrix.shape[0] or not self._matrix.flags.writeable:
+            capacity = self._matrix.shape[0]
+            if rows > capacity:
+                capacity = max(rows, capacity * 2)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+            self._matrix = grown
+
+    def add_many(self, item_ids: Sequence[Hashable], vectors: np.ndarray) -> None:
+        """Insert or replace rows (vectors are normalized here)."""
+        vectors = normalize_rows(vectors)
+        if len(item_ids) != vectors.shape[0]:
+            raise ValueError("item_ids and vectors differ in length")
+        if not len(item_ids):
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, index has {self.dim}")
+            new_count = len(self._ids) + sum(1 for item_id in set(item_ids) if item_id not in self._rows)
+            self._reserve(new_count)
+            for item_id, vector in zip(item_ids, vectors):
+                row = self._rows.get(item_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._ids.append(item_id)
+                    self._rows[item_id] = row
+                self._matrix[row] = vector
+
+    def add(self, item_id: Hashable, vector: np.ndarray) -> None:
+        self.add_many([item_id], vector)
+
+    def remove(self, item_id: Hashable) -> bool:
+        """Drop a row by moving the last row into its slot."""
+        with self._lock:
+            row = self._rows.pop(item_id, None)
+            if row is None:
+                return False
+            self._reserve(len(self._ids))
+            last = len(self._ids) - 1
+            if row != last:
+                moved_id = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved_id
+                self._rows[moved_id] = row
+            self._ids.pop()
+            return True
+
+    def get(self, item_id: Hashable) -> Optional[np.ndarray]:
+        row = self._rows.get(item_id)
+        return None if row is None else self._matrix[row].copy()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids = []
+            self._rows = {}
+
+    def search_many(self, vectors: np.ndarray, top_k: int = 1,
+                    threshold: Optional[float] = None) -> List[List[Tuple[Hashable, float]]]:
+        """Best (id, cosine similarity) pairs per query row, best first."""
+        queries = normalize_rows(vectors)
+        # Held for the products too: remove() moves rows in place
+        with self._lock:
+            count = len(self._ids)
+            if not count or top_k <= 0:
+                return [[] for _ in range(queries.shape[0])]
+            matrix = self._matrix[:count]
+            ids = self._ids
+            k = min(top_k, count)
+            results: List[List[Tuple[Hashable, float]]] = []
+            for start in range(0, queries.shape[0], SEARCH_CHUNK_ROWS):
+                scores = queries[start:start + SEARCH_CHUNK_ROWS] @ matrix.T
+                best = _top_k(scores, k)
+                best_scores = np.take_along_axis(scores, best, axis=1)
+                for row_idx, row_scores in zip(best, best_scores):
+                    results.append([
+                        (ids[i], float(s)) for i, s in zip(row_idx, row_scores)
+                        if threshold is None or s >= threshold
+                    ])
+            return results
+
+    def search(self, vector: np.ndarray, top_k: int = 5,
+               threshold: Optional[float] = None) -> List[Tuple[Hashable, float]]:
+        return self.search_many(vector, top_k=top_k, threshold=threshold)[0]
+
+    @classmethod
+    def from_arrays(cls, item_ids: Iterable[Hashable], vectors: np.ndarray) -> 'EmbeddingIndex':
+        item_ids = list(item_ids)
+        if not item_ids:
+            return cls()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        index = cls(dim=vectors.shape[1], capacity=max(len(item_ids), 1024))
+        index.add_many(item_ids, vectors)
+        return index
+
+    @classmethod
+    def from_normalized(cls, item_ids: Iterable[Hashable], matrix: np.ndarray) -> 'EmbeddingIndex':
+        """Adopt an already-normalized float32 matrix without copying it (e.g. np.load(mmap_mode='r'))."""
+        item_ids = list(item_ids)
+        if matrix.ndim != 2 or matrix.shape[0] != len(item_ids) or matrix.dtype != np.float32:
+            raise ValueError("matrix must be float32 with one row per id")
+        if not item_ids:
+            return cls(dim=matrix.shape[1] or None)
+        index = cls(capacity=0)
+        index.dim = matrix.shape[1]
+        index._matrix = matrix
+        index._ids = item_ids
+        index._rows = {item_id: row for row, item_id in enumerate(item_ids)}
+        if len(index._rows) != len(item_ids):
+            raise ValueError("duplicate ids")
+        return index
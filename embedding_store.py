@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Compact storage for image embeddings.
+In Postgres an embedding is its raw little-endian float32 bytes, with the
+dimension and the model version that produced it kept in their own columns
+(product_image_embeddings.dim / .model_version), so rows decode with
+np.frombuffer instead of unpickling and rows from another model can be told
+apart and re-embedded.
+
+On disk a snapshot is a .npy matrix (opened with mmap, so worker processes
+share the page cache instead of each holding a copy) plus a .idx JSON file
+naming that matrix and holding the ids, per-product metadata (stored as
+columns and read lazily, so loading doesn't build a dict per product) and a
+header (format, model version, dim, database stamp). The .idx file is replaced
+atomically and points at a uniquely named .npy, so a reader never pairs an
+index with the wrong matrix.
+"""
+
+import io
+import json
+import logging
+import os
+import pickle
+import tempfile
+import uuid
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+
+def encode_embedding(embedding: np.ndarray) -> bytes:
+    """Raw float32 bytes for the embedding column."""
+    return np.ascontiguousarray(embedding, dtype=EMBEDDING_DTYPE).ravel().tobytes()
+
+
+def decode_embedding(blob, dim: int) -> np.ndarray:
+    """Inverse of encode_embedding; checks the length against dim."""
+    vector = np.frombuffer(bytes(blob), dtype=EMBEDDING_DTYPE)
+    if vector.shape[0] != dim:
+        raise ValueError(f"Embedding has {vector.shape[0]} values, header says {dim}")
+    return vector
+
+
+class _NumpyArrayUnpickler(pickle.Unpickler):
+    """Only lets through what a pickled numpy array needs."""
+
+    _ALLOWED = {
+        ('numpy.core.multiarray', '_reconstruct'),
+        ('numpy._core.multiarray', '_reconstruct'),
+        ('numpy', 'ndarray'),
+        ('numpy', 'dtype'),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) in self._ALLOWED:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from an embedding blob")
+
+
+def decode_legacy_embedding(blob) -> np.ndarray:
+    """Read a row written before the raw format (a pickled numpy array)."""
+    vector = _NumpyArrayUnpickler(io.BytesIO(bytes(blob))).load()
+    if not isinstance(vector, np.ndarray):
+        raise ValueError("Legacy embedding blob is not an array")
+    return np.asarray(vector, dtype=np.float32).ravel()
+
+
+class SnapshotMetadata(Mapping):
+    """Read-only product_id -> metadata dict over a snapshot's metadata columns."""
+
+    def __init__(self, ids: List[int], columns: Dict[str, List[Any]]):
+        self._rows = {product_id: row for row, product_id in enumerate(ids)}
+        self._columns = columns
+
+    def __getitem__(self, product_id) -> Dict[str, Any]:
+        row = self._rows[product_id]
+        return {name: values[row] for name, values in self._columns.items()}
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def _matrix_prefix(path: str) -> str:
+    return os.path.basename(path) + '.'
+
+
+def save_snapshot(path: str, ids: List[int], matrix: np.ndarray,
+                  metadata: Mapping, header: Dict[str, Any]) -> None:
+    """Write path.<token>.npy and then atomically replace path.idx."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    matrix_name = f"{_matrix_prefix(path)}{uuid.uuid4().hex[:12]}.npy"
+    matrix_path = os.path.join(directory, matrix_name)
+    np.save(matrix_path, np.ascontiguousarray(matrix, dtype=EMBEDDING_DTYPE))
+
+    rows = [metadata.get(product_id) or {} for product_id in ids]
+    fields = list(dict.fromkeys(name for row in rows for name in row))
+    document = dict(header)
+    document.update({
+        'format': SNAPSHOT_FORMAT,
+        'matrix': matrix_name,
+        'count': len(ids),
+        'ids': [int(product_id) for product_id in ids],
+        'metadata': {name: [row.get(name) for row in rows] for name in fields},
+    })
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.embeddings-', suffix='.idx')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(document, f, separators=(',', ':'))
+        os.replace(tmp_path, path + '.idx')
+    except Exception:
+        for leftover in (tmp_path, matrix_path):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+        raise
+
+    # Older matrices; a process that still maps one keeps its pages after the unlink
+    for name in os.listdir(directory):
+        if name.startswith(_matrix_prefix(path)) and name.endswith('.npy') and name != matrix_name:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def load_snapshot(path: str) -> Optional[Tuple[List[int], np.ndarray, SnapshotMetadata, Dict[str, Any]]]:
+    """(ids, read-only mmap matrix, metadata, header), or None if missing or unreadable."""
+    try:
+        with open(path + '.idx') as f:
+            document = json.load(f)
+        if document.get('format') != SNAPSHOT_FORMAT:
+            return None
+        matrix_path = os.path.join(os.path.dirname(os.path.abspath(path)), document['matrix'])
+        matrix = np.load(matrix_path, mmap_mode='r')
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Ignoring unreadable embedding snapshot %s: %s", path, e)
+        return None
+    ids = document.pop('ids')
+    metadata = SnapshotMetadata(ids, document.pop('metadata'))
+    if matrix.ndim != 2 or matrix.shape[0] != len(ids) or matrix.dtype != EMBEDDING_DTYPE:
+        logger.warning("Embedding snapshot %s does not match its index; ignoring it", path)
+        return None
+    return ids, matrix, metadata, document
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+In-process index of registered employee face descriptors.
+Holds one normalized float32 row per active employee (face-api.js 128-value
+descriptors) in an EmbeddingIndex, so /api/face/identify and /api/face/clock
+are one matrix-vector product plus top-k with no database round trip.
+
+Writes made by this process (registration, employee update/deactivation/
+deletion) call refresh_employee() after commit and re-read just that employee.
+Writes from other processes are picked up by comparing a cheap stamp (face row
+count and newest updated_at of faces and employees), checked at most every
+FACE_INDEX_CHECK_SECONDS; a change reloads the whole index.
+
+Descriptors are stored as raw float32 bytes in employee_face_encodings.descriptor.
+Rows still holding the old JSON text in face_descriptor are converted on load.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_index import EmbeddingIndex
+from embedding_store import decode_embedding, encode_embedding
+
+logger = logging.getLogger(__name__)
+
+FACE_DESCRIPTOR_DIM = 128
+DEFAULT_FACE_THRESHOLD = 0.6
+FACE_INDEX_CHECK_SECONDS = float(os.getenv('FACE_INDEX_CHECK_SECONDS', '5') or 0)
+
+_EMPLOYEE_FIELDS = ('first_name', 'last_name', 'employee_code', 'position')
+
+
+def parse_descriptor(values) -> Optional[np.ndarray]:
+    """float32 vector for a request's face_descriptor, or None if it isn't 128 finite numbers."""
+    if not isinstance(values, list) or len(values) != FACE_DESCRIPTOR_DIM:
+        return None
+    try:
+        vector = np.asarray(values, dtype=np.float32)
+    except (TypeError, ValueError):
+        return None
+    if vector.ndim != 1 or not np.all(np.isfinite(vector)):
+        return None
+    return vector
+
+
+def encode_descriptor(vector: np.ndarray) -> bytes:
+    return encode_embedding(vector)
+
+
+class FaceDescriptorIndex:
+    """Active employees' face descriptors plus the employee fields the kiosk shows."""
+
+    def __init__(self, check_seconds: float = FACE_INDEX_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._lock = threading.RLock()
+        self._index = EmbeddingIndex(dim=FACE_DESCRIPTOR_DIM, capacity=256)
+        self._employees: Dict[int, Dict[str, Any]] = {}
+        self._loaded = False
+        self._stamp: Optional[tuple] = None
+        self._checked_at = 0.0
+        self._full_loads = 0
+        self._refreshes = 0
+
+    # -- loading -----------------------------------------------------------
+
+    def _read_stamp(self, cursor) -> tuple:
+        cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM employee_face_encodings) AS faces,
+                (SELECT MAX(updated_at) FROM employee_face_encodings) AS faces_updated,
+                (SELECT MAX(updated_at) FROM employees) AS employees_updated
+        """)
+        row = cursor.fetchone()
+        return (row['faces'], row['faces_updated'], row['employees_updated'])
+
+    def _ensure_fresh(self) -> None:
+        if self._loaded and time.monotonic() - self._checked_at < self.check_seconds:
+            return
+        from psycopg2.extras import RealDictCursor
+        from database_postgres import get_connection
+        with self._lock:
+            if self._loaded and time.monotonic() - self._checked_at < self.check_seconds:
+                return
+            conn = get_connection()
+            try:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                stamp = self._read_stamp(cursor)
+                if not self._loaded or stamp != self._stamp:
+                    self._load_all(cursor)
+                    # Converting legacy rows doesn't touch updated_at, so the stamp still holds
+                    self._stamp = stamp
+                conn.commit()
+                self._checked_at = time.monotonic()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    def _select_rows(self, cursor, employee_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        query = """
+            SELECT efe.employee_id, efe.descriptor, efe.face_descriptor,
+                   e.first_name, e.last_name, e.employee_code, e.position
+            FROM employee_face_encodings efe
+            JOIN employees e ON efe.employee_id = e.employee_id
+            WHERE e.active = 1
+        """
+        params = None
+        if employee_id is not None:
+            query += " AND efe.employee_id = %s"
+            params = (employee_id,)
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+    def _decode_rows(self, cursor, rows) -> Tuple[List[int], List[np.ndarray], Dict[int, Dict[str, Any]]]:
+        ids, vectors, employees, legacy = [], [], {}, []
+        for row in rows:
+            try:
+                if row['descriptor'] is not None:
+                    vector = decode_embedding(row['descriptor'], FACE_DESCRIPTOR_DIM)
+                else:
+                    vector = parse_descriptor(json.loads(row['face_descriptor'] or 'null'))
+                    if vector is None:
+                        raise ValueError("invalid JSON descriptor")
+                    legacy.append((encode_descriptor(vector), row['employee_id']))
+            except Exception as e:
+                logger.warning("Skipping face descriptor of employee %s: %s", row['employee_id'], e)
+                continue
+            ids.append(row['employee_id'])
+            vectors.append(vector)
+            employees[row['employee_id']] = {field: row[field] for field in _EMPLOYEE_FIELDS}
+        if legacy:
+            cursor.executemany("""
+                UPDATE employee_face_encodings SET descriptor = %s, face_descriptor = NULL
+                WHERE employee_id = %s
+            """, legacy)
+        return ids, vectors, employees
+
+    def _load_all(self, cursor) -> None:
+        ids, vectors, employees = self._decode_rows(cursor, self._select_rows(cursor))
+        index = EmbeddingIndex(dim=FACE_DESCRIPTOR_DIM, capacity=max(256, len(ids)))
+        if ids:
+            index.add_many(ids, np.stack(vectors))
+        self._index = index
+        self._employees = employees
+        self._loaded = True
+        self._full_loads += 1
+
+    def refresh_employee(self, employee_id: int) -> None:
+        """Re-read one employee after a committed write (registration, update, deactivation, deletion)."""
+        if employee_id is None:
+            return
+        with self._lock:
+            if not self._loaded:
+                return
+            from psycopg2.extras import RealDictCursor
+            from database_postgres import get_connection
+            conn = get_connection()
+            try:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                ids, vectors, employees = self._decode_rows(cursor, self._select_rows(cursor, int(employee_id)))
+                conn.commit()
+            finally:
+                conn.close()
+            if ids:
+                self._index.add(ids[0], vectors[0])
+                self._employees[ids[0]] = employees[ids[0]]
+            else:
+                self._index.remove(int(employee_id))
+                self._employees.pop(int(employee_id), None)
+            self._refreshes += 1
+
+    # -- reads -------------------------------------------------------------
+
+    def identify(self, descriptor: np.ndarray, top_k: int = 1,
+                 threshold: float = DEFAULT_FACE_THRESHOLD) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        Employees whose descriptor is closest to this one.
+
+        Returns:
+            (matches at or above threshold, best first, each the employee fields
+            plus employee_id and similarity; best similarity seen, matched or not).
+            No registered faces gives ([], 0.0).
+        """
+        self._ensure_fresh()
+        with self._lock:
+            best = self._index.search(descriptor, top_k=max(1, top_k))
+            matches = [
+                dict(self._employees[employee_id], employee_id=employee_id, similarity=similarity)
+                for employee_id, similarity in best if similarity >= threshold
+            ]
+        return matches, (best[0][1] if best else 0.0)
+
+    def similarity(self, employee_id: int, descriptor: np.ndarray) -> Optional[float]:
+        """Cosine similarity to one employee's registered face, or None if none is registered."""
+        self._ensure_fresh()
+        stored = self._index.get(employee_id)
+        if stored is None:
+            return None
+        norm = float(np.linalg.norm(descriptor))
+        if norm == 0:
+            return 0.0
+        return float(np.dot(stored, descriptor) / norm)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'faces': len(self._index),
+            'check_seconds': self.check_seconds,
+            'full_loads': self._full_loads,
+            'refreshes': self._refreshes,
+        }
+
+
+# Global index instance
+_face_index: Optional[FaceDescriptorIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_face_index() -> FaceDescriptorIndex:
+    """Get or create the face descriptor index singleton"""
+    global _face_index
+    if _face_index is None:
+        with _index_lock:
+            if _face_index is None:
+                _face_index = FaceDescriptorIndex()
+    return _face_index
+
+
+def refresh_face_employee(employee_id: int) -> None:
+    """Apply a committed change to one employee's face or employee row; never raises."""
+    try:
+        get_face_index().refresh_employee(employee_id)
+    except Exception as e:
+        # The periodic stamp check still catches it
+        logger.warning("Face index refresh for employee %s failed: %s", employee_id, e)
@@ -31,6 +31,8 @@ function RecentOrders() {
   const location = useLocation()
   const { themeColor, themeMode } = useTheme()
   const [ordersPage, setOrdersPage] = useState(0)
+  // Keyset cursors: ordersPageCursors[n] fetches page n (page 0 has none); filled from each response's next_cursor
+  const [ordersPageCursors, setOrdersPageCursors] = useState([null])
 
   useEffect(() => {
     if (location.state?.searchQuery) {
@@ -144,7 +146,9 @@ function RecentOrders() {
     queryFn: async () => {
       const params = new URLSearchParams()
       params.set('limit', String(ORDERS_PAGE_SIZE))
-      params.set('offset', String(ordersPage * ORDERS_PAGE_SIZE))
+      const pageCursor = ordersPageCursors[ordersPage]
+      if (pageCursor) params.set('cursor', pageCursor)
+      else if (ordersPage > 0) params.set('offset', String(ordersPage * ORDERS_PAGE_SIZE))
       const statusIn = []
       if (filterReturns) statusIn.push('returned')
       if (filterCanceled) statusIn.push('voided')
@@ -164,6 +168,18 @@ function RecentOrders() {
   const data = ordersResponse ?? { columns: [], data: [] }
   const error = ordersError?.message ?? null
   const ordersTotal = ordersResponse?.total ?? 0
+  const ordersTotalIsEstimate = !!ordersResponse?.total_is_estimate
+  const ordersNextCursor = ordersResponse?.next_cursor ?? null
+
+  useEffect(() => {
+    if (!ordersNextCursor) return
+    setOrdersPageCursors((prev) => {
+      if (prev[ordersPage + 1] === ordersNextCursor) return prev
+      const next = prev.slice(0, ordersPage + 1)
+      next[ordersPage + 1] = ordersNextCursor
+      return next
+    })
+  }, [ordersNextCursor, ordersPage])
 
   const MOBILE_BREAKPOINT = 768
   const [isMobile, setIsMobile] = useState(() => typeof window !== 'undefined' && window.innerWidth <= MOBILE_BREAKPOINT)
@@ -216,6 +232,7 @@ function RecentOrders() {
 
   useEffect(() => {
     setOrdersPage(0)
+    setOrdersPageCursors([null])
   }, [filterReturns, filterCanceled, filterOrderTypePickup, filterOrderTypeDelivery, filterOrderTypeInPerson])
 
   // Smooth scanner open: expand after mount (mobile inline only)
@@ -3281,10 +3298,10 @@ function RecentOrders() {
                     </table>
                   </div>
                 )}
-                {ordersTotal > ORDERS_PAGE_SIZE && (
+                {(ordersTotal > ORDERS_PAGE_SIZE || ordersPage > 0) && (
                   <div style={{ display: 'flex', alignItems: 'center', gap: '12px', marginTop: '12px', flexWrap: 'wrap', padding: '0 16px 16px' }}>
                     <span style={{ fontSize: '13px', color: isDarkMode ? '#aaa' : '#666' }}>
-                      Page {ordersPage + 1} of {Math.max(1, Math.ceil(ordersTotal / ORDERS_PAGE_SIZE))} ({ordersTotal} orders)
+                      Page {ordersPage + 1} of {ordersTotalIsEstimate ? '~' : ''}{Math.max(ordersPage + 1, Math.ceil(ordersTotal / ORDERS_PAGE_SIZE))} ({ordersTotalIsEstimate ? '~' : ''}{ordersTotal} orders)
                     </span>
                     <button
                       type="button"
@@ -3304,7 +3321,7 @@ function RecentOrders() {
                     </button>
                     <button
                       type="button"
-                      disabled={ordersPage >= Math.ceil(ordersTotal / ORDERS_PAGE_SIZE) - 1 || loading}
+                      disabled={!ordersNextCursor || loading}
                       onClick={() => setOrdersPage((p) => p + 1)}
                       style={{
                         padding: '6px 12px',
@@ -3312,8 +3329,8 @@ function RecentOrders() {
                         border: isDarkMode ? '1px solid #444' : '1px solid #ccc',
                         borderRadius: '6px',
                         background: isDarkMode ? '#333' : '#f5f5f5',
-                        color: (ordersPage >= Math.ceil(ordersTotal / ORDERS_PAGE_SIZE) - 1 || loading) ? (isDarkMode ? '#666' : '#999') : (isDarkMode ? '#fff' : '#333'),
-                        cursor: (ordersPage >= Math.ceil(ordersTotal / ORDERS_PAGE_SIZE) - 1 || loading) ? 'not-allowed' : 'pointer'
+                        color: (!ordersNextCursor || loading) ? (isDarkMode ? '#666' : '#999') : (isDarkMode ? '#fff' : '#333'),
+                        cursor: (!ordersNextCursor || loading) ? 'not-allowed' : 'pointer'
                       }}
                     >
                       Next
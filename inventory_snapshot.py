@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Versioned in-memory inventory snapshot for /api/inventory and /api/pos-bootstrap.
+Triggers on inventory, product_variants and product_metadata record in
+inventory_changes the id of the transaction that last changed each product;
+category and vendor writes store theirs as inventory_catalog_version.reset_version
+(schema bootstrap v11, v19). Nothing is locked across writers, so transactions
+can commit out of id order: the catalog version a reader reports is the newest
+change below its snapshot's xmin, where every older transaction has finished.
+A built snapshot (joined rows, category paths, variants) is kept per filter
+combination until the version moves, so unchanged catalogs cost one tiny
+version lookup, and clients can ask for a delta since the version they hold.
+
+Stock-only updates (current_quantity, updated_at, last_restocked) are not
+catalog changes; cached snapshots re-read quantities at most every
+INVENTORY_STOCK_REFRESH_SECONDS instead. Each re-read that changes a row bumps
+a per-process stock generation, which goes into the ETag and lets a delta
+(stock_since=) include the products whose stock moved.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from schema_registry import has_table, has_column
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_STOCK_REFRESH_SECONDS = float(os.getenv('INVENTORY_STOCK_REFRESH_SECONDS', '5') or 0)
+STOCK_COLUMNS = ('current_quantity', 'updated_at', 'last_restocked')
+
+
+def _value(row, key, index):
+    return row.get(key) if isinstance(row, dict) else row[index]
+
+
+def _stock_clock() -> int:
+    # Microseconds since the epoch, so generations keep rising across restarts
+    return time.time_ns() // 1000
+
+
+def build_inventory_rows(cursor, item_type: str = '', archived_only: bool = False,
+                         sell_at_pos_only: bool = False, include_variants: bool = False) -> Tuple[List[str], List[dict]]:
+    """
+    Run the inventory + vendor + metadata + category join and decorate rows with
+    the full category path (and variants if asked). cursor must be a RealDictCursor.
+    """
+    from category_cache import get_category_cache
+    sql = """
+        SELECT
+            i.*,
+            v.vendor_name,
+            pm.keywords,
+            pm.tags,
+            pm.attributes,
+            pm.brand,
+            pm.color,
+            pm.size,
+            pm.category_id as metadata_category_id,
+            c.category_name as metadata_category_name,
+            pm.category_confidence
+        FROM inventory i
+        LEFT JOIN vendors v ON i.vendor_id = v.vendor_id
+        LEFT JOIN product_metadata pm ON i.product_id = pm.product_id
+        LEFT JOIN categories c ON pm.category_id = c.category_id
+        WHERE 1=1
+    """
+    if has_column('inventory', 'archived'):
+        if archived_only:
+            sql += " AND i.archived = TRUE"
+        else:
+            sql += " AND (i.archived IS NULL OR i.archived = FALSE)"
+    has_item_type = has_column('inventory', 'item_type')
+    if has_item_type and item_type == 'product':
+        sql += " AND (i.item_type = 'product' OR i.item_type IS NULL)"
+    elif has_item_type and item_type == 'ingredient':
+        sql += " AND i.item_type = 'ingredient'"
+    if sell_at_pos_only and has_column('inventory', 'sell_at_pos'):
+        sql += " AND (i.sell_at_pos IS TRUE)"
+    if has_item_type:
+        sql += " ORDER BY i.item_type NULLS LAST, i.product_name"
+    else:
+        sql += " ORDER BY i.product_name"
+    cursor.execute(sql)
+    rows = cursor.fetchall()
+    columns = list(rows[0].keys()) if rows else []
+    data = [dict(r) for r in rows]
+
+    # Use full category path for each item so master category filter includes subcategories
+    try:
+        category_id_to_path = get_category_cache().id_to_path()
+        for row in data:
+            cid = row.get('metadata_category_id')
+            if cid and cid in category_id_to_path and category_id_to_path[cid]:
+                row['category'] = category_id_to_path[cid]
+    except Exception:
+        pass
+
+    if include_variants and data:
+        try:
+            product_ids = [r.get('product_id') for r in data if r.get('product_id')]
+            variants_by_product: Dict[Any, List[dict]] = {}
+            if product_ids:
+                cursor.execute(
+                    "SELECT variant_id, product_id, variant_name, price, cost, sort_order FROM product_variants WHERE product_id = ANY(%s) ORDER BY product_id, sort_order, variant_name",
+                    (product_ids,)
+                )
+                for v in cursor.fetchall():
+                    vd = dict(v)
+                    variants_by_product.setdefault(vd.get('product_id'), []).append(vd)
+            for row in data:
+                row['variants'] = variants_by_product.get(row.get('product_id')) or []
+        except Exception:
+            for row in data:
+                row['variants'] = []
+    return columns, data
+
+
+class InventorySnapshotCache:
+    """Built inventory snapshots keyed by filter set, valid for one catalog version."""
+
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._snapshots: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._builds = 0
+        self._stock_refreshed_at = 0.0
+        self._stock_refreshes = 0
+        # Generations below _stock_base were handed out by an earlier process
+        self._stock_generation = self._stock_base = _stock_clock()
+        self._stock_seen: Dict[Any, tuple] = {}
+        self._stock_changed: Dict[Any, int] = {}
+
+    def current_version(self, cursor) -> Optional[Tuple[int, int]]:
+        """
+        (version, reset_version), or None if the version table isn't bootstrapped.
+        version only counts changes by transactions older than this snapshot's xmin,
+        so a writer that commits later can never land at or below a version already
+        handed out; newer visible changes are simply sent again in the next delta.
+        The cost is that any open transaction holding a txid (a write to any table)
+        pins the version below its own id until it ends: catalog changes committed
+        meanwhile are served from the database but not reported as a new version
+        or ETag. Keep write transactions short; bulk jobs commit per batch and do
+        slow work (parsing, model or LLM calls) outside them.
+        """
+        if not has_table('inventory_catalog_version'):
+            return None
+        cursor.execute("""
+            WITH h AS (SELECT txid_snapshot_xmin(txid_current_snapshot()) AS horizon)
+            SELECT GREATEST(
+                       (SELECT MAX(c.version) FROM inventory_changes c WHERE c.version < h.horizon),
+                       CASE WHEN v.reset_version < h.horizon THEN v.reset_version END,
+                       0) AS version,
+                   v.reset_version
+            FROM inventory_catalog_version v, h
+            WHERE v.id = 1
+        """)
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return int(_value(row, 'version', 0)), int(_value(row, 'reset_version', 1))
+
+    def get(self, cursor, item_type: str = '', archived_only: bool = False,
+            sell_at_pos_only: bool = False, include_variants: bool = False,
+            version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Snapshot dict with version, columns, data and by_id. Rebuilt only when
+        version differs from the cached one; version=None builds without caching.
+        """
+        # Only these filters exist; anything else from the query string means "all"
+        item_type = item_type if item_type in ('product', 'ingredient') else ''
+        key = (item_type, bool(archived_only), bool(sell_at_pos_only), bool(include_variants))
+        if version is None:
+            return self._build(cursor, key, None)
+        if self._version != version or key not in self._snapshots:
+            # One build at a time so terminals reloading together share a single query
+            with self._lock:
+                if self._version != version or key not in self._snapshots:
+                    snapshot = self._build(cursor, key, version)
+                    self._observe_stock(snapshot['data'])
+                    if self._version != version:
+                        self._snapshots = {}
+                        self._version = version
+                        self._stock_refreshed_at = time.monotonic()
+                    self._snapshots[key] = snapshot
+                    return snapshot
+        self._hits += 1
+        self._refresh_stock(cursor)
+        # Read after the refresh, which swaps in a copy when stock changed
+        snapshot = self._snapshots.get(key) if self._version == version else None
+        return snapshot if snapshot is not None else self._build(cursor, key, None)
+
+    def stock_generation(self, cursor) -> int:
+        """Current stock generation, after re-reading stock if it's due."""
+        self._refresh_stock(cursor)
+        return self._stock_generation
+
+    def _refresh_stock(self, cursor) -> None:
+        """Swap rows with live stock columns into the cached snapshots (sales don't move the catalog version)."""
+        if time.monotonic() - self._stock_refreshed_at < INVENTORY_STOCK_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if time.monotonic() - self._stock_refreshed_at < INVENTORY_STOCK_REFRESH_SECONDS:
+                return
+            columns = [c for c in STOCK_COLUMNS if has_column('inventory', c)]
+            if columns:
+                cursor.execute(f"SELECT product_id, {', '.join(columns)} FROM inventory")
+                stock = {
+                    _value(row, 'product_id', 0): {c: _value(row, c, i) for i, c in enumerate(columns, start=1)}
+                    for row in cursor.fetchall()
+                }
+                changed = self._observe_stock(stock.items(), mark=False)
+                for key, snapshot in list(self._snapshots.items()):
+                    updated = self._with_stock(snapshot, stock)
+                    if updated is not snapshot:
+                        changed.update(pid for pid, row in updated['by_id'].items()
+                                       if row is not snapshot['by_id'].get(pid))
+                        self._snapshots[key] = updated
+                self._mark_stock_changed(changed)
+            self._stock_refreshed_at = time.monotonic()
+            self._stock_refreshes += 1
+
+    @staticmethod
+    def _with_stock(snapshot: Dict[str, Any], stock: Dict[Any, dict]) -> Dict[str, Any]:
+        """
+        Copy of snapshot with new dicts for the rows whose stock differs, or snapshot
+        itself if none do. Rows already handed out are never mutated, since other
+        threads may be serializing them.
+        """
+        replaced = {}
+        for product_id, row in snapshot['by_id'].items():
+            live = stock.get(product_id)
+            if live and any(row.get(c) != v for c, v in live.items()):
+                replaced[product_id] = {**row, **live}
+        if not replaced:
+            return snapshot
+        data = [replaced.get(row.get('product_id'), row) for row in snapshot['data']]
+        return {**snapshot, 'data': data, 'by_id': {row.get('product_id'): row for row in data}}
+
+    def _observe_stock(self, rows, mark: bool = True) -> set:
+        """
+        Record last-seen stock per product; products seen before with different
+        values are returned (and marked changed unless mark=False). Catches sales
+        that land between a version change and the rebuild, which no refresh sees.
+        """
+        changed = set()
+        for item in rows:
+            product_id, row = item if isinstance(item, tuple) else (item.get('product_id'), item)
+            values = tuple(row.get(c) for c in STOCK_COLUMNS)
+            previous = self._stock_seen.get(product_id)
+            if previous is not None and previous != values:
+                changed.add(product_id)
+            self._stock_seen[product_id] = values
+        if mark:
+            self._mark_stock_changed(changed)
+        return changed
+
+    def _mark_stock_changed(self, product_ids) -> None:
+        if not product_ids:
+            return
+        generation = max(self._stock_generation + 1, _stock_clock())
+        for product_id in product_ids:
+            self._stock_changed[product_id] = generation
+        self._stock_generation = generation
+
+    def _build(self, cursor, key: tuple, version: Optional[int]) -> Dict[str, Any]:
+        columns, data = build_inventory_rows(cursor, *key)
+        self._builds += 1
+        logger.debug("Inventory snapshot built for %s at version %s (%d rows)", key, version, len(data))
+        return {
+            'version': version,
+            'columns': columns,
+            'data': data,
+            'by_id': {row.get('product_id'): row for row in data},
+        }
+
+    def changed_since(self, cursor, since: int, version: int) -> List[int]:
+        """Product ids changed (or deleted) after since, up to version."""
+        cursor.execute(
+            "SELECT product_id FROM inventory_changes WHERE version > %s AND version <= %s ORDER BY product_id",
+            (since, version)
+        )
+        return [_value(row, 'product_id', 0) for row in cursor.fetchall()]
+
+    def delta(self, cursor, snapshot: Dict[str, Any], since: int, reset_version: int,
+              stock_since: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Rows changed since the given version or whose stock changed after the
+        stock_since generation, plus ids no longer in this view (deleted,
+        archived, or filtered out). None when a full reload is needed, including
+        when stock_since is missing or from another process.
+        """
+        version = snapshot.get('version')
+        if version is None or since < reset_version or since > version:
+            return None
+        if stock_since is None or not self._stock_base <= stock_since <= self._stock_generation:
+            return None
+        by_id = snapshot['by_id']
+        changed_ids, deleted = set(), []
+        if since < version:
+            for product_id in self.changed_since(cursor, since, version):
+                if product_id in by_id:
+                    changed_ids.add(product_id)
+                else:
+                    deleted.append(product_id)
+        # list() copies the items in one step while a refresh may be adding to the dict
+        for product_id, generation in list(self._stock_changed.items()):
+            if generation > stock_since and product_id in by_id:
+                changed_ids.add(product_id)
+        changed = [by_id[product_id] for product_id in sorted(changed_ids)]
+        return {'columns': snapshot['columns'], 'data': changed, 'deleted': deleted}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots = {}
+            self._version = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'version': self._version,
+            'snapshots': len(self._snapshots),
+            'hits': self._hits,
+            'builds': self._builds,
+            'stock_refreshes': self._stock_refreshes,
+            'stock_generation': self._stock_generation,
+        }
+
+
+# Global cache instance
+_inventory_snapshot_cache: Optional[InventorySnapshotCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_inventory_snapshot_cache() -> InventorySnapshotCache:
+    """Get or create the inventory snapshot cache singleton"""
+    global _inventory_snapshot_cache
+    if _inventory_snapshot_cache is None:
+        with _cache_lock:
+            if _inventory_snapshot_cache is None:
+                _inventory_snapshot_cache = InventorySnapshotCache()
+    return _inventory_snapshot_cache
+
+
+def inventory_etag(version: Optional[int], *parts: str) -> Optional[str]:
+    """Weak ETag value for a catalog version (plus any extra discriminators)."""
+    if version is None:
+        return None
+    return '-'.join(['inv', str(version)] + [p for p in parts if p])
@@ -4,9 +4,12 @@ Free Metadata Extraction System using local AI models and free APIs
 Completely FREE - no paid services required
 """
 
+import hashlib
 import json
 import logging
+import os
 import re
+import threading
 import time
 from collections import Counter
 from typing import Dict, List, Optional
@@ -15,19 +18,10 @@ import psycopg2
 
 logger = logging.getLogger(__name__)
 
-# Optional: requests for barcode lookup (will fail gracefully if not installed)
-try:
-    import requests
-    REQUESTS_AVAILABLE = True
-except ImportError:
-    REQUESTS_AVAILABLE = False
-    logger.warning("requests not installed. Barcode lookup disabled. pip install requests")
-
 # Optional: sklearn for ML features (will fail gracefully if not installed)
 try:
     from sklearn.feature_extraction.text import TfidfVectorizer
     from sklearn.cluster import KMeans
-    from sklearn.metrics.pairwise import cosine_similarity
     import numpy as np
     SKLEARN_AVAILABLE = True
 except ImportError:
@@ -59,6 +53,15 @@ except ImportError:
     # Don't print warning by default - it's optional
 
 from database import get_connection
+from category_cache import invalidate_categories
+from schema_bootstrap import EXTRACTION_INPUT_DIGEST
+from product_search_index import PRODUCT_COLUMNS, SEARCH_INDEX_AVAILABLE, get_product_search_index, record_search
+
+
+def extraction_input_digest(product_name, barcode) -> str:
+    """Digest of the inventory fields extraction reads; same value as EXTRACTION_INPUT_DIGEST."""
+    text = f"{product_name or ''}\n{barcode or ''}"
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
 
 
 class FreeMetadataSystem:
@@ -603,9 +606,12 @@ class FreeMetadataSystem:
         ]
     
     def extract_metadata_from_product(self, product_name, barcode=None, 
-                                     description=None, vendor_data=None):
+                                     description=None, vendor_data=None,
+                                     name_doc=None, lookup_barcode=True):
         """
         Extract metadata using FREE methods only
+        name_doc: spaCy Doc for product_name.lower() already parsed (batch mode uses nlp.pipe)
+        lookup_barcode: False skips the Open Food Facts HTTP lookup
         """
         start_time = time.time()
         
@@ -619,13 +625,13 @@ class FreeMetadataSystem:
         }
         
         # 1. Free barcode lookup (Open Product Data)
-        if barcode:
+        if barcode and lookup_barcode:
             barcode_metadata = self._free_barcode_lookup(barcode)
             if barcode_metadata:
                 metadata = self._merge_metadata(metadata, barcode_metadata)
         
         # 2. Parse product name using rules and NLP
-        name_metadata = self._parse_with_nlp(product_name)
+        name_metadata = self._parse_with_nlp(product_name, doc=name_doc)
         metadata = self._merge_metadata(metadata, name_metadata)
         
         # 3. Extract from description
@@ -688,6 +694,8 @@ class FreeMetadataSystem:
         
         execution_time = int((time.time() - start_time) * 1000)
         metadata['execution_time_ms'] = execution_time
+        # Saved with the row so batch mode only re-extracts when these inputs change
+        metadata['input_digest'] = extraction_input_digest(product_name, barcode)
 
         if not metadata.get('category_suggestions'):
             logger.debug(
@@ -699,48 +707,40 @@ class FreeMetadataSystem:
     def _free_barcode_lookup(self, barcode):
         """
         Use FREE barcode APIs (no API key needed)
+        Served from the persistent barcode cache (imported dumps, earlier hits and
+        misses); only cache misses go to Open Food Facts.
         """
         metadata = {}
         
-        if not REQUESTS_AVAILABLE:
-            return metadata
-        
         try:
-            # Option 1: Open Food Facts (free, no API key)
-            if len(barcode) == 13 or len(barcode) == 12:  # EAN/UPC
-                response = requests.get(
-                    f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json",
-                    timeout=3
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('status') == 1:
-                        product = data.get('product', {})
-                        tags = product.get('categories_tags') or []
-                        path = None
-                        if tags:
-                            parts = [t.replace("en:", "").replace(":", " ").strip().title() for t in tags if t]
-                            path = " > ".join(parts) if parts else (tags[0].replace("en:", "").replace(":", " ").strip().title() or tags[0])
-                        metadata = {
-                            'brand': product.get('brands'),
-                            'keywords': product.get('product_name', '').split() if product.get('product_name') else [],
-                            'category_suggestions': [{'category_name': path, 'confidence': 0.9}] if path else [],
-                            'attributes': {
-                                'quantity': product.get('quantity'),
-                                'packaging': product.get('packaging')
-                            }
-                        }
+            from barcode_lookup_cache import get_barcode_lookup_cache
+            product = get_barcode_lookup_cache().lookup(barcode)
+            if product:
+                tags = product.get('categories_tags') or []
+                path = None
+                if tags:
+                    parts = [t.replace("en:", "").replace(":", " ").strip().title() for t in tags if t]
+                    path = " > ".join(parts) if parts else (tags[0].replace("en:", "").replace(":", " ").strip().title() or tags[0])
+                metadata = {
+                    'brand': product.get('brands'),
+                    'keywords': product.get('product_name', '').split() if product.get('product_name') else [],
+                    'category_suggestions': [{'category_name': path, 'confidence': 0.9}] if path else [],
+                    'attributes': {
+                        'quantity': product.get('quantity'),
+                        'packaging': product.get('packaging')
+                    }
+                }
         
         except Exception as e:
             logger.debug("Barcode lookup failed for %s: %s", barcode, e)
         
         return metadata
     
-    def _parse_with_nlp(self, text):
+    def _parse_with_nlp(self, text, doc=None):
         """
         Use spaCy NLP (FREE, runs locally) to extract metadata
         Falls back to simple rule-based extraction if spaCy not available
+        doc: pre-parsed Doc for text.lower() (skips the per-call nlp() run)
         """
         metadata = {
             'keywords': [],
@@ -754,7 +754,8 @@ class FreeMetadataSystem:
         
         # Use spaCy if available
         if self.nlp:
-            doc = self.nlp(text.lower())
+            if doc is None:
+                doc = self.nlp(text.lower())
             
             # Extract named entities
             for ent in doc.ents:
@@ -1304,6 +1305,7 @@ Category name only (no explanation):"""
                         search_vector = %s,
                         category_id = %s,
                         category_confidence = %s,
+                        input_digest = %s,
                         updated_at = CURRENT_TIMESTAMP
                     WHERE product_id = %s
                 """, (
@@ -1316,14 +1318,15 @@ Category name only (no explanation):"""
                     search_vector,
                     category_id,
                     confidence,
+                    metadata.get('input_digest'),
                     product_id
                 ))
             else:
                 cursor.execute("""
                     INSERT INTO product_metadata 
                     (product_id, brand, color, size, tags, keywords, 
-                     attributes, search_vector, category_id, category_confidence, updated_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                     attributes, search_vector, category_id, category_confidence, input_digest, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
                 """, (
                 product_id,
                 metadata.get('brand'),
@@ -1334,7 +1337,8 @@ Category name only (no explanation):"""
                 json.dumps(attributes),
                 search_vector,
                 category_id,
-                confidence
+                confidence,
+                metadata.get('input_digest')
             ))
             
             # Log extraction
@@ -1363,6 +1367,234 @@ Category name only (no explanation):"""
         finally:
             conn.close()
     
+    def extract_metadata_batch(self, products, lookup_barcodes=False):
+        """
+        Extract metadata for many products, parsing all names in one nlp.pipe pass.
+        products: iterable of dicts with product_id, product_name, barcode.
+        Returns list of (product_id, metadata or None, error or None).
+        """
+        products = [p for p in products if p.get('product_name')]
+        if lookup_barcodes:
+            try:
+                from barcode_lookup_cache import prefetch_barcodes
+                prefetch_barcodes(p.get('barcode') for p in products)
+            except Exception as e:
+                logger.debug("Barcode prefetch failed: %s", e)
+        names = [p['product_name'].lower() for p in products]
+        if self.nlp and names:
+            docs = self.nlp.pipe(names, batch_size=256)
+        else:
+            docs = (None for _ in names)
+        results = []
+        for product, doc in zip(products, docs):
+            try:
+                metadata = self.extract_metadata_from_product(
+                    product['product_name'],
+                    barcode=product.get('barcode'),
+                    name_doc=doc,
+                    lookup_barcode=lookup_barcodes
+                )
+                results.append((product['product_id'], metadata, None))
+            except Exception as e:
+                results.append((product['product_id'], None, str(e)))
+        return results
+
+    def save_product_metadata_batch(self, results, extraction_method='batch', conn=None):
+        """
+        Bulk upsert product_metadata and metadata_extraction_log for
+        extract_metadata_batch results in one transaction. Returns rows saved.
+        """
+        from psycopg2.extras import execute_values
+        from database import create_or_get_category_with_hierarchy
+        should_close = conn is None
+        if conn is None:
+            conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            # Resolve each distinct category path once (may commit on conn, nothing else is pending yet)
+            category_ids = {}
+            for _, metadata, _ in results:
+                suggestions = (metadata or {}).get('category_suggestions') or []
+                path = suggestions[0].get('category_name') if suggestions else None
+                if path and path not in category_ids:
+                    category_ids[path] = create_or_get_category_with_hierarchy(path, conn)
+
+            metadata_rows = []
+            log_rows = []
+            for product_id, metadata, error in results:
+                if metadata is None:
+                    log_rows.append((product_id, extraction_method, None, 0, 0, error))
+                    continue
+                attributes = metadata.get('attributes', {})
+                keywords = metadata.get('keywords', [])
+                tags = metadata.get('tags', [])
+                search_vector = ' '.join([
+                    metadata.get('brand') or '',
+                    ' '.join(keywords),
+                    ' '.join(tags),
+                    json.dumps(attributes)
+                ])
+                suggestions = metadata.get('category_suggestions') or []
+                category_match = suggestions[0] if suggestions else None
+                category_id = category_ids.get(category_match.get('category_name')) if category_match else None
+                confidence = category_match.get('confidence', 0) if category_match else 0
+                metadata_rows.append((
+                    product_id,
+                    metadata.get('brand'),
+                    attributes.get('color'),
+                    attributes.get('size'),
+                    json.dumps(tags[:20]),  # Limit to 20 tags
+                    json.dumps(keywords[:30]),  # Limit to 30 keywords
+                    json.dumps(attributes),
+                    search_vector,
+                    category_id,
+                    confidence,
+                    metadata.get('input_digest')
+                ))
+                log_rows.append((product_id, extraction_method, json.dumps(metadata, default=str),
+                                 metadata.get('execution_time_ms', 0), 1, None))
+
+            if metadata_rows:
+                execute_values(cursor, """
+                    INSERT INTO product_metadata
+                    (product_id, brand, color, size, tags, keywords,
+                     attributes, search_vector, category_id, category_confidence, input_digest, updated_at)
+                    VALUES %s
+                    ON CONFLICT (product_id) DO UPDATE SET
+                        brand = EXCLUDED.brand,
+                        color = EXCLUDED.color,
+                        size = EXCLUDED.size,
+                        tags = EXCLUDED.tags,
+                        keywords = EXCLUDED.keywords,
+                        attributes = EXCLUDED.attributes,
+                        search_vector = EXCLUDED.search_vector,
+                        category_id = EXCLUDED.category_id,
+                        category_confidence = EXCLUDED.category_confidence,
+                        input_digest = EXCLUDED.input_digest,
+                        updated_at = CURRENT_TIMESTAMP
+                """, metadata_rows, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)",
+                    page_size=len(metadata_rows))
+            if log_rows:
+                execute_values(cursor, """
+                    INSERT INTO metadata_extraction_log
+                    (product_id, extraction_method, data_extracted, execution_time_ms, success, error_message)
+                    VALUES %s
+                """, log_rows, page_size=len(log_rows))
+            conn.commit()
+            return len(metadata_rows)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if should_close:
+                conn.close()
+
+    def batch_extract_all(self, only_missing=True, limit=None, chunk_size=500, workers=None,
+                          lookup_barcodes=False, extraction_method='batch_free', verbose=True):
+        """
+        Batch extraction mode: stream products with a server-side cursor, parse names
+        with nlp.pipe in a multiprocessing pool (workers=1 runs in-process), and write
+        each chunk with bulk upserts. Returns a throughput report.
+        only_missing: products with no metadata, or whose name/barcode changed since it was
+        extracted (input_digest); stock and category updates don't make metadata stale
+        """
+        import multiprocessing
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 2) - 1)
+
+        query = """
+            SELECT i.product_id, i.product_name, i.barcode
+            FROM inventory i
+            LEFT JOIN product_metadata pm ON i.product_id = pm.product_id
+        """
+        if only_missing:
+            query += f" WHERE pm.metadata_id IS NULL OR pm.input_digest IS DISTINCT FROM {EXTRACTION_INPUT_DIGEST}"
+        query += " ORDER BY i.product_id"
+        params = ()
+        if limit:
+            query += " LIMIT %s"
+            params = (int(limit),)
+
+        report = {'processed': 0, 'saved': 0, 'errors': 0, 'chunks': 0, 'workers': workers,
+                  'extract_seconds': 0.0, 'write_seconds': 0.0}
+        started = time.perf_counter()
+        read_conn = get_connection()
+        write_conn = get_connection()
+        pool = None
+        try:
+            # Named cursor = server-side; rows arrive chunk_size at a time instead of all at once
+            cursor = read_conn.cursor(name='metadata_batch_extract')
+            cursor.itersize = chunk_size
+            cursor.execute(query, params)
+
+            def chunks():
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        return
+                    yield [
+                        {'product_id': r[0], 'product_name': r[1], 'barcode': r[2]}
+                        if not isinstance(r, dict) else dict(r)
+                        for r in rows
+                    ]
+
+            def pooled_results():
+                # Split each chunk across the workers, and start the next chunk before
+                # handing this one back so extraction overlaps the parent's DB writes
+                def submit(chunk):
+                    return pool.map_async(_batch_worker_extract,
+                                          [(chunk[i::workers], lookup_barcodes) for i in range(workers)])
+                chunk_iter = chunks()
+                chunk = next(chunk_iter, None)
+                pending = submit(chunk) if chunk else None
+                while pending is not None:
+                    parts = pending.get()
+                    chunk = next(chunk_iter, None)
+                    pending = submit(chunk) if chunk else None
+                    yield [item for part in parts for item in part]
+
+            if workers > 1:
+                pool = multiprocessing.Pool(workers, initializer=_batch_worker_init)
+                results_iter = pooled_results()
+            else:
+                results_iter = (self.extract_metadata_batch(chunk, lookup_barcodes) for chunk in chunks())
+
+            while True:
+                t0 = time.perf_counter()
+                results = next(results_iter, None)
+                if results is None:
+                    break
+                t1 = time.perf_counter()
+                saved = self.save_product_metadata_batch(results, extraction_method, conn=write_conn)
+                t2 = time.perf_counter()
+                report['extract_seconds'] += t1 - t0
+                report['write_seconds'] += t2 - t1
+                report['chunks'] += 1
+                report['processed'] += len(results)
+                report['saved'] += saved
+                report['errors'] += sum(1 for _, metadata, _ in results if metadata is None)
+                if verbose:
+                    elapsed = time.perf_counter() - started
+                    print(f"  chunk {report['chunks']}: {report['processed']} products, "
+                          f"{report['processed'] / elapsed:.1f} products/sec")
+            cursor.close()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            try:
+                read_conn.rollback()
+            except Exception:
+                pass
+            read_conn.close()
+            write_conn.close()
+
+        report['elapsed_seconds'] = time.perf_counter() - started
+        report['products_per_second'] = (
+            report['processed'] / report['elapsed_seconds'] if report['elapsed_seconds'] > 0 else 0.0
+        )
+        return report
+
     def auto_categorize_products_kmeans(self, min_products_per_category=5):
         """
         Auto-categorize using K-Means clustering (FREE, runs locally)
@@ -1436,6 +1668,10 @@ Category name only (no explanation):"""
         # Generate category names from cluster keywords
         feature_names = vectorizer.get_feature_names_out()
         
+        # Name every cluster before writing anything: the LLM calls are slow, and an
+        # open write transaction holds back the inventory catalog version meanwhile
+        conn.rollback()
+        assignments = []
         for cluster_id in range(n_clusters):
             # Get cluster center
             center = kmeans.cluster_centers_[cluster_id]
@@ -1462,7 +1698,9 @@ Category name only (no explanation):"""
             # Fallback to keyword-based name if LLM fails
             if not category_name:
                 category_name = ' '.join(top_words[:3]).title()
-            
+            assignments.append((category_name, cluster_product_ids))
+        
+        for category_name, cluster_product_ids in assignments:
             # Check if similar category exists
             cursor.execute("""
                 SELECT category_id FROM categories
@@ -1483,25 +1721,37 @@ Category name only (no explanation):"""
                 category_id = row['category_id'] if isinstance(row, dict) else row[0]
             
             # Assign products to category (use the cluster_product_ids we already computed)
-            for prod_id in cluster_product_ids:
-                cursor.execute("""
-                    UPDATE product_metadata
-                    SET category_id = %s,
-                        category_confidence = 0.80
-                    WHERE product_id = %s
-                """, (category_id, prod_id))
+            cursor.execute("""
+                UPDATE product_metadata
+                SET category_id = %s,
+                    category_confidence = 0.80
+                WHERE product_id = ANY(%s)
+            """, (category_id, cluster_product_ids))
         
         conn.commit()
         cursor.close()
         conn.close()
+        invalidate_categories()
         
         print(f"Created {n_clusters} categories using K-Means clustering")
     
     def intelligent_search(self, query, limit=20, filters=None):
         """
-        Search using TF-IDF similarity (FREE, runs locally)
+        Search using the persistent TF-IDF index (FREE, runs locally)
         Falls back to simple text matching if scikit-learn not available
         """
+        if SEARCH_INDEX_AVAILABLE:
+            results = get_product_search_index().search(query, limit=limit, filters=filters)
+        else:
+            results = self._simple_text_search(query, limit, filters)
+        
+        # Log search (buffered, written in batches)
+        record_search(query, len(results), filters)
+        
+        return results
+    
+    def _simple_text_search(self, query, limit, filters):
+        """Word-overlap search over the whole catalog"""
         conn = get_connection()
         cursor = conn.cursor()
         
@@ -1528,85 +1778,21 @@ Category name only (no explanation):"""
         
         all_products = cursor.fetchall()
         
-        if not SKLEARN_AVAILABLE:
-            # Fallback to simple text matching
-            query_lower = query.lower()
-            results = []
-            for product in all_products:
-                # Handle dict-like row access (PostgreSQL RealDictCursor)
-                product_dict = dict(product) if isinstance(product, dict) else {
-                    'product_name': product[1],
-                    'search_vector': product[12],
-                    'category_id': product[7],
-                    'brand': product[6],
-                    'product_price': product[4]
-                }
-                product_name = product_dict['product_name'].lower()
-                search_vector = (product_dict['search_vector'] or '').lower()
-                
-                # Simple relevance: count word matches
-                query_words = set(query_lower.split())
-                product_words = set((product_name + ' ' + search_vector).split())
-                relevance = len(query_words & product_words) / len(query_words) if query_words else 0
-                
-                if relevance > 0:
-                    # Apply filters
-                    if filters:
-                        if 'category_id' in filters and product_dict['category_id'] != filters['category_id']:
-                            continue
-                        if 'brand' in filters and product_dict['brand'] != filters['brand']:
-                            continue
-                        if 'min_price' in filters and product_dict['product_price'] < filters['min_price']:
-                            continue
-                        if 'max_price' in filters and product_dict['product_price'] > filters['max_price']:
-                            continue
-                    
-                    result_dict = product_dict.copy() if isinstance(product_dict, dict) else dict(product)
-                    result_dict['relevance_score'] = relevance
-                    results.append(result_dict)
-            
-            # Sort by relevance
-            results.sort(key=lambda x: x['relevance_score'], reverse=True)
-            results = results[:limit]
-        else:
-            # Build corpus
-            corpus = [p['search_vector'] or '' for p in all_products]
-            corpus.append(query)
-            
-            # TF-IDF vectorization
-            vectorizer = TfidfVectorizer(stop_words='english')
-            tfidf_matrix = vectorizer.fit_transform(corpus)
-            
-            # Calculate similarity
-            query_vector = tfidf_matrix[-1]
-            similarities = cosine_similarity(query_vector, tfidf_matrix[:-1])[0]
+        # Fallback to simple text matching
+        query_lower = query.lower()
+        results = []
+        for product in all_products:
+            # Handle dict-like row access (PostgreSQL RealDictCursor)
+            product_dict = dict(product) if isinstance(product, dict) else dict(zip(PRODUCT_COLUMNS, product))
+            product_name = product_dict['product_name'].lower()
+            search_vector = (product_dict['search_vector'] or '').lower()
             
-            # Rank products
-            ranked_indices = similarities.argsort()[::-1]
+            # Simple relevance: count word matches
+            query_words = set(query_lower.split())
+            product_words = set((product_name + ' ' + search_vector).split())
+            relevance = len(query_words & product_words) / len(query_words) if query_words else 0
             
-            # Filter results
-            results = []
-            for idx in ranked_indices:
-                if similarities[idx] < 0.1:  # Threshold
-                    break
-                
-                product = all_products[idx]
-                product_dict = dict(product) if isinstance(product, dict) else {
-                    'product_id': product[0],
-                    'product_name': product[1],
-                    'sku': product[2],
-                    'barcode': product[3],
-                    'product_price': product[4],
-                    'current_quantity': product[5],
-                    'brand': product[6],
-                    'category_id': product[7],
-                    'category_name': product[8],
-                    'tags': product[9],
-                    'keywords': product[10],
-                    'attributes': product[11],
-                    'search_vector': product[12]
-                }
-                
+            if relevance > 0:
                 # Apply filters
                 if filters:
                     if 'category_id' in filters and product_dict['category_id'] != filters['category_id']:
@@ -1618,22 +1804,13 @@ Category name only (no explanation):"""
                     if 'max_price' in filters and product_dict['product_price'] > filters['max_price']:
                         continue
                 
-                result_dict = product_dict.copy()
-                result_dict['relevance_score'] = float(similarities[idx])
+                result_dict = product_dict.copy() if isinstance(product_dict, dict) else dict(product)
+                result_dict['relevance_score'] = relevance
                 results.append(result_dict)
-                
-                if len(results) >= limit:
-                    break
         
-        # Log search
-        try:
-            cursor.execute("""
-                INSERT INTO search_history (search_query, results_count)
-                VALUES (%s, %s)
-            """, (query, len(results)))
-            conn.commit()
-        except:
-            pass
+        # Sort by relevance
+        results.sort(key=lambda x: x['relevance_score'], reverse=True)
+        results = results[:limit]
         
         cursor.close()
         conn.close()
@@ -1641,6 +1818,42 @@ Category name only (no explanation):"""
         return results
 
 
+# Batch mode pool workers: each process loads its own FreeMetadataSystem once
+_batch_worker_system = None
+
+
+def _batch_worker_init():
+    global _batch_worker_system
+    # Forked workers inherit the parent's DB pool; barcode cache reads/writes
+    # must go through connections this process opened, not the parent's sockets
+    try:
+        from database_postgres import reset_pool_after_fork
+        reset_pool_after_fork()
+    except ImportError:
+        pass
+    _batch_worker_system = FreeMetadataSystem()
+
+
+def _batch_worker_extract(args):
+    products, lookup_barcodes = args
+    return _batch_worker_system.extract_metadata_batch(products, lookup_barcodes)
+
+
+# Global metadata system instance (spaCy model + knowledge bases load once per process)
+_metadata_system = None
+_metadata_system_lock = threading.Lock()
+
+
+def get_metadata_system() -> FreeMetadataSystem:
+    """Get or create the shared FreeMetadataSystem"""
+    global _metadata_system
+    if _metadata_system is None:
+        with _metadata_system_lock:
+            if _metadata_system is None:
+                _metadata_system = FreeMetadataSystem()
+    return _metadata_system
+
+
 if __name__ == '__main__':
     # Test the system
     system = FreeMetadataSystem()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Background worker for metadata_extraction_jobs.
+Product writes queue a job (database.enqueue_metadata_extraction) and return;
+this worker claims jobs with FOR UPDATE SKIP LOCKED, runs
+extract_metadata_for_product with one long-lived FreeMetadataSystem (spaCy and
+knowledge bases load once), and retries failures with backoff.
+
+Runs as a daemon thread inside web_viewer (METADATA_WORKER=0 disables it), or
+standalone:
+    python metadata_worker.py [--once]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METADATA_WORKER_ENABLED = os.getenv('METADATA_WORKER', '1').lower() not in ('0', 'false', 'no')
+POLL_SECONDS = float(os.getenv('METADATA_WORKER_POLL_SECONDS', '5') or 5)
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 3
+# A 'running' job older than this belonged to a worker that died
+STALE_RUNNING_MINUTES = 15
+DONE_RETENTION_DAYS = 7
+
+
+class MetadataExtractionWorker:
+    """Drains metadata_extraction_jobs with a single warm FreeMetadataSystem."""
+
+    def __init__(self, poll_seconds: float = POLL_SECONDS, batch_size: int = BATCH_SIZE):
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._metadata_system = None
+        self._last_cleanup = 0.0
+        self.processed = 0
+        self.failed = 0
+
+    def _get_metadata_system(self):
+        if self._metadata_system is None:
+            from metadata_extraction import get_metadata_system
+            self._metadata_system = get_metadata_system()
+        return self._metadata_system
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self.run_forever, name='metadata-worker', daemon=True)
+        self._thread.start()
+
+    def _claim(self) -> List[Tuple[int, int, bool, int]]:
+        from database import get_connection
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE metadata_extraction_jobs j
+                SET status = 'running', started_at = NOW(), attempts = j.attempts + 1
+                WHERE j.job_id IN (
+                    SELECT job_id FROM metadata_extraction_jobs
+                    WHERE status = 'pending' AND run_after <= NOW()
+                    ORDER BY run_after, job_id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING j.job_id, j.product_id, j.auto_sync_category, j.attempts
+            """, (self.batch_size,))
+            rows = cursor.fetchall()
+            conn.commit()
+            return [(r[0], r[1], r[2], r[3]) for r in rows]
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _finish(self, job_id: int, attempts: int, error: Optional[str]) -> None:
+        from database import get_connection
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            if error is None:
+                cursor.execute("""
+                    UPDATE metadata_extraction_jobs
+                    SET status = 'done', finished_at = NOW(), last_error = NULL
+                    WHERE job_id = %s
+                """, (job_id,))
+            elif attempts >= MAX_ATTEMPTS:
+                cursor.execute("""
+                    UPDATE metadata_extraction_jobs
+                    SET status = 'failed', finished_at = NOW(), last_error = %s
+                    WHERE job_id = %s
+                """, (error[:2000], job_id))
+            else:
+                # Back off 1, 4, 9... minutes; if a newer pending job for the product exists, let it win
+                cursor.execute("""
+                    UPDATE metadata_extraction_jobs j
+                    SET status = 'pending', last_error = %s,
+                        run_after = NOW() + (j.attempts * j.attempts) * INTERVAL '1 minute'
+                    WHERE j.job_id = %s
+                      AND NOT EXISTS (
+                          SELECT 1 FROM metadata_extraction_jobs o
+                          WHERE o.product_id = j.product_id AND o.status = 'pending'
+                      )
+                """, (error[:2000], job_id))
+                if cursor.rowcount == 0:
+                    cursor.execute("""
+                        UPDATE metadata_extraction_jobs
+                        SET status = 'failed', finished_at = NOW(), last_error = %s
+                        WHERE job_id = %s
+                    """, (error[:2000], job_id))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.warning("Could not record result of metadata job %s: %s", job_id, e)
+        finally:
+            conn.close()
+
+    def _housekeeping(self) -> None:
+        """Requeue jobs orphaned by a dead worker and trim old finished jobs (at most hourly)."""
+        if time.time() - self._last_cleanup < 3600:
+            return
+        self._last_cleanup = time.time()
+        from database import get_connection
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE metadata_extraction_jobs j
+                SET status = 'pending', run_after = NOW()
+                WHERE j.status = 'running'
+                  AND j.started_at < NOW() - %s * INTERVAL '1 minute'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM metadata_extraction_jobs o
+                      WHERE o.product_id = j.product_id AND o.status = 'pending'
+                  )
+            """, (STALE_RUNNING_MINUTES,))
+            cursor.execute("""
+                DELETE FROM metadata_extraction_jobs
+                WHERE status = 'done' AND finished_at < NOW() - %s * INTERVAL '1 day'
+            """, (DONE_RETENTION_DAYS,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.warning("Metadata job housekeeping failed: %s", e)
+        finally:
+            conn.close()
+
+    def _prefetch_barcodes(self, product_ids: List[int]) -> None:
+        """Resolve the batch's barcodes together (a received shipment arrives as one batch)."""
+        from database import get_connection
+        try:
+            conn = get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT barcode FROM inventory WHERE product_id = ANY(%s) AND barcode IS NOT NULL",
+                    (product_ids,)
+                )
+                barcodes = [row[0] for row in cursor.fetchall()]
+                conn.rollback()
+            finally:
+                conn.close()
+            if barcodes:
+                from barcode_lookup_cache import prefetch_barcodes
+                prefetch_barcodes(barcodes)
+        except Exception as e:
+            logger.debug("Barcode prefetch for metadata jobs failed: %s", e)
+
+    def run_once(self) -> int:
+        """Claim and process one batch; returns the number of jobs handled."""
+        from database import extract_metadata_for_product
+        self._housekeeping()
+        jobs = self._claim()
+        if jobs:
+            self._prefetch_barcodes([product_id for _, product_id, _, _ in jobs])
+        for job_id, product_id, auto_sync_category, attempts in jobs:
+            error = None
+            try:
+                ok = extract_metadata_for_product(
+                    product_id,
+                    auto_sync_category=bool(auto_sync_category),
+                    metadata_system=self._get_metadata_system(),
+                )
+                if not ok:
+                    error = 'extract_metadata_for_product returned False'
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+            if error is None:
+                self.processed += 1
+            else:
+                self.failed += 1
+                logger.warning("Metadata job %s for product %s failed (attempt %s): %s",
+                               job_id, product_id, attempts, error)
+            self._finish(job_id, attempts, error)
+        return len(jobs)
+
+    def run_forever(self) -> None:
+        while True:
+            try:
+                # Keep going while there is a backlog; otherwise wait for a wake-up or the poll interval
+                if self.run_once() >= self.batch_size:
+                    continue
+            except Exception as e:
+                logger.warning("Metadata worker error: %s", e)
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+
+# Global worker instance
+_metadata_worker: Optional[MetadataExtractionWorker] = None
+_worker_lock = threading.Lock()
+
+
+def get_metadata_worker() -> MetadataExtractionWorker:
+    """Get or create the metadata worker singleton"""
+    global _metadata_worker
+    if _metadata_worker is None:
+        with _worker_lock:
+            if _metadata_worker is None:
+                _metadata_worker = MetadataExtractionWorker()
+    return _metadata_worker
+
+
+def start_metadata_worker() -> None:
+    """Start the in-process worker thread (no-op when METADATA_WORKER=0)."""
+    if METADATA_WORKER_ENABLED:
+        get_metadata_worker().start()
+
+
+def wake_metadata_worker() -> None:
+    """Nudge the in-process worker after queueing jobs (no-op if it isn't running)."""
+    if _metadata_worker is not None:
+        _metadata_worker.wake()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Process queued metadata extraction jobs')
+    parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    worker = get_metadata_worker()
+    if not args.once:
+        worker.run_forever()
+        return 0
+    total = 0
+    while True:
+        handled = worker.run_once()
+        total += handled
+        if handled < worker.batch_size:
+            break
+    print(f"Processed {total} metadata job(s): {worker.processed} ok, {worker.failed} failed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
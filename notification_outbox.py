@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Dispatcher for notification_outbox.
+Orders queue their notification in the same transaction as the order
+(database.enqueue_notification, keyed 'order:<order_id>' so a notification is
+queued at most once); a claim thread takes due rows with FOR UPDATE SKIP
+LOCKED and hands them to a fixed pool of dispatchers, which run the handler
+registered for the row's kind (a notification_service send_* consumer).
+
+A handler returns send_* results ({'email': [...], 'sms': [...]}); recipients
+that succeeded are recorded in the row's delivered list and skipped on the
+next attempt, and failures are retried with backoff up to MAX_ATTEMPTS.
+Rows left 'sending' by a process that died are requeued by housekeeping.
+
+NOTIFICATION_DISPATCHERS sets the pool size (default 2). If the outbox table
+hasn't been bootstrapped, notifications go straight to the pool (not durable).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_DISPATCHERS = max(1, int(os.getenv('NOTIFICATION_DISPATCHERS', '2') or 1))
+POLL_SECONDS = float(os.getenv('NOTIFICATION_OUTBOX_POLL_SECONDS', '10') or 10)
+MAX_ATTEMPTS = 5
+# Retry after 30s, 2m, 4.5m, 8m: an order notification hours late is no use
+RETRY_BASE_SECONDS = 30
+# A 'sending' row older than this belonged to a process that died
+STALE_SENDING_MINUTES = 10
+SENT_RETENTION_DAYS = 7
+
+# handler(store_id, payload, skip) -> {'email': [{'to', 'success', 'message', ...}], 'sms': [...]}
+NotificationHandler = Callable[[int, Dict[str, Any], Set[str]], Dict[str, List[Dict[str, Any]]]]
+_handlers: Dict[str, NotificationHandler] = {}
+
+
+def register_notification_handler(kind: str, handler: NotificationHandler) -> None:
+    """Set the consumer for one kind of outbox row (e.g. 'order')."""
+    _handlers[kind] = handler
+
+
+class NotificationDispatcher:
+    """Claims due outbox rows and delivers them on a fixed-size thread pool."""
+
+    def __init__(self, workers: int = NOTIFICATION_DISPATCHERS, poll_seconds: float = POLL_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.batch_size = workers * 4
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notification-dispatch')
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics_lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.recipients_sent = 0
+        self.recipients_failed = 0
+        self.send_seconds = 0.0
+        self.queue_delay_seconds = 0.0
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self.run_forever, name='notification-outbox', daemon=True)
+        self._thread.start()
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        from database import get_connection
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE notification_outbox n
+                SET status = 'sending', started_at = NOW(), attempts = n.attempts + 1
+                WHERE n.outbox_id IN (
+                    SELECT outbox_id FROM notification_outbox
+                    WHERE status = 'pending' AND run_after <= NOW()
+                    ORDER BY run_after, outbox_id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING n.outbox_id, n.kind, n.store_id, n.payload, n.attempts, n.delivered,
+                          EXTRACT(EPOCH FROM NOW() - n.created_at)
+            """, (self.batch_size,))
+            rows = cursor.fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        keys = ('outbox_id', 'kind', 'store_id', 'payload', 'attempts', 'delivered', 'age')
+        claimed = []
+        for row in rows:
+            values = list(row.values()) if isinstance(row, dict) else list(row)
+            claimed.append(dict(zip(keys, values)))
+        return claimed
+
+    def _finish(self, outbox_id: int, attempts: int, delivered: Set[str], error: Optional[str]) -> None:
+        from database import get_connection
+        conn = get_connection()
+        cursor = conn.cursor()
+        delivered_json = json.dumps(sorted(delivered))
+        try:
+            if error is None:
+                cursor.execute("""
+                    UPDATE notification_outbox
+                    SET status = 'sent', finished_at = NOW(), delivered = %s::jsonb, last_error = NULL
+                    WHERE outbox_id = %s
+                """, (delivered_json, outbox_id))
+            elif attempts >= MAX_ATTEMPTS:
+                cursor.execute("""
+                    UPDATE notification_outbox
+                    SET status = 'failed', finished_at = NOW(), delivered = %s::jsonb, last_error = %s
+                    WHERE outbox_id = %s
+                """, (delivered_json, error[:2000], outbox_id))
+            else:
+                cursor.execute("""
+                    UPDATE notification_outbox
+                    SET status = 'pending', delivered = %s::jsonb, last_error = %s,
+                        run_after = NOW() + (attempts * attempts * %s) * INTERVAL '1 second'
+                    WHERE outbox_id = %s
+                """, (delivered_json, error[:2000], RETRY_BASE_SECONDS, outbox_id))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.warning("Could not record result of notification %s: %s", outbox_id, e)
+        finally:
+            conn.close()
+
+    def _housekeeping(self) -> None:
+        """Requeue rows orphaned mid-send and trim old sent rows (at most every 10 minutes)."""
+        if time.time() - self._last_cleanup < 600:
+            return
+        self._last_cleanup = time.time()
+        from database import get_connection
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE notification_outbox
+                SET status = 'pending', run_after = NOW()
+                WHERE status = 'sending' AND started_at < NOW() - %s * INTERVAL '1 minute'
+            """, (STALE_SENDING_MINUTES,))
+            cursor.execute("""
+                DELETE FROM notification_outbox
+                WHERE status = 'sent' AND finished_at < NOW() - %s * INTERVAL '1 day'
+            """, (SENT_RETENTION_DAYS,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.warning("Notification outbox housekeeping failed: %s", e)
+        finally:
+            conn.close()
+
+    def _send(self, kind: str, store_id: int, payload: Dict[str, Any], delivered: Set[str]) -> Optional[str]:
+        """Run the kind's handler, adding successful recipients to delivered; returns an error or None."""
+        handler = _handlers.get(kind)
+        if handler is None:
+            return f"No handler registered for notification kind '{kind}'"
+        started = time.perf_counter()
+        errors = []
+        try:
+            results = handler(store_id, payload, set(delivered)) or {}
+            for channel, channel_results in results.items():
+                for r in channel_results:
+                    if r.get('success'):
+                        delivered.add(f"{channel}:{r.get('to')}")
+                    else:
+                        errors.append(f"{channel}:{r.get('to')}: {r.get('message')}")
+        except Exception as e:
+            errors.append(str(e) or e.__class__.__name__)
+        with self._metrics_lock:
+            self.send_seconds += time.perf_counter() - started
+            self.recipients_failed += len(errors)
+        return '; '.join(errors) or None
+
+    def _deliver(self, row: Dict[str, Any]) -> None:
+        payload = row['payload']
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        delivered_before = row['delivered']
+        if isinstance(delivered_before, str):
+            delivered_before = json.loads(delivered_before)
+        delivered = set(delivered_before or [])
+        count_before = len(delivered)
+        error = self._send(row['kind'], row['store_id'], payload, delivered)
+        with self._metrics_lock:
+            self.recipients_sent += len(delivered) - count_before
+            if error is None:
+                self.sent += 1
+                self.queue_delay_seconds += float(row['age'] or 0)
+            elif row['attempts'] >= MAX_ATTEMPTS:
+                self.failed += 1
+            else:
+                self.retried += 1
+        if error is not None:
+            logger.warning("Notification %s (%s) failed (attempt %s): %s",
+                           row['outbox_id'], row['kind'], row['attempts'], error)
+        self._finish(row['outbox_id'], row['attempts'], delivered, error)
+
+    def dispatch(self, kind: str, payload: Dict[str, Any], store_id: int = 1) -> None:
+        """Deliver on the pool without an outbox row (single attempt; used before the table exists)."""
+        def _run():
+            error = self._send(kind, store_id, payload, set())
+            with self._metrics_lock:
+                if error is None:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            if error is not None:
+                logger.warning("Notification (%s, no outbox) failed: %s", kind, error)
+        self._pool.submit(_run)
+
+    def run_once(self) -> int:
+        """Claim one batch and deliver it on the pool; returns the number of rows handled."""
+        self._housekeeping()
+        rows = self._claim()
+        # Let every delivery finish before claiming more so the batch never outruns the pool
+        list(self._pool.map(self._deliver, rows))
+        return len(rows)
+
+    def run_forever(self) -> None:
+        while True:
+            try:
+                if self.run_once() >= self.batch_size:
+                    continue
+            except Exception as e:
+                logger.warning("Notification dispatcher error: %s", e)
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def backlog(self) -> Dict[str, int]:
+        from database import get_connection
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT status, COUNT(*) FROM notification_outbox WHERE status <> 'sent' GROUP BY status")
+            rows = cursor.fetchall()
+            conn.rollback()
+        finally:
+            conn.close()
+        return {(r['status'] if isinstance(r, dict) else r[0]): (r['count'] if isinstance(r, dict) else r[1]) for r in rows}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            out = {
+                'workers': self.workers,
+                'sent': self.sent,
+                'retried': self.retried,
+                'failed': self.failed,
+                'recipients_sent': self.recipients_sent,
+                'recipients_failed': self.recipients_failed,
+                'avg_send_ms': round(self.send_seconds * 1000 / max(1, self.sent + self.retried + self.failed), 1),
+                'avg_queue_delay_ms': round(self.queue_delay_seconds * 1000 / max(1, self.sent), 1),
+            }
+        try:
+            out['backlog'] = self.backlog()
+        except Exception as e:
+            out['backlog'] = {'error': str(e)}
+        return out
+
+
+# Global dispatcher instance
+_dispatcher: Optional[NotificationDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    """Get or create the notification dispatcher singleton"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher()
+    return _dispatcher
+
+
+def start_notification_dispatcher() -> None:
+    """Start the claim thread (the dispatcher pool is created with the singleton)."""
+    get_notification_dispatcher().start()
+
+
+def wake_notification_dispatcher() -> None:
+    """Nudge the claim thread after queueing notifications (no-op if it isn't running)."""
+    if _dispatcher is not None:
+        _dispatcher.wake()
+
+
+def notification_committed(queued: Optional[bool], kind: str, payload: Dict[str, Any], store_id: int = 1) -> None:
+    """
+    Call after committing the transaction that ran database.enqueue_notification
+    with its result: wakes the dispatcher, or delivers from the pool when the
+    outbox table doesn't exist (queued is None).
+    """
+    if queued is None:
+        get_notification_dispatcher().dispatch(kind, payload, store_id)
+    elif queued:
+        wake_notification_dispatcher()
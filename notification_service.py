@@ -13,14 +13,24 @@ import io
 import json
 import os
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
-from typing import Optional, Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Set
 import logging
 
 logger = logging.getLogger(__name__)
 
+NOTIFICATION_SETTINGS_TTL_SECONDS = float(os.getenv('NOTIFICATION_SETTINGS_TTL_SECONDS', '30') or 0)
+# Idle authenticated SMTP connections kept per credential set (also the batch send concurrency)
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '3') or 0)
+# Providers drop idle sessions; an older idle connection is closed instead of reused
+SMTP_IDLE_SECONDS = float(os.getenv('SMTP_IDLE_SECONDS', '60') or 0)
+
 # Email notification order source logos – use inline base64 for reliable display in emails
 _EMAIL_LOGO_FILES = {
     "doordash": "doordash-email-logo.svg",
@@ -64,7 +74,7 @@ DEFAULT_PREFS = {
 }
 
 
-def _get_sms_settings(store_id: int = 1):
+def _load_sms_settings(store_id: int = 1):
     """Load sms_settings for store. Returns None if not found. Tolerates missing email_* columns."""
     try:
         from database_postgres import get_connection
@@ -110,6 +120,54 @@ def _get_sms_settings(store_id: int = 1):
     return None
 
 
+class _StoreSettingsCache:
+    """sms_settings rows per store with a TTL; callers get a copy."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[int, tuple] = {}
+        # Bumped on invalidation so a load that raced a save isn't kept
+        self._generation = 0
+
+    def get(self, store_id: int, loader) -> Optional[Dict[str, Any]]:
+        if self.ttl <= 0:
+            return loader(store_id)
+        with self._lock:
+            entry = self._entries.get(store_id)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                return dict(entry[1]) if entry[1] is not None else None
+            generation = self._generation
+        value = loader(store_id)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[store_id] = (time.monotonic(), dict(value) if value is not None else None)
+        return value
+
+    def invalidate(self, store_id: Optional[int] = None) -> None:
+        with self._lock:
+            if store_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(store_id, None)
+            self._generation += 1
+
+
+_settings_cache = _StoreSettingsCache(NOTIFICATION_SETTINGS_TTL_SECONDS)
+
+
+def _get_sms_settings(store_id: int = 1):
+    """sms_settings for store (cached for NOTIFICATION_SETTINGS_TTL_SECONDS). Returns None if not found."""
+    return _settings_cache.get(store_id, _load_sms_settings)
+
+
+def invalidate_notification_settings(store_id: Optional[int] = None) -> None:
+    """Call after saving sms_settings: drops the cached row and transports built from old credentials."""
+    _settings_cache.invalidate(store_id)
+    _smtp_pool.close_all()
+    _aws_client.cache_clear()
+
+
 def get_notification_preferences(store_id: int = 1) -> Dict[str, Any]:
     """Return merged preferences (DB + defaults).
     
@@ -235,6 +293,160 @@ def get_order_email_recipients(store_id: int, order_source: str = '') -> List[st
 
 
 
+def _quit_smtp(conn: smtplib.SMTP) -> None:
+    try:
+        conn.quit()
+    except Exception:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+class _SMTPPool:
+    """Authenticated SMTP connections kept open per (server, port, user, password, tls)."""
+
+    def __init__(self, max_idle: int = SMTP_POOL_SIZE, idle_seconds: float = SMTP_IDLE_SECONDS):
+        self.max_idle = max_idle
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._idle: Dict[tuple, List[tuple]] = {}
+        self.opened = 0
+        self.reused = 0
+        self.reconnects = 0
+
+    def _connect(self, key: tuple) -> smtplib.SMTP:
+        server, port, user, password, use_tls = key
+        conn = smtplib.SMTP(server, port, timeout=30)
+        try:
+            if use_tls:
+                conn.starttls()
+            conn.login(user, password)
+        except Exception:
+            _quit_smtp(conn)
+            raise
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self, key: tuple) -> tuple:
+        """(connection, reused): an idle connection for key if one is fresh enough, else a new login."""
+        now = time.monotonic()
+        conn, stale = None, []
+        with self._lock:
+            idle = self._idle.get(key) or []
+            while idle:
+                candidate, released_at = idle.pop()
+                if now - released_at < self.idle_seconds:
+                    conn = candidate
+                    self.reused += 1
+                    break
+                stale.append(candidate)
+        for c in stale:
+            _quit_smtp(c)
+        if conn is not None:
+            return conn, True
+        return self._connect(key), False
+
+    def release(self, key: tuple, conn: smtplib.SMTP) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((conn, time.monotonic()))
+                return
+        _quit_smtp(conn)
+
+    def close_all(self) -> None:
+        with self._lock:
+            conns = [conn for idle in self._idle.values() for conn, _ in idle]
+            self._idle.clear()
+        for conn in conns:
+            _quit_smtp(conn)
+
+    def sendmail(self, key: tuple, from_addr: str, to_addrs, message: str) -> None:
+        """Send on a pooled connection; a reused connection the server has dropped is replaced."""
+        while True:
+            conn, reused = self.acquire(key)
+            try:
+                conn.sendmail(from_addr, to_addrs, message)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                # The message was refused but the session is still usable, unless the server is closing it
+                if getattr(e, 'smtp_code', None) == 421:
+                    _quit_smtp(conn)
+                else:
+                    self.release(key, conn)
+                raise
+            except (smtplib.SMTPException, OSError):
+                _quit_smtp(conn)
+                if reused:
+                    with self._lock:
+                        self.reconnects += 1
+                    continue
+                raise
+            self.release(key, conn)
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'opened': self.opened,
+                'reused': self.reused,
+                'reconnects': self.reconnects,
+            }
+
+
+_smtp_pool = _SMTPPool()
+
+
+def _smtp_key(s: Dict) -> tuple:
+    return (
+        s.get("smtp_server") or "smtp.gmail.com",
+        int(s.get("smtp_port") or 587),
+        (s.get("smtp_user") or "").replace("\xa0", " ").strip(),
+        (s.get("smtp_password") or "").replace("\xa0", "").replace("\u00a0", "").strip(),
+        bool(s.get("smtp_use_tls", 1)),
+    )
+
+
+@lru_cache(maxsize=16)
+def _aws_client(service: str, region: str, access_key: str, secret_key: str):
+    """One boto3 client per service and credential set (boto3 clients are thread-safe)."""
+    import boto3
+    return boto3.client(service, region_name=region, aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+
+
+def transport_stats() -> Dict[str, Any]:
+    aws = _aws_client.cache_info()
+    return {'smtp': _smtp_pool.stats(), 'aws_clients': {'cached': aws.currsize, 'hits': aws.hits, 'misses': aws.misses}}
+
+
+def _email_sender(s: Dict, from_name: Optional[str] = None) -> tuple:
+    """(provider, From header) for the store's email settings."""
+    provider = (s.get("email_provider") or "gmail").lower()
+    from_addr = s.get("email_from_address") or s.get("smtp_user") or "noreply@localhost"
+    from_display = from_name or s.get("business_name") or "POS"
+    if from_display:
+        from_header = f"{from_display} <{from_addr}>"
+    else:
+        from_header = from_addr
+    return provider, from_header
+
+
+def _send_with_settings(
+    s: Dict, provider: str, from_header: str, to_address: str, subject: str, body_html: str,
+    body_text: Optional[str] = None, inline_images: Optional[List[tuple]] = None,
+) -> Dict[str, Any]:
+    if provider == "gmail":
+        return _send_email_gmail(s, to_address, from_header, subject, body_html, body_text, inline_images=inline_images)
+    if provider == "aws_ses":
+        return _send_email_aws_ses(s, to_address, from_header, subject, body_html, body_text, inline_images=inline_images)
+    return {"success": False, "message": f"Unknown email provider: {provider}", "provider": provider}
+
+
+_NO_SETTINGS_MESSAGE = "No notification settings configured. Save your Gmail/credentials first, or provide them for testing."
+
+
 def send_email(
     to_address: str,
     subject: str,
@@ -252,66 +464,100 @@ def send_email(
     """
     s = settings_override if settings_override else _get_sms_settings(store_id)
     if not s:
-        return {"success": False, "message": "No notification settings configured. Save your Gmail/credentials first, or provide them for testing.", "provider": None}
+        return {"success": False, "message": _NO_SETTINGS_MESSAGE, "provider": None}
+    provider, from_header = _email_sender(s, from_name)
+    return _send_with_settings(s, provider, from_header, to_address, subject, body_html, body_text, inline_images)
 
-    provider = (s.get("email_provider") or "gmail").lower()
-    from_addr = s.get("email_from_address") or s.get("smtp_user") or "noreply@localhost"
-    from_display = from_name or s.get("business_name") or "POS"
-    if from_display:
-        from_header = f"{from_display} <{from_addr}>"
-    else:
-        from_header = from_addr
 
-    if provider == "gmail":
-        return _send_email_gmail(s, to_address, from_header, subject, body_html, body_text, inline_images=inline_images)
-    if provider == "aws_ses":
-        return _send_email_aws_ses(s, to_address, from_header, subject, body_html, body_text, inline_images=inline_images)
-    return {"success": False, "message": f"Unknown email provider: {provider}", "provider": provider}
+def send_email_batch(
+    messages: List[Dict[str, Any]],
+    store_id: int = 1,
+    from_name: Optional[str] = None,
+    settings_override: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Send many emails with one settings lookup, over pooled SMTP connections or the
+    cached SES client, up to SMTP_POOL_SIZE at a time.
+    messages: dicts with to, subject, body_html and optionally body_text, inline_images.
+    Returns {to, success, message, provider} per message, in order.
+    """
+    if not messages:
+        return []
+    s = settings_override if settings_override else _get_sms_settings(store_id)
+    if not s:
+        return [{"to": m["to"], "success": False, "message": _NO_SETTINGS_MESSAGE, "provider": None} for m in messages]
+    provider, from_header = _email_sender(s, from_name)
+
+    def _send_one(m: Dict[str, Any]) -> Dict[str, Any]:
+        r = _send_with_settings(s, provider, from_header, m["to"], m["subject"], m["body_html"],
+                                m.get("body_text"), m.get("inline_images"))
+        return {"to": m["to"], **r}
+
+    workers = min(max(1, SMTP_POOL_SIZE), len(messages))
+    if workers == 1:
+        return [_send_one(m) for m in messages]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='email-batch') as pool:
+        return list(pool.map(_send_one, messages))
+
+
+def send_bulk_email(
+    to_addresses: List[str],
+    subject: str,
+    body_html: str,
+    body_text: Optional[str] = None,
+    store_id: int = 1,
+    inline_images: Optional[List[tuple]] = None,
+) -> List[Dict[str, Any]]:
+    """Send one message to many recipients (each gets their own copy); see send_email_batch."""
+    return send_email_batch([
+        {"to": addr, "subject": subject, "body_html": body_html, "body_text": body_text, "inline_images": inline_images}
+        for addr in to_addresses
+    ], store_id)
+
+
+def _build_email_message(
+    to_addr: str, from_header: str, subject: str, body_html: str, body_text: Optional[str],
+    inline_images: Optional[List[tuple]] = None,
+) -> MIMEMultipart:
+    if inline_images:
+        msg = MIMEMultipart("related")
+        msg["Subject"] = subject
+        msg["From"] = from_header
+        msg["To"] = to_addr
+        alt = MIMEMultipart("alternative")
+        alt.attach(MIMEText(body_text or body_html, "plain"))
+        alt.attach(MIMEText(body_html, "html"))
+        msg.attach(alt)
+        for cid, img_bytes in inline_images:
+            if img_bytes:
+                img_part = MIMEImage(img_bytes, _subtype="png")
+                img_part.add_header("Content-ID", f"<{cid}>")
+                img_part.add_header("Content-Disposition", "inline", filename=f"{cid}.png")
+                msg.attach(img_part)
+    else:
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = from_header
+        msg["To"] = to_addr
+        msg.attach(MIMEText(body_text or body_html, "plain"))
+        if body_html and body_html != (body_text or ""):
+            msg.attach(MIMEText(body_html, "html"))
+    return msg
 
 
 def _send_email_gmail(
     s: Dict, to_addr: str, from_header: str, subject: str, body_html: str, body_text: Optional[str],
     inline_images: Optional[List[tuple]] = None,
 ) -> Dict[str, Any]:
-    smtp_server = s.get("smtp_server") or "smtp.gmail.com"
-    smtp_port = int(s.get("smtp_port") or 587)
-    smtp_user = (s.get("smtp_user") or "").replace("\xa0", " ").strip()
-    smtp_password = (s.get("smtp_password") or "").replace("\xa0", "").replace("\u00a0", "").strip()
-    use_tls = s.get("smtp_use_tls", 1)
+    key = _smtp_key(s)
+    smtp_user, smtp_password = key[2], key[3]
 
     if not smtp_user or not smtp_password or smtp_password == "***":
         return {"success": False, "message": "Gmail: SMTP user and app password required", "provider": "gmail"}
 
     try:
-        if inline_images:
-            msg = MIMEMultipart("related")
-            msg["Subject"] = subject
-            msg["From"] = from_header
-            msg["To"] = to_addr
-            alt = MIMEMultipart("alternative")
-            alt.attach(MIMEText(body_text or body_html, "plain"))
-            alt.attach(MIMEText(body_html, "html"))
-            msg.attach(alt)
-            for cid, img_bytes in inline_images:
-                if img_bytes:
-                    img_part = MIMEImage(img_bytes, _subtype="png")
-                    img_part.add_header("Content-ID", f"<{cid}>")
-                    img_part.add_header("Content-Disposition", "inline", filename=f"{cid}.png")
-                    msg.attach(img_part)
-        else:
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = from_header
-            msg["To"] = to_addr
-            msg.attach(MIMEText(body_text or body_html, "plain"))
-            if body_html and body_html != (body_text or ""):
-                msg.attach(MIMEText(body_html, "html"))
-
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            if use_tls:
-                server.starttls()
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_addr, msg.as_string())
+        msg = _build_email_message(to_addr, from_header, subject, body_html, body_text, inline_images)
+        _smtp_pool.sendmail(key, smtp_user, to_addr, msg.as_string())
         return {"success": True, "message": "Email sent via Gmail", "provider": "gmail"}
     except Exception as e:
         logger.exception("Gmail send failed")
@@ -334,22 +580,9 @@ def _send_email_aws_ses(
         return {"success": False, "message": "AWS SES: Access key and secret required", "provider": "aws_ses"}
 
     try:
-        client = boto3.client("ses", region_name=region, aws_access_key_id=ak, aws_secret_access_key=sk)
+        client = _aws_client("ses", region, ak, sk)
         if inline_images:
-            msg = MIMEMultipart("related")
-            msg["Subject"] = subject
-            msg["From"] = from_header
-            msg["To"] = to_addr
-            alt = MIMEMultipart("alternative")
-            alt.attach(MIMEText(body_text or body_html, "plain"))
-            alt.attach(MIMEText(body_html, "html"))
-            msg.attach(alt)
-            for cid, img_bytes in inline_images:
-                if img_bytes:
-                    img_part = MIMEImage(img_bytes, _subtype="png")
-                    img_part.add_header("Content-ID", f"<{cid}>")
-                    img_part.add_header("Content-Disposition", "inline", filename=f"{cid}.png")
-                    msg.attach(img_part)
+            msg = _build_email_message(to_addr, from_header, subject, body_html, body_text, inline_images)
             raw = msg.as_string()
             raw_bytes = raw.encode("utf-8") if isinstance(raw, str) else raw
             client.send_raw_email(
@@ -412,11 +645,8 @@ def _send_sms_email(
     s: Dict, store_id: int, phone: str, text: str, message_type: str, customer_id: Optional[int]
 ) -> Dict[str, Any]:
     """Send via SMTP to carrier gateway (e.g. number@txt.att.net)."""
-    smtp_server = s.get("smtp_server") or "smtp.gmail.com"
-    smtp_port = int(s.get("smtp_port") or 587)
-    smtp_user = s.get("smtp_user")
-    smtp_password = s.get("smtp_password")
-    use_tls = s.get("smtp_use_tls", 1)
+    key = _smtp_key(s)
+    smtp_user, smtp_password = key[2], key[3]
 
     if not smtp_user or not smtp_password or smtp_password == "***":
         return {"success": False, "message": "Gmail: SMTP credentials required for email-to-SMS", "provider": "email", "message_id": None}
@@ -433,11 +663,7 @@ def _send_sms_email(
         msg["From"] = smtp_user
         msg["To"] = gateway
 
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            if use_tls:
-                server.starttls()
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, gateway, msg.as_string())
+        _smtp_pool.sendmail(key, smtp_user, gateway, msg.as_string())
 
         msg_id = _log_sms_message(store_id, phone, text, "sent", "email", customer_id)
         return {"success": True, "message": "SMS sent via email gateway", "provider": "email", "message_id": msg_id}
@@ -467,7 +693,7 @@ def _send_sms_aws_sns(
     e164 = f"+1{normalized}" if len(normalized) == 10 else f"+{normalized}"
 
     try:
-        client = boto3.client("sns", region_name=region, aws_access_key_id=ak, aws_secret_access_key=sk)
+        client = _aws_client("sns", region, ak, sk)
         r = client.publish(PhoneNumber=e164, Message=text)
         msg_id = _log_sms_message(store_id, phone, text, "sent", "aws_sns", customer_id, provider_sid=r.get("MessageId"))
         return {"success": True, "message": "SMS sent via AWS SNS", "provider": "aws_sns", "message_id": msg_id}
@@ -625,8 +851,11 @@ def build_receipt_email_html(order_data: Dict[str, Any], order_items: List[Dict]
     return (html_out, text_out)
 
 
-def send_order_notification(store_id: int, order_info: Dict, emails: List[str], phones: List[str]) -> Dict[str, List[Dict]]:
-    """Send order notifications (email + SMS) if enabled. Uses email template when available."""
+def send_order_notification(store_id: int, order_info: Dict, emails: List[str], phones: List[str],
+                            skip: Optional[Set[str]] = None) -> Dict[str, List[Dict]]:
+    """Send order notifications (email + SMS) if enabled. Uses email template when available.
+    skip: recipient keys ('email:<address>', 'sms:<phone>') already delivered on an earlier attempt."""
+    skip = skip or set()
     results = {"email": [], "sms": []}
     if not should_send(store_id, "orders", "email") and not should_send(store_id, "orders", "sms"):
         return results
@@ -741,16 +970,36 @@ def send_order_notification(store_id: int, order_info: Dict, emails: List[str],
     if not inline_images:
         inline_images = None
     if should_send(store_id, "orders", "email") and emails:
-        for addr in emails:
-            r = send_email(addr, subj, body_html, body, store_id, inline_images=inline_images)
-            results["email"].append({"to": addr, **r})
+        pending = [addr for addr in emails if f"email:{addr}" not in skip]
+        results["email"] = send_bulk_email(pending, subj, body_html, body, store_id, inline_images=inline_images)
     if should_send(store_id, "orders", "sms") and phones:
         for p in phones:
+            if f"sms:{p}" in skip:
+                continue
             r = send_sms(p, body[:160], store_id, "order")
             results["sms"].append({"to": p, **r})
     return results
 
 
+def deliver_order_notification(store_id: int, order_info: Dict, skip: Optional[Set[str]] = None) -> Dict[str, List[Dict]]:
+    """Resolve the new-order recipients (order email preferences, store phone) and send to them.
+    Used by the notification_outbox dispatchers; order_info should already be enriched."""
+    order_source = (order_info.get('order_source') or '').strip().lower()
+    emails = get_order_email_recipients(store_id, order_source)
+    phones = []
+    try:
+        from database import get_store_location_settings
+        store_settings = get_store_location_settings() or {}
+        phone = (store_settings.get('store_phone') or store_settings.get('store_phone_number') or '').replace('-', '').replace(' ', '').strip()
+        if len(phone) >= 10:
+            phones.append(phone)
+    except Exception as e:
+        logger.warning("deliver_order_notification: could not load store phone: %s", e)
+    if not emails and not phones:
+        return {"email": [], "sms": []}
+    return send_order_notification(store_id, order_info, emails, phones, skip=skip)
+
+
 def _get_store_settings(store_id: int = 1) -> Dict[str, Any]:
     """Load store location + receipt settings for template variables. Same sources as receipt."""
     out = {}
@@ -811,19 +1060,43 @@ def send_receipt_email_for_order(
 ) -> Dict[str, Any]:
     """
     Build receipt email from template (or default) and send. If order_data/order_items not provided,
-    fetches from DB. Use when customer opts for email receipt after payment.
+    uses the pre-rendered email from receipt_prerender (built from the DB on a miss).
+    Use when customer opts for email receipt after payment.
     transaction_id: When provided, used to fetch signature directly (more reliable than order_id).
     """
     if not should_send(store_id, "receipts", "email"):
         return {"success": False, "message": "Receipts email disabled", "provider": None}
 
+    if order_data is None or order_items is None:
+        from receipt_prerender import receipt_email_content
+        content = receipt_email_content(store_id, order_id, transaction_id)
+    else:
+        content = build_receipt_email_for_order(store_id, order_id, order_data, order_items, transaction_id)
+    if content is None:
+        return {"success": False, "message": "Order not found", "provider": None}
+
+    inline_images = content.get('inline_images')
+    return send_receipt_email(store_id, to_address, content['subject'], content['body_html'], content['body_text'],
+                              inline_images=inline_images if inline_images else None)
+
+
+def build_receipt_email_for_order(
+    store_id: int, order_id: int,
+    order_data: Optional[Dict] = None, order_items: Optional[List[Dict]] = None,
+    transaction_id: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Receipt email content for an order: dict with subject, body_html, body_text and
+    inline_images ([(cid, bytes)]). Fetches order_data/order_items from the DB when not
+    provided; returns None if the order is not found.
+    """
     barcode_base64 = None
     if order_data is None or order_items is None:
         # Use same backend as printed receipts (/api/receipt/transaction, /api/receipt/<order_id>)
         from receipt_generator import get_receipt_data_for_email
         rd = get_receipt_data_for_email(transaction_id=transaction_id, order_id=order_id)
         if rd is None:
-            return {"success": False, "message": "Order not found", "provider": None}
+            return None
         order_data = rd['order_data']
         order_items = rd['order_items']
         barcode_base64 = rd.get('barcode_base64', '')
@@ -864,7 +1137,7 @@ def send_receipt_email_for_order(
         body_html, body_text = build_receipt_email_html(order_data, order_items, store_settings, barcode_base64=barcode_base64, use_cid_barcode=use_cid_barcode, use_cid_signature=use_cid_signature)
         subj = f"Receipt for Order {order_data.get('order_number', order_id)}"
 
-    return send_receipt_email(store_id, to_address, subj, body_html, body_text, inline_images=inline_images if inline_images else None)
+    return {'subject': subj, 'body_html': body_html, 'body_text': body_text, 'inline_images': inline_images}
 
 
 def _format_phone(phone: str) -> str:
@@ -1243,9 +1516,7 @@ def send_schedule_notification(store_id: int, employee_emails: List[str], employ
         body = render_template(tpl.get('body_text_template', ''), vars_) or body
 
     if should_send(store_id, "scheduling", "email") and employee_emails:
-        for addr in employee_emails:
-            r = send_email(addr, subj, body_html, body, store_id)
-            results["email"].append({"to": addr, **r})
+        results["email"] = send_bulk_email(employee_emails, subj, body_html, body, store_id)
     if should_send(store_id, "scheduling", "sms") and employee_phones:
         for p in employee_phones:
             r = send_sms(p, message[:160], store_id, "schedule")
@@ -1297,9 +1568,7 @@ def send_report_notification(store_id: int, to_emails: List[str], subject: str,
         subj_rendered = render_template(tpl.get('subject_template', ''), vars_)
         if subj_rendered:
             subject = subj_rendered
-    for addr in to_emails:
-        r = send_email(addr, subject, body_html, body_text, store_id)
-        results["email"].append({"to": addr, **r})
+    results["email"] = send_bulk_email(to_emails, subject, body_html, body_text, store_id)
     return results
 
 
@@ -1645,9 +1914,7 @@ def send_clockin_notification(
     if settings.get('notify_employee_self', False) and employee_email:
         to_send.add(employee_email)
 
-    for addr in to_send:
-        r = send_email(addr, subject, html, text, store_id)
-        results["email"].append({"to": addr, **r})
+    results["email"] = send_bulk_email(sorted(to_send), subject, html, text, store_id)
 
     return results
 
@@ -1690,9 +1957,7 @@ def send_late_alert_notification(
     if settings.get('late_alert_to_employee', False) and employee_email:
         to_send.add(employee_email)
 
-    for addr in to_send:
-        r = send_email(addr, subject, html, text, store_id)
-        results["email"].append({"to": addr, **r})
+    results["email"] = send_bulk_email(sorted(to_send), subject, html, text, store_id)
 
     return results
 
@@ -1810,6 +2075,7 @@ def send_schedule_notification_advanced(
             full_schedule_html += f'<td style="padding:10px;border-bottom:1px solid #e2e8f0;color:#64748b;">{s.get("position","")}</td></tr>'
         full_schedule_html += '</table>'
 
+    messages: List[Dict[str, Any]] = []
     for ed in employees_data:
         email = (ed.get('email') or '').strip()
         if not email:
@@ -1879,9 +2145,10 @@ def send_schedule_notification_advanced(
             dtpl = tpl.get('body_html_template', '')
             body_html = render_template(dtpl, vars_) or body_html
 
-        r = send_email(email, subj, body_html, "Your schedule has been updated. Please check the email HTML version.", store_id)
-        results["email"].append({"to": email, **r})
+        messages.append({"to": email, "subject": subj, "body_html": body_html,
+                         "body_text": "Your schedule has been updated. Please check the email HTML version."})
 
+    results["email"] = send_email_batch(messages, store_id)
     return results
 
 # ── Register Notification Settings ───────────────────────────────────────────
@@ -2125,9 +2392,7 @@ def send_register_notification(
     if notify_self and employee_email:
         to_send.add(employee_email)
 
-    for addr in to_send:
-        r = send_email(addr, subject, html, text, store_id)
-        results["email"].append({"to": addr, **r})
+    results["email"] = send_bulk_email(sorted(to_send), subject, html, text, store_id)
 
     return results
 def check_scheduled_orders(store_id: int = 1):
@@ -6,18 +6,159 @@ Role-Based Access Control (RBAC) Permission Manager
 import hashlib
 import secrets
 import json
+import os
+import re
+import atexit
+import threading
+import time
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, FrozenSet, Tuple
 from functools import wraps
 from database import get_connection
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from session_cache import publish_invalidation, register_invalidation_handler
+
+# Compiled permission sets are also dropped explicitly on grant/revoke/role change,
+# in every process via the session cache's NOTIFY channel ('p:<employee_id>' / 'p:*');
+# the TTL bounds staleness for edits made by scripts or while a listener reconnects
+PERMISSION_CHANNEL_PREFIX = 'p'
+PERMISSION_CACHE_TTL_SECONDS = float(os.getenv('PERMISSION_CACHE_TTL_SECONDS', '60') or 0)
+ACTIVITY_LOG_FLUSH_SECONDS = float(os.getenv('ACTIVITY_LOG_FLUSH_SECONDS', '2') or 0)
+ACTIVITY_LOG_BATCH_SIZE = 200
+
+# (full_access, granted permission names); full_access covers legacy admins without role_id
+CompiledPermissions = Tuple[bool, FrozenSet[str]]
+_NO_PERMISSIONS: CompiledPermissions = (False, frozenset())
+
+# Values allowed by audit_log_action_type_check (read once per process; empty = unconstrained).
+# Activity actions outside the list (permission names, 'grant_permission', ...) are
+# recorded as AUDIT_FALLBACK_ACTION with the original action kept in details.
+AUDIT_FALLBACK_ACTION = 'UPDATE'
+_audit_action_types: Optional[FrozenSet[str]] = None
+
+
+def _load_audit_action_types(cursor) -> FrozenSet[str]:
+    global _audit_action_types
+    if _audit_action_types is None:
+        cursor.execute("""
+            SELECT pg_get_constraintdef(c.oid)
+            FROM pg_constraint c
+            JOIN pg_class t ON t.oid = c.conrelid
+            WHERE t.relname = 'audit_log' AND c.conname = 'audit_log_action_type_check'
+        """)
+        row = cursor.fetchone()
+        definition = (row[0] if isinstance(row, tuple) else next(iter(row.values()))) if row else ''
+        _audit_action_types = frozenset(re.findall(r"'([^']*)'", definition or ''))
+    return _audit_action_types
+
+
+def _audit_action(allowed: FrozenSet[str], action: str, details: Optional[str]) -> Tuple[str, Optional[str]]:
+    """(action_type, details) that satisfy audit_log_action_type_check."""
+    if not allowed or action in allowed:
+        return action, details
+    if action and action.upper() in allowed:
+        return action.upper(), details
+    return AUDIT_FALLBACK_ACTION, f"{action}: {details}" if details else action
+
+
+class _ActivityLogBuffer:
+    """Collects audit_log rows and writes them in batches from a background thread."""
+
+    _INSERT_SQL = """
+        INSERT INTO audit_log
+        (establishment_id, table_name, record_id, action_type, employee_id, details, ip_address, resource_type, action_timestamp)
+        SELECT
+            COALESCE(e.establishment_id,
+                     (SELECT establishment_id FROM establishments ORDER BY establishment_id LIMIT 1), 1),
+            v.table_name, v.record_id, v.action_type, v.employee_id, v.details, v.ip_address, v.resource_type, v.action_timestamp
+        FROM (VALUES %s) AS v(employee_id, table_name, record_id, action_type, details, ip_address, resource_type, action_timestamp)
+        LEFT JOIN employees e ON e.employee_id = v.employee_id
+    """
+    _TEMPLATE = "(%s::integer, %s, %s::integer, %s, %s, %s, %s, %s::timestamp)"
+
+    def __init__(self, flush_interval: float = ACTIVITY_LOG_FLUSH_SECONDS, batch_size: int = ACTIVITY_LOG_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._rows: List[tuple] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+
+    def add(self, employee_id, action, resource_type, resource_id, details, ip_address) -> None:
+        row = (employee_id, resource_type or "activity", resource_id or 0, action, details,
+               ip_address, resource_type, datetime.now())
+        with self._lock:
+            self._rows.append(row)
+            pending = len(self._rows)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='activity-log-writer', daemon=True)
+                self._thread.start()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing activity log: {e}")
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns rows written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            conn = get_connection()
+            try:
+                try:
+                    allowed = _load_audit_action_types(conn.cursor())
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Error reading audit_log action types: {e}")
+                    allowed = frozenset()
+                mapped = []
+                for row in rows:
+                    action_type, details = _audit_action(allowed, row[3], row[4])
+                    mapped.append(row[:3] + (action_type, details) + row[5:])
+                written = self._write(conn, mapped)
+                self.written += written
+                return written
+            finally:
+                conn.close()
+
+    def _write(self, conn, rows: List[tuple]) -> int:
+        """Insert rows in one statement; on failure split the batch in half so a bad row costs log2(n) retries."""
+        cursor = conn.cursor()
+        try:
+            execute_values(cursor, self._INSERT_SQL, rows, template=self._TEMPLATE, page_size=len(rows))
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            conn.rollback()
+            if len(rows) == 1:
+                self.dropped += 1
+                print(f"Error logging activity (employee {rows[0][0]}, {rows[0][3]}): {e}")
+                return 0
+        mid = len(rows) // 2
+        return self._write(conn, rows[:mid]) + self._write(conn, rows[mid:])
 
 
 class PermissionManager:
     """Manages roles, permissions, and access control"""
     
     def __init__(self):
-        pass
+        # employee_id -> (expires_at, CompiledPermissions)
+        self._permission_sets: Dict[int, Tuple[float, CompiledPermissions]] = {}
+        self._permission_lock = threading.Lock()
+        self._permission_generation = 0
+        self._activity_buffer = _ActivityLogBuffer()
     
     def get_connection(self):
         """Get database connection"""
@@ -33,14 +174,37 @@ class PermissionManager:
     def has_permission(self, employee_id: int, permission_name: str) -> bool:
         """
         Check if employee has specific permission
-        Checks role permissions first, then employee-specific overrides.
+        Employee-specific overrides win over role permissions.
         Employees with admin-like position but no role_id get full access (legacy fallback).
+        Answered from the employee's compiled permission set; no query once cached.
         """
+        full_access, granted = self.get_compiled_permissions(employee_id)
+        return full_access or permission_name in granted
+
+    def get_compiled_permissions(self, employee_id: int) -> CompiledPermissions:
+        """Effective (full_access, permission names) for an employee, cached for PERMISSION_CACHE_TTL_SECONDS."""
+        try:
+            employee_id = int(employee_id)
+        except (TypeError, ValueError):
+            return _NO_PERMISSIONS
+        entry = self._permission_sets.get(employee_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        generation = self._permission_generation
+        compiled = self._compile_permissions(employee_id)
+        if PERMISSION_CACHE_TTL_SECONDS > 0:
+            with self._permission_lock:
+                # Skip caching if a grant/revoke landed while we were reading
+                if generation == self._permission_generation:
+                    self._permission_sets[employee_id] = (time.monotonic() + PERMISSION_CACHE_TTL_SECONDS, compiled)
+        return compiled
+
+    def _compile_permissions(self, employee_id: int) -> CompiledPermissions:
+        """Merge role grants with employee overrides (override wins) into one frozenset."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            # Get employee's role_id (and position for legacy admin check)
             cursor.execute("""
                 SELECT role_id, position FROM employees
                 WHERE employee_id = %s AND active = 1
@@ -48,50 +212,48 @@ class PermissionManager:
             
             role_result = cursor.fetchone()
             if not role_result:
-                return False
+                return _NO_PERMISSIONS
             
             role_id = role_result[0] if isinstance(role_result, tuple) else role_result.get('role_id')
             position = role_result[1] if isinstance(role_result, tuple) else role_result.get('position')
             # Legacy: no role_id but position is admin -> full access
             if role_id is None:
-                if self._is_admin_position_value(position):
-                    return True
-                return False
-            
-            # Get permission_id
-            cursor.execute("""
-                SELECT permission_id FROM permissions
-                WHERE permission_name = %s
-            """, (permission_name,))
-            
-            perm_result = cursor.fetchone()
-            if not perm_result:
-                return False
-            
-            permission_id = perm_result[0] if isinstance(perm_result, tuple) else perm_result['permission_id']
-            
-            # Check for employee-specific override first
-            cursor.execute("""
-                SELECT granted FROM employee_permission_overrides
-                WHERE employee_id = %s AND permission_id = %s
-            """, (employee_id, permission_id))
+                return (True, frozenset()) if self._is_admin_position_value(position) else _NO_PERMISSIONS
             
-            override = cursor.fetchone()
-            if override:
-                granted = override[0] if isinstance(override, tuple) else override['granted']
-                return bool(granted)
-            
-            # Check role permissions
             cursor.execute("""
-                SELECT granted FROM role_permissions
-                WHERE role_id = %s AND permission_id = %s AND granted = 1
-            """, (role_id, permission_id))
-            
-            role_perm = cursor.fetchone()
-            return bool(role_perm) if role_perm else False
+                SELECT p.permission_name
+                FROM permissions p
+                LEFT JOIN role_permissions rp
+                    ON rp.permission_id = p.permission_id AND rp.role_id = %s
+                LEFT JOIN employee_permission_overrides epo
+                    ON epo.permission_id = p.permission_id AND epo.employee_id = %s
+                WHERE COALESCE(epo.granted, rp.granted, 0) = 1
+            """, (role_id, employee_id))
             
+            return (False, frozenset(
+                row[0] if isinstance(row, tuple) else row['permission_name']
+                for row in cursor.fetchall()
+            ))
         finally:
             conn.close()
+
+    def invalidate_permissions(self, employee_id: Optional[int] = None, broadcast: bool = True):
+        """
+        Drop one employee's compiled permissions (or everyone's when employee_id is None).
+        broadcast=True also tells other processes; call it after the change is committed.
+        """
+        try:
+            employee_id = None if employee_id is None else int(employee_id)
+        except (TypeError, ValueError):
+            return
+        with self._permission_lock:
+            self._permission_generation += 1
+            if employee_id is None:
+                self._permission_sets.clear()
+            else:
+                self._permission_sets.pop(employee_id, None)
+        if broadcast:
+            publish_invalidation(PERMISSION_CHANNEL_PREFIX, '*' if employee_id is None else str(employee_id))
     
     def get_employee_permissions(self, employee_id: int) -> Dict[str, List[Dict[str, Any]]]:
         """
@@ -238,6 +400,7 @@ class PermissionManager:
             """, (employee_id, permission_id, reason, granted_by, reason, granted_by))
             
             conn.commit()
+            self.invalidate_permissions(employee_id)
             
             # Log the action
             self.log_activity(
@@ -288,6 +451,7 @@ class PermissionManager:
             """, (employee_id, permission_id, reason, revoked_by, reason, revoked_by))
             
             conn.commit()
+            self.invalidate_permissions(employee_id)
             
             # Log the action
             self.log_activity(
@@ -307,8 +471,16 @@ class PermissionManager:
             conn.close()
     
     def log_activity(self, employee_id: int, action: str, resource_type: Optional[str],
-                     resource_id: Optional[int], details: str, ip_address: Optional[str] = None):
-        """Log employee activity into audit_log (single audit trail)."""
+                     resource_id: Optional[int], details: str, ip_address: Optional[str] = None,
+                     buffered: bool = False):
+        """
+        Log employee activity into audit_log (single audit trail).
+        buffered=True queues the row for the background batch writer instead of
+        writing it on the caller's request path.
+        """
+        if buffered and ACTIVITY_LOG_FLUSH_SECONDS > 0:
+            self._activity_buffer.add(employee_id, action, resource_type, resource_id, details, ip_address)
+            return
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
@@ -322,6 +494,7 @@ class PermissionManager:
                 cursor.execute("SELECT establishment_id FROM establishments ORDER BY establishment_id LIMIT 1")
                 row = cursor.fetchone()
                 establishment_id = row[0] if row and (isinstance(row, tuple) and row[0]) else 1
+            action, details = _audit_action(_load_audit_action_types(cursor), action, details)
             cursor.execute("""
                 INSERT INTO audit_log
                 (establishment_id, table_name, record_id, action_type, employee_id, details, ip_address, resource_type)
@@ -402,6 +575,7 @@ class PermissionManager:
             """, (role_id, employee_id))
             
             conn.commit()
+            self.invalidate_permissions(employee_id)
             return cursor.rowcount > 0
         except Exception as e:
             conn.rollback()
@@ -469,6 +643,34 @@ def get_permission_manager():
     return _permission_manager
 
 
+def invalidate_employee_permissions(employee_id: Optional[int] = None):
+    """Drop cached permission sets here and in every other process (for callers outside PermissionManager that change roles/status)."""
+    if _permission_manager is not None:
+        _permission_manager.invalidate_permissions(employee_id)
+    else:
+        publish_invalidation(PERMISSION_CHANNEL_PREFIX, '*' if employee_id is None else str(int(employee_id)))
+
+
+def _apply_permission_invalidation(value: str) -> None:
+    """Listener side of invalidate_permissions: drop locally without re-broadcasting."""
+    if _permission_manager is not None:
+        _permission_manager.invalidate_permissions(int(value) if value.isdigit() else None, broadcast=False)
+
+
+register_invalidation_handler(PERMISSION_CHANNEL_PREFIX, _apply_permission_invalidation)
+
+
+def _flush_activity_log_on_exit():
+    if _permission_manager is not None:
+        try:
+            _permission_manager._activity_buffer.flush()
+        except Exception:
+            pass
+
+
+atexit.register(_flush_activity_log_on_exit)
+
+
 def require_permission(permission_name: str):
     """
     Decorator to check if user has permission
@@ -513,13 +715,14 @@ def require_permission(permission_name: str):
                     'required_permission': permission_name
                 }), 403
             
-            # Log successful action
+            # Log successful action (batched off the request path)
             pm.log_activity(
                 employee_id, permission_name,
                 request.path.split('/')[-1] if request.path else None,
                 None,
                 f"Performed {permission_name}",
-                request.remote_addr
+                request.remote_addr,
+                buffered=True
             )
             
             return f(*args, **kwargs)
@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 """
 Product Image Matcher using Deep Learning Embeddings
-Uses EfficientNet for feature extraction and cosine similarity for matching
+Uses EfficientNet for feature extraction and cosine similarity for matching.
+Catalog embeddings are held in an EmbeddingIndex (one normalized float32
+matrix), so identification is a matrix product plus top-k, not a loop.
+Images are embedded in batches: a thread pool decodes and transforms the next
+batches while the model runs on the current one.
+Embeddings are stored as raw float32 rows tagged with the model version that
+produced them (embedding_store.py); workers start from a memory-mapped
+snapshot when it matches the database.
 """
 
 import torch
@@ -9,10 +16,38 @@ import torchvision.transforms as transforms
 from torchvision import models
 import numpy as np
 from PIL import Image
-import pickle
+import argparse
 import os
-from typing import List, Dict, Optional, Any
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
 from database import get_connection
+from embedding_index import EmbeddingIndex, normalize_rows
+from embedding_store import (
+    decode_embedding, decode_legacy_embedding, encode_embedding, load_snapshot, save_snapshot
+)
+
+# Images per forward pass
+IMAGE_EMBED_BATCH_SIZE = int(os.getenv('IMAGE_EMBED_BATCH_SIZE', '32') or 32)
+# Decode/transform threads (PIL and the torchvision transforms release the GIL)
+IMAGE_EMBED_WORKERS = int(os.getenv('IMAGE_EMBED_WORKERS', '0') or 0) or min(8, os.cpu_count() or 1)
+# torch intra-op threads for CPU inference during builds; 0 keeps torch's default
+IMAGE_EMBED_TORCH_THREADS = int(os.getenv('IMAGE_EMBED_TORCH_THREADS', '0') or 0)
+# Batches decoded ahead of the model
+IMAGE_EMBED_PREFETCH_BATCHES = 2
+# Embeddings written per transaction during a build (an interrupted build resumes from here)
+IMAGE_EMBED_COMMIT_EVERY = 256
+# Bump when decoding/preprocessing changes in a way that moves embeddings
+EMBEDDING_PREPROCESS_VERSION = 1
+# Pooled feature size per model (the classifier is cut off)
+MODEL_EMBEDDING_DIMS = {'efficientnet_b0': 1280, 'resnet18': 512}
+# Rows stored before embeddings carried a model version were pickled by this model
+LEGACY_EMBEDDING_MODEL = 'efficientnet_b0'
+# Snapshot path prefix: <prefix>.idx plus <prefix>.<token>.npy
+PRODUCT_EMBEDDINGS_SNAPSHOT = os.getenv('PRODUCT_EMBEDDINGS_SNAPSHOT', 'product_embeddings')
 
 
 class ProductImageMatcher:
@@ -37,10 +72,12 @@ class ProductImageMatcher:
         if model_name == 'efficientnet_b0':
             try:
                 # Try new API (torchvision 0.13+)
-                self.model = models.efficientnet_b0(weights=models.EfficientNet_B0_Weights.DEFAULT)
+                weights = models.EfficientNet_B0_Weights.DEFAULT
+                self.model = models.efficientnet_b0(weights=weights)
             except (AttributeError, TypeError):
                 try:
                     # Fallback for older torchvision versions
+                    weights = 'pretrained'
                     self.model = models.efficientnet_b0(pretrained=True)
                 except Exception as e:
                     raise RuntimeError(f"Failed to load EfficientNet model: {e}. Make sure torchvision is installed correctly.")
@@ -49,10 +86,12 @@ class ProductImageMatcher:
         elif model_name == 'resnet18':
             try:
                 # Try new API (torchvision 0.13+)
-                self.model = models.resnet18(weights=models.ResNet18_Weights.DEFAULT)
+                weights = models.ResNet18_Weights.DEFAULT
+                self.model = models.resnet18(weights=weights)
             except (AttributeError, TypeError):
                 try:
                     # Fallback for older torchvision versions
+                    weights = 'pretrained'
                     self.model = models.resnet18(pretrained=True)
                 except Exception as e:
                     raise RuntimeError(f"Failed to load ResNet model: {e}. Make sure torchvision is installed correctly.")
@@ -64,6 +103,11 @@ class ProductImageMatcher:
         self.model.to(self.device)
         self.model.eval()
         
+        # Stored embeddings from any other version are stale and get re-embedded
+        self.model_name = model_name
+        self.model_version = f"{model_name}:{weights}:p{EMBEDDING_PREPROCESS_VERSION}"
+        self.embedding_dim = MODEL_EMBEDDING_DIMS[model_name]
+        
         # Image preprocessing
         self.transform = transforms.Compose([
             transforms.Resize(256),
@@ -74,9 +118,47 @@ class ProductImageMatcher:
         ])
         
         # Load or create embedding database
-        self.product_embeddings = {}
+        self.index = EmbeddingIndex()
         self.product_metadata = {}
     
+    @property
+    def embedding_count(self) -> int:
+        return len(self.index)
+    
+    @property
+    def product_embeddings(self) -> Dict[int, np.ndarray]:
+        """product_id -> embedding (copied out of the index; prefer self.index)"""
+        return {product_id: self.index.get(product_id) for product_id in self.index.ids}
+    
+    def _writable_metadata(self) -> Dict[int, Dict[str, Any]]:
+        # Metadata loaded from a snapshot is a read-only view
+        if not isinstance(self.product_metadata, dict):
+            self.product_metadata = dict(self.product_metadata)
+        return self.product_metadata
+    
+    def add_product_embedding(self, product_id: int, embedding: np.ndarray, metadata: Dict[str, Any]):
+        """Add or replace one product in the in-memory index"""
+        self.index.add(product_id, embedding)
+        self._writable_metadata()[product_id] = metadata
+    
+    def remove_product_embedding(self, product_id: int) -> bool:
+        self._writable_metadata().pop(product_id, None)
+        return self.index.remove(product_id)
+    
+    def _load_image_tensor(self, image_path: str) -> torch.Tensor:
+        """Decode and preprocess one image (runs on the decode threads)"""
+        with Image.open(image_path) as image:
+            # JPEGs decode straight at a reduced scale that still covers the 256px resize
+            image.draft('RGB', (256, 256))
+            return self.transform(image.convert('RGB'))
+    
+    def _embed_tensors(self, tensors: List[torch.Tensor]) -> np.ndarray:
+        """One forward pass over preprocessed images; returns normalized rows"""
+        batch = torch.stack(tensors).to(self.device)
+        with torch.inference_mode():
+            output = self.model(batch)
+        return normalize_rows(output.reshape(output.shape[0], -1).cpu().numpy())
+    
     def extract_embedding(self, image_path: str) -> np.ndarray:
         """
         Extract feature embedding from image
@@ -88,48 +170,117 @@ class ProductImageMatcher:
             Normalized embedding vector
         """
         try:
-            image = Image.open(image_path).convert('RGB')
-            input_tensor = self.transform(image).unsqueeze(0).to(self.device)
+            return self._embed_tensors([self._load_image_tensor(image_path)])[0]
+        except Exception as e:
+            raise ValueError(f"Error processing image {image_path}: {str(e)}")
+    
+    def iter_embeddings(self, items: Iterable[Tuple[Hashable, str]], batch_size: Optional[int] = None,
+                        num_workers: Optional[int] = None) -> Iterator[Tuple[Hashable, str, Optional[np.ndarray], Optional[str]]]:
+        """
+        Embed many images in batches
+        
+        Args:
+            items: (key, image_path) pairs; key is passed through untouched
+            batch_size: Images per forward pass (IMAGE_EMBED_BATCH_SIZE)
+            num_workers: Decode threads (IMAGE_EMBED_WORKERS)
             
-            with torch.no_grad():
-                embedding = self.model(input_tensor)
+        Yields:
+            (key, image_path, embedding, None), or (key, image_path, None, error)
+            for images that could not be read. Order within a batch is not kept.
+        """
+        batch_size = max(1, batch_size or IMAGE_EMBED_BATCH_SIZE)
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=max(1, num_workers or IMAGE_EMBED_WORKERS),
+                                thread_name_prefix='embed-decode') as pool:
+            pending = deque()
             
-            # Flatten and normalize
-            embedding = embedding.cpu().squeeze().numpy()
-            embedding = embedding.flatten()
-            embedding = embedding / (np.linalg.norm(embedding) + 1e-8)  # Add small epsilon to avoid division by zero
+            def submit_next() -> None:
+                chunk = list(islice(items, batch_size))
+                if chunk:
+                    pending.append([(key, path, pool.submit(self._load_image_tensor, path)) for key, path in chunk])
             
-            return embedding
-        except Exception as e:
-            raise ValueError(f"Error processing image {image_path}: {str(e)}")
+            for _ in range(IMAGE_EMBED_PREFETCH_BATCHES):
+                submit_next()
+            while pending:
+                batch = pending.popleft()
+                # Keep the decode threads busy while this batch goes through the model
+                submit_next()
+                loaded = []
+                for key, path, future in batch:
+                    try:
+                        loaded.append((key, path, future.result()))
+                    except Exception as e:
+                        yield key, path, None, f"Error processing image {path}: {e}"
+                if not loaded:
+                    continue
+                try:
+                    embeddings = self._embed_tensors([tensor for _, _, tensor in loaded])
+                except Exception as e:
+                    for key, path, _ in loaded:
+                        yield key, path, None, f"Error processing image {path}: {e}"
+                    continue
+                for (key, path, _), embedding in zip(loaded, embeddings):
+                    yield key, path, embedding, None
+    
+    def _flush_embeddings(self, conn, rows: List[Tuple]) -> None:
+        """Upsert (product_id, embedding_bytes, dim, model_version, photo, photo_mtime) rows and commit"""
+        from psycopg2.extras import execute_values
+        cursor = conn.cursor()
+        execute_values(cursor, """
+            INSERT INTO product_image_embeddings
+            (product_id, embedding, dim, model_version, photo, photo_mtime, updated_at)
+            VALUES %s
+            ON CONFLICT (product_id) DO UPDATE SET
+                embedding = EXCLUDED.embedding,
+                dim = EXCLUDED.dim,
+                model_version = EXCLUDED.model_version,
+                photo = EXCLUDED.photo,
+                photo_mtime = EXCLUDED.photo_mtime,
+                updated_at = EXCLUDED.updated_at
+        """, rows, template="(%s, %s, %s, %s, %s, %s, NOW())", page_size=len(rows))
+        conn.commit()
     
-    def build_product_database(self, rebuild_existing: bool = False):
+    def build_product_database(self, rebuild_existing: bool = False, batch_size: Optional[int] = None,
+                               num_workers: Optional[int] = None, num_threads: Optional[int] = None):
         """
         Build embedding database from all product images in inventory
-        Run this once when setting up, then periodically when adding products
+        Run this once when setting up, then periodically when adding products.
+        Without rebuild_existing only products whose photo path, file mtime or
+        model version differs from what was last embedded are processed, and progress is
+        committed every IMAGE_EMBED_COMMIT_EVERY products, so an interrupted
+        build picks up where it stopped.
         
         Args:
             rebuild_existing: If True, rebuild embeddings even if they exist
+            batch_size: Images per forward pass (IMAGE_EMBED_BATCH_SIZE)
+            num_workers: Decode threads (IMAGE_EMBED_WORKERS)
+            num_threads: torch threads for CPU inference (IMAGE_EMBED_TORCH_THREADS)
         """
+        num_threads = num_threads or IMAGE_EMBED_TORCH_THREADS
+        if num_threads and self.device.type == 'cpu':
+            torch.set_num_threads(num_threads)
+        
         conn = get_connection()
         cursor = conn.cursor()
         
-        # Get all products with images
-        if rebuild_existing:
-            cursor.execute("""
-                SELECT product_id, sku, product_name, photo, category
-                FROM inventory
-                WHERE photo IS NOT NULL AND photo != ''
-            """)
-        else:
-            # Only get products without embeddings
-            cursor.execute("""
-                SELECT product_id, sku, product_name, photo, category
-                FROM inventory
-                WHERE photo IS NOT NULL AND photo != ''
-                AND (image_embedding IS NULL OR last_embedding_update IS NULL)
-            """)
+        # Embeddings of products that no longer have a photo
+        cursor.execute("""
+            DELETE FROM product_image_embeddings e
+            USING inventory i
+            WHERE e.product_id = i.product_id AND (i.photo IS NULL OR i.photo = '')
+            RETURNING e.product_id
+        """)
+        for (product_id,) in cursor.fetchall():
+            self.remove_product_embedding(product_id)
+        conn.commit()
         
+        cursor.execute("""
+            SELECT i.product_id, i.sku, i.product_name, i.photo, i.category,
+                   e.photo, e.photo_mtime, e.model_version
+            FROM inventory i
+            LEFT JOIN product_image_embeddings e ON e.product_id = i.product_id
+            WHERE i.photo IS NOT NULL AND i.photo != ''
+        """)
         products = cursor.fetchall()
         
         if not products:
@@ -137,81 +288,131 @@ class ProductImageMatcher:
             conn.close()
             return
         
-        print(f"Building embeddings for {len(products)} products...")
-        
-        processed = 0
+        todo = []
+        pending_metadata = {}
+        unchanged_missing = False
         errors = 0
-        
-        for product in products:
-            product_id, sku, product_name, photo_path, category = product
-            
+        for (product_id, sku, product_name, photo_path, category,
+             embedded_photo, embedded_mtime, embedded_version) in products:
             try:
-                # Check if image file exists
-                if not os.path.exists(photo_path):
-                    print(f"✗ Image not found: {product_name} ({photo_path})")
+                mtime = os.path.getmtime(photo_path)
+            except OSError:
+                print(f"✗ Image not found: {product_name} ({photo_path})")
+                errors += 1
+                continue
+            if (not rebuild_existing and embedded_photo == photo_path and embedded_mtime == mtime
+                    and embedded_version == self.model_version):
+                unchanged_missing = unchanged_missing or product_id not in self.index
+                continue
+            todo.append((product_id, photo_path))
+            pending_metadata[product_id] = ({
+                'sku': sku,
+                'name': product_name,
+                'category': category or '',
+                'image_path': photo_path
+            }, mtime)
+        
+        print(f"Building embeddings for {len(todo)} products "
+              f"({len(products) - len(todo) - errors} up to date)...")
+        
+        processed = 0
+        rows = []
+        started = time.perf_counter()
+        try:
+            for product_id, photo_path, embedding, error in self.iter_embeddings(todo, batch_size, num_workers):
+                metadata, mtime = pending_metadata.pop(product_id)
+                if error:
+                    print(f"✗ Error with {metadata['name']} (ID: {product_id}): {error}")
                     errors += 1
                     continue
-                
-                # Extract embedding
-                embedding = self.extract_embedding(photo_path)
-                
-                # Store in memory
-                self.product_embeddings[product_id] = embedding
-                self.product_metadata[product_id] = {
-                    'sku': sku,
-                    'name': product_name,
-                    'category': category or '',
-                    'image_path': photo_path
-                }
-                
-                # Save embedding to database (as pickle)
-                embedding_blob = pickle.dumps(embedding)
-                cursor.execute("""
-                    UPDATE inventory
-                    SET image_embedding = ?,
-                        last_embedding_update = CURRENT_TIMESTAMP
-                    WHERE product_id = ?
-                """, (embedding_blob, product_id))
-                
+                self.add_product_embedding(product_id, embedding, metadata)
+                rows.append((product_id, encode_embedding(embedding), embedding.shape[0],
+                             self.model_version, photo_path, mtime))
                 processed += 1
-                print(f"✓ Processed: {product_name} (ID: {product_id})")
-                
-            except Exception as e:
-                print(f"✗ Error with {product_name} (ID: {product_id}): {e}")
-                errors += 1
+                if len(rows) >= IMAGE_EMBED_COMMIT_EVERY:
+                    self._flush_embeddings(conn, rows)
+                    rows = []
+                    elapsed = time.perf_counter() - started
+                    print(f"  {processed}/{len(todo)} embedded ({processed / elapsed:.1f} images/s)")
+            if rows:
+                self._flush_embeddings(conn, rows)
+        finally:
+            conn.close()
         
-        conn.commit()
-        conn.close()
+        # Products skipped as up to date that this process hasn't loaded yet
+        if unchanged_missing:
+            self.load_from_database()
         
-        # Save to disk for fast loading
-        self.save_database('product_embeddings.pkl')
+        # Snapshot for fast startup of the web workers
+        try:
+            self.save_database(PRODUCT_EMBEDDINGS_SNAPSHOT, stamp=self._database_stamp())
+        except Exception as e:
+            print(f"Could not write embedding snapshot: {e}")
         
-        print(f"\nDatabase built: {processed} products processed, {errors} errors")
-        print(f"Total products in memory: {len(self.product_embeddings)}")
+        elapsed = time.perf_counter() - started
+        print(f"\nDatabase built: {processed} products processed, {errors} errors in {elapsed:.1f}s")
+        print(f"Total products in memory: {self.embedding_count}")
+    
+    def _database_stamp(self, cursor=None) -> str:
+        """Changes whenever this model's stored embeddings do (row count + newest write)"""
+        conn = None
+        if cursor is None:
+            conn = get_connection()
+            cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT COUNT(*), MAX(updated_at) FROM product_image_embeddings
+                WHERE model_version = %s
+            """, (self.model_version,))
+            count, newest = cursor.fetchone()
+            return f"{count}:{newest.isoformat() if newest else ''}"
+        finally:
+            if conn is not None:
+                conn.close()
     
     def load_from_database(self):
-        """Load embeddings from database into memory"""
+        """Load this model version's embeddings from database into memory"""
         conn = get_connection()
         cursor = conn.cursor()
         
+        # Rows without a model version predate versioning and were pickled by
+        # LEGACY_EMBEDDING_MODEL; any other model treats them as stale
+        include_legacy = self.model_name == LEGACY_EMBEDDING_MODEL
         cursor.execute("""
-            SELECT product_id, sku, product_name, photo, category, image_embedding
-            FROM inventory
-            WHERE image_embedding IS NOT NULL
-        """)
+            SELECT i.product_id, i.sku, i.product_name, i.photo, i.category,
+                   e.embedding, e.dim, e.model_version
+            FROM product_image_embeddings e
+            JOIN inventory i ON i.product_id = e.product_id
+            WHERE e.model_version = %s OR (%s AND e.model_version IS NULL)
+            ORDER BY i.product_id
+        """, (self.model_version, include_legacy))
         
         products = cursor.fetchall()
         
-        self.product_embeddings = {}
-        self.product_metadata = {}
+        cursor.execute("""
+            SELECT COUNT(*) FROM product_image_embeddings
+            WHERE model_version IS DISTINCT FROM %s AND NOT (%s AND model_version IS NULL)
+        """, (self.model_version, include_legacy))
+        stale = cursor.fetchone()[0]
+        
+        product_ids = []
+        embeddings = []
+        metadata = {}
         
         for product in products:
-            product_id, sku, product_name, photo_path, category, embedding_blob = product
+            product_id, sku, product_name, photo_path, category, embedding_blob, dim, model_version = product
             
             try:
-                embedding = pickle.loads(embedding_blob)
-                self.product_embeddings[product_id] = embedding
-                self.product_metadata[product_id] = {
+                if model_version is None:
+                    embedding = decode_legacy_embedding(embedding_blob)
+                else:
+                    embedding = decode_embedding(embedding_blob, dim)
+                # Checked against the model, not the first row, so one odd row can't reject the rest
+                if embedding.shape[0] != self.embedding_dim:
+                    raise ValueError(f"{embedding.shape[0]} dimensions, {self.model_name} produces {self.embedding_dim}")
+                embeddings.append(embedding)
+                product_ids.append(product_id)
+                metadata[product_id] = {
                     'sku': sku,
                     'name': product_name,
                     'category': category or '',
@@ -221,30 +422,70 @@ class ProductImageMatcher:
                 print(f"Error loading embedding for product {product_id}: {e}")
         
         conn.close()
-        print(f"Loaded {len(self.product_embeddings)} product embeddings from database")
+        self.index = EmbeddingIndex.from_arrays(product_ids, np.stack(embeddings) if embeddings else [])
+        self.product_metadata = metadata
+        print(f"Loaded {self.embedding_count} product embeddings from database")
+        if stale:
+            print(f"{stale} embeddings were made by another model version; run build_product_database() to re-embed them")
     
-    def save_database(self, filepath: str):
-        """Save embeddings to disk for fast loading"""
-        data = {
-            'embeddings': self.product_embeddings,
-            'metadata': self.product_metadata
-        }
-        with open(filepath, 'wb') as f:
-            pickle.dump(data, f)
-        print(f"Saved embeddings to {filepath}")
+    def save_database(self, filepath: str = PRODUCT_EMBEDDINGS_SNAPSHOT, stamp: Optional[str] = None):
+        """Save embeddings to a memory-mappable snapshot (<filepath>.idx + .npy)"""
+        if filepath.endswith('.pkl'):
+            filepath = filepath[:-len('.pkl')]
+        save_snapshot(filepath, self.index.ids, self.index.matrix, self.product_metadata, {
+            'model_version': self.model_version,
+            'dim': self.index.dim,
+            'stamp': stamp,
+        })
+        print(f"Saved embeddings to {filepath}.idx")
     
-    def load_database(self, filepath: str):
-        """Load embeddings from disk"""
-        if not os.path.exists(filepath):
-            print(f"Embedding file not found: {filepath}. Building from database...")
-            self.build_product_database()
-            return
+    def load_database(self, filepath: str = PRODUCT_EMBEDDINGS_SNAPSHOT, stamp: Optional[str] = None) -> bool:
+        """
+        Load embeddings from a snapshot without copying the matrix
         
-        with open(filepath, 'rb') as f:
-            data = pickle.load(f)
-        self.product_embeddings = data['embeddings']
-        self.product_metadata = data['metadata']
-        print(f"Loaded {len(self.product_embeddings)} product embeddings from {filepath}")
+        Args:
+            filepath: Snapshot prefix
+            stamp: If given, only accept a snapshot taken at this database stamp
+            
+        Returns:
+            True if the snapshot was used
+        """
+        if filepath.endswith('.pkl'):
+            filepath = filepath[:-len('.pkl')]
+        snapshot = load_snapshot(filepath)
+        if snapshot is None:
+            return False
+        ids, matrix, metadata, header = snapshot
+        if header.get('model_version') != self.model_version:
+            print(f"Embedding snapshot {filepath} is from model {header.get('model_version')}; ignoring it")
+            return False
+        if stamp is not None and header.get('stamp') != stamp:
+            return False
+        self.index = EmbeddingIndex.from_normalized(ids, matrix)
+        self.product_metadata = metadata
+        print(f"Loaded {self.embedding_count} product embeddings from {filepath}.idx")
+        return True
+    
+    def load(self, snapshot_path: str = PRODUCT_EMBEDDINGS_SNAPSHOT):
+        """
+        Load embeddings from the fastest current source: the snapshot when it
+        matches the database, otherwise the database (then refresh the snapshot).
+        Falls back to any snapshot for this model if the database can't be read.
+        """
+        try:
+            stamp = self._database_stamp()
+        except Exception as e:
+            print(f"Could not read stored embeddings ({e}); trying snapshot")
+            if not self.load_database(snapshot_path):
+                raise
+            return
+        if self.load_database(snapshot_path, stamp=stamp):
+            return
+        self.load_from_database()
+        try:
+            self.save_database(snapshot_path, stamp=stamp)
+        except Exception as e:
+            print(f"Could not write embedding snapshot: {e}")
     
     def cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
         """Calculate cosine similarity between two vectors"""
@@ -270,29 +511,30 @@ class ProductImageMatcher:
         Returns:
             List of match dictionaries with product info and confidence
         """
-        if not self.product_embeddings:
-            raise ValueError("No product embeddings loaded. Call load_database() or build_product_database() first.")
-        
         # Extract embedding from query image
         query_embedding = self.extract_embedding(query_image_path)
+        return self.match_embeddings([query_embedding], top_k=top_k, threshold=threshold)[0]
+    
+    def match_embeddings(self, embeddings: List[np.ndarray], top_k: int = 5,
+                         threshold: float = 0.7) -> List[List[Dict[str, Any]]]:
+        """
+        Top matches for each query embedding (one matrix product for all of them)
         
-        # Calculate similarity with all products
-        similarities = {}
-        for product_id, db_embedding in self.product_embeddings.items():
-            similarity = self.cosine_similarity(query_embedding, db_embedding)
-            similarities[product_id] = similarity
+        Returns:
+            One list of match dictionaries per query, best first
+        """
+        if not len(self.index):
+            raise ValueError("No product embeddings loaded. Call load_database() or build_product_database() first.")
         
-        # Sort by similarity
-        sorted_matches = sorted(similarities.items(), 
-                               key=lambda x: x[1], 
-                               reverse=True)[:top_k]
+        all_matches = self.index.search_many(np.stack(embeddings), top_k=top_k, threshold=threshold)
         
         # Format results
         results = []
-        for product_id, similarity in sorted_matches:
-            if similarity >= threshold:
+        for matches in all_matches:
+            formatted = []
+            for product_id, similarity in matches:
                 metadata = self.product_metadata[product_id]
-                results.append({
+                formatted.append({
                     'product_id': int(product_id),
                     'confidence': float(similarity),
                     'sku': metadata['sku'],
@@ -300,7 +542,33 @@ class ProductImageMatcher:
                     'category': metadata['category'],
                     'reference_image': metadata['image_path']
                 })
+            results.append(formatted)
+        
+        return results
+    
+    def identify_products(self, image_paths: List[str], top_k: int = 5, threshold: float = 0.7,
+                          batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Identify several photos with one batched embedding pass and one match
+        
+        Returns:
+            One {'image', 'matches', 'error'} dict per path, in input order
+        """
+        if not len(self.index):
+            raise ValueError("No product embeddings loaded. Call load_database() or build_product_database() first.")
+        
+        results = [{'image': path, 'matches': [], 'error': None} for path in image_paths]
+        rows, embeddings = [], []
+        for position, _, embedding, error in self.iter_embeddings(enumerate(image_paths), batch_size):
+            if error:
+                results[position]['error'] = error
+            else:
+                rows.append(position)
+                embeddings.append(embedding)
         
+        if embeddings:
+            for position, matches in zip(rows, self.match_embeddings(embeddings, top_k=top_k, threshold=threshold)):
+                results[position]['matches'] = matches
         return results
     
     def batch_identify_shipment(self, image_paths: List[str], threshold: float = 0.75) -> List[Dict[str, Any]]:
@@ -316,19 +584,20 @@ class ProductImageMatcher:
             List of identified products with match info
         """
         identified_products = []
+        if not image_paths:
+            return identified_products
         
-        for image_path in image_paths:
-            matches = self.identify_product(image_path, top_k=1, threshold=threshold)
-            if matches:
+        for result in self.identify_products(image_paths, top_k=1, threshold=threshold):
+            if result['matches']:
                 identified_products.append({
-                    'image': image_path,
-                    'match': matches[0]
+                    'image': result['image'],
+                    'match': result['matches'][0]
                 })
             else:
                 identified_products.append({
-                    'image': image_path,
+                    'image': result['image'],
                     'match': None,
-                    'error': 'No match found above threshold'
+                    'error': result['error'] or 'No match found above threshold'
                 })
         
         return identified_products
@@ -354,13 +623,40 @@ class ProductImageMatcher:
         
         cursor.execute("""
             INSERT INTO image_identifications 
-            (product_id, query_image_path, confidence_score, identified_by, context)
-            VALUES (?, ?, ?, ?, ?)
-        """, (product_id, query_image_path, confidence, identified_by, context))
-        
-        identification_id = cursor.lastrowid
+            (establishment_id, product_id, query_image_path, confidence_score, identified_by, context)
+            SELECT establishment_id, %s, %s, %s, %s, %s
+            FROM inventory WHERE product_id = %s
+            RETURNING identification_id
+        """, (product_id, query_image_path, round(float(confidence), 2), identified_by, context, product_id))
+        
+        row = cursor.fetchone()
+        identification_id = row[0] if row else None
         conn.commit()
         conn.close()
         
         return identification_id
 
+
+def main():
+    parser = argparse.ArgumentParser(description='Build product image embeddings')
+    parser.add_argument('--rebuild', action='store_true', help='Re-embed every product, not only changed photos')
+    parser.add_argument('--batch-size', type=int, default=IMAGE_EMBED_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=IMAGE_EMBED_WORKERS, help='Image decode threads')
+    parser.add_argument('--threads', type=int, default=IMAGE_EMBED_TORCH_THREADS,
+                        help='torch threads for CPU inference (0 = torch default)')
+    parser.add_argument('--model', default='efficientnet_b0', choices=['efficientnet_b0', 'resnet18'])
+    parser.add_argument('--device', default=None)
+    args = parser.parse_args()
+    
+    matcher = ProductImageMatcher(model_name=args.model, device=args.device)
+    matcher.build_product_database(
+        rebuild_existing=args.rebuild,
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        num_threads=args.threads
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+"""
+Persistent TF-IDF index behind FreeMetadataSystem.intelligent_search.
+The vectorizer is fitted once over product_metadata.search_vector and the
+normalized sparse matrix is kept in memory (and saved to disk with np.savez so
+a restart doesn't refit). Queries only transform the query string and take one
+sparse dot product; category/brand/price filters are applied as a mask before top-k.
+
+The index follows inventory_catalog_version. Products listed in inventory_changes
+since the indexed version are re-read: if their indexed text (search_vector,
+name, sku) is unchanged, price/brand/category are updated in place; otherwise
+the product is re-transformed into a small delta matrix and its old row masked
+out. The delta is merged into the main matrix once it grows (no refit); the
+vocabulary is refit after SEARCH_INDEX_REFIT_SECONDS or when categories/vendors
+change (reset_version). Sales don't move the catalog version, so quantities are
+copied from inventory every INVENTORY_STOCK_REFRESH_SECONDS.
+
+search_history rows are buffered and written in batches.
+
+    python product_search_index.py rebuild
+    python product_search_index.py query "<text>" [--repeat N]
+"""
+
+import argparse
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import get_connection
+from inventory_snapshot import INVENTORY_STOCK_REFRESH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    SEARCH_INDEX_AVAILABLE = True
+except ImportError:
+    SEARCH_INDEX_AVAILABLE = False
+
+SEARCH_INDEX_PATH = os.getenv('PRODUCT_SEARCH_INDEX_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'product_search_index.npz')
+# How often a query checks inventory_catalog_version for changes
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv('SEARCH_INDEX_REFRESH_SECONDS', '2') or 0)
+# New words are only searchable after a refit
+SEARCH_INDEX_REFIT_SECONDS = float(os.getenv('SEARCH_INDEX_REFIT_SECONDS', '3600') or 0)
+SEARCH_INDEX_SAVE_SECONDS = 300
+# Merge the delta matrix into the main one past this many rows (or this fraction of it)
+DELTA_MERGE_ROWS = 500
+DELTA_MERGE_FRACTION = 0.05
+# Without the version table there is nothing to follow; rebuild at most this often
+UNVERSIONED_REBUILD_SECONDS = 60
+MIN_SCORE = 0.1
+SEARCH_HISTORY_FLUSH_SECONDS = float(os.getenv('SEARCH_HISTORY_FLUSH_SECONDS', '5') or 0)
+SEARCH_HISTORY_BATCH_SIZE = 200
+
+_INDEX_FORMAT = 2
+
+PRODUCT_COLUMNS = [
+    'product_id', 'product_name', 'sku', 'barcode', 'product_price', 'current_quantity',
+    'brand', 'category_id', 'category_name', 'tags', 'keywords', 'attributes', 'search_vector',
+]
+# A change to any of these re-transforms the product; anything else is updated in place
+TEXT_COLUMNS = ('search_vector', 'product_name', 'sku')
+
+_PRODUCTS_SQL = """
+    SELECT
+        i.product_id,
+        i.product_name,
+        i.sku,
+        i.barcode,
+        i.product_price,
+        i.current_quantity,
+        pm.brand,
+        pm.category_id,
+        c.category_name,
+        pm.tags,
+        pm.keywords,
+        pm.attributes,
+        pm.search_vector
+    FROM inventory i
+    LEFT JOIN product_metadata pm ON i.product_id = pm.product_id
+    LEFT JOIN categories c ON pm.category_id = c.category_id
+"""
+
+
+def _price(value) -> float:
+    return float(value) if value is not None else float('nan')
+
+
+def _text_key(row: Dict[str, Any]) -> int:
+    """Stable digest of a product's indexed text (saved with the matrix to spot stale rows on load)."""
+    text = '\x1f'.join(str(row.get(c) or '') for c in TEXT_COLUMNS)
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def _text(row: Dict[str, Any]) -> str:
+    return row['search_vector'] or ''
+
+
+class ProductSearchIndex:
+    """Fitted vectorizer + row-normalized TF-IDF matrix (main + delta) over the catalog."""
+
+    def __init__(self, path: Optional[str] = SEARCH_INDEX_PATH):
+        self.path = path
+        # _lock guards swapping the query-side state; _refresh_lock serializes maintenance
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._vectorizer = None
+        # Row i < main rows is self._matrix[i]; the rest are self._delta rows
+        self._matrix = None
+        self._delta = None
+        self._rows: List[Optional[Dict[str, Any]]] = []
+        self._positions: Dict[int, int] = {}
+        self._alive = None
+        self._category_ids = None
+        self._brands = None
+        self._prices = None
+        self._version: Optional[int] = None
+        self._reset_version: Optional[int] = None
+        self._reindexed = 0
+        self._fitted_at = 0.0
+        self._last_check = 0.0
+        self._last_stock = 0.0
+        self._last_save = 0.0
+        self._dirty = False
+        self.queries = 0
+        self.rebuilds = 0
+        self.updates = 0
+        self.merges = 0
+        self.in_place = 0
+
+    # -- maintenance -------------------------------------------------------
+
+    def _current_version(self, cursor) -> Optional[Tuple[int, int]]:
+        from inventory_snapshot import get_inventory_snapshot_cache
+        return get_inventory_snapshot_cache().current_version(cursor)
+
+    def _fetch(self, cursor, product_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        if product_ids is None:
+            cursor.execute(_PRODUCTS_SQL + " ORDER BY i.product_id")
+        else:
+            cursor.execute(_PRODUCTS_SQL + " WHERE i.product_id = ANY(%s)", (product_ids,))
+        return [dict(zip(PRODUCT_COLUMNS, row)) for row in cursor.fetchall()]
+
+    def _rebuild(self, cursor, current: Optional[Tuple[int, int]]) -> None:
+        """Refit the vectorizer over the whole catalog."""
+        started = time.monotonic()
+        rows = self._fetch(cursor)
+        vectorizer = TfidfVectorizer(stop_words='english', dtype=np.float32)
+        texts = [_text(row) for row in rows]
+        try:
+            matrix = vectorizer.fit_transform(texts).tocsr()
+        except ValueError:
+            # Empty vocabulary (no metadata yet); keep a fitted-but-empty index
+            vectorizer = TfidfVectorizer(dtype=np.float32, token_pattern=r'(?u)\b\w+\b')
+            vectorizer.fit(['_'])
+            matrix = vectorizer.transform(texts).tocsr()
+        self._swap(vectorizer, matrix, None, rows)
+        self._version, self._reset_version = current if current else (None, None)
+        self._reindexed = 0
+        self._fitted_at = time.time()
+        self._dirty = True
+        self.rebuilds += 1
+        logger.info("Product search index rebuilt: %d products, %d terms in %.2fs",
+                    len(rows), len(vectorizer.vocabulary_), time.monotonic() - started)
+
+    def _swap(self, vectorizer, matrix, delta, rows: List[Optional[Dict[str, Any]]]) -> None:
+        """Install new query-side state; rows[i] is matrix/delta row i (None = replaced/deleted)."""
+        positions = {row['product_id']: pos for pos, row in enumerate(rows) if row is not None}
+        alive = np.array([row is not None for row in rows], dtype=bool)
+        category_ids = np.array([row['category_id'] if row else None for row in rows], dtype=object)
+        brands = np.array([row['brand'] if row else None for row in rows], dtype=object)
+        prices = np.array([_price(row['product_price'] if row else None) for row in rows], dtype=np.float64)
+        with self._lock:
+            self._vectorizer = vectorizer
+            self._matrix = matrix
+            self._delta = delta
+            self._rows = rows
+            self._positions = positions
+            self._alive = alive
+            self._category_ids = category_ids
+            self._brands = brands
+            self._prices = prices
+
+    def _update_in_place(self, pos: int, row: Dict[str, Any]) -> None:
+        """Same indexed text: refresh the non-text fields without touching the matrix."""
+        self._rows[pos] = row
+        self._category_ids[pos] = row['category_id']
+        self._brands[pos] = row['brand']
+        self._prices[pos] = _price(row['product_price'])
+        self.in_place += 1
+
+    def _apply_rows(self, fresh: List[Dict[str, Any]], removed: List[int]) -> None:
+        """Take fresh rows for changed products; removed are product ids that no longer exist."""
+        positions = self._positions
+        reindex = []
+        for row in fresh:
+            pos = positions.get(row['product_id'])
+            if pos is not None and _text_key(self._rows[pos]) == _text_key(row):
+                self._update_in_place(pos, row)
+            else:
+                reindex.append(row)
+        dead = [positions[pid] for pid in removed if pid in positions]
+        dead.extend(positions[row['product_id']] for row in reindex if row['product_id'] in positions)
+        if not reindex and not dead:
+            return
+        rows = list(self._rows)
+        for pos in dead:
+            rows[pos] = None
+        delta = self._delta
+        if reindex:
+            added = self._vectorizer.transform([_text(row) for row in reindex]).tocsr()
+            # Only the (small) delta is copied; the main matrix is shared with in-flight queries
+            delta = added if delta is None else sparse.vstack([delta, added], format='csr')
+            rows.extend(reindex)
+            self._reindexed += len(reindex)
+        self._swap(self._vectorizer, self._matrix, delta, rows)
+        if delta is not None and delta.shape[0] > max(DELTA_MERGE_ROWS, DELTA_MERGE_FRACTION * self._matrix.shape[0]):
+            self._merge()
+
+    def _merge(self) -> None:
+        """Fold the delta into the main matrix and drop dead rows (same vocabulary, no refit)."""
+        with self._lock:
+            matrix, delta, rows, alive = self._matrix, self._delta, self._rows, self._alive
+        if delta is not None:
+            matrix = sparse.vstack([matrix, delta], format='csr')
+        keep = np.flatnonzero(alive)
+        if keep.size < len(rows):
+            matrix = matrix[keep]
+        self._swap(self._vectorizer, matrix, None, [rows[pos] for pos in keep])
+        self.merges += 1
+
+    def _apply_changes(self, cursor, version: int) -> None:
+        """Bring products changed after the indexed version up to date."""
+        from inventory_snapshot import get_inventory_snapshot_cache
+        product_ids = get_inventory_snapshot_cache().changed_since(cursor, self._version, version)
+        if product_ids:
+            fresh = self._fetch(cursor, product_ids)
+            found = {row['product_id'] for row in fresh}
+            self._apply_rows(fresh, [pid for pid in product_ids if pid not in found])
+            self._dirty = True
+            self.updates += 1
+        self._version = version
+
+    def _refresh_stock(self, cursor) -> None:
+        """Swap in rows with live quantities (sales don't move the catalog version)."""
+        cursor.execute("SELECT product_id, current_quantity FROM inventory")
+        rows, positions = self._rows, self._positions
+        for product_id, quantity in cursor.fetchall():
+            pos = positions.get(product_id)
+            # New dict rather than an in-place update: search results may be serializing the old one
+            if pos is not None and rows[pos].get('current_quantity') != quantity:
+                rows[pos] = {**rows[pos], 'current_quantity': quantity}
+        self._last_stock = time.monotonic()
+
+    def _needs_refit(self) -> bool:
+        return (SEARCH_INDEX_REFIT_SECONDS > 0 and self._reindexed > 0
+                and time.time() - self._fitted_at > SEARCH_INDEX_REFIT_SECONDS)
+
+    def refresh(self, force: bool = False) -> None:
+        """Bring the index up to the current catalog version (throttled unless force)."""
+        if (not force and self._matrix is not None
+                and time.monotonic() - self._last_check < SEARCH_INDEX_REFRESH_SECONDS):
+            return
+        with self._refresh_lock:
+            if (not force and self._matrix is not None
+                    and time.monotonic() - self._last_check < SEARCH_INDEX_REFRESH_SECONDS):
+                return
+            rebuilds = self.rebuilds
+            conn = get_connection()
+            try:
+                cursor = conn.cursor()
+                current = self._current_version(cursor)
+                if self._matrix is None and not force:
+                    self._load(cursor, current)
+                if force or self._matrix is None:
+                    self._rebuild(cursor, current)
+                elif current is None:
+                    if self._version is not None or time.time() - self._fitted_at > UNVERSIONED_REBUILD_SECONDS:
+                        self._rebuild(cursor, None)
+                elif self._version is None or current[1] != self._reset_version or current[0] < self._version:
+                    self._rebuild(cursor, current)
+                elif current[0] > self._version:
+                    self._apply_changes(cursor, current[0])
+                    if self._needs_refit():
+                        self._rebuild(cursor, current)
+                if (self.rebuilds == rebuilds
+                        and time.monotonic() - self._last_stock >= INVENTORY_STOCK_REFRESH_SECONDS):
+                    self._refresh_stock(cursor)
+                conn.rollback()
+            finally:
+                conn.close()
+            self._last_check = time.monotonic()
+            if self._dirty and (self.rebuilds != rebuilds
+                                or time.monotonic() - self._last_save > SEARCH_INDEX_SAVE_SECONDS):
+                self.save()
+
+    def save(self) -> bool:
+        """
+        Write the vectorizer vocabulary/idf and the CSR arrays to self.path with
+        np.savez (temp file, then renamed). Product rows aren't saved; _load re-reads them.
+        """
+        if not self.path or self._matrix is None:
+            return False
+        if self._delta is not None or not self._alive.all():
+            self._merge()
+        with self._lock:
+            vectorizer, matrix, rows = self._vectorizer, self._matrix, self._rows
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    format=np.int64(_INDEX_FORMAT),
+                    version=np.int64(self._version if self._version is not None else -1),
+                    reset_version=np.int64(self._reset_version if self._reset_version is not None else -1),
+                    fitted_at=np.float64(self._fitted_at),
+                    stop_words=np.str_(vectorizer.stop_words or ''),
+                    token_pattern=np.str_(vectorizer.token_pattern),
+                    terms=np.array(terms, dtype=str),
+                    idf=vectorizer.idf_,
+                    data=matrix.data,
+                    indices=matrix.indices,
+                    indptr=matrix.indptr,
+                    shape=np.array(matrix.shape, dtype=np.int64),
+                    product_ids=np.array([row['product_id'] for row in rows], dtype=np.int64),
+                    text_keys=np.array([_text_key(row) for row in rows], dtype=np.int64),
+                )
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning("Could not save product search index to %s: %s", self.path, e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        self._dirty = False
+        self._last_save = time.monotonic()
+        return True
+
+    def _load(self, cursor, current: Optional[Tuple[int, int]]) -> bool:
+        """
+        Adopt the saved vectorizer and matrix if they were fitted at the current
+        reset_version; products are re-read and any whose text changed since the
+        save are re-transformed.
+        """
+        if not self.path or current is None or not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path, allow_pickle=False) as state:
+                if (int(state['format']) != _INDEX_FORMAT or int(state['version']) < 0
+                        or int(state['reset_version']) != current[1] or int(state['version']) > current[0]):
+                    return False
+                terms = state['terms'].tolist()
+                vectorizer = TfidfVectorizer(
+                    stop_words=str(state['stop_words']) or None,
+                    token_pattern=str(state['token_pattern']),
+                    dtype=np.float32,
+                    vocabulary={term: i for i, term in enumerate(terms)},
+                )
+                vectorizer.idf_ = state['idf']
+                matrix = sparse.csr_matrix(
+                    (state['data'], state['indices'], state['indptr']), shape=tuple(state['shape']))
+                product_ids = state['product_ids'].tolist()
+                text_keys = state['text_keys'].tolist()
+                fitted_at = float(state['fitted_at'])
+        except Exception as e:
+            logger.warning("Ignoring unreadable product search index %s: %s", self.path, e)
+            return False
+        current_rows = {row['product_id']: row for row in self._fetch(cursor)}
+        rows: List[Optional[Dict[str, Any]]] = []
+        stale: List[Dict[str, Any]] = []
+        for product_id, text_key in zip(product_ids, text_keys):
+            row = current_rows.pop(product_id, None)
+            if row is not None and _text_key(row) != text_key:
+                stale.append(row)
+                row = None
+            rows.append(row)
+        self._swap(vectorizer, matrix, None, rows)
+        self._version, self._reset_version = current
+        self._reindexed = 0
+        self._fitted_at = fitted_at
+        # New products and ones edited since the save go through the delta
+        self._apply_rows(stale + list(current_rows.values()), [])
+        self._last_save = time.monotonic()
+        self._last_stock = time.monotonic()
+        logger.info("Loaded product search index at version %s (%d products, %d re-indexed)",
+                    self._version, len(self._positions), self._reindexed)
+        return True
+
+    # -- queries -----------------------------------------------------------
+
+    def _filter_mask(self, filters: Optional[Dict[str, Any]]):
+        mask = self._alive
+        if not filters:
+            return mask
+        mask = mask.copy()
+        if 'category_id' in filters:
+            mask &= self._category_ids == filters['category_id']
+        if 'brand' in filters:
+            mask &= self._brands == filters['brand']
+        if 'min_price' in filters:
+            mask &= self._prices >= float(filters['min_price'])
+        if 'max_price' in filters:
+            mask &= self._prices <= float(filters['max_price'])
+        return mask
+
+    def search(self, query: str, limit: int = 20, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Top products by cosine similarity to query (score >= MIN_SCORE), best first."""
+        self.refresh()
+        self.queries += 1
+        # Grab a consistent view; refresh() swaps these under the lock
+        with self._lock:
+            vectorizer, matrix, delta, rows = self._vectorizer, self._matrix, self._delta, self._rows
+            if matrix is None or not rows or limit <= 0:
+                return []
+            mask = self._filter_mask(filters)
+        query_vector = vectorizer.transform([query or ''])
+        if not query_vector.nnz:
+            return []
+        # Rows and query are L2-normalized, so the dot product is the cosine similarity
+        scores = (matrix @ query_vector.T).toarray().ravel()
+        if delta is not None:
+            scores = np.concatenate([scores, (delta @ query_vector.T).toarray().ravel()])
+        hits = np.flatnonzero(mask & (scores >= MIN_SCORE))
+        if hits.size > limit:
+            hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        results = []
+        for pos in hits:
+            result = dict(rows[pos])
+            result['relevance_score'] = float(scores[pos])
+            results.append(result)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'available': SEARCH_INDEX_AVAILABLE,
+            'version': self._version,
+            'products': len(self._positions),
+            'rows': len(self._rows),
+            'terms': len(self._vectorizer.vocabulary_) if self._vectorizer is not None else 0,
+            'delta_rows': self._delta.shape[0] if self._delta is not None else 0,
+            'reindexed_since_fit': self._reindexed,
+            'queries': self.queries,
+            'rebuilds': self.rebuilds,
+            'updates': self.updates,
+            'updated_in_place': self.in_place,
+            'merges': self.merges,
+        }
+
+
+class _SearchHistoryBuffer:
+    """Collects search_history rows and writes them in batches from a background thread."""
+
+    _INSERT_SQL = "INSERT INTO search_history (search_query, results_count, filters, user_id, search_timestamp) VALUES %s"
+
+    def __init__(self, flush_interval: float = SEARCH_HISTORY_FLUSH_SECONDS, batch_size: int = SEARCH_HISTORY_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._rows: List[tuple] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+
+    def add(self, query: str, results_count: int, filters: Optional[Dict[str, Any]], user_id: Optional[int]) -> None:
+        from datetime import datetime
+        row = (query, results_count, json.dumps(filters, default=str) if filters else None, user_id, datetime.now())
+        with self._lock:
+            self._rows.append(row)
+            pending = len(self._rows)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='search-history-writer', daemon=True)
+                self._thread.start()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns rows written. Search history is
+        best-effort, so a failed batch is dropped rather than retried."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                from psycopg2.extras import execute_values
+                conn = get_connection()
+            except Exception as e:
+                self.dropped += len(rows)
+                logger.debug("Dropping %d search history rows: %s", len(rows), e)
+                return 0
+            try:
+                execute_values(conn.cursor(), self._INSERT_SQL, rows, page_size=len(rows))
+                conn.commit()
+                self.written += len(rows)
+                return len(rows)
+            except Exception as e:
+                conn.rollback()
+                self.dropped += len(rows)
+                logger.debug("Dropping %d search history rows: %s", len(rows), e)
+                return 0
+            finally:
+                conn.close()
+
+
+# Global instances
+_search_index: Optional[ProductSearchIndex] = None
+_search_history: Optional[_SearchHistoryBuffer] = None
+_index_lock = threading.Lock()
+
+
+def get_product_search_index() -> ProductSearchIndex:
+    """Get or create the product search index singleton"""
+    global _search_index
+    if _search_index is None:
+        with _index_lock:
+            if _search_index is None:
+                _search_index = ProductSearchIndex()
+    return _search_index
+
+
+def record_search(query: str, results_count: int, filters: Optional[Dict[str, Any]] = None,
+                  user_id: Optional[int] = None) -> None:
+    """Queue a search_history row (written within SEARCH_HISTORY_FLUSH_SECONDS)."""
+    global _search_history
+    if _search_history is None:
+        with _index_lock:
+            if _search_history is None:
+                _search_history = _SearchHistoryBuffer()
+    _search_history.add(query, results_count, filters, user_id)
+    if SEARCH_HISTORY_FLUSH_SECONDS <= 0:
+        _search_history.flush()
+
+
+def _flush_on_exit():
+    if _search_history is not None:
+        try:
+            _search_history.flush()
+        except Exception:
+            pass
+    if _search_index is not None and _search_index._dirty:
+        _search_index.save()
+
+
+atexit.register(_flush_on_exit)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Product search index maintenance')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('rebuild', help='Refit the index over the whole catalog and save it')
+    query_parser = sub.add_parser('query', help='Run a query and report latency')
+    query_parser.add_argument('text')
+    query_parser.add_argument('--limit', type=int, default=10)
+    query_parser.add_argument('--repeat', type=int, default=1, help='Run N times and report mean latency')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not SEARCH_INDEX_AVAILABLE:
+        print("scikit-learn (with numpy/scipy) is required: pip install scikit-learn")
+        return 1
+    index = get_product_search_index()
+    if args.command == 'rebuild':
+        index.refresh(force=True)
+        index.save()
+        print(json.dumps(index.stats(), indent=2))
+        return 0
+    index.refresh()
+    started = time.perf_counter()
+    for _ in range(max(1, args.repeat)):
+        results = index.search(args.text, limit=args.limit)
+    elapsed = (time.perf_counter() - started) / max(1, args.repeat)
+    for result in results:
+        print(f"{result['relevance_score']:.3f}  {result['product_id']}  {result['product_name']}")
+    print(f"{len(results)} result(s), {elapsed * 1000:.3f} ms/query over {len(index._positions)} products")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
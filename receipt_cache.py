@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+In-process caches for receipt rendering.
+- Receipt settings (receipt_settings merged with store_location_settings) are
+  kept for RECEIPT_SETTINGS_TTL_SECONDS and dropped immediately when this
+  process saves either table (invalidate_receipt_settings).
+- Compiled layouts (ParagraphStyles, divider widths, decoded logo) are keyed by
+  template_version(), a digest of everything that shapes them, so a settings
+  change simply produces a new key.
+- Barcode PNGs are kept in an LRU keyed by order number.
+- Rendered order receipt PDFs are kept in a byte-bounded LRU keyed by
+  (order_id, template version, digest of the order's receipt inputs), so a
+  reprint or emailed copy of an unchanged order is not re-rendered.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+RECEIPT_SETTINGS_TTL_SECONDS = float(os.getenv('RECEIPT_SETTINGS_TTL_SECONDS', '30') or 0)
+RECEIPT_LAYOUT_CACHE_SIZE = int(os.getenv('RECEIPT_LAYOUT_CACHE_SIZE', '16') or 0)
+RECEIPT_BARCODE_CACHE_SIZE = int(os.getenv('RECEIPT_BARCODE_CACHE_SIZE', '512') or 0)
+RECEIPT_PDF_CACHE_MAX_BYTES = int(os.getenv('RECEIPT_PDF_CACHE_MAX_BYTES', str(32 * 1024 * 1024)) or 0)
+
+
+def digest(value: Any) -> str:
+    """Stable short digest of JSON-like data (dates, Decimals etc. via str)"""
+    encoded = json.dumps(value, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()[:16]
+
+
+def template_version(settings: Dict[str, Any], template_styles: Dict[str, Any]) -> str:
+    """Key for a compiled layout: the template styles plus the logo they may fall back to"""
+    return digest({'ts': template_styles or {}, 'logo': settings.get('store_logo') or ''})
+
+
+class LRUCache:
+    """Thread-safe LRU bounded by entry count, or by total size when sizeof is given."""
+
+    def __init__(self, max_size: int, sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_size = max_size
+        self.sizeof = sizeof or (lambda value: 1)
+        self._entries: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        if value is None or self.max_size <= 0 or size > self.max_size:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= self.sizeof(old)
+            self._entries[key] = value
+            self._size += size
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self.sizeof(evicted)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._size -= self.sizeof(self._entries.pop(key))
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size': self._size,
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+
+class _SettingsCache:
+    """The merged receipt settings dict with a TTL; callers get a copy."""
+
+    def __init__(self, ttl: float = RECEIPT_SETTINGS_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value: Optional[Dict[str, Any]] = None
+        self._loaded_at = 0.0
+        # Bumped on invalidation so a load that raced a save isn't kept
+        self._generation = 0
+
+    def get(self, loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        if self.ttl <= 0:
+            return loader()
+        with self._lock:
+            if self._value is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return _copy_settings(self._value)
+            generation = self._generation
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self._value = _copy_settings(value)
+                self._loaded_at = time.monotonic()
+        return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
+            self._generation += 1
+
+
+def _copy_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+    copied = dict(settings)
+    if isinstance(copied.get('template_styles'), dict):
+        copied['template_styles'] = dict(copied['template_styles'])
+    return copied
+
+
+settings_cache = _SettingsCache()
+layout_cache = LRUCache(RECEIPT_LAYOUT_CACHE_SIZE)
+barcode_cache = LRUCache(RECEIPT_BARCODE_CACHE_SIZE)
+pdf_cache = LRUCache(RECEIPT_PDF_CACHE_MAX_BYTES, sizeof=len)
+
+
+def invalidate_receipt_settings() -> None:
+    """Call after saving receipt_settings or store_location_settings."""
+    settings_cache.invalidate()
+
+
+def invalidate_order_receipts(order_id: int) -> int:
+    """Drop rendered PDFs of one order (they are also superseded by a new input digest)."""
+    return pdf_cache.discard_where(lambda key: key[0] == order_id)
+
+
+def clear_receipt_caches() -> None:
+    settings_cache.invalidate()
+    layout_cache.clear()
+    barcode_cache.clear()
+    pdf_cache.clear()
+
+
+def receipt_cache_stats() -> Dict[str, Any]:
+    return {
+        'layouts': layout_cache.stats(),
+        'barcodes': barcode_cache.stats(),
+        'pdfs': pdf_cache.stats(),
+    }
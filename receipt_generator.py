@@ -8,6 +8,8 @@ from typing import Dict, Any, Optional
 from datetime import datetime
 import io
 
+from receipt_cache import settings_cache, layout_cache, barcode_cache, pdf_cache, template_version, digest
+
 try:
     from reportlab.lib.pagesizes import letter, A4
     from reportlab.lib.units import inch
@@ -38,7 +40,12 @@ except ImportError:
 
 def get_receipt_settings() -> Dict[str, Any]:
     """Get receipt settings from database (PostgreSQL). Merges in store_location_settings
-    for store name/address/contact so printed receipts always use the latest store info."""
+    for store name/address/contact so printed receipts always use the latest store info.
+    Served from receipt_cache for a few seconds; saving either table invalidates it."""
+    return settings_cache.get(_load_receipt_settings)
+
+
+def _load_receipt_settings() -> Dict[str, Any]:
     from database import get_connection, get_store_location_settings
     from psycopg2.extras import RealDictCursor
     conn = get_connection()
@@ -154,7 +161,16 @@ def _build_style(ts: dict, prefix: str, default_font_size: float, parent_style,
 
 
 def generate_barcode_data(order_number: str) -> bytes:
-    """Generate Code128 barcode image data for order number"""
+    """Generate Code128 barcode image data for order number (cached per order number)"""
+    barcode_bytes = barcode_cache.get(order_number)
+    if barcode_bytes is None:
+        barcode_bytes = _render_barcode_png(order_number)
+        if barcode_bytes:
+            barcode_cache.put(order_number, barcode_bytes)
+    return barcode_bytes
+
+
+def _render_barcode_png(order_number: str) -> bytes:
     if not BARCODE_AVAILABLE:
         # Fallback to QR code if barcode library not available
         if QRCODE_AVAILABLE:
@@ -178,7 +194,8 @@ def generate_barcode_data(order_number: str) -> bytes:
     try:
         # Generate Code128 barcode
         code128 = barcode.get_barcode_class('code128')
-        barcode_instance = code128(order_number, writer=ImageWriter())
+        # Grayscale: same black/white bars, a third of the pixel data for reportlab to embed
+        barcode_instance = code128(order_number, writer=ImageWriter(mode='L'))
         
         # Create image with custom options for receipt printing
         # Optimized for fast scanning: wider bars, taller height, larger quiet zone
@@ -226,70 +243,16 @@ def generate_barcode_data(order_number: str) -> bytes:
                 print(f"Error generating QR code fallback: {e2}")
         return b''
 
-def generate_receipt_pdf(order_data: Dict[str, Any], order_items: list, settings_override: dict = None, original_order_items: list = None) -> bytes:
+def _compile_layout(settings: Dict[str, Any], ts: dict) -> Dict[str, Any]:
     """
-    Generate receipt PDF with barcode
-    
-    Args:
-        order_data: Order information (order_id, order_number, order_date, etc.)
-        order_items: List of order items with product details (or returned items for return receipts)
-        settings_override: Optional dict to override receipt_settings (e.g. for test receipt from Settings)
-        original_order_items: For partial return receipts only: full order line items (what was bought) to show above returned items
-    
-    Returns:
-        PDF bytes
+    Everything generate_receipt_pdf derives from the template alone: page width,
+    ParagraphStyles, divider lengths and the decoded store logo. Cached in
+    receipt_cache.layout_cache by template_version(); the styles are shared
+    between renders and must not be modified.
     """
-    if not REPORTLAB_AVAILABLE:
-        raise ImportError("reportlab is required for receipt generation. Install with: pip install reportlab")
-    
-    buffer = io.BytesIO()
-    
-    # Generate barcode first if available
-    order_number = order_data.get('order_number', '')
-    barcode_data = None
-    if order_number and (BARCODE_AVAILABLE or QRCODE_AVAILABLE):
-        try:
-            barcode_data = generate_barcode_data(order_number)
-            if barcode_data and len(barcode_data) > 0:
-                print(f"Successfully generated barcode for order {order_number}, size: {len(barcode_data)} bytes")
-            else:
-                print(f"Warning: Barcode data is empty for order {order_number}")
-        except Exception as e:
-            print(f"Error generating barcode: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    # Get receipt settings (includes template_styles from Settings receipt editor)
-    settings = get_receipt_settings()
-    store_keys = ('store_name', 'store_address', 'store_phone', 'store_city', 'store_state', 'store_zip', 'store_email', 'store_website', 'footer_message', 'return_policy', 'show_signature', 'store_logo')
-    if settings_override:
-        for k in store_keys:
-            if k in settings_override and settings_override[k] is not None:
-                settings[k] = settings_override[k]
-        base_ts = settings.get('template_styles') or {}
-        override_ts = settings_override.get('template_styles')
-        if isinstance(override_ts, dict):
-            ts = {**base_ts, **override_ts}
-        else:
-            ts = {**base_ts, **{k: v for k, v in settings_override.items() if k not in store_keys and k != 'template_styles' and v is not None}}
-        settings['template_styles'] = ts
-    else:
-        ts = settings.get('template_styles') or {}
-    
     # Receipt width from template: 58mm or 80mm (matches Settings preview)
     width_mm = 58 if (ts.get('receipt_width') == 58 or ts.get('receipt_width') == '58') else 80
     receipt_width = (width_mm / 25.4) * inch  # mm to inches
-    receipt_height = 11 * inch  # Standard letter height, will cut at content
-    
-    doc = SimpleDocTemplate(buffer, 
-                           pagesize=(receipt_width, receipt_height),
-                           rightMargin=0.15*inch, 
-                           leftMargin=0.15*inch,
-                           topMargin=0.2*inch, 
-                           bottomMargin=0.2*inch)
-    
-    # Build story (content)
-    story = []
     styles = getSampleStyleSheet()
     
     # Styles driven by template_styles - order data plugged in with template styling
@@ -326,12 +289,6 @@ def generate_receipt_pdf(order_data: Dict[str, Any], order_items: list, settings
     _div_chars = max(18, min(36, _base - _sub))
     # Solid (underscore) line is 3 chars shorter on 80mm so it doesn't wrap
     _div_chars_solid = max(18, _div_chars - (3 if width_mm == 80 else 0))
-    def _divider(hstyle):
-        if divider_style == 'none':
-            return Spacer(1, 0.05*inch)
-        if divider_style == 'solid':
-            return Paragraph('_' * _div_chars_solid, hstyle)
-        return Paragraph('- ' * (_div_chars // 2), hstyle)  # dashed
     
     subtotal_style = _build_style(ts, 'subtotal', int(fs) or 8, styles['Normal'], align_fallback='right')
     subtotal_style.alignment = _to_reportlab_align(ts.get('subtotal_align', 'right'))
@@ -392,21 +349,181 @@ def generate_receipt_pdf(order_data: Dict[str, Any], order_items: list, settings
         spaceBefore=6
     )
     
-    # Store header - matches edit modal: logo, store name, address (multi-line), phone, header alignment
+    # Store logo decoded once per template (data URL from the receipt editor)
+    logo_bytes = None
     store_logo = ts.get('store_logo') or settings.get('store_logo', '')
     if store_logo and isinstance(store_logo, str) and store_logo.startswith('data:image'):
         try:
-            from reportlab.platypus import Image
             import base64
             _b64 = store_logo.split(',', 1)[1] if ',' in store_logo else ''
             if _b64:
                 logo_bytes = base64.b64decode(_b64)
-                logo_io = io.BytesIO(logo_bytes)
-                logo_img = Image(logo_io, width=min(2*inch, receipt_width - 0.3*inch), height=0.5*inch)
-                logo_table = Table([[logo_img]], colWidths=[receipt_width - 0.3*inch])
-                logo_table.setStyle(TableStyle([('ALIGN', (0, 0), (0, 0), 'CENTER')]))
-                story.append(logo_table)
-                story.append(Spacer(1, 0.05*inch))
+        except Exception as e:
+            print(f"Note: Could not decode store logo: {e}")
+    
+    return {
+        'receipt_width': receipt_width,
+        'logo_bytes': logo_bytes,
+        'divider_style': divider_style,
+        'show_item_descriptions': show_item_descriptions,
+        'show_item_skus': show_item_skus,
+        'tax_line_display': tax_line_display,
+        'title_style': title_style,
+        'store_address_style': store_address_style,
+        'store_phone_style': store_phone_style,
+        'header_style': header_style,
+        'item_name_style': item_name_style,
+        'item_desc_style': item_desc_style,
+        'item_sku_style': item_sku_style,
+        'item_price_style': item_price_style,
+        '_div_chars': _div_chars,
+        '_div_chars_solid': _div_chars_solid,
+        'subtotal_style': subtotal_style,
+        'tax_style': tax_style,
+        'tip_style': tip_style,
+        'total_style': total_style,
+        'payment_style': payment_style,
+        'date_style': date_style,
+        'barcode_number_style': barcode_number_style,
+        'footer_style': footer_style,
+        'return_policy_style': return_policy_style,
+        'store_website_style': store_website_style,
+        'store_email_style': store_email_style,
+        'signature_label_style': signature_label_style,
+        'customer_order_style': customer_order_style,
+        'order_type_style': order_type_style,
+        'customer_name_style': customer_name_style,
+        'customer_phone_style': customer_phone_style,
+        'customer_address_style': customer_address_style,
+        'return_section_title_style': return_section_title_style,
+        'return_label_style': return_label_style,
+    }
+
+
+def _get_layout(settings: Dict[str, Any], ts: dict) -> Dict[str, Any]:
+    """Compiled layout for this template, built on first use"""
+    key = template_version(settings, ts)
+    layout = layout_cache.get(key)
+    if layout is None:
+        layout = _compile_layout(settings, ts)
+        layout_cache.put(key, layout)
+    return layout
+
+
+def generate_receipt_pdf(order_data: Dict[str, Any], order_items: list, settings_override: dict = None, original_order_items: list = None) -> bytes:
+    """
+    Generate receipt PDF with barcode
+    
+    Args:
+        order_data: Order information (order_id, order_number, order_date, etc.)
+        order_items: List of order items with product details (or returned items for return receipts)
+        settings_override: Optional dict to override receipt_settings (e.g. for test receipt from Settings)
+        original_order_items: For partial return receipts only: full order line items (what was bought) to show above returned items
+    
+    Returns:
+        PDF bytes
+    """
+    if not REPORTLAB_AVAILABLE:
+        raise ImportError("reportlab is required for receipt generation. Install with: pip install reportlab")
+    
+    buffer = io.BytesIO()
+    
+    # Generate barcode first if available
+    order_number = order_data.get('order_number', '')
+    barcode_data = None
+    if order_number and (BARCODE_AVAILABLE or QRCODE_AVAILABLE):
+        try:
+            barcode_data = generate_barcode_data(order_number)
+            if barcode_data and len(barcode_data) > 0:
+                print(f"Successfully generated barcode for order {order_number}, size: {len(barcode_data)} bytes")
+            else:
+                print(f"Warning: Barcode data is empty for order {order_number}")
+        except Exception as e:
+            print(f"Error generating barcode: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    # Get receipt settings (includes template_styles from Settings receipt editor)
+    settings = get_receipt_settings()
+    store_keys = ('store_name', 'store_address', 'store_phone', 'store_city', 'store_state', 'store_zip', 'store_email', 'store_website', 'footer_message', 'return_policy', 'show_signature', 'store_logo')
+    if settings_override:
+        for k in store_keys:
+            if k in settings_override and settings_override[k] is not None:
+                settings[k] = settings_override[k]
+        base_ts = settings.get('template_styles') or {}
+        override_ts = settings_override.get('template_styles')
+        if isinstance(override_ts, dict):
+            ts = {**base_ts, **override_ts}
+        else:
+            ts = {**base_ts, **{k: v for k, v in settings_override.items() if k not in store_keys and k != 'template_styles' and v is not None}}
+        settings['template_styles'] = ts
+    else:
+        ts = settings.get('template_styles') or {}
+    
+    layout = _get_layout(settings, ts)
+    receipt_width = layout['receipt_width']
+    receipt_height = 11 * inch  # Standard letter height, will cut at content
+    
+    doc = SimpleDocTemplate(buffer, 
+                           pagesize=(receipt_width, receipt_height),
+                           rightMargin=0.15*inch, 
+                           leftMargin=0.15*inch,
+                           topMargin=0.2*inch, 
+                           bottomMargin=0.2*inch)
+    
+    # Build story (content); styles come precompiled from the layout cache
+    story = []
+    divider_style = layout['divider_style']
+    show_item_descriptions = layout['show_item_descriptions']
+    show_item_skus = layout['show_item_skus']
+    tax_line_display = layout['tax_line_display']
+    title_style = layout['title_style']
+    store_address_style = layout['store_address_style']
+    store_phone_style = layout['store_phone_style']
+    header_style = layout['header_style']
+    item_name_style = layout['item_name_style']
+    item_desc_style = layout['item_desc_style']
+    item_sku_style = layout['item_sku_style']
+    item_price_style = layout['item_price_style']
+    _div_chars = layout['_div_chars']
+    _div_chars_solid = layout['_div_chars_solid']
+    subtotal_style = layout['subtotal_style']
+    tax_style = layout['tax_style']
+    tip_style = layout['tip_style']
+    total_style = layout['total_style']
+    payment_style = layout['payment_style']
+    date_style = layout['date_style']
+    barcode_number_style = layout['barcode_number_style']
+    footer_style = layout['footer_style']
+    return_policy_style = layout['return_policy_style']
+    store_website_style = layout['store_website_style']
+    store_email_style = layout['store_email_style']
+    signature_label_style = layout['signature_label_style']
+    customer_order_style = layout['customer_order_style']
+    order_type_style = layout['order_type_style']
+    customer_name_style = layout['customer_name_style']
+    customer_phone_style = layout['customer_phone_style']
+    customer_address_style = layout['customer_address_style']
+    return_section_title_style = layout['return_section_title_style']
+    return_label_style = layout['return_label_style']
+    
+    def _divider(hstyle):
+        if divider_style == 'none':
+            return Spacer(1, 0.05*inch)
+        if divider_style == 'solid':
+            return Paragraph('_' * _div_chars_solid, hstyle)
+        return Paragraph('- ' * (_div_chars // 2), hstyle)  # dashed
+    
+    # Store header - matches edit modal: logo, store name, address (multi-line), phone, header alignment
+    logo_bytes = layout['logo_bytes']
+    if logo_bytes:
+        try:
+            from reportlab.platypus import Image
+            logo_img = Image(io.BytesIO(logo_bytes), width=min(2*inch, receipt_width - 0.3*inch), height=0.5*inch)
+            logo_table = Table([[logo_img]], colWidths=[receipt_width - 0.3*inch])
+            logo_table.setStyle(TableStyle([('ALIGN', (0, 0), (0, 0), 'CENTER')]))
+            story.append(logo_table)
+            story.append(Spacer(1, 0.05*inch))
         except Exception as e:
             print(f"Note: Could not embed store logo: {e}")
     
@@ -849,6 +966,23 @@ def generate_receipt_pdf(order_data: Dict[str, Any], order_items: list, settings
     return pdf_bytes
 
 
+def render_order_receipt_pdf(order_id: Optional[int], source: str, order_data: Dict[str, Any], order_items: list) -> bytes:
+    """
+    generate_receipt_pdf through the rendered-PDF cache.
+    
+    Keyed by (order_id, source, receipt settings version, digest of order_data and
+    order_items): reprinting or emailing an unchanged order returns the cached
+    bytes, and any change to the order, its payment or the settings is a new key.
+    """
+    settings = get_receipt_settings()
+    key = (order_id, source, digest(settings), digest([order_data, order_items]))
+    pdf_bytes = pdf_cache.get(key)
+    if pdf_bytes is None:
+        pdf_bytes = generate_receipt_pdf(order_data, order_items)
+        pdf_cache.put(key, pdf_bytes)
+    return pdf_bytes
+
+
 def generate_test_receipt_pdf(settings_override: dict = None) -> bytes:
     """
     Generate a test receipt PDF with sample data (for Settings Print test).
@@ -959,7 +1093,7 @@ def generate_receipt_with_barcode(order_id: int) -> Optional[bytes]:
             current_status = (order_data.get('payment_status') or 'completed').lower()
             if current_status != 'completed' and (order_data.get('order_type') or '').lower() in ('pickup', 'delivery'):
                 order_data['payment_status'] = 'pending'
-        return generate_receipt_pdf(order_data, order_items)
+        return render_order_receipt_pdf(order_id, 'order', order_data, order_items)
     except Exception as e:
         print(f"Error generating receipt: {e}")
         import traceback
@@ -1219,7 +1353,7 @@ def generate_transaction_receipt(transaction_id: int) -> Optional[bytes]:
                 'sku': item.get('sku', '')
             })
         
-        return generate_receipt_pdf(order_data, order_items)
+        return render_order_receipt_pdf(order_id, f'transaction:{transaction_id}', order_data, order_items)
     except Exception as e:
         print(f"Error generating transaction receipt: {e}")
         import traceback
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Receipt pre-rendering.
+When an order is created or paid, web_viewer enqueues a job; a small worker
+pool renders the order receipt PDF, the transaction receipt PDF and the email
+receipt content and writes them to a bounded on-disk cache. /api/receipt/...
+and send_receipt_email_for_order then serve the prepared artifact and only
+render synchronously on a miss (the result is stored for the next request).
+
+Each artifact is stored under a version made of a stamp of the receipt's
+source rows (one query hashing the order, its items, transactions,
+transaction items and payments) and a digest of the receipt settings, so an
+order that changed after pre-rendering (tip, signature, payment) or a settings
+edit is never served stale.
+
+RECEIPT_PRERENDER_WORKERS sets the pool size (default 1, 0 disables
+pre-rendering); keep it small so rendering does not compete with checkout.
+"""
+
+import base64
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from receipt_cache import digest
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_PRERENDER_WORKERS = int(os.getenv('RECEIPT_PRERENDER_WORKERS', '1') or 0)
+RECEIPT_PRERENDER_QUEUE_SIZE = int(os.getenv('RECEIPT_PRERENDER_QUEUE_SIZE', '256') or 0)
+RECEIPT_PRERENDER_DIR = os.getenv('RECEIPT_PRERENDER_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'receipt_prerender')
+RECEIPT_PRERENDER_MAX_MB = float(os.getenv('RECEIPT_PRERENDER_MAX_MB', '256') or 0)
+
+RECEIPT_STAMP_SQL = """
+    WITH target AS (
+        SELECT COALESCE(%(order_id)s,
+                        (SELECT order_id FROM transactions WHERE transaction_id = %(transaction_id)s)) AS order_id
+    ), txns AS (
+        SELECT t.* FROM transactions t, target
+        WHERE t.order_id = target.order_id OR t.transaction_id = %(transaction_id)s
+    )
+    SELECT md5(concat_ws('#',
+        (SELECT row(o.*)::text FROM orders o, target WHERE o.order_id = target.order_id),
+        (SELECT string_agg(row(oi.*)::text, '|' ORDER BY oi.order_item_id)
+         FROM order_items oi, target WHERE oi.order_id = target.order_id),
+        (SELECT string_agg(md5(row(t.*)::text), '|' ORDER BY t.transaction_id) FROM txns t),
+        (SELECT string_agg(row(ti.*)::text, '|' ORDER BY ti.transaction_item_id)
+         FROM transaction_items ti WHERE ti.transaction_id = %(transaction_id)s),
+        (SELECT string_agg(row(p.*)::text, '|' ORDER BY p.payment_id)
+         FROM payments p JOIN txns t ON t.transaction_id = p.transaction_id)
+    )) AS stamp
+"""
+
+
+def receipt_stamp(order_id: Optional[int] = None, transaction_id: Optional[int] = None) -> str:
+    """Hash of every row a receipt for this order/transaction is rendered from"""
+    from database import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(RECEIPT_STAMP_SQL, {'order_id': order_id, 'transaction_id': transaction_id})
+        row = cursor.fetchone()
+        stamp = row['stamp'] if isinstance(row, dict) else row[0]
+        return (stamp or '')[:16]
+    finally:
+        conn.close()
+
+
+def _pdf_version(stamp: str) -> str:
+    from receipt_generator import get_receipt_settings
+    return f"{stamp}-{digest(get_receipt_settings())[:8]}"
+
+
+def _email_version(stamp: str, store_id: int) -> str:
+    from notification_service import _get_store_settings, get_email_template
+    return f"{stamp}-{digest([_get_store_settings(store_id), get_email_template(store_id, 'receipt')])[:8]}"
+
+
+class ReceiptArtifactStore:
+    """Receipt artifacts on disk as <name>.<version>, evicting least recently used past max_bytes."""
+
+    def __init__(self, directory: str = RECEIPT_PRERENDER_DIR, max_bytes: int = int(RECEIPT_PRERENDER_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._written_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, name: str, version: str) -> str:
+        return os.path.join(self.directory, f"{name}.{version}")
+
+    def get(self, name: str, version: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        path = self._path(name, version)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, name: str, version: str, data: bytes) -> None:
+        if not self.enabled or not data:
+            return
+        path = self._path(name, version)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            # Older versions of the same receipt can never be served again
+            for stale in glob.glob(os.path.join(glob.escape(self.directory), glob.escape(name) + '.*')):
+                if stale != path and not stale.endswith('.tmp'):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+        except OSError as e:
+            logger.warning("receipt prerender: could not write %s: %s", path, e)
+            return
+        with self._lock:
+            self._written_since_evict += len(data)
+            if self._written_since_evict < self.max_bytes // 20:
+                return
+            self._written_since_evict = 0
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used artifacts until the directory is under 90% of max_bytes"""
+        with self._lock:
+            try:
+                entries = []
+                with os.scandir(self.directory) as it:
+                    for entry in it:
+                        if entry.is_file():
+                            st = entry.stat()
+                            entries.append((st.st_mtime, st.st_size, entry.path))
+            except OSError:
+                return
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    self.evicted += 1
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {'directory': self.directory, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evicted': self.evicted}
+
+
+_store = ReceiptArtifactStore()
+
+
+def _encode_email(content: Dict[str, Any]) -> bytes:
+    return json.dumps({
+        **content,
+        'inline_images': [[cid, base64.b64encode(data).decode('ascii')] for cid, data in content.get('inline_images') or []],
+    }).encode('utf-8')
+
+
+def _decode_email(data: bytes) -> Dict[str, Any]:
+    content = json.loads(data.decode('utf-8'))
+    content['inline_images'] = [(cid, base64.b64decode(b64)) for cid, b64 in content.get('inline_images') or []]
+    return content
+
+
+def order_receipt_pdf(order_id: int) -> Optional[bytes]:
+    """Receipt PDF for an order: the pre-rendered copy if current, else rendered now and stored"""
+    from receipt_generator import generate_receipt_with_barcode
+    name = f"order_{order_id}"
+    version = _pdf_version(receipt_stamp(order_id=order_id))
+    pdf_bytes = _store.get(name, version)
+    if pdf_bytes is None:
+        pdf_bytes = generate_receipt_with_barcode(order_id)
+        _store.put(name, version, pdf_bytes)
+    return pdf_bytes
+
+
+def transaction_receipt_pdf(transaction_id: int) -> Optional[bytes]:
+    """Receipt PDF for a transaction: the pre-rendered copy if current, else rendered now and stored"""
+    from receipt_generator import generate_transaction_receipt
+    name = f"transaction_{transaction_id}"
+    version = _pdf_version(receipt_stamp(transaction_id=transaction_id))
+    pdf_bytes = _store.get(name, version)
+    if pdf_bytes is None:
+        pdf_bytes = generate_transaction_receipt(transaction_id)
+        _store.put(name, version, pdf_bytes)
+    return pdf_bytes
+
+
+def receipt_email_content(store_id: int, order_id: int, transaction_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Email receipt (subject, body_html, body_text, inline_images) for an order:
+    the pre-rendered copy if current, else built now and stored. None if the order is missing.
+    """
+    from notification_service import build_receipt_email_for_order
+    name = f"email_{store_id}_{order_id}_{transaction_id or 0}"
+    version = _email_version(receipt_stamp(order_id=order_id, transaction_id=transaction_id), store_id)
+    data = _store.get(name, version)
+    if data is not None:
+        return _decode_email(data)
+    content = build_receipt_email_for_order(store_id, order_id, transaction_id=transaction_id)
+    if content is not None:
+        _store.put(name, version, _encode_email(content))
+    return content
+
+
+class ReceiptPrerenderer:
+    """Bounded pool rendering receipts for just-completed orders."""
+
+    def __init__(self, workers: int = RECEIPT_PRERENDER_WORKERS, queue_size: int = RECEIPT_PRERENDER_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending: set = set()
+        self.rendered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.render_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0 and _store.enabled
+
+    def enqueue(self, order_id: Optional[int], transaction_id: Optional[int] = None, store_id: int = 1) -> bool:
+        """Queue a pre-render; returns False when disabled, already queued or the queue is full"""
+        if not self.enabled or not (order_id or transaction_id):
+            return False
+        key = (order_id, transaction_id, store_id)
+        with self._lock:
+            if key in self._pending:
+                return False
+            if len(self._pending) >= self.queue_size:
+                self.dropped += 1
+                return False
+            self._pending.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='receipt-prerender')
+            executor = self._executor
+        executor.submit(self._run, key)
+        return True
+
+    def _run(self, key: Tuple[Optional[int], Optional[int], int]) -> None:
+        order_id, transaction_id, store_id = key
+        # Drop the key first so a change made while rendering queues a fresh job
+        with self._lock:
+            self._pending.discard(key)
+        started = time.perf_counter()
+        try:
+            if order_id:
+                order_receipt_pdf(order_id)
+            if transaction_id:
+                transaction_receipt_pdf(transaction_id)
+            if order_id:
+                receipt_email_content(store_id, order_id, transaction_id)
+            self.rendered += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning("receipt prerender for order %s / transaction %s failed: %s", order_id, transaction_id, e)
+        finally:
+            self.render_seconds += time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued = len(self._pending)
+        return {
+            'workers': self.workers,
+            'queued': queued,
+            'rendered': self.rendered,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'avg_render_ms': round(self.render_seconds * 1000 / max(1, self.rendered + self.failed), 1),
+            'store': _store.stats(),
+        }
+
+
+_prerenderer: Optional[ReceiptPrerenderer] = None
+_prerenderer_lock = threading.Lock()
+
+
+def get_receipt_prerenderer() -> ReceiptPrerenderer:
+    """Get or create the process-wide receipt prerenderer"""
+    global _prerenderer
+    if _prerenderer is None:
+        with _prerenderer_lock:
+            if _prerenderer is None:
+                _prerenderer = ReceiptPrerenderer()
+    return _prerenderer
+
+
+def enqueue_receipt_prerender(order_id: Optional[int], transaction_id: Optional[int] = None, store_id: int = 1) -> bool:
+    return get_receipt_prerenderer().enqueue(order_id, transaction_id, store_id)
@@ -0,0 +1,839 @@
+#!/usr/bin/env python3
+"""
+Versioned schema bootstrap.
+Holds the CREATE TABLE / ADD COLUMN statements that used to run inside request
+handlers. Steps are applied once (at process start or from
+database/migrations/run_migrations.py) and recorded in schema_bootstrap_versions,
+so request paths can assume the schema exists and never take catalog locks.
+
+To change the schema, append a new step with the next version number; never
+edit a step that has already shipped.
+"""
+
+import logging
+import threading
+from typing import List, Tuple
+
+from schema_registry import refresh_schema_registry
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary constant for pg_advisory_lock so concurrent workers don't bootstrap twice
+BOOTSTRAP_LOCK_KEY = 74617001
+
+# Search document expressions for the inventory search GIN indexes (bootstrap v14).
+# Queries must use these exact expressions for the planner to pick the indexes,
+# so changing one needs a new step that recreates its index.
+INVENTORY_SEARCH_TSV = (
+    "setweight(to_tsvector('simple'::regconfig, COALESCE(product_name, '')), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, COALESCE(sku, '') || ' ' || COALESCE(barcode, '')), 'A')"
+)
+METADATA_SEARCH_TSV = (
+    "setweight(to_tsvector('simple'::regconfig, COALESCE(brand, '')), 'B') || "
+    "setweight(to_tsvector('simple'::regconfig, COALESCE(keywords, '')), 'C')"
+)
+
+# Digest of the inventory fields metadata extraction reads (bootstrap v21). Must agree
+# with metadata_extraction.extraction_input_digest, which computes it in Python.
+EXTRACTION_INPUT_DIGEST = "md5(COALESCE(product_name, '') || chr(10) || COALESCE(barcode, ''))"
+
+# (version, name, statements) - every statement must be idempotent
+BOOTSTRAP_STEPS: List[Tuple[int, str, List[str]]] = [
+    (1, 'establishments_vendors_pending_shipments', [
+        """
+        CREATE TABLE IF NOT EXISTS establishments (
+            establishment_id SERIAL PRIMARY KEY,
+            establishment_name TEXT NOT NULL,
+            establishment_code TEXT UNIQUE NOT NULL,
+            subdomain TEXT UNIQUE,
+            created_at TIMESTAMP DEFAULT NOW(),
+            is_active BOOLEAN DEFAULT TRUE,
+            settings JSONB DEFAULT '{}'::jsonb
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS vendors (
+            vendor_id SERIAL PRIMARY KEY,
+            establishment_id INTEGER NOT NULL REFERENCES establishments(establishment_id) ON DELETE CASCADE,
+            vendor_name TEXT NOT NULL,
+            contact_person TEXT,
+            email TEXT,
+            phone TEXT,
+            address TEXT,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS pending_shipments (
+            pending_shipment_id SERIAL PRIMARY KEY,
+            establishment_id INTEGER NOT NULL REFERENCES establishments(establishment_id) ON DELETE CASCADE,
+            vendor_id INTEGER NOT NULL REFERENCES vendors(vendor_id),
+            expected_date TEXT,
+            upload_timestamp TIMESTAMP DEFAULT NOW(),
+            file_path TEXT,
+            purchase_order_number TEXT,
+            tracking_number TEXT,
+            status TEXT DEFAULT 'in_progress' CHECK(status IN ('pending_review', 'in_progress', 'approved', 'rejected', 'completed_with_issues')),
+            uploaded_by INTEGER,
+            approved_by INTEGER,
+            approved_date TIMESTAMP,
+            reviewed_by TEXT,
+            reviewed_date TIMESTAMP,
+            notes TEXT,
+            started_by INTEGER,
+            started_at TIMESTAMP,
+            completed_by INTEGER,
+            completed_at TIMESTAMP,
+            verification_mode TEXT DEFAULT 'verify_whole_shipment'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS pending_shipment_items (
+            pending_item_id SERIAL PRIMARY KEY,
+            establishment_id INTEGER NOT NULL REFERENCES establishments(establishment_id) ON DELETE CASCADE,
+            pending_shipment_id INTEGER NOT NULL REFERENCES pending_shipments(pending_shipment_id) ON DELETE CASCADE,
+            product_sku TEXT,
+            product_name TEXT,
+            quantity_expected INTEGER NOT NULL CHECK(quantity_expected > 0),
+            quantity_verified INTEGER,
+            unit_cost NUMERIC(10,2) NOT NULL CHECK(unit_cost >= 0),
+            lot_number TEXT,
+            expiration_date TEXT,
+            discrepancy_notes TEXT,
+            product_id INTEGER REFERENCES inventory(product_id),
+            barcode TEXT,
+            line_number INTEGER
+        )
+        """,
+        "ALTER TABLE pending_shipments ADD COLUMN IF NOT EXISTS verification_mode TEXT DEFAULT 'verify_whole_shipment'",
+        "ALTER TABLE pending_shipments ADD COLUMN IF NOT EXISTS started_by INTEGER",
+        "ALTER TABLE pending_shipments ADD COLUMN IF NOT EXISTS started_at TIMESTAMP",
+        "ALTER TABLE pending_shipments ADD COLUMN IF NOT EXISTS completed_by INTEGER",
+        "ALTER TABLE pending_shipments ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP",
+        # Older databases have a status CHECK without 'in_progress'
+        """
+        DO $$
+        DECLARE
+            r RECORD;
+            dropped BOOLEAN := FALSE;
+        BEGIN
+            FOR r IN
+                SELECT c.conname FROM pg_constraint c
+                JOIN pg_class t ON c.conrelid = t.oid
+                WHERE t.relname = 'pending_shipments' AND c.contype = 'c'
+                  AND pg_get_constraintdef(c.oid) LIKE '%status%'
+                  AND pg_get_constraintdef(c.oid) NOT LIKE '%in_progress%'
+            LOOP
+                EXECUTE format('ALTER TABLE pending_shipments DROP CONSTRAINT IF EXISTS %I', r.conname);
+                dropped := TRUE;
+            END LOOP;
+            IF dropped THEN
+                ALTER TABLE pending_shipments
+                ADD CONSTRAINT pending_shipments_status_check
+                CHECK (status IN ('pending_review', 'in_progress', 'approved', 'rejected', 'completed_with_issues'));
+            END IF;
+        END $$
+        """,
+    ]),
+    (2, 'metadata_tables', [
+        """
+        CREATE TABLE IF NOT EXISTS categories (
+            category_id SERIAL PRIMARY KEY,
+            establishment_id INTEGER NOT NULL DEFAULT 1 REFERENCES establishments(establishment_id) ON DELETE CASCADE,
+            category_name TEXT NOT NULL,
+            description TEXT,
+            parent_category_id INTEGER REFERENCES categories(category_id),
+            is_auto_generated INTEGER DEFAULT 0 CHECK(is_auto_generated IN (0, 1)),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_root_name
+        ON categories (establishment_id, category_name) WHERE parent_category_id IS NULL
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_name_parent
+        ON categories (establishment_id, category_name, parent_category_id) WHERE parent_category_id IS NOT NULL
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_categories_establishment ON categories(establishment_id)",
+        """
+        CREATE TABLE IF NOT EXISTS product_metadata (
+            metadata_id SERIAL PRIMARY KEY,
+            product_id INTEGER NOT NULL UNIQUE REFERENCES inventory(product_id) ON DELETE CASCADE,
+            brand TEXT,
+            color TEXT,
+            size TEXT,
+            tags TEXT,
+            keywords TEXT,
+            attributes TEXT,
+            search_vector TEXT,
+            category_id INTEGER REFERENCES categories(category_id),
+            category_confidence REAL DEFAULT 0 CHECK(category_confidence >= 0 AND category_confidence <= 1),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS metadata_extraction_log (
+            log_id SERIAL PRIMARY KEY,
+            product_id INTEGER NOT NULL REFERENCES inventory(product_id) ON DELETE CASCADE,
+            extraction_method TEXT NOT NULL,
+            data_extracted TEXT,
+            execution_time_ms INTEGER,
+            success INTEGER DEFAULT 1 CHECK(success IN (0, 1)),
+            error_message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS search_history (
+            search_id SERIAL PRIMARY KEY,
+            search_query TEXT NOT NULL,
+            results_count INTEGER DEFAULT 0,
+            filters TEXT,
+            user_id INTEGER REFERENCES employees(employee_id),
+            search_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_product_metadata_product ON product_metadata(product_id)",
+        "CREATE INDEX IF NOT EXISTS idx_product_metadata_category ON product_metadata(category_id)",
+        "CREATE INDEX IF NOT EXISTS idx_product_metadata_brand ON product_metadata(brand)",
+        "CREATE INDEX IF NOT EXISTS idx_metadata_log_product ON metadata_extraction_log(product_id)",
+        "CREATE INDEX IF NOT EXISTS idx_search_history_timestamp ON search_history(search_timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_categories_name ON categories(category_name)",
+        "CREATE INDEX IF NOT EXISTS idx_categories_parent ON categories(parent_category_id)",
+    ]),
+    (3, 'shipment_verification', [
+        """
+        CREATE TABLE IF NOT EXISTS shipment_verification_settings (
+            setting_key TEXT PRIMARY KEY,
+            setting_value TEXT NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        INSERT INTO shipment_verification_settings (setting_key, setting_value, description)
+        VALUES
+            ('workflow_mode', 'simple', 'Verification workflow mode: simple or three_step'),
+            ('auto_add_to_inventory', 'true', 'Automatically add verified items to inventory')
+        ON CONFLICT (setting_key) DO NOTHING
+        """,
+        "ALTER TABLE pending_shipments ADD COLUMN IF NOT EXISTS workflow_step TEXT",
+        "ALTER TABLE pending_shipments ADD COLUMN IF NOT EXISTS added_to_inventory INTEGER DEFAULT 0 CHECK(added_to_inventory IN (0, 1))",
+        "ALTER TABLE pending_shipment_items ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'pending'",
+        "ALTER TABLE pending_shipment_items ADD COLUMN IF NOT EXISTS verified_by INTEGER",
+        "ALTER TABLE pending_shipment_items ADD COLUMN IF NOT EXISTS verified_at TIMESTAMP",
+        "ALTER TABLE pending_shipment_items ADD COLUMN IF NOT EXISTS barcode TEXT",
+        "ALTER TABLE pending_shipment_items ADD COLUMN IF NOT EXISTS line_number INTEGER",
+        """
+        CREATE TABLE IF NOT EXISTS shipment_issues (
+            issue_id SERIAL PRIMARY KEY,
+            pending_shipment_id INTEGER NOT NULL REFERENCES pending_shipments(pending_shipment_id),
+            pending_item_id INTEGER REFERENCES pending_shipment_items(pending_item_id),
+            issue_type TEXT NOT NULL CHECK(issue_type IN ('missing', 'damaged', 'wrong_item', 'quantity_mismatch', 'expired', 'quality', 'other')),
+            severity TEXT DEFAULT 'minor' CHECK(severity IN ('minor', 'major', 'critical')),
+            quantity_affected INTEGER DEFAULT 1,
+            reported_by INTEGER NOT NULL REFERENCES employees(employee_id),
+            reported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            description TEXT,
+            photo_path TEXT,
+            resolution_status TEXT DEFAULT 'open' CHECK(resolution_status IN ('open', 'resolved', 'vendor_contacted', 'credit_issued')),
+            resolved_by INTEGER REFERENCES employees(employee_id),
+            resolved_at TIMESTAMP,
+            resolution_notes TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shipment_scan_log (
+            scan_id SERIAL PRIMARY KEY,
+            pending_shipment_id INTEGER NOT NULL REFERENCES pending_shipments(pending_shipment_id),
+            pending_item_id INTEGER REFERENCES pending_shipment_items(pending_item_id),
+            scanned_barcode TEXT NOT NULL,
+            scanned_by INTEGER NOT NULL REFERENCES employees(employee_id),
+            scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            scan_result TEXT DEFAULT 'match' CHECK(scan_result IN ('match', 'mismatch', 'unknown', 'duplicate')),
+            device_id TEXT,
+            location TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS verification_sessions (
+            session_id SERIAL PRIMARY KEY,
+            pending_shipment_id INTEGER NOT NULL REFERENCES pending_shipments(pending_shipment_id),
+            employee_id INTEGER NOT NULL REFERENCES employees(employee_id),
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ended_at TIMESTAMP,
+            total_scans INTEGER DEFAULT 0,
+            items_verified INTEGER DEFAULT 0,
+            issues_reported INTEGER DEFAULT 0,
+            device_id TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS approved_shipments (
+            shipment_id SERIAL PRIMARY KEY,
+            pending_shipment_id INTEGER REFERENCES pending_shipments(pending_shipment_id),
+            vendor_id INTEGER NOT NULL REFERENCES vendors(vendor_id),
+            purchase_order_number TEXT,
+            received_date DATE,
+            approved_by INTEGER NOT NULL REFERENCES employees(employee_id),
+            approved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            total_items_received INTEGER DEFAULT 0,
+            total_cost NUMERIC DEFAULT 0,
+            has_issues INTEGER DEFAULT 0 CHECK(has_issues IN (0, 1)),
+            issue_count INTEGER DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS approved_shipment_items (
+            approved_item_id SERIAL PRIMARY KEY,
+            shipment_id INTEGER NOT NULL REFERENCES approved_shipments(shipment_id),
+            product_id INTEGER NOT NULL REFERENCES inventory(product_id),
+            quantity_received INTEGER NOT NULL CHECK(quantity_received > 0),
+            unit_cost NUMERIC NOT NULL CHECK(unit_cost >= 0),
+            lot_number TEXT,
+            expiration_date DATE,
+            received_by INTEGER NOT NULL REFERENCES employees(employee_id),
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_shipment_issues_shipment ON shipment_issues(pending_shipment_id)",
+        "CREATE INDEX IF NOT EXISTS idx_shipment_issues_item ON shipment_issues(pending_item_id)",
+        "CREATE INDEX IF NOT EXISTS idx_shipment_scan_log_shipment ON shipment_scan_log(pending_shipment_id)",
+        "CREATE INDEX IF NOT EXISTS idx_shipment_scan_log_item ON shipment_scan_log(pending_item_id)",
+        "CREATE INDEX IF NOT EXISTS idx_verification_sessions_shipment ON verification_sessions(pending_shipment_id)",
+        "CREATE INDEX IF NOT EXISTS idx_approved_shipments_pending ON approved_shipments(pending_shipment_id)",
+    ]),
+    (4, 'employee_auth_columns', [
+        "ALTER TABLE employees ADD COLUMN IF NOT EXISTS pin_code TEXT",
+        "ALTER TABLE employees ADD COLUMN IF NOT EXISTS clerk_user_id TEXT",
+        "ALTER TABLE employees ADD COLUMN IF NOT EXISTS role_id INTEGER",
+    ]),
+    (5, 'customer_rewards_settings', [
+        """
+        CREATE TABLE IF NOT EXISTS customer_rewards_settings (
+            id SERIAL PRIMARY KEY,
+            enabled INTEGER DEFAULT 0 CHECK(enabled IN (0, 1)),
+            require_email INTEGER DEFAULT 0 CHECK(require_email IN (0, 1)),
+            require_phone INTEGER DEFAULT 0 CHECK(require_phone IN (0, 1)),
+            require_both INTEGER DEFAULT 0 CHECK(require_both IN (0, 1)),
+            reward_type TEXT DEFAULT 'points' CHECK(reward_type IN ('points', 'percentage', 'fixed')),
+            points_per_dollar REAL DEFAULT 1.0 CHECK(points_per_dollar >= 0),
+            points_redemption_value REAL DEFAULT 0.01 CHECK(points_redemption_value >= 0),
+            percentage_discount REAL DEFAULT 0.0 CHECK(percentage_discount >= 0 AND percentage_discount <= 100),
+            fixed_discount REAL DEFAULT 0.0 CHECK(fixed_discount >= 0),
+            minimum_spend REAL DEFAULT 0.0 CHECK(minimum_spend >= 0),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "ALTER TABLE customer_rewards_settings ADD COLUMN IF NOT EXISTS points_enabled INTEGER DEFAULT 1",
+        "ALTER TABLE customer_rewards_settings ADD COLUMN IF NOT EXISTS percentage_enabled INTEGER DEFAULT 0",
+        "ALTER TABLE customer_rewards_settings ADD COLUMN IF NOT EXISTS fixed_enabled INTEGER DEFAULT 0",
+    ]),
+    (6, 'payment_and_onboarding_settings', [
+        """
+        CREATE TABLE IF NOT EXISTS payment_settings (
+            setting_id SERIAL PRIMARY KEY,
+            store_id INTEGER,
+            payment_processor TEXT DEFAULT 'cash_only',
+            stripe_account_id INTEGER,
+            stripe_credential_id INTEGER,
+            default_currency TEXT DEFAULT 'usd',
+            transaction_fee_rate REAL DEFAULT 0.029,
+            transaction_fee_fixed REAL DEFAULT 0.30,
+            enabled_payment_methods TEXT DEFAULT '["cash"]',
+            require_cvv INTEGER DEFAULT 1 CHECK(require_cvv IN (0, 1)),
+            require_zip INTEGER DEFAULT 0 CHECK(require_zip IN (0, 1)),
+            auto_capture INTEGER DEFAULT 1 CHECK(auto_capture IN (0, 1)),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS store_setup (
+            setup_id SERIAL PRIMARY KEY,
+            setup_completed INTEGER DEFAULT 0 CHECK(setup_completed IN (0, 1)),
+            setup_step INTEGER DEFAULT 1,
+            completed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS onboarding_progress (
+            progress_id SERIAL PRIMARY KEY,
+            step_name TEXT NOT NULL,
+            completed INTEGER DEFAULT 0,
+            data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(step_name)
+        )
+        """,
+    ]),
+    (7, 'pos_settings_and_returns_columns', [
+        "ALTER TABLE IF EXISTS pos_settings ADD COLUMN IF NOT EXISTS require_signature_for_return BOOLEAN DEFAULT false",
+        "ALTER TABLE IF EXISTS pos_settings ADD COLUMN IF NOT EXISTS discount_presets TEXT",
+        "ALTER TABLE IF EXISTS pending_returns ADD COLUMN IF NOT EXISTS signature TEXT",
+    ]),
+    (8, 'calendar_subscriptions_and_google_tokens', [
+        """
+        CREATE TABLE IF NOT EXISTS calendar_subscriptions (
+            subscription_id SERIAL PRIMARY KEY,
+            employee_id INTEGER NOT NULL,
+            subscription_token VARCHAR(255) NOT NULL,
+            include_shifts SMALLINT DEFAULT 1,
+            include_shipments SMALLINT DEFAULT 1,
+            include_meetings SMALLINT DEFAULT 1,
+            include_deadlines SMALLINT DEFAULT 1,
+            calendar_name VARCHAR(255) DEFAULT 'My Work Schedule',
+            is_active SMALLINT DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS google_calendar_tokens (
+            id SERIAL PRIMARY KEY,
+            employee_id INTEGER NOT NULL,
+            access_token TEXT NOT NULL,
+            refresh_token TEXT,
+            token_expiry TIMESTAMP WITH TIME ZONE,
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW(),
+            UNIQUE(employee_id)
+        )
+        """,
+        "ALTER TABLE IF EXISTS master_calendar ADD COLUMN IF NOT EXISTS google_event_id TEXT",
+    ]),
+    (9, 'order_number_counters', [
+        # One row per prefix (ORD/DD/SH/UE) per day; generate_order_number bumps it with an UPSERT
+        """
+        CREATE TABLE IF NOT EXISTS order_number_counters (
+            prefix TEXT NOT NULL,
+            day DATE NOT NULL,
+            last_value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (prefix, day)
+        )
+        """,
+    ]),
+    (10, 'orders_keyset_index', [
+        # Serves list_orders' ORDER BY order_date DESC, order_id DESC and its (order_date, order_id) < cursor
+        "CREATE INDEX IF NOT EXISTS idx_orders_order_date_id ON orders (order_date DESC, order_id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_payment_transactions_order ON payment_transactions (order_id)",
+    ]),
+    (11, 'inventory_catalog_version', [
+        # Single-row catalog version; reset_version marks changes that can't be sent as a
+        # per-product delta (category/vendor renames change many rows' derived fields)
+        """
+        CREATE TABLE IF NOT EXISTS inventory_catalog_version (
+            id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            version BIGINT NOT NULL DEFAULT 1,
+            reset_version BIGINT NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+        """,
+        "INSERT INTO inventory_catalog_version (id) VALUES (1) ON CONFLICT (id) DO NOTHING",
+        # Latest version per product; deleted rows stay as tombstones for delta clients
+        """
+        CREATE TABLE IF NOT EXISTS inventory_changes (
+            product_id INTEGER PRIMARY KEY,
+            version BIGINT NOT NULL,
+            deleted BOOLEAN NOT NULL DEFAULT FALSE,
+            changed_at TIMESTAMP DEFAULT NOW()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_inventory_changes_version ON inventory_changes (version)",
+        # One version per transaction: the first write bumps the counter (row lock held to
+        # commit, so versions become visible in order) and caches it in a tx-local setting
+        """
+        CREATE OR REPLACE FUNCTION inventory_catalog_bump() RETURNS BIGINT AS $$
+        DECLARE
+            v BIGINT;
+        BEGIN
+            v := NULLIF(current_setting('pos.inventory_catalog_version', true), '')::BIGINT;
+            IF v IS NULL THEN
+                UPDATE inventory_catalog_version SET version = version + 1, updated_at = NOW()
+                WHERE id = 1 RETURNING version INTO v;
+                PERFORM set_config('pos.inventory_catalog_version', v::TEXT, true);
+            END IF;
+            RETURN v;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION inventory_catalog_product_changed() RETURNS TRIGGER AS $$
+        DECLARE
+            v BIGINT := inventory_catalog_bump();
+            pid INTEGER;
+            is_deleted BOOLEAN := (TG_OP = 'DELETE' AND TG_TABLE_NAME = 'inventory');
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                pid := OLD.product_id;
+            ELSE
+                pid := NEW.product_id;
+            END IF;
+            INSERT INTO inventory_changes (product_id, version, deleted) VALUES (pid, v, is_deleted)
+            ON CONFLICT (product_id) DO UPDATE
+                SET version = EXCLUDED.version, deleted = EXCLUDED.deleted, changed_at = NOW();
+            IF TG_OP = 'UPDATE' AND OLD.product_id IS DISTINCT FROM NEW.product_id THEN
+                INSERT INTO inventory_changes (product_id, version) VALUES (OLD.product_id, v)
+                ON CONFLICT (product_id) DO UPDATE SET version = EXCLUDED.version, changed_at = NOW();
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION inventory_catalog_reset() RETURNS TRIGGER AS $$
+        DECLARE
+            v BIGINT := inventory_catalog_bump();
+        BEGIN
+            UPDATE inventory_catalog_version SET reset_version = v WHERE id = 1 AND reset_version < v;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        DO $$
+        DECLARE
+            t TEXT;
+        BEGIN
+            FOREACH t IN ARRAY ARRAY['inventory', 'product_variants', 'product_metadata'] LOOP
+                IF to_regclass('public.' || t) IS NOT NULL THEN
+                    EXECUTE format('DROP TRIGGER IF EXISTS inventory_catalog_changed ON %I', t);
+                    EXECUTE format('CREATE TRIGGER inventory_catalog_changed AFTER INSERT OR UPDATE OR DELETE ON %I '
+                                   'FOR EACH ROW EXECUTE PROCEDURE inventory_catalog_product_changed()', t);
+                END IF;
+            END LOOP;
+            FOREACH t IN ARRAY ARRAY['categories', 'vendors'] LOOP
+                IF to_regclass('public.' || t) IS NOT NULL THEN
+                    EXECUTE format('DROP TRIGGER IF EXISTS inventory_catalog_reset ON %I', t);
+                    EXECUTE format('CREATE TRIGGER inventory_catalog_reset AFTER INSERT OR UPDATE OR DELETE ON %I '
+                                   'FOR EACH STATEMENT EXECUTE PROCEDURE inventory_catalog_reset()', t);
+                END IF;
+            END LOOP;
+        END $$;
+        """,
+    ]),
+    (12, 'metadata_extraction_jobs', [
+        # Durable queue drained by metadata_worker; at most one pending job per product
+        """
+        CREATE TABLE IF NOT EXISTS metadata_extraction_jobs (
+            job_id SERIAL PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            auto_sync_category BOOLEAN NOT NULL DEFAULT TRUE,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            run_after TIMESTAMP NOT NULL DEFAULT NOW(),
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_metadata_jobs_pending_product ON metadata_extraction_jobs (product_id) WHERE status = 'pending'",
+        "CREATE INDEX IF NOT EXISTS idx_metadata_jobs_claim ON metadata_extraction_jobs (run_after, job_id) WHERE status = 'pending'",
+    ]),
+    (13, 'barcode_lookup_cache', [
+        # Open Food Facts results (found and not-found); expires_at NULL = imported dump row
+        """
+        CREATE TABLE IF NOT EXISTS barcode_lookup_cache (
+            barcode TEXT PRIMARY KEY,
+            found BOOLEAN NOT NULL,
+            data JSONB,
+            source TEXT NOT NULL DEFAULT 'api',
+            fetched_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            expires_at TIMESTAMP
+        )
+        """,
+    ]),
+    (14, 'inventory_search_indexes', [
+        f"CREATE INDEX IF NOT EXISTS idx_inventory_search_tsv ON inventory USING gin (({INVENTORY_SEARCH_TSV}))",
+        f"CREATE INDEX IF NOT EXISTS idx_product_metadata_search_tsv ON product_metadata USING gin (({METADATA_SEARCH_TSV}))",
+        # pg_trgm may not be installable without superuser; search then runs without typo tolerance
+        """
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        EXCEPTION WHEN insufficient_privilege OR feature_not_supported OR undefined_file THEN
+            RAISE NOTICE 'pg_trgm unavailable: %', SQLERRM;
+        END $$
+        """,
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+                CREATE INDEX IF NOT EXISTS idx_inventory_name_trgm ON inventory USING gin (product_name gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS idx_inventory_sku_trgm ON inventory USING gin (sku gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS idx_inventory_barcode_trgm ON inventory USING gin (barcode gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS idx_product_metadata_brand_trgm ON product_metadata USING gin (brand gin_trgm_ops);
+            END IF;
+        END $$
+        """,
+    ]),
+    # Image embeddings live beside inventory, not in it: SELECT i.* must not
+    # ship a bytea per row. photo/photo_mtime record what was embedded so a
+    # resumable build only re-embeds photos that changed.
+    (15, 'product_image_embeddings', [
+        """
+        CREATE TABLE IF NOT EXISTS product_image_embeddings (
+            product_id INTEGER PRIMARY KEY REFERENCES inventory(product_id) ON DELETE CASCADE,
+            embedding BYTEA NOT NULL,
+            photo TEXT,
+            photo_mtime DOUBLE PRECISION,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+        """,
+        # Carry over embeddings from the old inventory.image_embedding column, where present
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'inventory' AND column_name = 'image_embedding'
+            ) THEN
+                INSERT INTO product_image_embeddings (product_id, embedding, photo)
+                SELECT product_id, image_embedding, photo FROM inventory
+                WHERE image_embedding IS NOT NULL
+                ON CONFLICT (product_id) DO NOTHING;
+            END IF;
+        END $$
+        """,
+    ]),
+    # Embeddings become raw float32 bytes; dim and model_version describe them.
+    # Rows left with model_version NULL are the pickled ones from v15.
+    (16, 'product_image_embeddings_raw', [
+        "ALTER TABLE product_image_embeddings ADD COLUMN IF NOT EXISTS dim INTEGER",
+        "ALTER TABLE product_image_embeddings ADD COLUMN IF NOT EXISTS model_version TEXT",
+        """
+        DO $$
+        BEGIN
+            ALTER TABLE product_image_embeddings ADD CONSTRAINT product_image_embeddings_dim_check
+                CHECK (dim IS NULL OR octet_length(embedding) = dim * 4);
+        EXCEPTION WHEN duplicate_object THEN
+            NULL;
+        END $$
+        """,
+    ]),
+    # Face descriptors as raw float32 bytes; face_descriptor keeps legacy JSON
+    # until face_index converts the row on load
+    (17, 'employee_face_descriptor_bytes', [
+        """
+        CREATE TABLE IF NOT EXISTS employee_face_encodings (
+            face_id SERIAL PRIMARY KEY,
+            employee_id INTEGER NOT NULL UNIQUE REFERENCES employees(employee_id) ON DELETE CASCADE,
+            face_descriptor TEXT,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "ALTER TABLE employee_face_encodings ADD COLUMN IF NOT EXISTS descriptor BYTEA",
+        "ALTER TABLE employee_face_encodings ALTER COLUMN face_descriptor DROP NOT NULL",
+    ]),
+    (18, 'notification_outbox', [
+        # Durable queue drained by notification_outbox; dedup_key makes enqueueing idempotent,
+        # delivered lists recipients already sent to so a retry skips them
+        """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            outbox_id BIGSERIAL PRIMARY KEY,
+            dedup_key TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            store_id INTEGER NOT NULL DEFAULT 1,
+            payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            delivered JSONB NOT NULL DEFAULT '[]'::jsonb,
+            last_error TEXT,
+            run_after TIMESTAMP NOT NULL DEFAULT NOW(),
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_notification_outbox_claim ON notification_outbox (run_after, outbox_id) WHERE status = 'pending'",
+    ]),
+    # Catalog versions become the writing transaction's id instead of a counter row every
+    # writer locked until commit; readers only trust versions below their snapshot's xmin
+    # (see InventorySnapshotCache.current_version). Stock-only inventory updates no longer
+    # count as catalog changes.
+    (19, 'inventory_catalog_txid_versions', [
+        """
+        CREATE OR REPLACE FUNCTION inventory_catalog_bump() RETURNS BIGINT AS $$
+        BEGIN
+            RETURN txid_current();
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Counter-based versions held by clients must not be mistaken for txids: force one full reload
+        "UPDATE inventory_catalog_version SET reset_version = GREATEST(reset_version, txid_current()), updated_at = NOW() WHERE id = 1",
+        """
+        DO $$
+        BEGIN
+            IF to_regclass('public.inventory') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS inventory_catalog_changed ON inventory;
+                DROP TRIGGER IF EXISTS inventory_catalog_updated ON inventory;
+                CREATE TRIGGER inventory_catalog_changed AFTER INSERT OR DELETE ON inventory
+                    FOR EACH ROW EXECUTE PROCEDURE inventory_catalog_product_changed();
+                CREATE TRIGGER inventory_catalog_updated AFTER UPDATE ON inventory
+                    FOR EACH ROW
+                    WHEN ((to_jsonb(OLD) - ARRAY['current_quantity', 'updated_at', 'last_restocked'])
+                          IS DISTINCT FROM (to_jsonb(NEW) - ARRAY['current_quantity', 'updated_at', 'last_restocked']))
+                    EXECUTE PROCEDURE inventory_catalog_product_changed();
+            END IF;
+        END $$;
+        """,
+    ]),
+    # search_inventory matches keywords through the full-text document only; the trigram
+    # index on it (step 14) was never used by a query and only slowed metadata writes
+    (20, 'drop_keywords_trgm_index', [
+        "DROP INDEX IF EXISTS idx_product_metadata_keywords_trgm",
+    ]),
+    # Batch extraction compared pm.updated_at with inventory.updated_at, which stock
+    # changes and category syncs also bump; it now compares the digest of the inputs.
+    # Rows the old rule considered fresh are stamped with their current digest.
+    (21, 'product_metadata_input_digest', [
+        "ALTER TABLE product_metadata ADD COLUMN IF NOT EXISTS input_digest TEXT",
+        f"""
+        UPDATE product_metadata pm SET input_digest = {EXTRACTION_INPUT_DIGEST}
+        FROM inventory i
+        WHERE i.product_id = pm.product_id AND pm.input_digest IS NULL
+          AND pm.updated_at >= i.updated_at
+        """,
+    ]),
+]
+
+LATEST_VERSION = max(version for version, _, _ in BOOTSTRAP_STEPS)
+
+_bootstrap_lock = threading.Lock()
+_bootstrapped = False
+
+
+def _get_connection():
+    from database_postgres import get_connection
+    return get_connection()
+
+
+def _applied_versions(cursor) -> set:
+    cursor.execute("SELECT version FROM schema_bootstrap_versions")
+    return {row['version'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()}
+
+
+def get_schema_version(conn=None) -> int:
+    """Highest applied bootstrap version (0 if none)."""
+    should_close = False
+    if conn is None:
+        conn = _get_connection()
+        should_close = True
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('public.schema_bootstrap_versions') IS NOT NULL")
+        row = cursor.fetchone()
+        exists = list(row.values())[0] if isinstance(row, dict) else row[0]
+        if not exists:
+            return 0
+        versions = _applied_versions(cursor)
+        conn.rollback()
+        return max(versions) if versions else 0
+    finally:
+        if should_close:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def run_schema_bootstrap(conn=None, verbose: bool = False) -> int:
+    """
+    Apply any bootstrap steps not yet recorded in schema_bootstrap_versions.
+    Each step runs in its own transaction; on failure the step is rolled back,
+    logged, and later steps are skipped. Returns the highest applied version.
+    """
+    global _bootstrapped
+    should_close = False
+    if conn is None:
+        conn = _get_connection()
+        should_close = True
+    cursor = conn.cursor()
+    applied: set = set()
+    try:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        cursor.execute("SELECT pg_advisory_lock(%s)", (BOOTSTRAP_LOCK_KEY,))
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_bootstrap_versions (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.commit()
+            applied = _applied_versions(cursor)
+            conn.commit()
+            for version, name, statements in BOOTSTRAP_STEPS:
+                if version in applied:
+                    continue
+                try:
+                    for statement in statements:
+                        cursor.execute(statement)
+                    cursor.execute(
+                        "INSERT INTO schema_bootstrap_versions (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                    conn.commit()
+                    applied.add(version)
+                    if verbose:
+                        print(f"✅ Schema bootstrap v{version} ({name}) applied")
+                    logger.info("Schema bootstrap v%d (%s) applied", version, name)
+                except Exception as e:
+                    conn.rollback()
+                    logger.error("Schema bootstrap v%d (%s) failed: %s", version, name, e)
+                    if verbose:
+                        print(f"❌ Schema bootstrap v{version} ({name}) failed: {e}")
+                    break
+        finally:
+            try:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (BOOTSTRAP_LOCK_KEY,))
+                conn.commit()
+            except Exception:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+        refresh_schema_registry(conn)
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        _bootstrapped = LATEST_VERSION in applied
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+        if should_close:
+            try:
+                conn.close()
+            except Exception:
+                pass
+    return max(applied) if applied else 0
+
+
+def ensure_schema_bootstrapped() -> bool:
+    """Run the bootstrap once per process (no-op after a successful run)."""
+    if _bootstrapped:
+        return True
+    with _bootstrap_lock:
+        if _bootstrapped:
+            return True
+        try:
+            run_schema_bootstrap()
+        except Exception as e:
+            logger.warning("Schema bootstrap failed: %s", e)
+    return _bootstrapped
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Process-wide schema capability registry.
+Loads table/column metadata for the public schema once and answers
+has_table / has_column from memory, so request handlers don't query
+information_schema on every call. Refresh explicitly after migrations or
+runtime DDL (refresh/invalidate), or from the admin endpoint.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, FrozenSet, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaRegistry:
+    """In-memory map of table_name -> frozenset(column_name) for one schema."""
+
+    def __init__(self, schema: str = 'public'):
+        self.schema = schema
+        self._tables: Dict[str, FrozenSet[str]] = {}
+        self._loaded = False
+        self._loaded_at: Optional[float] = None
+        self._load_count = 0
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        from database_postgres import get_connection
+        return get_connection()
+
+    def load(self, conn=None) -> None:
+        """(Re)load all tables and columns with a single catalog query."""
+        should_close = False
+        if conn is None:
+            conn = self._get_connection()
+            should_close = True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT table_name, column_name FROM information_schema.columns
+                WHERE table_schema = %s
+            """, (self.schema,))
+            tables: Dict[str, set] = {}
+            for row in cursor.fetchall():
+                if isinstance(row, dict):
+                    t, c = row.get('table_name'), row.get('column_name')
+                else:
+                    t, c = row[0], row[1]
+                tables.setdefault(t, set()).add(c)
+            cursor.close()
+        finally:
+            if should_close:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        # Swap the whole mapping so concurrent readers never see a partial load
+        self._tables = {t: frozenset(cols) for t, cols in tables.items()}
+        self._loaded = True
+        self._loaded_at = time.time()
+        self._load_count += 1
+        logger.debug("Schema registry loaded %d tables", len(self._tables))
+
+    def refresh(self, conn=None) -> None:
+        """Reload now (call after migrations / runtime ALTER TABLE)."""
+        with self._lock:
+            self.load(conn)
+
+    def invalidate(self) -> None:
+        """Mark stale; the next lookup reloads."""
+        self._loaded = False
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                self.load()
+            except Exception as e:
+                # Leave unloaded so the next lookup retries; treat everything as absent meanwhile
+                logger.warning("Schema registry load failed: %s", e)
+
+    def has_table(self, table_name: str) -> bool:
+        self._ensure_loaded()
+        return table_name in self._tables
+
+    def has_column(self, table_name: str, column_name: str) -> bool:
+        self._ensure_loaded()
+        return column_name in self._tables.get(table_name, ())
+
+    def table_columns(self, table_name: str) -> FrozenSet[str]:
+        self._ensure_loaded()
+        return self._tables.get(table_name, frozenset())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'schema': self.schema,
+            'loaded': self._loaded,
+            'loaded_at': self._loaded_at,
+            'load_count': self._load_count,
+            'table_count': len(self._tables),
+        }
+
+
+# Global registry instance
+_schema_registry: Optional[SchemaRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_schema_registry() -> SchemaRegistry:
+    """Get or create the schema registry singleton"""
+    global _schema_registry
+    if _schema_registry is None:
+        with _registry_lock:
+            if _schema_registry is None:
+                _schema_registry = SchemaRegistry()
+    return _schema_registry
+
+
+def has_table(table_name: str) -> bool:
+    """True if public.<table_name> exists (from cached catalog)."""
+    return get_schema_registry().has_table(table_name)
+
+
+def has_column(table_name: str, column_name: str) -> bool:
+    """True if public.<table_name>.<column_name> exists (from cached catalog)."""
+    return get_schema_registry().has_column(table_name, column_name)
+
+
+def table_columns(table_name: str) -> FrozenSet[str]:
+    """All column names of public.<table_name> (empty if the table doesn't exist)."""
+    return get_schema_registry().table_columns(table_name)
+
+
+def refresh_schema_registry(conn=None) -> None:
+    """Reload table/column metadata now."""
+    get_schema_registry().refresh(conn)
+
+
+def invalidate_schema_registry() -> None:
+    """Mark cached metadata stale; reloaded lazily on next lookup."""
+    get_schema_registry().invalidate()
@@ -5,80 +5,35 @@ Completely FREE - no API costs
 Run this periodically to extract metadata for products
 """
 
-import sys
-import json
 from metadata_extraction import FreeMetadataSystem
-from database import get_connection
 
-def batch_process_all_products(limit=None):
+def batch_process_all_products(limit=None, workers=None, chunk_size=500, lookup_barcodes=False, all_products=False):
     """
-    Process all products without metadata
+    Process all products without metadata (or whose name/barcode changed since extraction)
+    Uses FreeMetadataSystem's batch mode: server-side cursor, nlp.pipe, a process
+    pool and one bulk upsert per chunk.
     Completely FREE - no API costs
     """
     
     metadata_system = FreeMetadataSystem()
     
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Get products without metadata or with outdated metadata
-    query = """
-        SELECT i.*
-        FROM inventory i
-        LEFT JOIN product_metadata pm ON i.product_id = pm.product_id
-        WHERE pm.metadata_id IS NULL OR pm.updated_at < i.updated_at
-        ORDER BY i.created_at DESC
-    """
-    
-    if limit:
-        query += f" LIMIT {limit}"
-    
-    cursor.execute(query)
-    products = cursor.fetchall()
-    
-    print(f"Processing {len(products)} products...")
+    print("Batch extracting metadata...")
     print("-" * 70)
+    report = metadata_system.batch_extract_all(
+        only_missing=not all_products,
+        limit=limit,
+        chunk_size=chunk_size,
+        workers=workers,
+        lookup_barcodes=lookup_barcodes,
+    )
+    success_count = report['saved']
+    error_count = report['errors']
     
-    success_count = 0
-    error_count = 0
-    
-    for idx, product in enumerate(products, 1):
-        try:
-            # Convert Row to dict for easier access (sqlite3.Row doesn't have .get() method)
-            product_dict = dict(product)
-            print(f"[{idx}/{len(products)}] Processing: {product_dict['product_name']}")
-            
-            # Extract metadata (FREE)
-            metadata = metadata_system.extract_metadata_from_product(
-                product_dict['product_name'],
-                product_dict.get('barcode'),
-                None  # No description field in current schema
-            )
-            
-            # Save
-            metadata_system.save_product_metadata(
-                product_dict['product_id'],
-                metadata,
-                'batch_free'
-            )
-            
-            # Get category name safely
-            category_name = 'N/A'
-            category_suggestions = metadata.get('category_suggestions', [])
-            if category_suggestions and len(category_suggestions) > 0:
-                category_name = category_suggestions[0].get('category_name', 'N/A')
-            
-            print(f"  ✓ Completed - Brand: {metadata.get('brand', 'N/A')}, Category: {category_name}")
-            success_count += 1
-            
-        except Exception as e:
-            print(f"  ✗ Error: {e}")
-            import traceback
-            traceback.print_exc()
-            error_count += 1
-    
-    cursor.close()
-    conn.close()
+    print("-" * 70)
+    print(f"Throughput: {report['products_per_second']:.1f} products/sec "
+          f"({report['processed']} products in {report['elapsed_seconds']:.1f}s, "
+          f"{report['workers']} worker(s), {report['chunks']} chunk(s))")
+    print(f"  extract wait: {report['extract_seconds']:.1f}s, DB writes: {report['write_seconds']:.1f}s")
     
     # Auto-categorize after processing (only if scikit-learn is available)
     if success_count > 0:
@@ -112,7 +67,17 @@ if __name__ == '__main__':
     
     parser = argparse.ArgumentParser(description='Batch process metadata extraction')
     parser.add_argument('--limit', type=int, help='Limit number of products to process')
+    parser.add_argument('--workers', type=int, help='Extraction processes (default: CPUs - 1; 1 = in-process)')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Products per fetch/upsert chunk')
+    parser.add_argument('--barcode-lookup', action='store_true', help='Also query Open Food Facts per barcode (slow)')
+    parser.add_argument('--all', action='store_true', help='Re-extract every product, not just missing/outdated ones')
     args = parser.parse_args()
     
-    batch_process_all_products(limit=args.limit)
+    batch_process_all_products(
+        limit=args.limit,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        lookup_barcodes=args.barcode_lookup,
+        all_products=args.all,
+    )
 
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark create_order: round-trips and latency vs. number of order lines.
+create_order validates/locks stock in one statement, inserts order_items in one
+multi-row INSERT and decrements inventory in one UPDATE ... FROM (VALUES ...),
+so the statement count should stay flat as lines grow.
+
+Runs as a dry run by default: every commit is turned into a rollback, so no
+orders are saved and stock is untouched. Benchmarks products with
+current_quantity >= MIN_STOCK (100), so even a --commit run of the default
+line counts and iterations doesn't run them out of stock.
+
+Usage:
+    python scripts/benchmark_create_order.py [--lines 1,5,10,30] [--iterations 5] [--employee-id 1]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+MIN_STOCK = 100
+
+
+class _CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, *args, **kwargs):
+        self._counter['statements'] += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._counter['statements'] += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _CountingConnection:
+    def __init__(self, conn, counter, dry_run):
+        self._conn = conn
+        self._counter = counter
+        self._dry_run = dry_run
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self._conn.cursor(*args, **kwargs), self._counter)
+
+    def commit(self):
+        self._counter['statements'] += 1
+        if self._dry_run:
+            return self._conn.rollback()
+        return self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _pick_products(count):
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT product_id, product_price FROM inventory
+        WHERE current_quantity >= %s
+        ORDER BY product_id
+        LIMIT %s
+    """, (MIN_STOCK, count))
+    rows = cursor.fetchall()
+    conn.close()
+    return [(r[0], float(r[1] or 0)) if not isinstance(r, dict) else (r['product_id'], float(r['product_price'] or 0))
+            for r in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark create_order round-trips')
+    parser.add_argument('--lines', default='1,5,10,30', help='Comma-separated line counts')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--employee-id', type=int, default=1)
+    parser.add_argument('--commit', action='store_true', help='Really commit the orders (changes stock!)')
+    args = parser.parse_args()
+
+    line_counts = [int(x) for x in args.lines.split(',') if x.strip()]
+    products = _pick_products(max(line_counts))
+    if not products:
+        print(f"No products with current_quantity >= {MIN_STOCK} found; nothing to benchmark.")
+        return 1
+
+    counter = {'statements': 0}
+    original_get_connection = database.get_connection
+    database.get_connection = lambda: _CountingConnection(original_get_connection(), counter, not args.commit)
+
+    print(f"{'lines':>6} {'statements':>11} {'avg ms':>9} {'min ms':>9}")
+    print("-" * 40)
+    try:
+        for n in line_counts:
+            # Cycle through available products so N lines can exceed distinct products
+            items = [
+                {'product_id': products[i % len(products)][0], 'quantity': 1, 'unit_price': products[i % len(products)][1]}
+                for i in range(n)
+            ]
+            timings = []
+            statements = None
+            for _ in range(args.iterations):
+                counter['statements'] = 0
+                started = time.perf_counter()
+                result = database.create_order(args.employee_id, items, 'cash')
+                timings.append((time.perf_counter() - started) * 1000)
+                if not result.get('success'):
+                    print(f"  create_order failed for {n} lines: {result.get('message')}")
+                    break
+                statements = counter['statements']
+            if timings and statements is not None:
+                print(f"{n:>6} {statements:>11} {sum(timings) / len(timings):>9.1f} {min(timings):>9.1f}")
+    finally:
+        database.get_connection = original_get_connection
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark product image matching on synthetic embeddings: the previous
+per-product Python loop (cosine_similarity per product + full sort) vs.
+EmbeddingIndex (one matrix product + argpartition top-k), for single
+queries and a shipment-sized batch. Needs only numpy.
+
+Usage:
+    python scripts/benchmark_image_matching.py [--sizes 10000,100000] [--dim 1280] [--queries 20] [--batch 50]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_index import EmbeddingIndex
+
+
+def _cosine(vec1, vec2):
+    norm1 = np.linalg.norm(vec1)
+    norm2 = np.linalg.norm(vec2)
+    if norm1 == 0 or norm2 == 0:
+        return 0.0
+    return float(np.dot(vec1, vec2) / (norm1 * norm2))
+
+
+def _loop_identify(embeddings, query, top_k):
+    similarities = {pid: _cosine(query, emb) for pid, emb in embeddings.items()}
+    return sorted(similarities.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+
+def _ms(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark image embedding matching')
+    parser.add_argument('--sizes', default='10000,100000', help='Comma-separated catalog sizes')
+    parser.add_argument('--dim', type=int, default=1280, help='Embedding size (EfficientNet-B0: 1280)')
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=50, help='Photos per shipment batch')
+    parser.add_argument('--loop-queries', type=int, default=3, help='Queries for the (slow) loop baseline')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'products':>9} {'loop ms/q':>10} {'index ms/q':>11} {'batch ms/img':>13} {'build ms':>9} {'top-1 agree':>12}")
+    print("-" * 70)
+    for size in [int(x) for x in args.sizes.split(',') if x.strip()]:
+        catalog = rng.standard_normal((size, args.dim), dtype=np.float32)
+        ids = list(range(1, size + 1))
+        queries = catalog[rng.integers(0, size, args.queries)] + 0.1 * rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+        started = time.perf_counter()
+        index = EmbeddingIndex.from_arrays(ids, catalog)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        as_dict = dict(zip(ids, catalog))
+        loop_q = queries[:args.loop_queries]
+        loop_ms = _ms(lambda: [_loop_identify(as_dict, q, 5) for q in loop_q], 1) / max(1, len(loop_q))
+        index_ms = _ms(lambda: [index.search(q, top_k=5) for q in queries], 1) / len(queries)
+        batch = queries[np.arange(args.batch) % len(queries)]
+        batch_ms = _ms(lambda: index.search_many(batch, top_k=1), 1) / len(batch)
+
+        agree = sum(
+            _loop_identify(as_dict, q, 1)[0][0] == index.search(q, top_k=1)[0][0] for q in loop_q
+        ) / max(1, len(loop_q))
+        print(f"{size:>9} {loop_ms:>10.1f} {index_ms:>11.2f} {batch_ms:>13.2f} {build_ms:>9.0f} {agree:>12.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
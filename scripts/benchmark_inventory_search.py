@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark typeahead search: database.search_inventory (GIN tsvector/pg_trgm
+indexes, what /api/inventory/search serves) vs. FreeMetadataSystem.intelligent_search.
+Queries are built from real product names in the catalog: short prefixes,
+whole words and one-letter typos.
+
+Usage:
+    python scripts/benchmark_inventory_search.py [--queries 50] [--iterations 5] [--skip-tfidf]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+def _sample_queries(count, seed):
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM inventory")
+    total = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT product_name FROM inventory
+        WHERE product_name IS NOT NULL AND length(product_name) >= 4
+        ORDER BY random() LIMIT %s
+    """, (count,))
+    names = [r[0] for r in cursor.fetchall()]
+    conn.close()
+    rng = random.Random(seed)
+    queries = []
+    for name in names:
+        word = max(name.split(), key=len)
+        kind = rng.choice(('prefix', 'word', 'typo'))
+        if kind == 'prefix':
+            queries.append(word[:max(2, len(word) // 2)])
+        elif kind == 'typo' and len(word) > 4:
+            pos = rng.randrange(1, len(word) - 1)
+            queries.append(word[:pos] + word[pos + 1] + word[pos] + word[pos + 2:])
+        else:
+            queries.append(word)
+    return total, queries
+
+
+def _time(fn, queries, iterations):
+    timings = []
+    hits = 0
+    for _ in range(iterations):
+        for q in queries:
+            started = time.perf_counter()
+            results = fn(q)
+            timings.append((time.perf_counter() - started) * 1000)
+            hits += 1 if results else 0
+    timings.sort()
+    return {
+        'avg': sum(timings) / len(timings),
+        'p50': timings[len(timings) // 2],
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'hit_rate': hits / len(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark inventory typeahead search')
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--skip-tfidf', action='store_true', help='Only time search_inventory')
+    args = parser.parse_args()
+
+    total, queries = _sample_queries(args.queries, args.seed)
+    if not queries:
+        print("No products found; nothing to benchmark.")
+        return 1
+    print(f"{total} products, {len(queries)} queries x {args.iterations} iterations")
+
+    contenders = [('search_inventory', lambda q: database.search_inventory(q, limit=args.limit)['data'])]
+    if not args.skip_tfidf:
+        from metadata_extraction import get_metadata_system
+        metadata_system = get_metadata_system()
+        # First call builds (or loads) the TF-IDF index; keep that out of the timings
+        metadata_system.intelligent_search(queries[0], limit=args.limit)
+        contenders.append(('intelligent_search', lambda q: metadata_system.intelligent_search(q, limit=args.limit)))
+
+    print(f"{'method':<20} {'avg ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'hit rate':>9}")
+    print("-" * 60)
+    for name, fn in contenders:
+        # Warm up caches/plans
+        fn(queries[0])
+        r = _time(fn, queries, args.iterations)
+        print(f"{name:<20} {r['avg']:>9.2f} {r['p50']:>9.2f} {r['p95']:>9.2f} {r['hit_rate']:>9.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
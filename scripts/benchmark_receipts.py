@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark receipt rendering (receipts/sec) without a database: receipt settings
+come from a synthetic row instead of receipt_settings.
+
+- cold:    every receipt clears the receipt caches first, which is what each
+           receipt cost before (settings reload, every ParagraphStyle rebuilt,
+           logo decoded, fresh Code128 PNG)
+- new:     warm layout/settings caches, a different order every time
+- reprint: the same order again (rendered-PDF cache)
+
+Usage:
+    python scripts/benchmark_receipts.py [--receipts 200] [--items 8] [--logo]
+"""
+
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import receipt_generator
+from receipt_cache import clear_receipt_caches, receipt_cache_stats
+
+
+def _settings(with_logo):
+    template_styles = {
+        'receipt_width': 80, 'font_family': 'monospace', 'font_size': 10,
+        'divider_style': 'dashed', 'show_item_skus': True, 'show_barcode': True,
+    }
+    settings = {
+        'receipt_type': 'traditional', 'store_name': 'Benchmark Store',
+        'store_address': '1 Main St\nSuite 2', 'store_city': 'Springfield', 'store_state': 'IL',
+        'store_zip': '62701', 'store_phone': '(555) 010-0000', 'store_email': 'store@example.com',
+        'store_website': 'example.com', 'footer_message': 'Thank you for your business!',
+        'return_policy': 'Returns within 30 days', 'show_tax_breakdown': 1,
+        'show_payment_method': 1, 'show_signature': 1, 'show_tip': 1,
+        'template_styles': template_styles,
+    }
+    if with_logo:
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.new('RGB', (400, 100), 'white').save(buf, format='PNG')
+        settings['store_logo'] = 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+    return settings
+
+
+def _order(n, items):
+    order_data = {
+        'order_id': n, 'order_number': f'ORD-20260101-{n:05d}', 'order_date': '2026-01-01 12:00:00',
+        'subtotal': 10.0 * items, 'tax_rate': 0.08, 'tax_amount': 0.8 * items, 'discount': 0,
+        'total': 10.8 * items, 'payment_method': 'card', 'payment_status': 'completed',
+    }
+    order_items = [
+        {'product_name': f'Product {i}', 'sku': f'SKU-{i:03d}', 'quantity': 1, 'unit_price': 10.0}
+        for i in range(items)
+    ]
+    return order_data, order_items
+
+
+def _rate(fn, count):
+    started = time.perf_counter()
+    for n in range(count):
+        fn(n)
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark receipt rendering')
+    parser.add_argument('--receipts', type=int, default=200)
+    parser.add_argument('--items', type=int, default=8, help='Line items per receipt')
+    parser.add_argument('--logo', action='store_true', help='Include a store logo in the template')
+    args = parser.parse_args()
+
+    settings = _settings(args.logo)
+    receipt_generator._load_receipt_settings = lambda: dict(settings)
+    # Silence the per-receipt progress prints
+    sys.stdout, real_stdout = io.StringIO(), sys.stdout
+
+    def cold(n):
+        clear_receipt_caches()
+        receipt_generator.render_order_receipt_pdf(n, 'order', *_order(n, args.items))
+
+    def new(n):
+        receipt_generator.render_order_receipt_pdf(n, 'order', *_order(100000 + n, args.items))
+
+    def reprint(n):
+        receipt_generator.render_order_receipt_pdf(1, 'order', *_order(1, args.items))
+
+    try:
+        results = [(name, _rate(fn, args.receipts)) for name, fn in (('cold', cold), ('new', new), ('reprint', reprint))]
+    finally:
+        sys.stdout = real_stdout
+
+    print(f"{'mode':>8} {'receipts/s':>11} {'ms/receipt':>11}")
+    print('-' * 32)
+    for name, rate in results:
+        print(f"{name:>8} {rate:>11.1f} {1000 / rate:>11.2f}")
+    print(receipt_cache_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+In-process cache of validated employee session tokens.
+verify_session answers from here on the common path instead of joining
+employee_sessions with employees. Entries expire after a short TTL and are
+dropped immediately on logout, employee update/deactivation or deletion.
+Other processes are told through a Postgres NOTIFY on SESSION_CHANNEL, which a
+background LISTEN thread applies to this process's cache. Other per-process
+caches share the channel: register_invalidation_handler() claims a payload
+prefix and publish_invalidation() broadcasts under it.
+
+Tokens are keyed (and broadcast) by SHA-256 digest, never in clear text.
+"""
+
+import hashlib
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+SESSION_CHANNEL = 'pos_session_invalidation'
+SESSION_CACHE_TTL_SECONDS = float(os.getenv('SESSION_CACHE_TTL_SECONDS', '60') or 0)
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '10000') or 0)
+
+
+def token_digest(session_token: str) -> str:
+    return hashlib.sha256(session_token.encode('utf-8')).hexdigest()
+
+
+def _seconds_until(expires_at: Union[datetime, float]) -> float:
+    """Time left before a session's own expiry (datetime, naive = local time, or epoch seconds)."""
+    if isinstance(expires_at, datetime):
+        now = datetime.now(expires_at.tzinfo) if expires_at.tzinfo else datetime.now()
+        return (expires_at - now).total_seconds()
+    return float(expires_at) - time.time()
+
+
+class SessionCache:
+    """Bounded LRU of token digest -> (expires_at, verify_session result)."""
+
+    def __init__(self, ttl: float = SESSION_CACHE_TTL_SECONDS, max_entries: int = SESSION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        # Bumped on every invalidation so a DB read that raced a logout isn't cached
+        self._generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, session_token: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        key = token_digest(session_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, result = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return dict(result)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def put(self, session_token: str, result: Dict[str, Any], generation: Optional[int] = None,
+            expires_at: Optional[Union[datetime, float]] = None) -> None:
+        """
+        Cache a valid result; skipped if anything was invalidated since generation was read.
+        expires_at (the session's own expiry) caps the entry's lifetime below the TTL.
+        """
+        if not self.enabled or not result.get('valid'):
+            return
+        lifetime = self.ttl
+        if expires_at is not None:
+            lifetime = min(lifetime, _seconds_until(expires_at))
+            if lifetime <= 0:
+                return
+        key = token_digest(session_token)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + lifetime, dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_digest(self, digest: str) -> None:
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(digest, None) is not None:
+                self._invalidations += 1
+
+    def invalidate_token(self, session_token: str) -> None:
+        self.invalidate_digest(token_digest(session_token))
+
+    def invalidate_employee(self, employee_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            stale = [k for k, (_, result) in self._entries.items() if result.get('employee_id') == employee_id]
+            for key in stale:
+                del self._entries[key]
+            self._invalidations += len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+
+    def apply_notification(self, payload: str) -> None:
+        """Payload is 't:<digest>', 'e:<employee_id>' or '*'."""
+        kind, _, value = (payload or '').partition(':')
+        if kind == 't' and value:
+            self.invalidate_digest(value)
+        elif kind == 'e' and value.isdigit():
+            self.invalidate_employee(int(value))
+        else:
+            self.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'ttl_seconds': self.ttl,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self._hits,
+            'misses': self._misses,
+            'invalidations': self._invalidations,
+            'listener_running': _listener_thread is not None and _listener_thread.is_alive(),
+        }
+
+
+# Global cache instance
+_session_cache: Optional[SessionCache] = None
+_cache_lock = threading.Lock()
+_listener_thread: Optional[threading.Thread] = None
+# Payload prefix -> handler(value); '*' means drop everything (also sent on listener reconnect)
+_invalidation_handlers: Dict[str, Callable[[str], None]] = {}
+
+
+def get_session_cache() -> SessionCache:
+    """Get or create the session cache singleton"""
+    global _session_cache
+    if _session_cache is None:
+        with _cache_lock:
+            if _session_cache is None:
+                _session_cache = SessionCache()
+    return _session_cache
+
+
+def register_invalidation_handler(kind: str, handler: Callable[[str], None]) -> None:
+    """Route '<kind>:<value>' payloads on SESSION_CHANNEL to handler (call before the listener starts)."""
+    if kind in ('t', 'e'):
+        raise ValueError(f"Invalidation prefix '{kind}' is used by the session cache")
+    _invalidation_handlers[kind] = handler
+
+
+def publish_invalidation(kind: str, value: str = '*') -> None:
+    """Broadcast '<kind>:<value>' to every process's registered handler (call after commit)."""
+    _notify(f"{kind}:{value}")
+
+
+def _apply_payload(payload: str) -> None:
+    kind, _, value = (payload or '').partition(':')
+    handler = _invalidation_handlers.get(kind)
+    if handler is None:
+        get_session_cache().apply_notification(payload)
+        return
+    try:
+        handler(value)
+    except Exception as e:
+        logger.warning("Invalidation handler for '%s' failed: %s", kind, e)
+
+
+def _drop_all() -> None:
+    get_session_cache().clear()
+    for kind in list(_invalidation_handlers):
+        _apply_payload(f"{kind}:*")
+
+
+def _notify(payload: str) -> None:
+    """Broadcast to other processes (this one's listener receives it too; re-dropping is harmless)."""
+    try:
+        from database_postgres import get_connection
+        conn = get_connection()
+        try:
+            conn.cursor().execute("SELECT pg_notify(%s, %s)", (SESSION_CHANNEL, payload))
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        # Other processes still drop the entry when its TTL runs out
+        logger.warning("Session invalidation NOTIFY failed: %s", e)
+
+
+# Call these after the session/employee change is committed, so a concurrent
+# cache miss can't re-read and re-cache the old row.
+
+def invalidate_session_token(session_token: str) -> None:
+    """Drop one token here and in every other process."""
+    if not session_token:
+        return
+    digest = token_digest(session_token)
+    get_session_cache().invalidate_digest(digest)
+    _notify(f"t:{digest}")
+
+
+def invalidate_employee_sessions(employee_id: int) -> None:
+    """Drop all cached tokens of one employee here and in every other process."""
+    if employee_id is None:
+        return
+    get_session_cache().invalidate_employee(employee_id)
+    _notify(f"e:{int(employee_id)}")
+
+
+def _listen_loop():
+    from database_postgres import get_dedicated_connection
+    backoff = 1.0
+    while True:
+        conn = None
+        try:
+            conn = get_dedicated_connection()
+            conn.cursor().execute(f"LISTEN {SESSION_CHANNEL}")
+            # Anything sent while we weren't listening is lost, so start clean
+            _drop_all()
+            backoff = 1.0
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _apply_payload(conn.notifies.pop(0).payload)
+        except Exception as e:
+            logger.warning("Session invalidation listener error: %s (retrying in %.0fs)", e, backoff)
+            _drop_all()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def start_session_invalidation_listener() -> None:
+    """Start the LISTEN thread once per process (no-op when no cache needs it)."""
+    global _listener_thread
+    if not get_session_cache().enabled and not _invalidation_handlers:
+        return
+    with _cache_lock:
+        if _listener_thread is not None and _listener_thread.is_alive():
+            return
+        _listener_thread = threading.Thread(target=_listen_loop, name='session-invalidation-listener', daemon=True)
+        _listener_thread.start()
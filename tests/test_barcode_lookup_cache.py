@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the barcode lookup cache against a stub Open Food Facts server
+(the barcode_lookup_cache table layer is replaced, so no database is needed).
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('requests')
+
+import barcode_lookup_cache
+from barcode_lookup_cache import BarcodeLookupCache, _slim_product, is_lookup_barcode
+
+KNOWN = {
+    '0123456789012': {
+        'product_name': 'Oat Milk',
+        'brands': 'Oatly',
+        'categories_tags': ['en:beverages', 'en:plant-milks'],
+        'quantity': '1 l',
+        'nutriments': {'energy': 195},
+    },
+}
+UNKNOWN = '0000000000000'
+BROKEN = '9999999999999'
+
+
+class _OpenFoodFactsStub(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        barcode = self.path.rsplit('/', 1)[-1].replace('.json', '')
+        if barcode == BROKEN:
+            self.send_response(503)
+            self.end_headers()
+            return
+        if barcode in KNOWN:
+            body = {'status': 1, 'product': KNOWN[barcode]}
+        else:
+            body = {'status': 0, 'status_verbose': 'product not found'}
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def off_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _OpenFoodFactsStub)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class _MemoryTable:
+    """Stands in for _load_many/_store_many."""
+
+    def __init__(self, rows=None):
+        self.rows = dict(rows or {})
+        self.loads = 0
+        self.upserts = []
+
+    def load_many(self, barcodes):
+        self.loads += 1
+        return {b: self.rows[b] for b in barcodes if b in self.rows}
+
+    def store_many(self, entries, source='api'):
+        if entries:
+            self.upserts.append(dict(entries))
+            self.rows.update(entries)
+
+
+def _cache(server, table, **kwargs):
+    cache = BarcodeLookupCache(base_url=f"http://127.0.0.1:{server.server_address[1]}", timeout=2, **kwargs)
+    cache._load_many = table.load_many
+    cache._store_many = table.store_many
+    return cache
+
+
+class TestLookup:
+    """lookup(): memory -> table -> API"""
+
+    def test_api_hit_is_slimmed_stored_and_remembered(self, off_server):
+        table = _MemoryTable()
+        cache = _cache(off_server, table)
+        product = cache.lookup('0123456789012')
+        assert product['brands'] == 'Oatly'
+        assert 'nutriments' not in product
+        assert table.upserts == [{'0123456789012': product}]
+        assert cache.lookup('0123456789012') == product
+        assert len(off_server.requests) == 1
+        assert cache.stats['memory_hits'] == 1
+
+    def test_unknown_barcode_is_cached_as_miss(self, off_server):
+        table = _MemoryTable()
+        cache = _cache(off_server, table)
+        assert cache.lookup(UNKNOWN) is None
+        assert table.rows == {UNKNOWN: None}
+        assert cache.lookup(UNKNOWN) is None
+        assert len(off_server.requests) == 1
+
+    def test_remembered_miss_expires(self, off_server, monkeypatch):
+        monkeypatch.setattr(barcode_lookup_cache, 'MISSING_TTL_DAYS', 0)
+        table = _MemoryTable()
+        cache = _cache(off_server, table)
+        assert cache.lookup(UNKNOWN) is None
+        assert cache.lookup('0123456789012') is not None
+        # The miss is gone from memory and re-read from the table; the hit is kept
+        assert cache.lookup(UNKNOWN) is None
+        assert cache.lookup('0123456789012') is not None
+        assert cache.stats['db_hits'] == 1
+        assert cache.stats['memory_hits'] == 1
+
+    def test_table_hit_skips_the_api(self, off_server):
+        table = _MemoryTable({'0123456789012': {'product_name': 'From dump'}})
+        cache = _cache(off_server, table)
+        assert cache.lookup('0123456789012') == {'product_name': 'From dump'}
+        assert off_server.requests == []
+        assert cache.stats['db_hits'] == 1
+
+    def test_server_error_is_not_cached(self, off_server):
+        table = _MemoryTable()
+        cache = _cache(off_server, table)
+        assert cache.lookup(BROKEN) is None
+        assert table.upserts == []
+        assert cache.stats['api_errors'] == 1
+
+    def test_unreachable_api_backs_off(self):
+        table = _MemoryTable()
+        # Nothing listens on port 9 locally; the first failure takes the API offline
+        cache = BarcodeLookupCache(base_url='http://127.0.0.1:9', timeout=1)
+        cache._load_many = table.load_many
+        cache._store_many = table.store_many
+        assert cache.lookup('0123456789012') is None
+        assert cache.lookup('0123456789013') is None
+        assert cache.stats['api_calls'] == 1
+        assert table.upserts == []
+
+    def test_offline_only_never_calls_the_api(self, off_server):
+        cache = _cache(off_server, _MemoryTable(), offline_only=True)
+        assert cache.lookup('0123456789012') is None
+        assert off_server.requests == []
+
+    def test_non_upc_ean_barcodes_are_ignored(self, off_server):
+        cache = _cache(off_server, _MemoryTable())
+        assert cache.lookup('12345') is None
+        assert off_server.requests == []
+        assert not is_lookup_barcode('12345')
+        assert is_lookup_barcode('012345678905')
+
+
+class TestPrefetch:
+    """prefetch(): one table read, concurrent API calls, one upsert"""
+
+    def test_prefetch_resolves_batch(self, off_server):
+        table = _MemoryTable({'1111111111111': {'product_name': 'Cached'}})
+        cache = _cache(off_server, table)
+        barcodes = ['0123456789012', UNKNOWN, BROKEN, '1111111111111', '0123456789012', 'short']
+        summary = cache.prefetch(barcodes, max_workers=3)
+        assert summary == {'requested': 4, 'cached': 1, 'fetched': 2, 'unresolved': 1}
+        assert table.loads == 1
+        assert len(table.upserts) == 1
+        assert set(table.upserts[0]) == {'0123456789012', UNKNOWN}
+        # Everything resolved is now served from memory
+        requests_before = len(off_server.requests)
+        assert cache.lookup('0123456789012')['brands'] == 'Oatly'
+        assert cache.lookup('1111111111111') == {'product_name': 'Cached'}
+        assert len(off_server.requests) == requests_before
+
+    def test_prefetch_skips_remembered_barcodes(self, off_server):
+        cache = _cache(off_server, _MemoryTable())
+        cache.lookup('0123456789012')
+        assert cache.prefetch(['0123456789012'])['requested'] == 0
+
+
+def test_slim_product_splits_csv_category_tags():
+    slim = _slim_product({'product_name': 'Tea', 'brands': '', 'categories_tags': 'en:drinks, en:teas'})
+    assert slim == {'product_name': 'Tea', 'categories_tags': ['en:drinks', 'en:teas']}
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Unit tests for connection pool bookkeeping in database_postgres (no database).
+"""
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+import database_postgres
+
+
+class _InheritedPool:
+    def __init__(self):
+        self.closed = False
+
+    def closeall(self):
+        self.closed = True
+
+
+def test_reset_pool_after_fork_keeps_parent_connections_open(monkeypatch):
+    inherited = _InheritedPool()
+    monkeypatch.setattr(database_postgres, '_pg_pool', inherited)
+    monkeypatch.setattr(database_postgres, '_inherited_pools', [])
+    lock, stats = database_postgres._pool_lock, database_postgres._pool_stats
+    monkeypatch.setattr(database_postgres, '_pool_lock', lock)
+    monkeypatch.setattr(database_postgres, '_pool_stats', stats)
+    monkeypatch.setattr(database_postgres, '_leak_thread', database_postgres._leak_thread)
+    monkeypatch.setattr(database_postgres, '_request_scope_enabled', database_postgres._request_scope_enabled)
+
+    database_postgres.reset_pool_after_fork()
+
+    assert database_postgres._pg_pool is None
+    assert not inherited.closed
+    assert database_postgres._inherited_pools == [inherited]
+    assert database_postgres._pool_lock is not lock
+    assert database_postgres._pool_stats is not stats
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Unit tests for EmbeddingIndex top-k search and in-place remove/replace.
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from embedding_index import EmbeddingIndex, normalize_rows
+
+
+def _brute_force(index, query, k):
+    """Reference ranking: cosine similarity against every live row."""
+    q = normalize_rows(query)[0]
+    scored = sorted(((float(index.get(i) @ q), i) for i in index.ids), key=lambda t: -t[0])
+    return [i for _, i in scored[:k]]
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(7)
+
+
+@pytest.fixture
+def index(rng):
+    return EmbeddingIndex.from_arrays([f'item-{i}' for i in range(200)], rng.normal(size=(200, 16)))
+
+
+class TestSearch:
+    """top-k matches a brute-force ranking"""
+
+    @pytest.mark.parametrize('k', [1, 5, 50, 200, 500])
+    def test_top_k_matches_brute_force(self, index, rng, k):
+        query = rng.normal(size=16)
+        hits = index.search(query, top_k=k)
+        assert [i for i, _ in hits] == _brute_force(index, query, k)
+        scores = [s for _, s in hits]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_exact_vector_is_best_match(self, index):
+        hits = index.search(index.get('item-42') * 3.0, top_k=3)
+        assert hits[0][0] == 'item-42'
+        assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    def test_threshold_filters_low_scores(self, index):
+        hits = index.search(index.get('item-7'), top_k=10, threshold=0.99)
+        assert [i for i, _ in hits] == ['item-7']
+
+    def test_search_many_matches_single_queries(self, index, rng, monkeypatch):
+        import embedding_index
+        # Force several chunks through the matrix-matrix path
+        monkeypatch.setattr(embedding_index, 'SEARCH_CHUNK_ROWS', 4)
+        queries = rng.normal(size=(10, 16))
+        batched = index.search_many(queries, top_k=3)
+        for hits, query in zip(batched, queries):
+            single = index.search(query, top_k=3)
+            assert [i for i, _ in hits] == [i for i, _ in single]
+            assert [s for _, s in hits] == pytest.approx([s for _, s in single], abs=1e-5)
+
+    def test_empty_index(self):
+        assert EmbeddingIndex(dim=4).search(np.ones(4), top_k=3) == []
+
+
+class TestMutation:
+    """remove() swaps the last row in; add() replaces existing ids"""
+
+    def test_remove_keeps_other_rows_searchable(self, index, rng):
+        before = {i: index.get(i) for i in index.ids}
+        assert index.remove('item-10')
+        assert not index.remove('item-10')
+        assert 'item-10' not in index
+        assert len(index) == 199
+        for item_id in index.ids:
+            np.testing.assert_array_equal(index.get(item_id), before[item_id])
+        query = rng.normal(size=16)
+        assert [i for i, _ in index.search(query, top_k=20)] == _brute_force(index, query, 20)
+        assert 'item-10' not in [i for i, _ in index.search(before['item-10'], top_k=200)]
+
+    def test_remove_last_row(self, index):
+        assert index.remove('item-199')
+        assert index.ids[-1] == 'item-198'
+
+    def test_add_replaces_existing_id(self, index):
+        vector = np.zeros(16)
+        vector[0] = 1.0
+        index.add('item-3', vector)
+        assert len(index) == 200
+        assert index.search(vector, top_k=1)[0][0] == 'item-3'
+
+    def test_grows_past_capacity(self, rng):
+        index = EmbeddingIndex(dim=8, capacity=2)
+        index.add_many(list(range(10)), rng.normal(size=(10, 8)))
+        assert len(index) == 10
+        assert index.search(index.get(9), top_k=1)[0][0] == 9
+
+    def test_dimension_mismatch(self, index):
+        with pytest.raises(ValueError):
+            index.add('bad', np.ones(8))
+
+    def test_read_only_matrix_is_copied_on_write(self):
+        matrix = normalize_rows(np.eye(3))
+        matrix.flags.writeable = False
+        index = EmbeddingIndex.from_normalized(['a', 'b', 'c'], matrix)
+        assert index.remove('a')
+        index.add('d', np.ones(3))
+        np.testing.assert_array_equal(matrix, normalize_rows(np.eye(3)))
+        assert index.search(np.array([0.0, 0.0, 1.0]), top_k=1)[0][0] == 'c'
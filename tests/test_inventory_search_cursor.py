@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the /api/inventory/search keyset cursor (no database).
+"""
+
+import base64
+import json
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from database import decode_inventory_search_cursor, encode_inventory_search_cursor
+
+
+class TestInventorySearchCursor:
+    """encode/decode round trip and rejection of malformed tokens"""
+
+    @pytest.mark.parametrize('score', [0.75, Decimal('0.333333'), '1', 0])
+    def test_round_trip(self, score):
+        token = encode_inventory_search_cursor(score, 42)
+        assert decode_inventory_search_cursor(token) == (str(score), 42)
+
+    def test_token_is_url_safe_and_unpadded(self):
+        token = encode_inventory_search_cursor(0.123456789, 987654321)
+        assert '=' not in token
+        assert set(token) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_')
+
+    def test_score_keeps_full_precision(self):
+        # The score goes back into SQL as the keyset bound; rounding would repeat or skip rows
+        token = encode_inventory_search_cursor(Decimal('0.12345678901234567890'), 7)
+        assert decode_inventory_search_cursor(token)[0] == '0.12345678901234567890'
+
+    @pytest.mark.parametrize('token', [
+        '',
+        'not base64 !',
+        base64.urlsafe_b64encode(b'{"score": 1}').decode('ascii'),
+        base64.urlsafe_b64encode(json.dumps(['abc', 1]).encode()).decode('ascii'),
+        base64.urlsafe_b64encode(json.dumps(['0.5', 'x']).encode()).decode('ascii'),
+        base64.urlsafe_b64encode(json.dumps(['0.5', 1, 2]).encode()).decode('ascii'),
+    ])
+    def test_malformed_tokens_raise_value_error(self, token):
+        with pytest.raises(ValueError):
+            decode_inventory_search_cursor(token)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Unit tests for stock refreshes of cached inventory snapshots (no database).
+"""
+
+import pytest
+
+import inventory_snapshot
+from inventory_snapshot import InventorySnapshotCache, inventory_etag
+
+
+class _StockCursor:
+    """Answers the stock re-read from a dict; no catalog changes."""
+
+    def __init__(self, stock):
+        self.stock = stock
+
+    def execute(self, sql, params=None):
+        self.sql = sql
+
+    def fetchall(self):
+        if 'inventory_changes' in self.sql:
+            return []
+        return [{'product_id': pid, 'current_quantity': qty, 'updated_at': None, 'last_restocked': None}
+                for pid, qty in self.stock.items()]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    rows = [{'product_id': pid, 'product_name': f'p{pid}', 'current_quantity': 10,
+             'updated_at': None, 'last_restocked': None} for pid in (1, 2, 3)]
+    monkeypatch.setattr(inventory_snapshot, 'has_column', lambda table, column: True)
+    monkeypatch.setattr(inventory_snapshot, 'build_inventory_rows',
+                        lambda cursor, *key: (list(rows[0]), [dict(r) for r in rows]))
+    monkeypatch.setattr(inventory_snapshot, 'INVENTORY_STOCK_REFRESH_SECONDS', 0)
+    return InventorySnapshotCache()
+
+
+class TestStockRefresh:
+    """Stock changes bump the generation and show up in deltas"""
+
+    def test_changed_rows_are_swapped_not_mutated(self, cache):
+        cursor = _StockCursor({1: 10, 2: 10, 3: 10})
+        before = cache.get(cursor, version=5)
+        held_row = before['by_id'][2]
+        cursor.stock[2] = 7
+        after = cache.get(cursor, version=5)
+        assert after['by_id'][2]['current_quantity'] == 7
+        assert held_row['current_quantity'] == 10
+        assert before['data'][1] is held_row
+        assert after['by_id'][1] is before['by_id'][1]
+
+    def test_generation_moves_only_when_stock_changes(self, cache):
+        cursor = _StockCursor({1: 10, 2: 10, 3: 10})
+        cache.get(cursor, version=5)
+        generation = cache.stock_generation(cursor)
+        assert cache.stock_generation(cursor) == generation
+        cursor.stock[3] = 4
+        assert cache.stock_generation(cursor) > generation
+        assert inventory_etag(5, f's{generation}') != inventory_etag(5, f's{cache.stock_generation(cursor)}')
+
+    def test_delta_includes_stock_changes(self, cache):
+        cursor = _StockCursor({1: 10, 2: 10, 3: 10})
+        cache.get(cursor, version=5)
+        generation = cache.stock_generation(cursor)
+        cursor.stock[3] = 4
+        snapshot = cache.get(cursor, version=5)
+        delta = cache.delta(cursor, snapshot, 5, 0, generation)
+        assert [row['product_id'] for row in delta['data']] == [3]
+        assert delta['data'][0]['current_quantity'] == 4
+        assert cache.delta(cursor, snapshot, 5, 0, cache.stock_generation(cursor))['data'] == []
+
+    def test_sale_before_a_rebuild_is_still_in_the_delta(self, cache, monkeypatch):
+        cursor = _StockCursor({1: 10, 2: 10, 3: 10})
+        cache.get(cursor, version=5)
+        generation = cache.stock_generation(cursor)
+        # The rebuild for the next version already reads the new quantity
+        monkeypatch.setattr(inventory_snapshot, 'build_inventory_rows', lambda cursor, *key: (
+            ['product_id', 'current_quantity'],
+            [{'product_id': 1, 'current_quantity': 10}, {'product_id': 2, 'current_quantity': 1},
+             {'product_id': 3, 'current_quantity': 10}]))
+        cursor.stock[2] = 1
+        snapshot = cache.get(cursor, version=6)
+        delta = cache.delta(cursor, snapshot, 5, 0, generation)
+        assert [row['product_id'] for row in delta['data']] == [2]
+
+    def test_unknown_stock_generation_needs_full_reload(self, cache):
+        cursor = _StockCursor({1: 10, 2: 10, 3: 10})
+        snapshot = cache.get(cursor, version=5)
+        generation = cache.stock_generation(cursor)
+        assert cache.delta(cursor, snapshot, 5, 0) is None
+        assert cache.delta(cursor, snapshot, 5, 0, generation - 1) is None
+        assert cache.delta(cursor, snapshot, 5, 0, generation + 1) is None
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the notification outbox dispatcher (no database: the outbox
+connection is replaced by a recorder and handlers are stubs).
+"""
+
+import sys
+import types
+
+import pytest
+
+import notification_outbox
+from notification_outbox import MAX_ATTEMPTS, RETRY_BASE_SECONDS, NotificationDispatcher
+
+
+class _RecordingConnection:
+    """Stands in for a pooled connection; keeps every statement executed on it."""
+
+    def __init__(self, log):
+        self.log = log
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.log.append((' '.join(sql.split()), params))
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def statements(monkeypatch):
+    """SQL run by _finish, via a stub database module."""
+    log = []
+    fake_db = types.ModuleType('database')
+    fake_db.get_connection = lambda: _RecordingConnection(log)
+    monkeypatch.setitem(sys.modules, 'database', fake_db)
+    return log
+
+
+@pytest.fixture
+def dispatcher():
+    d = NotificationDispatcher(workers=2, poll_seconds=0.01)
+    yield d
+    d._pool.shutdown(wait=True)
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    """Stub 'test' handler: fails the recipients in handler.failing, records each call."""
+    def stub(store_id, payload, skip):
+        stub.calls.append((store_id, dict(payload), set(skip)))
+        if stub.error:
+            raise stub.error
+        return {'email': [{'to': to, 'success': to not in stub.failing, 'message': 'mailbox full'}
+                          for to in payload['to'] if f"email:{to}" not in skip]}
+    stub.calls = []
+    stub.failing = set()
+    stub.error = None
+    monkeypatch.setitem(notification_outbox._handlers, 'test', stub)
+    return stub
+
+
+def _row(outbox_id=1, attempts=1, delivered=None, to=('a@x', 'b@x')):
+    return {
+        'outbox_id': outbox_id,
+        'kind': 'test',
+        'store_id': 1,
+        'payload': {'to': list(to)},
+        'attempts': attempts,
+        'delivered': delivered or [],
+        'age': 0.5,
+    }
+
+
+class TestDeliver:
+    """_deliver: handler results -> delivered set, outbox status and metrics"""
+
+    def test_all_recipients_sent(self, dispatcher, handler, statements):
+        dispatcher._deliver(_row())
+        sql, params = statements[-1]
+        assert "status = 'sent'" in sql
+        assert params[0] == '["email:a@x", "email:b@x"]'
+        assert dispatcher.sent == 1
+        assert dispatcher.recipients_sent == 2
+
+    def test_partial_delivery_is_retried_with_backoff(self, dispatcher, handler, statements):
+        handler.failing = {'b@x'}
+        dispatcher._deliver(_row(attempts=1))
+        sql, params = statements[-1]
+        assert "status = 'pending'" in sql
+        assert 'attempts * attempts' in sql
+        assert params[0] == '["email:a@x"]'
+        assert 'b@x' in params[1] and 'mailbox full' in params[1]
+        assert params[2] == RETRY_BASE_SECONDS
+        assert dispatcher.retried == 1
+        assert dispatcher.recipients_sent == 1
+        assert dispatcher.recipients_failed == 1
+
+    def test_retry_skips_already_delivered_recipients(self, dispatcher, handler, statements):
+        dispatcher._deliver(_row(attempts=2, delivered='["email:a@x"]'))
+        assert handler.calls[0][2] == {'email:a@x'}
+        sql, params = statements[-1]
+        assert "status = 'sent'" in sql
+        assert params[0] == '["email:a@x", "email:b@x"]'
+        # Only the recipient sent on this attempt counts
+        assert dispatcher.recipients_sent == 1
+
+    def test_gives_up_after_max_attempts(self, dispatcher, handler, statements):
+        handler.failing = {'a@x', 'b@x'}
+        dispatcher._deliver(_row(attempts=MAX_ATTEMPTS))
+        sql, _ = statements[-1]
+        assert "status = 'failed'" in sql
+        assert dispatcher.failed == 1
+        assert dispatcher.retried == 0
+
+    def test_handler_exception_is_recorded(self, dispatcher, handler, statements):
+        handler.error = RuntimeError('SMTP down')
+        dispatcher._deliver(_row())
+        sql, params = statements[-1]
+        assert "status = 'pending'" in sql
+        assert params[1] == 'SMTP down'
+
+    def test_unknown_kind(self, dispatcher, statements):
+        row = _row()
+        row['kind'] = 'no-such-kind'
+        dispatcher._deliver(row)
+        _, params = statements[-1]
+        assert "No handler registered" in params[1]
+
+
+class TestRunOnce:
+    """run_once / dispatch on the worker pool"""
+
+    def test_run_once_delivers_claimed_batch(self, dispatcher, handler, statements, monkeypatch):
+        rows = [_row(outbox_id=i, to=(f'{i}@x',)) for i in range(1, 6)]
+        monkeypatch.setattr(dispatcher, '_housekeeping', lambda: None)
+        monkeypatch.setattr(dispatcher, '_claim', lambda: rows)
+        assert dispatcher.run_once() == 5
+        assert dispatcher.sent == 5
+        assert sorted(params[-1] for _, params in statements) == [1, 2, 3, 4, 5]
+
+    def test_dispatch_without_outbox(self, dispatcher, handler, statements):
+        dispatcher.dispatch('test', {'to': ['a@x']}, store_id=3)
+        dispatcher._pool.shutdown(wait=True)
+        assert handler.calls == [(3, {'to': ['a@x']}, set())]
+        assert dispatcher.sent == 1
+        # Single attempt: nothing is written to the outbox
+        assert statements == []
+
+    def test_notification_committed_without_table_dispatches(self, handler, monkeypatch):
+        d = NotificationDispatcher(workers=1)
+        monkeypatch.setattr(notification_outbox, '_dispatcher', d)
+        notification_outbox.notification_committed(None, 'test', {'to': ['a@x']})
+        d._pool.shutdown(wait=True)
+        assert len(handler.calls) == 1
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the pooled SMTP transport in notification_service, run against
+a minimal in-process SMTP sink (no network, no database).
+"""
+
+import socket
+import socketserver
+import threading
+
+import pytest
+
+from notification_service import _SMTPPool
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: EHLO, AUTH PLAIN, MAIL/RCPT/DATA, RSET, NOOP, QUIT."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+        self.wfile.flush()
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.sockets.append(self.connection)
+        self.reply('220 sink ready')
+        recipients = []
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                return
+            if not line:
+                return
+            command = line.decode('ascii').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-sink')
+                self.reply('250 AUTH PLAIN')
+            elif verb == 'AUTH':
+                with sink.lock:
+                    sink.logins += 1
+                self.reply('235 authenticated')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 ok')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip('<> ')
+                if address in sink.refuse:
+                    self.reply('550 no such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 ok')
+            elif verb == 'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with sink.lock:
+                    sink.received.extend(recipients)
+                self.reply('250 queued')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 ok')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
+
+
+class _Sink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SinkHandler)
+        self.sink = self
+        self.lock = threading.Lock()
+        self.sockets = []
+        self.received = []
+        self.refuse = set()
+        self.logins = 0
+
+    def drop_connections(self):
+        """Server-side hangup on every open session (like an idle timeout)."""
+        with self.lock:
+            sockets, self.sockets = self.sockets, []
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+@pytest.fixture
+def sink():
+    server = _Sink()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def smtp_pool():
+    pool = _SMTPPool(max_idle=2, idle_seconds=60)
+    yield pool
+    pool.close_all()
+
+
+def _key(sink):
+    return ('127.0.0.1', sink.server_address[1], 'user@example.com', 'secret', False)
+
+
+def _message(to):
+    return f"From: pos@example.com\r\nTo: {to}\r\nSubject: test\r\n\r\nhello\r\n"
+
+
+class TestSMTPPool:
+    """Connection reuse, reconnect after a server hangup, refusal handling"""
+
+    def test_sequential_sends_reuse_one_login(self, sink, smtp_pool):
+        key = _key(sink)
+        for i in range(5):
+            smtp_pool.sendmail(key, 'pos@example.com', [f'r{i}@example.com'], _message(f'r{i}@example.com'))
+        stats = smtp_pool.stats()
+        assert stats['opened'] == 1
+        assert stats['reused'] == 4
+        assert stats['idle'] == 1
+        assert sink.logins == 1
+        assert len(sink.received) == 5
+
+    def test_dropped_idle_connection_is_replaced(self, sink, smtp_pool):
+        key = _key(sink)
+        smtp_pool.sendmail(key, 'pos@example.com', ['a@example.com'], _message('a@example.com'))
+        sink.drop_connections()
+        smtp_pool.sendmail(key, 'pos@example.com', ['b@example.com'], _message('b@example.com'))
+        stats = smtp_pool.stats()
+        assert stats['reconnects'] == 1
+        assert stats['opened'] == 2
+        assert sink.received == ['a@example.com', 'b@example.com']
+
+    def test_refused_recipient_keeps_the_session(self, sink, smtp_pool):
+        import smtplib
+        key = _key(sink)
+        sink.refuse.add('gone@example.com')
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            smtp_pool.sendmail(key, 'pos@example.com', ['gone@example.com'], _message('gone@example.com'))
+        smtp_pool.sendmail(key, 'pos@example.com', ['ok@example.com'], _message('ok@example.com'))
+        stats = smtp_pool.stats()
+        assert stats['opened'] == 1
+        assert stats['reconnects'] == 0
+        assert sink.received == ['ok@example.com']
+
+    def test_concurrent_senders_are_capped_at_max_idle(self, sink, smtp_pool):
+        key = _key(sink)
+        conns = [smtp_pool.acquire(key)[0] for _ in range(3)]
+        for conn in conns:
+            smtp_pool.release(key, conn)
+        assert smtp_pool.stats()['idle'] == 2
+
+    def test_stale_idle_connection_is_not_reused(self, sink):
+        pool = _SMTPPool(max_idle=2, idle_seconds=0)
+        try:
+            key = _key(sink)
+            pool.sendmail(key, 'pos@example.com', ['a@example.com'], _message('a@example.com'))
+            pool.sendmail(key, 'pos@example.com', ['b@example.com'], _message('b@example.com'))
+            assert pool.stats()['opened'] == 2
+            assert pool.stats()['reused'] == 0
+        finally:
+            pool.close_all()
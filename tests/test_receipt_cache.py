@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the receipt rendering caches (pure in-process logic).
+"""
+
+from receipt_cache import LRUCache, _SettingsCache, digest
+
+
+class TestLRUCache:
+    """Count- and byte-bounded LRU eviction"""
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_byte_bound_with_sizeof(self):
+        cache = LRUCache(10, sizeof=len)
+        cache.put('x', b'12345')
+        cache.put('y', b'1234')
+        cache.put('z', b'123')
+        assert cache.get('x') is None
+        assert cache.stats()['size'] == 7
+        assert cache.stats()['entries'] == 2
+
+    def test_value_larger_than_cache_is_not_stored(self):
+        cache = LRUCache(4, sizeof=len)
+        cache.put('small', b'12')
+        cache.put('big', b'12345')
+        assert cache.get('big') is None
+        assert cache.get('small') == b'12'
+
+    def test_replacing_a_key_adjusts_size(self):
+        cache = LRUCache(10, sizeof=len)
+        cache.put('k', b'123456')
+        cache.put('k', b'12')
+        assert cache.stats()['size'] == 2
+        cache.put('other', b'12345678')
+        assert cache.get('k') == b'12'
+
+    def test_discard_where(self):
+        cache = LRUCache(10, sizeof=len)
+        for order_id in (1, 2, 3):
+            cache.put((order_id, 'v1'), b'pdf')
+        assert cache.discard_where(lambda key: key[0] == 2) == 1
+        assert cache.get((2, 'v1')) is None
+        assert cache.stats()['size'] == 6
+
+    def test_disabled_and_none_values(self):
+        disabled = LRUCache(0)
+        disabled.put('a', 1)
+        assert disabled.get('a') is None
+        cache = LRUCache(2)
+        cache.put('none', None)
+        assert cache.stats()['entries'] == 0
+
+    def test_hit_and_miss_counts(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+class TestSettingsCache:
+    """TTL cache of merged receipt settings"""
+
+    def test_serves_copies_until_invalidated(self):
+        loads = []
+        cache = _SettingsCache(ttl=60)
+
+        def loader():
+            loads.append(1)
+            return {'store_name': 'Shop', 'template_styles': {'font': 'Helvetica'}}
+
+        first = cache.get(loader)
+        first['template_styles']['font'] = 'Courier'
+        assert cache.get(loader)['template_styles']['font'] == 'Helvetica'
+        assert len(loads) == 1
+        cache.invalidate()
+        cache.get(loader)
+        assert len(loads) == 2
+
+    def test_load_racing_an_invalidation_is_not_kept(self):
+        cache = _SettingsCache(ttl=60)
+
+        def stale_loader():
+            cache.invalidate()
+            return {'store_name': 'old'}
+
+        assert cache.get(stale_loader) == {'store_name': 'old'}
+        assert cache.get(lambda: {'store_name': 'new'}) == {'store_name': 'new'}
+
+
+def test_digest_is_key_order_independent():
+    assert digest({'a': 1, 'b': [1, 2]}) == digest({'b': [1, 2], 'a': 1})
+    assert digest({'a': 1}) != digest({'a': 2})
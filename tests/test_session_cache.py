@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the session verification cache (no database).
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+import session_cache
+from session_cache import SessionCache
+
+
+class TestSessionCacheLifetime:
+    """Entries live for min(ttl, session expiry)"""
+
+    def test_ttl_applies_without_expiry(self):
+        cache = SessionCache(ttl=60)
+        cache.put('tok', {'valid': True, 'employee_id': 1})
+        assert cache.get('tok')['employee_id'] == 1
+
+    def test_session_expiry_caps_the_ttl(self):
+        cache = SessionCache(ttl=60)
+        cache.put('tok', {'valid': True}, expires_at=datetime.now() + timedelta(seconds=0.2))
+        assert cache.get('tok') is not None
+        time.sleep(0.3)
+        assert cache.get('tok') is None
+
+    def test_expired_session_is_not_cached(self):
+        cache = SessionCache(ttl=60)
+        cache.put('tok', {'valid': True}, expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        cache.put('epoch', {'valid': True}, expires_at=time.time() - 1)
+        assert cache.get('tok') is None
+        assert cache.get('epoch') is None
+
+    def test_put_after_invalidation_is_skipped(self):
+        cache = SessionCache(ttl=60)
+        generation = cache.generation
+        cache.invalidate_employee(1)
+        cache.put('tok', {'valid': True, 'employee_id': 1}, generation)
+        assert cache.get('tok') is None
+
+
+class TestInvalidationPayloads:
+    """NOTIFY payload routing"""
+
+    def test_employee_and_token_payloads(self, monkeypatch):
+        cache = SessionCache(ttl=60)
+        monkeypatch.setattr(session_cache, '_session_cache', cache)
+        cache.put('a', {'valid': True, 'employee_id': 1})
+        cache.put('b', {'valid': True, 'employee_id': 2})
+        session_cache._apply_payload('e:1')
+        assert cache.get('a') is None
+        session_cache._apply_payload(f"t:{session_cache.token_digest('b')}")
+        assert cache.get('b') is None
+
+    def test_registered_prefix_goes_to_its_handler(self, monkeypatch):
+        cache = SessionCache(ttl=60)
+        monkeypatch.setattr(session_cache, '_session_cache', cache)
+        monkeypatch.setattr(session_cache, '_invalidation_handlers', {})
+        received = []
+        session_cache.register_invalidation_handler('p', received.append)
+        cache.put('a', {'valid': True, 'employee_id': 7})
+        session_cache._apply_payload('p:7')
+        assert received == ['7']
+        assert cache.get('a') is not None
+        session_cache._drop_all()
+        assert received == ['7', '*']
+        assert cache.get('a') is None
@@ -23,12 +23,12 @@ except ImportError:
     SOCKETIO_AVAILABLE = False
     print("Warning: flask-socketio not installed. Real-time features will be disabled.")
 from database import (
-    list_products, list_vendors, list_categories, list_shipments, get_sales,
+    list_products, search_inventory, list_vendors, list_categories, list_shipments, get_sales,
     get_shipment_items, get_shipment_details, get_product,
     employee_login, verify_session, employee_logout,
-    list_employees, get_employee, add_employee, update_employee, delete_employee, reactivate_employee, permanently_delete_employee, list_orders, count_orders,
+    list_employees, get_employee, add_employee, update_employee, delete_employee, reactivate_employee, permanently_delete_employee, list_orders, count_orders, count_orders_cached, encode_orders_cursor,
     get_employee_by_clerk_user_id, link_clerk_user_to_employee, verify_pin_login, generate_pin,
-    get_connection,
+    get_connection, enqueue_notification,
     get_discrepancies, get_audit_trail,
     get_pending_return, list_pending_returns,
     get_employee_role, assign_role_to_employee,
@@ -54,6 +54,22 @@ from database import (
     create_stripe_credentials, update_stripe_credentials, get_stripe_credentials, get_stripe_config,
 )
 from permission_manager import get_permission_manager
+from schema_registry import has_table, has_column, table_columns, get_schema_registry
+from schema_bootstrap import run_schema_bootstrap, get_schema_version, LATEST_VERSION as SCHEMA_BOOTSTRAP_LATEST
+from inventory_snapshot import get_inventory_snapshot_cache, inventory_etag
+from session_cache import get_session_cache, start_session_invalidation_listener
+from category_cache import get_category_cache, invalidate_categories
+from receipt_cache import invalidate_receipt_settings, receipt_cache_stats
+from receipt_prerender import enqueue_receipt_prerender, get_receipt_prerenderer
+from face_index import (
+    DEFAULT_FACE_THRESHOLD, encode_descriptor, get_face_index, parse_descriptor, refresh_face_employee
+)
+from metadata_worker import start_metadata_worker
+from notification_service import invalidate_notification_settings, transport_stats as notification_transport_stats
+from notification_outbox import (
+    get_notification_dispatcher, notification_committed, register_notification_handler,
+    start_notification_dispatcher,
+)
 import os
 # QuickBooks-style accounting backend (accounting schema)
 try:
@@ -73,6 +89,7 @@ except Exception as e:
     print(f"Note: Accounting backend not loaded: {e}")
 import sys
 import json
+import hashlib
 import threading
 import time
 from datetime import datetime, time, date
@@ -102,15 +119,11 @@ def get_image_matcher():
         try:
             from product_image_matcher import ProductImageMatcher
             _image_matcher = ProductImageMatcher()
-            # Try to load from database first, fallback to file
+            # Memory-mapped snapshot when it matches the database, else the database
             try:
-                _image_matcher.load_from_database()
-            except:
-                # If database load fails, try loading from file
-                if os.path.exists('product_embeddings.pkl'):
-                    _image_matcher.load_database('product_embeddings.pkl')
-                else:
-                    print("Warning: No product embeddings found. Run build_product_database() first.")
+                _image_matcher.load()
+            except Exception:
+                print("Warning: No product embeddings found. Run build_product_database() first.")
         except ImportError as e:
             print(f"Warning: Could not import ProductImageMatcher: {e}")
             print("Install dependencies: pip install torch torchvision Pillow numpy")
@@ -145,14 +158,35 @@ try:
     from database_postgres import (
         get_connection as get_postgres_connection,
         set_current_establishment as _set_establishment,
-        get_current_establishment as _get_establishment
+        get_current_establishment as _get_establishment,
+        init_request_connection_scope,
     )
+    # One pooled connection per request (bound on first use, returned in teardown_request)
+    init_request_connection_scope(app)
     # Test connection on startup
     try:
         test_conn = get_postgres_connection()
         test_conn.close()
         set_current_establishment = _set_establishment
         get_current_establishment = _get_establishment
+        # Apply pending schema bootstrap steps once (request handlers assume the schema exists),
+        # then load table/column metadata so handlers don't probe information_schema per request
+        try:
+            schema_version = run_schema_bootstrap()
+            if schema_version < SCHEMA_BOOTSTRAP_LATEST:
+                print(f"Warning: schema bootstrap at v{schema_version} of v{SCHEMA_BOOTSTRAP_LATEST}; see log for the failing step")
+        except Exception as boot_err:
+            print(f"Warning: schema bootstrap failed at startup ({boot_err})")
+            try:
+                get_schema_registry().refresh()
+            except Exception as reg_err:
+                print(f"Warning: schema registry not loaded at startup ({reg_err}); will load on first use")
+        # verify_session caches validated tokens; logouts/deactivations elsewhere arrive via NOTIFY
+        start_session_invalidation_listener()
+        # Product writes only queue metadata extraction; this thread runs it with a warm model
+        start_metadata_worker()
+        # Order notifications are queued with the order; a fixed pool delivers them
+        start_notification_dispatcher()
         db_url = os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL') or ''
         if 'supabase' in db_url.lower():
             print("✓ Connected to Supabase (PostgreSQL)")
@@ -188,18 +222,7 @@ def set_establishment_context():
 
 def _table_has_archived_column(table_name):
     """Return True if the given table has an 'archived' column (migration applied)."""
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = %s AND column_name = 'archived'",
-            (table_name,),
-        )
-        out = cursor.fetchone() is not None
-        conn.close()
-        return out
-    except Exception:
-        return False
+    return has_column(table_name, 'archived')
 
 
 # Initialize Socket.IO
@@ -623,30 +646,16 @@ def _enrich_order_info_for_notification(order_info: dict) -> dict:
     return info
 
 
-def _send_order_notification_async(order_info):
-    """Fire-and-forget: send order notification (email/SMS) if enabled. Runs in thread."""
-    print(f"[notification] queuing email for order {order_info.get('order_number')}", flush=True)
-    def _do():
-        try:
-            from notification_service import send_order_notification, get_order_email_recipients
-            # Enrich order_info with full DB details before sending
-            enriched = _enrich_order_info_for_notification(order_info)
-            order_source = (enriched.get('order_source') or '').strip().lower()
-            print(f"[notification] checking order email for source='{order_source}' order={enriched.get('order_number')}", flush=True)
-            emails = get_order_email_recipients(1, order_source)
-            print(f"[notification] resolved emails: {emails}", flush=True)
-            store_settings = get_store_location_settings() or {}
-            phones = [p for p in [(store_settings.get('store_phone') or store_settings.get('store_phone_number') or '').replace('-', '').replace(' ', '').strip()] if p and len(p) >= 10]
-            if emails or phones:
-                result = send_order_notification(1, enriched, emails, phones)
-                print(f"[notification] send result: {result}", flush=True)
-            else:
-                print(f"[notification] no recipients — email disabled or filtered", flush=True)
-        except Exception as e:
-            import traceback
-            print(f"[notification] order notify error: {e}", flush=True)
-            traceback.print_exc()
-    threading.Thread(target=_do, daemon=True).start()
+def _deliver_order_notification(store_id, order_info, skip):
+    """notification_outbox consumer for 'order' rows: enrich from the DB, then email/SMS the recipients."""
+    from notification_service import deliver_order_notification
+    enriched = _enrich_order_info_for_notification(order_info)
+    result = deliver_order_notification(store_id, enriched, skip=skip)
+    print(f"[notification] order {enriched.get('order_number')} send result: {result}", flush=True)
+    return result
+
+
+register_notification_handler('order', _deliver_order_notification)
 
 
 
@@ -864,127 +873,58 @@ def api_inventory():
             return jsonify({'success': False, 'message': str(e)}), 500
     else:
         # GET request (PostgreSQL) - optional filter: item_type=product|ingredient (default: all)
+        # Served from the versioned snapshot; ?since=<version>&stock_since=<stock_generation>
+        # returns only changed/deleted products
         try:
-            from database import ensure_metadata_tables
-            ensure_metadata_tables()
-            item_type_filter = request.args.get('item_type', '').lower()
+            item_type_filter = request.args.get('item_type', '').strip().lower()
+            if item_type_filter not in ('product', 'ingredient'):
+                item_type_filter = ''
+            archived_only = request.args.get('archived', '').lower() in ('1', 'true', 'yes')
+            sell_at_pos_only = request.args.get('sell_at_pos', '').lower() in ('1', 'true', 'yes')
+            include_variants = request.args.get('include_variants', '').lower() in ('1', 'true', 'yes')
+            since_str = request.args.get('since')
+            since = int(since_str) if since_str and since_str.isdigit() else None
+            stock_since_str = request.args.get('stock_since')
+            stock_since = int(stock_since_str) if stock_since_str and stock_since_str.isdigit() else None
+            cache = get_inventory_snapshot_cache()
             conn, cursor = _pg_conn()
             try:
-                sql = """
-                    SELECT 
-                        i.*,
-                        v.vendor_name,
-                        pm.keywords,
-                        pm.tags,
-                        pm.attributes,
-                        pm.brand,
-                        pm.color,
-                        pm.size,
-                        pm.category_id as metadata_category_id,
-                        c.category_name as metadata_category_name,
-                        pm.category_confidence
-                    FROM inventory i
-                    LEFT JOIN vendors v ON i.vendor_id = v.vendor_id
-                    LEFT JOIN product_metadata pm ON i.product_id = pm.product_id
-                    LEFT JOIN categories c ON pm.category_id = c.category_id
-                    WHERE 1=1
-                """
-                params = []
-                archived_only = request.args.get('archived', '').lower() in ('1', 'true', 'yes')
-                cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'archived'")
-                if cursor.fetchone():
-                    if archived_only:
-                        sql += " AND i.archived = TRUE"
-                    else:
-                        sql += " AND (i.archived IS NULL OR i.archived = FALSE)"
-                cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'item_type'")
-                has_item_type = cursor.fetchone() is not None
-                if has_item_type and item_type_filter == 'product':
-                    sql += " AND (i.item_type = 'product' OR i.item_type IS NULL)"
-                elif has_item_type and item_type_filter == 'ingredient':
-                    sql += " AND i.item_type = 'ingredient'"
-                sell_at_pos_only = request.args.get('sell_at_pos', '').lower() in ('1', 'true', 'yes')
-                cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'sell_at_pos'")
-                has_sell_at_pos = cursor.fetchone() is not None
-                if has_sell_at_pos and sell_at_pos_only:
-                    sql += " AND (i.sell_at_pos IS TRUE)"
-                if has_item_type:
-                    sql += " ORDER BY i.item_type NULLS LAST, i.product_name"
-                else:
-                    sql += " ORDER BY i.product_name"
+                current = cache.current_version(cursor)
+                version, reset_version = current if current else (None, None)
+                # Stock changes don't move the version, so their generation is part of the ETag
+                stock_generation = cache.stock_generation(cursor) if version is not None else None
+                etag = inventory_etag(version, f's{stock_generation}')
+                if etag and request.if_none_match.contains_weak(etag):
+                    return _not_modified(etag)
+                snapshot = cache.get(cursor, item_type_filter, archived_only, sell_at_pos_only,
+                                     include_variants, version=version)
+                if since is not None:
+                    delta = cache.delta(cursor, snapshot, since, reset_version, stock_since)
+                    if delta is not None:
+                        delta.update({'version': version, 'stock_generation': stock_generation,
+                                      'since': since, 'delta': True})
+                        return _with_etag(jsonify(delta), etag)
+                data = snapshot['data']
+                total = None
                 limit_str = request.args.get('limit')
                 offset_str = request.args.get('offset')
                 limit_val = int(limit_str) if limit_str and str(limit_str).isdigit() else None
                 offset_val = int(offset_str) if offset_str and str(offset_str).isdigit() else None
                 if limit_val is not None:
-                    sql += " LIMIT %s"
-                    params.append(limit_val)
-                if offset_val is not None:
-                    sql += " OFFSET %s"
-                    params.append(offset_val)
-                cursor.execute(sql, params)
-                rows = cursor.fetchall()
-                columns = list(rows[0].keys()) if rows else []
-                data = [dict(r) for r in rows]
-                total = None
+                    total = len(data)
+                start = offset_val or 0
                 if limit_val is not None:
-                    try:
-                        count_sql = "SELECT COUNT(*) AS c FROM inventory i WHERE 1=1"
-                        count_params = []
-                        cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'archived'")
-                        if cursor.fetchone():
-                            if archived_only:
-                                count_sql += " AND i.archived = TRUE"
-                            else:
-                                count_sql += " AND (i.archived IS NULL OR i.archived = FALSE)"
-                        if has_item_type and item_type_filter == 'product':
-                            count_sql += " AND (i.item_type = 'product' OR i.item_type IS NULL)"
-                        elif has_item_type and item_type_filter == 'ingredient':
-                            count_sql += " AND i.item_type = 'ingredient'"
-                        if has_sell_at_pos and sell_at_pos_only:
-                            count_sql += " AND (i.sell_at_pos IS TRUE)"
-                        cursor.execute(count_sql, count_params)
-                        row = cursor.fetchone()
-                        total = row['c'] if row else len(data)
-                    except Exception:
-                        total = len(data)
-                # Use full category path for each item so master category filter includes subcategories
-                try:
-                    cats = list_categories(include_path=True)
-                    category_id_to_path = {c['category_id']: c.get('category_path') or c.get('category_name') for c in cats if c.get('category_id')}
-                    for row in data:
-                        cid = row.get('metadata_category_id')
-                        if cid and cid in category_id_to_path and category_id_to_path[cid]:
-                            row['category'] = category_id_to_path[cid]
-                except Exception:
-                    pass
-                include_variants = request.args.get('include_variants', '').lower() in ('1', 'true', 'yes')
-                if include_variants and data:
-                    try:
-                        product_ids = [r.get('product_id') for r in data if r.get('product_id')]
-                        if product_ids:
-                            placeholders = ','.join(['%s'] * len(product_ids))
-                            cursor.execute(
-                                "SELECT variant_id, product_id, variant_name, price, cost, sort_order FROM product_variants WHERE product_id IN (" + placeholders + ") ORDER BY product_id, sort_order, variant_name",
-                                tuple(product_ids)
-                            )
-                            variant_rows = cursor.fetchall()
-                            variants_by_product = {}
-                            for v in variant_rows:
-                                vd = dict(v)
-                                pid = vd.get('product_id')
-                                if pid not in variants_by_product:
-                                    variants_by_product[pid] = []
-                                variants_by_product[pid].append(vd)
-                            for row in data:
-                                row['variants'] = variants_by_product.get(row.get('product_id')) or []
-                    except Exception:
-                        for row in data:
-                            row['variants'] = []
-                out = {'columns': columns, 'data': data}
+                    data = data[start:start + limit_val]
+                elif start:
+                    data = data[start:]
+                out = {'columns': snapshot['columns'], 'data': data}
                 if total is not None:
                     out['total'] = total
-                return jsonify(out)
+                if version is not None:
+                    out['version'] = version
+                    out['stock_generation'] = stock_generation
+                    out['delta'] = False
+                return _with_etag(jsonify(out), etag)
             finally:
                 conn.close()
         except Exception as e:
@@ -992,6 +932,43 @@ def api_inventory():
             traceback.print_exc()
             return jsonify({'error': str(e), 'columns': [], 'data': []}), 500
 
+
+@app.route('/api/inventory/search')
+def api_inventory_search():
+    """Typeahead product search for the POS (no full catalog download).
+    Query params: q, limit (max 100, default 20), cursor (from next_cursor), item_type=product|ingredient,
+    sell_at_pos=1, include_archived=1."""
+    try:
+        limit_str = request.args.get('limit')
+        try:
+            result = search_inventory(
+                request.args.get('q', ''),
+                limit=int(limit_str) if limit_str and limit_str.isdigit() else 20,
+                after_cursor=request.args.get('cursor') or None,
+                item_type=request.args.get('item_type', '').lower(),
+                sell_at_pos_only=request.args.get('sell_at_pos', '').lower() in ('1', 'true', 'yes'),
+                include_archived=request.args.get('include_archived', '').lower() in ('1', 'true', 'yes'),
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e), 'data': []}), 400
+        return jsonify(result)
+    except Exception as e:
+        print(f"Error in api_inventory_search: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'data': []}), 500
+
+
+def _with_etag(response, etag):
+    """Attach a weak ETag and make clients revalidate before reusing the body."""
+    if etag:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _not_modified(etag):
+    return _with_etag(make_response('', 304), etag)
+
 @app.route('/api/inventory/<int:product_id>', methods=['PUT'])
 def api_update_inventory(product_id):
     """Update inventory product with audit logging"""
@@ -1454,10 +1431,8 @@ def api_category_doordash_bulk(category_id):
                 conn.close()
                 return jsonify({'success': True, 'message': 'No products in this category.', 'updated': 0}), 200
 
-            cur.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'sell_at_pos'")
-            has_sell_at_pos = cur.fetchone() is not None
-            cur.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'item_special_hours'")
-            has_item_special_hours = cur.fetchone() is not None
+            has_sell_at_pos = has_column('inventory', 'sell_at_pos')
+            has_item_special_hours = has_column('inventory', 'item_special_hours')
 
             placeholders = ','.join(['%s'] * len(product_ids))
             updates = []
@@ -1541,9 +1516,10 @@ def api_update_category_impl(category_id):
                 (category_path, category_id)
             )
         
-        conn.commit()
         success = cursor.rowcount > 0
+        conn.commit()
         conn.close()
+        invalidate_categories([category_id])
         
         if success:
             return jsonify({
@@ -2780,7 +2756,6 @@ def api_create_order():
                                 new_total = subtotal + tax - discount + txn_fee + tip_val
                                 pcur.execute("UPDATE orders SET tip = %s, total = %s WHERE order_id = %s", (tip_val, new_total, order_id))
                                 pcur.execute("UPDATE transactions SET tip = %s, total = %s WHERE transaction_id = %s", (tip_val, new_total, int(transaction_id)))
-                                pconn.commit()
                                 pcur.execute("SELECT order_number FROM orders WHERE order_id = %s", (order_id,))
                                 onum = pcur.fetchone()
                                 order_number = (onum.get('order_number') if isinstance(onum, dict) else onum[0]) if onum else None
@@ -2792,7 +2767,11 @@ def api_create_order():
                                 src = (data.get('order_source') or '').strip()
                                 if src:
                                     return_info['order_source'] = src
-                                _send_order_notification_async(return_info)
+                                # Same key as create_order, so an order already notified isn't notified twice
+                                queued = enqueue_notification('order', f'order:{order_id}', return_info, cursor=pcur)
+                                pconn.commit()
+                                notification_committed(queued, 'order', return_info)
+                                enqueue_receipt_prerender(order_id, int(transaction_id))
                                 return jsonify({
                                     'success': True,
                                     'order_id': order_id,
@@ -2822,6 +2801,7 @@ def api_create_order():
             order_source=(data.get('order_source') or '').strip() or None,
             prepare_by=data.get('prepare_by'),
             scheduled_time=data.get('scheduled_time'),
+            notify=True,
         )
         
         # Post to accounting only when order was paid (not pay-later)
@@ -2837,13 +2817,8 @@ def api_create_order():
                     print(f"Accounting journalize_sale error (order {result['order_id']}): {je}")
                     traceback.print_exc()
 
-        # Send order notification (email/SMS) if enabled
         if result.get('success') and result.get('order_id'):
-            oi = {'order_number': result.get('order_number', ''), 'total': result.get('total', 0)}
-            src = (data.get('order_source') or '').strip()
-            if src:
-                oi['order_source'] = src
-            _send_order_notification_async(oi)
+            enqueue_receipt_prerender(result['order_id'])
 
         return jsonify(result)
     except Exception as e:
@@ -2856,9 +2831,10 @@ def api_create_order():
 def api_generate_transaction_receipt(transaction_id):
     """Generate receipt PDF for a transaction"""
     try:
-        from receipt_generator import generate_transaction_receipt
+        from receipt_prerender import transaction_receipt_pdf
         
-        pdf_bytes = generate_transaction_receipt(transaction_id)
+        # Pre-rendered when the payment completed; rendered here on a miss
+        pdf_bytes = transaction_receipt_pdf(transaction_id)
         
         if pdf_bytes:
             response = Response(pdf_bytes, mimetype='application/pdf')
@@ -2893,9 +2869,10 @@ def api_generate_test_receipt():
 def api_generate_receipt(order_id):
     """Generate receipt PDF for an order"""
     try:
-        from receipt_generator import generate_receipt_with_barcode
+        from receipt_prerender import order_receipt_pdf
         
-        pdf_bytes = generate_receipt_with_barcode(order_id)
+        # Pre-rendered when the order completed; rendered here on a miss
+        pdf_bytes = order_receipt_pdf(order_id)
         
         if pdf_bytes:
             response = Response(pdf_bytes, mimetype='application/pdf')
@@ -2951,22 +2928,10 @@ def api_update_receipt_settings():
                 template_preset,
             )
             # Check if template_preset column exists before including it
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = 'receipt_settings' AND column_name = 'template_preset'
-            """)
-            has_template_preset = cursor.fetchone() is not None
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = 'receipt_settings' AND column_name = 'show_tip'
-            """)
-            has_show_tip = cursor.fetchone() is not None
+            has_template_preset = has_column('receipt_settings', 'template_preset')
+            has_show_tip = has_column('receipt_settings', 'show_tip')
             # Check if template_styles column exists (stores full receipt template for PDF generation)
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = 'receipt_settings' AND column_name = 'template_styles'
-            """)
-            has_template_styles = cursor.fetchone() is not None
+            has_template_styles = has_column('receipt_settings', 'template_styles')
             # Full receipt template from Settings UI - variables inserted at print time
             template_styles = data if isinstance(data, dict) else {}
             if count == 0:
@@ -3036,6 +3001,7 @@ def api_update_receipt_settings():
                         WHERE id = (SELECT id FROM receipt_settings ORDER BY id DESC LIMIT 1)
                     """, (json.dumps(template_styles),))
             conn.commit()
+            invalidate_receipt_settings()
             return jsonify({'success': True, 'message': 'Receipt settings updated successfully'})
         finally:
             conn.close()
@@ -3244,21 +3210,7 @@ def api_update_pos_settings():
             discount_presets_json = None
         conn, cursor = _pg_conn()
         try:
-            # Ensure require_signature_for_return column exists so the setting saves
-            try:
-                cursor.execute("ALTER TABLE pos_settings ADD COLUMN IF NOT EXISTS require_signature_for_return BOOLEAN DEFAULT false")
-            except Exception:
-                pass
-            try:
-                cursor.execute("ALTER TABLE pos_settings ADD COLUMN IF NOT EXISTS discount_presets TEXT")
-            except Exception:
-                pass
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = 'pos_settings'
-                AND column_name IN ('return_transaction_fee_take_loss', 'return_tip_refund', 'require_signature_for_return', 'transaction_fee_mode', 'transaction_fee_charge_cash')
-            """)
-            cols = [r['column_name'] for r in cursor.fetchall()]
+            cols = table_columns('pos_settings')
             has_return_opts = 'return_transaction_fee_take_loss' in cols and 'return_tip_refund' in cols
             has_signature_return = 'require_signature_for_return' in cols
             has_fee_mode = 'transaction_fee_mode' in cols and 'transaction_fee_charge_cash' in cols
@@ -3362,7 +3314,6 @@ def api_pos_bootstrap():
                 raw_presets = row.get('discount_presets')
                 if raw_presets and isinstance(raw_presets, str):
                     try:
-                        import json
                         presets = json.loads(raw_presets)
                         discount_presets = presets if isinstance(presets, list) and len(presets) > 0 else _default_discount_presets()
                     except Exception:
@@ -3384,18 +3335,7 @@ def api_pos_bootstrap():
             else:
                 pos_settings = {'num_registers': 1, 'register_type': 'one_screen', 'return_transaction_fee_take_loss': False, 'return_tip_refund': False, 'require_signature_for_return': False, 'transaction_fee_mode': 'additional', 'transaction_fee_charge_cash': False, 'discount_presets': _default_discount_presets()}
 
-            # 2) Customer rewards settings (ensure table exists)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS customer_rewards_settings (
-                id SERIAL PRIMARY KEY,
-                enabled INTEGER DEFAULT 0 CHECK(enabled IN (0, 1)),
-                require_email INTEGER DEFAULT 0, require_phone INTEGER DEFAULT 0, require_both INTEGER DEFAULT 0,
-                reward_type TEXT DEFAULT 'points', points_per_dollar REAL DEFAULT 1.0, points_redemption_value REAL DEFAULT 0.01,
-                percentage_discount REAL DEFAULT 0.0, fixed_discount REAL DEFAULT 0.0, minimum_spend REAL DEFAULT 0.0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            conn.commit()
+            # 2) Customer rewards settings (table created by schema bootstrap)
             cursor.execute("""
                 SELECT * FROM customer_rewards_settings ORDER BY id DESC LIMIT 1
             """)
@@ -3433,71 +3373,42 @@ def api_pos_bootstrap():
                 pos_search_filters = _default_pos_search_filters()
 
             # 4) Inventory (products + variants) – same shape as GET /api/inventory?item_type=product&include_variants=1
-            from database import ensure_metadata_tables, list_categories
-            ensure_metadata_tables()
-            sql = """
-                SELECT i.*, v.vendor_name, pm.keywords, pm.tags, pm.attributes, pm.brand, pm.color, pm.size,
-                    pm.category_id as metadata_category_id, c.category_name as metadata_category_name, pm.category_confidence
-                FROM inventory i
-                LEFT JOIN vendors v ON i.vendor_id = v.vendor_id
-                LEFT JOIN product_metadata pm ON i.product_id = pm.product_id
-                LEFT JOIN categories c ON pm.category_id = c.category_id
-                WHERE 1=1
-            """
-            cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'archived'")
-            if cursor.fetchone():
-                sql += " AND (i.archived IS NULL OR i.archived = FALSE)"
-            cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'item_type'")
-            has_item_type = cursor.fetchone() is not None
-            if has_item_type:
-                sql += " AND (i.item_type = 'product' OR i.item_type IS NULL) ORDER BY i.item_type NULLS LAST, i.product_name"
-            else:
-                sql += " ORDER BY i.product_name"
-            cursor.execute(sql)
-            rows = cursor.fetchall()
-            columns = list(rows[0].keys()) if rows else []
-            data = [dict(r) for r in rows]
-            try:
-                cats = list_categories(include_path=True)
-                category_id_to_path = {c['category_id']: c.get('category_path') or c.get('category_name') for c in (cats or []) if c.get('category_id')}
-                for row in data:
-                    cid = row.get('metadata_category_id')
-                    if cid and cid in category_id_to_path and category_id_to_path[cid]:
-                        row['category'] = category_id_to_path[cid]
-            except Exception:
-                pass
-            if data:
-                product_ids = [r.get('product_id') for r in data if r.get('product_id')]
-                if product_ids:
-                    placeholders = ','.join(['%s'] * len(product_ids))
-                    cursor.execute(
-                        "SELECT variant_id, product_id, variant_name, price, cost, sort_order FROM product_variants WHERE product_id IN (" + placeholders + ") ORDER BY product_id, sort_order, variant_name",
-                        tuple(product_ids)
-                    )
-                    variant_rows = cursor.fetchall()
-                    variants_by_product = {}
-                    for v in variant_rows:
-                        vd = dict(v)
-                        pid = vd.get('product_id')
-                        if pid not in variants_by_product:
-                            variants_by_product[pid] = []
-                        variants_by_product[pid].append(vd)
-                    for row in data:
-                        row['variants'] = variants_by_product.get(row.get('product_id')) or []
-                else:
-                    for row in data:
-                        row['variants'] = []
-            else:
-                for row in data:
-                    row['variants'] = []
-
-            return jsonify({
+            # Settings and the stock generation are part of the ETag since they don't move the catalog version
+            cache = get_inventory_snapshot_cache()
+            current = cache.current_version(cursor)
+            version, reset_version = current if current else (None, None)
+            stock_generation = cache.stock_generation(cursor) if version is not None else None
+            settings_payload = {
+                'posSettings': pos_settings,
+                'rewardsSettings': rewards_settings,
+                'posSearchFilters': pos_search_filters,
+            }
+            settings_hash = hashlib.sha1(json.dumps(settings_payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+            etag = inventory_etag(version, f's{stock_generation}', 'pos', settings_hash)
+            if etag and request.if_none_match.contains_weak(etag):
+                return _not_modified(etag)
+            snapshot = cache.get(cursor, 'product', include_variants=True, version=version)
+            inventory = None
+            since_str = request.args.get('since')
+            stock_since_str = request.args.get('stock_since')
+            if since_str and since_str.isdigit():
+                stock_since = int(stock_since_str) if stock_since_str and stock_since_str.isdigit() else None
+                inventory = cache.delta(cursor, snapshot, int(since_str), reset_version, stock_since)
+                if inventory is not None:
+                    inventory.update({'version': version, 'stock_generation': stock_generation,
+                                      'since': int(since_str), 'delta': True})
+            if inventory is None:
+                inventory = {'columns': snapshot['columns'], 'data': snapshot['data']}
+                if version is not None:
+                    inventory.update({'version': version, 'stock_generation': stock_generation, 'delta': False})
+
+            return _with_etag(jsonify({
                 'success': True,
                 'posSettings': pos_settings,
                 'rewardsSettings': rewards_settings,
                 'posSearchFilters': pos_search_filters,
-                'inventory': {'columns': columns, 'data': data}
-            })
+                'inventory': inventory
+            }), etag)
         finally:
             conn.close()
     except Exception as e:
@@ -3738,30 +3649,39 @@ def api_update_table_row(table_name):
 # Specialized endpoints with joins
 @app.route('/api/orders')
 def api_orders():
-    """Get orders with employee and customer names. Query params: order_status, order_status_in (comma), order_type_in (comma), limit, offset."""
+    """Get orders with employee and customer names.
+    Query params: order_status, order_status_in (comma), order_type_in (comma), limit, cursor (from next_cursor;
+    preferred over offset), offset, total=exact|estimate|none (default estimate when limit is set)."""
     try:
         order_status = request.args.get('order_status')
         order_status_in_str = request.args.get('order_status_in')
         order_type_in_str = request.args.get('order_type_in')
         limit_str = request.args.get('limit')
         offset_str = request.args.get('offset')
+        after_cursor = request.args.get('cursor') or None
+        total_mode = (request.args.get('total') or 'estimate').strip().lower()
         order_status_in = [s.strip() for s in order_status_in_str.split(',') if s.strip()] if order_status_in_str else None
         order_type_in = [t.strip() for t in order_type_in_str.split(',') if t.strip()] if order_type_in_str else None
         limit = int(limit_str) if limit_str and str(limit_str).isdigit() else None
         offset = int(offset_str) if offset_str and str(offset_str).isdigit() else None
-        orders = list_orders(
-            order_status=order_status or None,
-            order_status_in=order_status_in,
-            order_type_in=order_type_in,
-            limit=limit,
-            offset=offset
-        )
-        if not orders:
-            out = {'columns': [], 'data': []}
+        filters = {'order_status': order_status or None, 'order_status_in': order_status_in, 'order_type_in': order_type_in}
+        try:
+            orders = list_orders(limit=limit, offset=offset, after_cursor=after_cursor, **filters)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'columns': [], 'data': []}), 400
+
+        def _with_paging(out):
             if limit is not None:
-                total = count_orders(order_status=order_status or None, order_status_in=order_status_in, order_type_in=order_type_in)
-                out['total'] = total
-            return jsonify(out)
+                out['next_cursor'] = encode_orders_cursor(orders[-1]) if orders and len(orders) == limit else None
+                if total_mode == 'exact':
+                    out['total'] = count_orders(**filters)
+                    out['total_is_estimate'] = False
+                elif total_mode != 'none':
+                    out['total'], out['total_is_estimate'] = count_orders_cached(**filters)
+            return out
+
+        if not orders:
+            return jsonify(_with_paging({'columns': [], 'data': []}))
         # Ensure every order has order_source, prepare_by, dasher fields (for logos and Dasher status in table/cards)
         for o in orders:
             if isinstance(o, dict):
@@ -3781,11 +3701,7 @@ def api_orders():
             columns.append('dasher_status_at')
         if 'dasher_info' not in columns:
             columns.append('dasher_info')
-        out = {'columns': columns, 'data': orders}
-        if limit is not None:
-            total = count_orders(order_status=order_status or None, order_status_in=order_status_in, order_type_in=order_type_in)
-            out['total'] = total
-        return jsonify(out)
+        return jsonify(_with_paging({'columns': columns, 'data': orders}))
     except Exception as e:
         print(f"Error in api_orders: {e}")
         import traceback
@@ -4671,6 +4587,7 @@ def api_orders_from_integration():
             order_status_override='placed',
             order_source=order_source,
             prepare_by=prepare_by_iso,
+            notify=True,
         )
         if result.get('success') and result.get('order_id'):
             order_id = result['order_id']
@@ -4679,8 +4596,6 @@ def api_orders_from_integration():
                 journalize_sale_to_accounting(order_id, int(employee_id))
             except Exception as je:
                 print(f"Accounting journalize_sale (order {order_id}) from integration: {je}")
-            oi = {'order_number': result.get('order_number', ''), 'total': result.get('total', 0), 'order_source': order_source}
-            _send_order_notification_async(oi)
             return jsonify({
                 'success': True,
                 'order_id': order_id,
@@ -4938,6 +4853,7 @@ def api_webhooks_doordash_orders():
             doordash_promo_details=payload.get('doordash_promo_details'),
             doordash_total_merchant_funded_discount_cents=payload.get('doordash_total_merchant_funded_discount_cents'),
             doordash_total_doordash_funded_discount_cents=payload.get('doordash_total_doordash_funded_discount_cents'),
+            notify=True,
         )
         if result.get('success') and result.get('order_id'):
             try:
@@ -4953,10 +4869,6 @@ def api_webhooks_doordash_orders():
             merchant_id = str(result.get('order_id') or result.get('order_number') or '')
             pickup_instructions = (payload.get('pickup_instructions') or config.get('doordash_pickup_instructions_default') or config.get('pickup_instructions') or '').strip() or None
             confirm_doordash_order(str(doordash_order_id or ''), merchant_id, success=True, config=config, pickup_instructions=pickup_instructions)
-            try:
-                _send_order_notification_async({'order_number': result.get('order_number', ''), 'total': result.get('total', 0), 'order_source': 'doordash'})
-            except Exception:
-                pass
         else:
             confirm_doordash_order(str(doordash_order_id or ''), 'pos', success=False, failure_reason=(result.get('message') or FAILURE_REASON_CONNECTIVITY)[:500], config=config)
         return jsonify({'ok': True}), 200
@@ -5440,13 +5352,11 @@ def api_doordash_add_all_items():
         conn = get_connection()
         cur = conn.cursor()
         try:
-            cur.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'sell_at_pos'")
-            if cur.fetchone() is None:
+            if not has_column('inventory', 'sell_at_pos'):
                 cur.close()
                 conn.close()
                 return jsonify({'success': False, 'message': 'sell_at_pos column not present'}), 400
-            cur.execute("SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'inventory' AND column_name = 'item_type'")
-            has_item_type = cur.fetchone() is not None
+            has_item_type = has_column('inventory', 'item_type')
             if has_item_type:
                 cur.execute(
                     "UPDATE inventory SET sell_at_pos = TRUE WHERE (item_type = 'product' OR item_type IS NULL)"
@@ -5763,11 +5673,7 @@ def api_create_demo_integration_orders():
         # Ensure order_source column exists so demo orders show Shopify / DoorDash / Uber Eats (not in-house)
         conn2 = get_connection()
         cur2 = conn2.cursor()
-        cur2.execute("""
-            SELECT 1 FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = 'orders' AND column_name = 'order_source'
-        """)
-        has_order_source_col = cur2.fetchone() is not None
+        has_order_source_col = has_column('orders', 'order_source')
         cur2.close()
         conn2.close()
         if not has_order_source_col:
@@ -6112,12 +6018,7 @@ def api_employee_schedule():
         old_schedules = cursor.fetchall()
         
         # Also get published schedules from Scheduled_Shifts (new system)
-        cursor.execute("""
-            SELECT EXISTS (SELECT 1 FROM information_schema.tables
-                WHERE table_schema = 'public' AND table_name = 'scheduled_shifts') AS ok
-        """)
-        row = cursor.fetchone()
-        has_scheduled_shifts = row and row.get('ok')
+        has_scheduled_shifts = has_table('scheduled_shifts')
         
         new_schedules = []
         if has_scheduled_shifts:
@@ -6363,12 +6264,7 @@ def api_clock_in():
         schedule = cursor.fetchone()
         
         if not schedule:
-            cursor.execute("""
-                SELECT EXISTS (SELECT 1 FROM information_schema.tables
-                    WHERE table_schema = 'public' AND table_name = 'scheduled_shifts') AS ok
-            """)
-            r = cursor.fetchone()
-            has_scheduled_shifts = r and r.get('ok')
+            has_scheduled_shifts = has_table('scheduled_shifts')
             if has_scheduled_shifts:
                 cursor.execute("""
                     SELECT ss.scheduled_shift_id, ss.shift_date, ss.start_time, ss.end_time
@@ -6799,7 +6695,11 @@ def api_register_face():
         if len(face_descriptor) != 128:
             return jsonify({'success': False, 'message': 'Face descriptor must have 128 values'}), 400
         
-        # Store face encoding in database
+        descriptor = parse_descriptor(face_descriptor)
+        if descriptor is None:
+            return jsonify({'success': False, 'message': 'Face descriptor must contain only numbers'}), 400
+        
+        # Store face encoding in database (raw float32 bytes)
         conn, cursor = _pg_conn()
         
         # Check if face encoding already exists
@@ -6814,20 +6714,22 @@ def api_register_face():
             # Update existing encoding
             cursor.execute("""
                 UPDATE employee_face_encodings
-                SET face_descriptor = %s,
+                SET descriptor = %s,
+                    face_descriptor = NULL,
                     updated_at = CURRENT_TIMESTAMP
                 WHERE employee_id = %s
-            """, (json.dumps(face_descriptor), employee_id))
+            """, (encode_descriptor(descriptor), employee_id))
         else:
             # Insert new encoding
             cursor.execute("""
                 INSERT INTO employee_face_encodings (
-                    employee_id, face_descriptor
+                    employee_id, descriptor
                 ) VALUES (%s, %s)
-            """, (employee_id, json.dumps(face_descriptor)))
+            """, (employee_id, encode_descriptor(descriptor)))
         
         conn.commit()
         conn.close()
+        refresh_face_employee(employee_id)
         
         return jsonify({
             'success': True,
@@ -6850,40 +6752,25 @@ def api_verify_face():
         if not data or 'face_descriptor' not in data:
             return jsonify({'success': False, 'message': 'Face descriptor required'}), 400
         
-        input_descriptor = data['face_descriptor']
+        input_descriptor = parse_descriptor(data['face_descriptor'])
         
         # Validate descriptor
-        if not isinstance(input_descriptor, list) or len(input_descriptor) != 128:
+        if input_descriptor is None:
             return jsonify({'success': False, 'message': 'Invalid face descriptor'}), 400
         
-        # Get stored face encoding for this employee
-        conn, cursor = _pg_conn()
+        # Cosine similarity against this employee's registered face (from the in-memory index)
+        similarity = get_face_index().similarity(employee_id, input_descriptor)
         
-        cursor.execute("""
-            SELECT face_descriptor FROM employee_face_encodings
-            WHERE employee_id = %s
-        """, (employee_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        if not row:
+        if similarity is None:
             return jsonify({
                 'success': False,
                 'message': 'No face registered for this employee',
                 'verified': False
             }), 404
         
-        # Parse stored descriptor
-        stored_descriptor = json.loads(row[0])
-        
-        # Calculate cosine similarity (face-api.js uses cosine distance)
-        # Similarity = 1 - distance, so we want similarity > threshold
-        similarity = cosine_similarity(input_descriptor, stored_descriptor)
-        
         # Threshold for face recognition (0.6 is typical, but can be adjusted)
         # face-api.js typically uses 0.6 as default threshold
-        threshold = data.get('threshold', 0.6)
+        threshold = data.get('threshold', DEFAULT_FACE_THRESHOLD)
         verified = similarity >= threshold
         
         return jsonify({
@@ -6934,18 +6821,6 @@ def api_face_status():
         traceback.print_exc()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-def cosine_similarity(vec1, vec2):
-    """Calculate cosine similarity between two vectors"""
-    import math
-    dot_product = sum(a * b for a, b in zip(vec1, vec2))
-    magnitude1 = math.sqrt(sum(a * a for a in vec1))
-    magnitude2 = math.sqrt(sum(a * a for a in vec2))
-    
-    if magnitude1 == 0 or magnitude2 == 0:
-        return 0
-    
-    return dot_product / (magnitude1 * magnitude2)
-
 @app.route('/api/face/identify', methods=['POST'])
 def api_identify_face():
     """
@@ -6957,58 +6832,27 @@ def api_identify_face():
         if not data or 'face_descriptor' not in data:
             return jsonify({'success': False, 'message': 'Face descriptor required'}), 400
         
-        input_descriptor = data['face_descriptor']
+        input_descriptor = parse_descriptor(data['face_descriptor'])
         
         # Validate descriptor
-        if not isinstance(input_descriptor, list) or len(input_descriptor) != 128:
+        if input_descriptor is None:
             return jsonify({'success': False, 'message': 'Invalid face descriptor'}), 400
         
-        # Get all registered face encodings with employee info
-        conn, cursor = _pg_conn()
-        
-        cursor.execute("""
-            SELECT 
-                efe.employee_id,
-                efe.face_descriptor,
-                e.first_name,
-                e.last_name,
-                e.employee_code,
-                e.position,
-                e.active
-            FROM employee_face_encodings efe
-            JOIN employees e ON efe.employee_id = e.employee_id
-            WHERE e.active = 1
-        """)
+        face_index = get_face_index()
+        threshold = data.get('threshold', DEFAULT_FACE_THRESHOLD)  # Default threshold for face recognition
+        top_k = max(1, min(int(data.get('top_k', 1) or 1), 10))
         
-        rows = cursor.fetchall()
-        conn.close()
+        # One matrix-vector product against every registered active employee
+        matches, best_similarity = face_index.identify(input_descriptor, top_k=top_k, threshold=threshold)
         
-        if not rows:
+        if not len(face_index):
             return jsonify({
                 'success': False,
                 'message': 'No employees have registered faces',
                 'employee_id': None
             }), 404
         
-        # Compare against all registered faces and find best match
-        best_match = None
-        best_similarity = 0.0
-        threshold = data.get('threshold', 0.6)  # Default threshold for face recognition
-        
-        for row in rows:
-            stored_descriptor = json.loads(row['face_descriptor'])
-            similarity = cosine_similarity(input_descriptor, stored_descriptor)
-            
-            if similarity > best_similarity and similarity >= threshold:
-                best_similarity = similarity
-                best_match = {
-                    'employee_id': row['employee_id'],
-                    'first_name': row['first_name'],
-                    'last_name': row['last_name'],
-                    'employee_code': row['employee_code'],
-                    'position': row['position'],
-                    'similarity': similarity
-                }
+        best_match = matches[0] if matches else None
         
         if best_match:
             return jsonify({
@@ -7020,7 +6864,8 @@ def api_identify_face():
                 'position': best_match['position'],
                 'similarity': best_match['similarity'],
                 'confidence': f"{(best_match['similarity'] * 100):.1f}%",
-                'message': f"Face identified as {best_match['first_name']} {best_match['last_name']}"
+                'message': f"Face identified as {best_match['first_name']} {best_match['last_name']}",
+                **({'candidates': matches} if top_k > 1 else {})
             })
         else:
             return jsonify({
@@ -7048,60 +6893,24 @@ def api_face_clock():
             return jsonify({'success': False, 'message': 'Face descriptor required'}), 400
         
         action = data.get('action', 'clock_in')  # 'clock_in' or 'clock_out'
-        input_descriptor = data['face_descriptor']
+        input_descriptor = parse_descriptor(data['face_descriptor'])
         
         # Validate descriptor
-        if not isinstance(input_descriptor, list) or len(input_descriptor) != 128:
+        if input_descriptor is None:
             return jsonify({'success': False, 'message': 'Invalid face descriptor'}), 400
         
-        # Step 1: Identify the employee by face
-        identify_data = request.json.copy()
-        identify_data['threshold'] = data.get('threshold', 0.6)
-        
-        # Call internal identify function (simulate by calling the logic)
-        conn, cursor = _pg_conn()
-        
-        cursor.execute("""
-            SELECT 
-                efe.employee_id,
-                efe.face_descriptor,
-                e.first_name,
-                e.last_name,
-                e.employee_code,
-                e.position,
-                e.active
-            FROM employee_face_encodings efe
-            JOIN employees e ON efe.employee_id = e.employee_id
-            WHERE e.active = 1
-        """)
-        
-        rows = cursor.fetchall()
-        conn.close()
+        # Step 1: Identify the employee by face (in-memory index, no DB round trip)
+        face_index = get_face_index()
+        threshold = data.get('threshold', DEFAULT_FACE_THRESHOLD)
+        matches, best_similarity = face_index.identify(input_descriptor, top_k=1, threshold=threshold)
         
-        if not rows:
+        if not len(face_index):
             return jsonify({
                 'success': False,
                 'message': 'No employees have registered faces',
             }), 404
         
-        # Find best match
-        best_match = None
-        best_similarity = 0.0
-        threshold = data.get('threshold', 0.6)
-        
-        for row in rows:
-            stored_descriptor = json.loads(row['face_descriptor'])
-            similarity = cosine_similarity(input_descriptor, stored_descriptor)
-            
-            if similarity > best_similarity and similarity >= threshold:
-                best_similarity = similarity
-                best_match = {
-                    'employee_id': row['employee_id'],
-                    'first_name': row['first_name'],
-                    'last_name': row['last_name'],
-                    'employee_code': row['employee_code'],
-                    'similarity': similarity
-                }
+        best_match = matches[0] if matches else None
         
         if not best_match:
             return jsonify({
@@ -7427,20 +7236,7 @@ def api_dashboard_statistics():
         try:
             if is_postgres:
                 # Check if orders table exists
-                cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables 
-                        WHERE table_schema = 'public' 
-                        AND table_name = 'orders'
-                    )
-                """)
-                table_exists_result = cursor.fetchone()
-                table_exists = False
-                if table_exists_result:
-                    if isinstance(table_exists_result, dict):
-                        table_exists = table_exists_result.get('exists', False)
-                    elif isinstance(table_exists_result, (list, tuple)) and len(table_exists_result) > 0:
-                        table_exists = bool(table_exists_result[0])
+                table_exists = has_table('orders')
                 
                 if table_exists:
                     cursor.execute("SELECT COUNT(*) as total FROM orders")
@@ -7459,20 +7255,7 @@ def api_dashboard_statistics():
         try:
             if is_postgres:
                 # Check if table exists
-                cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables 
-                        WHERE table_schema = 'public' 
-                        AND table_name = 'pending_returns'
-                    )
-                """)
-                table_exists_result = cursor.fetchone()
-                table_exists = False
-                if table_exists_result:
-                    if isinstance(table_exists_result, dict):
-                        table_exists = table_exists_result.get('exists', False)
-                    elif isinstance(table_exists_result, (list, tuple)) and len(table_exists_result) > 0:
-                        table_exists = bool(table_exists_result[0])
+                table_exists = has_table('pending_returns')
                 
                 if table_exists:
                     cursor.execute("SELECT COUNT(*) as total FROM pending_returns")
@@ -7965,20 +7748,7 @@ def api_dashboard_statistics():
         try:
             # Check if pending_returns table exists first
             if is_postgres:
-                cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables 
-                        WHERE table_schema = 'public' 
-                        AND table_name = 'pending_returns'
-                    )
-                """)
-                table_exists_result = cursor.fetchone()
-                table_exists = False
-                if table_exists_result:
-                    if isinstance(table_exists_result, dict):
-                        table_exists = table_exists_result.get('exists', False)
-                    elif isinstance(table_exists_result, (list, tuple)) and len(table_exists_result) > 0:
-                        table_exists = bool(table_exists_result[0])
+                table_exists = has_table('pending_returns')
                 
                 if table_exists:
                     cursor.execute("""
@@ -8289,21 +8059,23 @@ def api_identify_shipment():
                 temp_paths.append(tmp_file.name)
         
         try:
-            from barcode_scanner import smart_product_identification
+            from barcode_scanner import smart_identify_batch
             
             # Get scanners
             barcode_scanner = get_barcode_scanner() if use_barcode else None
             image_matcher = get_image_matcher() if use_image_matching else None
             
+            # Barcodes per photo, then one batched embedding pass for the rest
+            results = smart_identify_batch(
+                temp_paths,
+                barcode_scanner=barcode_scanner,
+                image_matcher=image_matcher,
+                prefer_barcode=use_barcode,
+                threshold=threshold
+            )
+            
             identified = []
-            for image_path in temp_paths:
-                result = smart_product_identification(
-                    image_path=image_path,
-                    barcode_scanner=barcode_scanner,
-                    image_matcher=image_matcher,
-                    prefer_barcode=use_barcode
-                )
-                
+            for image_path, result in zip(temp_paths, results):
                 # Format result
                 item = {
                     'image': image_path,
@@ -8377,7 +8149,7 @@ def api_build_product_database():
         
         return jsonify({
             'success': True,
-            'message': f'Product database built with {len(matcher.product_embeddings)} products'
+            'message': f'Product database built with {matcher.embedding_count} products'
         })
     except Exception as e:
         print(f"Build database error: {e}")
@@ -8519,43 +8291,30 @@ def api_scan_barcode():
         if file.filename == '':
             return jsonify({'success': False, 'error': 'No file selected'}), 400
         
-        # Save temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-            file.save(tmp_file.name)
-            temp_path = tmp_file.name
+        # Decode straight from the upload, no temp file
+        result = scanner.identify_bytes(file.read())
         
-        try:
-            # Scan barcode
-            result = scanner.identify_product(temp_path)
-            
-            if result and result.get('product'):
-                return jsonify({
-                    'success': True,
-                    'method': 'barcode',
-                    'barcode': result.get('barcode'),
-                    'product': result['product']
-                })
-            elif result and result.get('barcode'):
-                # Barcode found but product not in database
-                return jsonify({
-                    'success': False,
-                    'method': 'barcode',
-                    'barcode': result.get('barcode'),
-                    'message': result.get('message', 'Product not found in database'),
-                    'product': None
-                }), 404
-            else:
-                return jsonify({
-                    'success': False,
-                    'message': 'No barcode found in image'
-                }), 404
-                
-        finally:
-            # Clean up temp file
-            try:
-                os.remove(temp_path)
-            except:
-                pass
+        if result and result.get('product'):
+            return jsonify({
+                'success': True,
+                'method': 'barcode',
+                'barcode': result.get('barcode'),
+                'product': result['product']
+            })
+        elif result and result.get('barcode'):
+            # Barcode found but product not in database
+            return jsonify({
+                'success': False,
+                'method': 'barcode',
+                'barcode': result.get('barcode'),
+                'message': result.get('message', 'Product not found in database'),
+                'product': None
+            }), 404
+        else:
+            return jsonify({
+                'success': False,
+                'message': 'No barcode found in image'
+            }), 404
                 
     except Exception as e:
         print(f"Scan barcode error: {e}")
@@ -8580,30 +8339,18 @@ def api_scan_barcodes():
         if not files:
             return jsonify({'success': False, 'error': 'No files selected'}), 400
         
-        temp_paths = []
-        for file in files:
-            if file.filename == '':
-                continue
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                file.save(tmp_file.name)
-                temp_paths.append(tmp_file.name)
+        files = [file for file in files if file.filename != '']
+        # Uploads are read here; decoding and scanning fan out over the shared scan pool
+        results = scanner.batch_scan_bytes(
+            [file.read() for file in files],
+            labels=[file.filename for file in files]
+        )
         
-        try:
-            results = scanner.batch_scan(temp_paths)
-            
-            return jsonify({
-                'success': True,
-                'total_items': len(results),
-                'scanned_items': results
-            })
-            
-        finally:
-            # Clean up temp files
-            for path in temp_paths:
-                try:
-                    os.remove(path)
-                except:
-                    pass
+        return jsonify({
+            'success': True,
+            'total_items': len(results),
+            'scanned_items': results
+        })
                     
     except Exception as e:
         print(f"Scan barcodes error: {e}")
@@ -8798,10 +8545,6 @@ def api_return_receipt_options():
             cursor.execute("SELECT return_id FROM pending_returns WHERE return_id = %s", (return_id,))
             if not cursor.fetchone():
                 return jsonify({'success': False, 'message': 'Return not found'}), 404
-            try:
-                cursor.execute("ALTER TABLE pending_returns ADD COLUMN IF NOT EXISTS signature TEXT")
-            except Exception:
-                pass
             cursor.execute(
                 "UPDATE pending_returns SET signature = %s WHERE return_id = %s",
                 (signature if signature else None, return_id)
@@ -9472,6 +9215,75 @@ def api_employee_activity_detail():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ============================================================================
+# DATABASE ADMIN API ENDPOINTS (Admin Only)
+# ============================================================================
+
+def _require_admin_auth():
+    """Require session and admin/manage_settings. Returns (ok, err_response)."""
+    session_token = (request.json or {}).get('session_token') if request.is_json else None
+    session_token = session_token or request.headers.get('X-Session-Token') or request.args.get('session_token')
+    if not session_token:
+        return False, (jsonify({'success': False, 'message': 'Session token required'}), 401)
+    session_result = verify_session(session_token)
+    if not session_result.get('valid'):
+        return False, (jsonify({'success': False, 'message': 'Invalid session'}), 401)
+    employee_id = session_result.get('employee_id')
+    employee = get_employee(employee_id) if employee_id else None
+    is_admin = employee and (employee.get('position') or '').lower() == 'admin'
+    pm = get_permission_manager()
+    has_perm = pm.has_permission(employee_id, 'manage_settings') if employee_id else False
+    if not is_admin and not has_perm:
+        return False, (jsonify({'success': False, 'message': 'Permission denied'}), 403)
+    return True, None
+
+
+@app.route('/api/admin/schema-registry', methods=['GET', 'POST'])
+def api_admin_schema_registry():
+    """GET: schema registry status. POST: reload table/column metadata (e.g. after running a migration by hand)."""
+    ok, err = _require_admin_auth()
+    if not ok:
+        return err
+    try:
+        registry = get_schema_registry()
+        if request.method == 'POST':
+            registry.refresh()
+        return jsonify({
+            'success': True,
+            **registry.stats(),
+            'bootstrap_version': get_schema_version(),
+            'bootstrap_latest_version': SCHEMA_BOOTSTRAP_LATEST,
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/admin/db-pool-stats', methods=['GET', 'POST'])
+def api_admin_db_pool_stats():
+    """GET: connection pool telemetry (?stacks=1 adds acquiring stacks when DB_LEAK_DETECT_SECONDS is set). POST: reset counters."""
+    ok, err = _require_admin_auth()
+    if not ok:
+        return err
+    try:
+        from database_postgres import get_pool_stats, reset_pool_stats
+        if request.method == 'POST':
+            reset_pool_stats()
+        include_stacks = request.args.get('stacks', '').lower() in ('1', 'true', 'yes')
+        # Session cache hits are checkouts the pool never saw
+        return jsonify({
+            'success': True,
+            **get_pool_stats(include_stacks=include_stacks),
+            'session_cache': get_session_cache().stats(),
+            'category_cache': get_category_cache().stats(),
+            'face_index': get_face_index().stats(),
+            'receipt_cache': receipt_cache_stats(),
+            'receipt_prerender': get_receipt_prerenderer().stats(),
+            'notification_outbox': get_notification_dispatcher().stats(),
+            'notification_transports': notification_transport_stats(),
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ============================================================================
 # EMPLOYEE MANAGEMENT API ENDPOINTS (Admin Only)
 # ============================================================================
@@ -10530,48 +10342,10 @@ def calendar_feed(token):
         traceback.print_exc()
         return f"Error generating calendar feed: {str(e)}", 500
 
-def _create_calendar_subscriptions_table_if_missing():
-    """Create calendar_subscriptions table (lowercase) so INSERT finds it. Idempotent."""
-    conn = None
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS calendar_subscriptions (
-                subscription_id SERIAL PRIMARY KEY,
-                employee_id INTEGER NOT NULL,
-                subscription_token VARCHAR(255) NOT NULL,
-                include_shifts SMALLINT DEFAULT 1,
-                include_shipments SMALLINT DEFAULT 1,
-                include_meetings SMALLINT DEFAULT 1,
-                include_deadlines SMALLINT DEFAULT 1,
-                calendar_name VARCHAR(255) DEFAULT 'My Work Schedule',
-                is_active SMALLINT DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        cur.close()
-    except Exception:
-        if conn:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-        raise
-    finally:
-        if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
-
-
 @app.route('/api/calendar/subscription/create', methods=['POST'])
 def api_calendar_subscription_create():
     """Create calendar subscription for employee"""
     try:
-        _create_calendar_subscriptions_table_if_missing()
         session_token = request.headers.get('Authorization', '').replace('Bearer ', '')
         data = request.get_json(silent=True) or {}
         if not session_token:
@@ -10606,51 +10380,10 @@ def api_calendar_subscription_create():
         traceback.print_exc()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-def _ensure_calendar_subscriptions_table():
-    """Create calendar_subscriptions table if it does not exist."""
-    conn = None
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS calendar_subscriptions (
-                subscription_id SERIAL PRIMARY KEY,
-                employee_id INTEGER NOT NULL,
-                subscription_token VARCHAR(255) NOT NULL,
-                include_shifts SMALLINT DEFAULT 1,
-                include_shipments SMALLINT DEFAULT 1,
-                include_meetings SMALLINT DEFAULT 1,
-                include_deadlines SMALLINT DEFAULT 1,
-                calendar_name VARCHAR(255) DEFAULT 'My Work Schedule',
-                is_active SMALLINT DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        cur.close()
-    except Exception:
-        if conn:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-        raise
-    finally:
-        if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
-
-
 @app.route('/api/calendar/subscription/urls', methods=['GET'])
 def get_subscription_urls():
     """Get calendar subscription URLs"""
     try:
-        try:
-            _create_calendar_subscriptions_table_if_missing()
-        except Exception:
-            pass
         session_token = request.headers.get('Authorization', '').replace('Bearer ', '')
         if not session_token:
             session_token = request.args.get('session_token')
@@ -10688,38 +10421,6 @@ def get_subscription_urls():
         }), 500
 
 
-def _ensure_google_calendar_tokens_table():
-    try:
-        conn = None
-        try:
-            from database import get_connection
-            conn = get_connection()
-            if not conn:
-                return
-            cur = conn.cursor()
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS google_calendar_tokens (
-                    id SERIAL PRIMARY KEY,
-                    employee_id INTEGER NOT NULL,
-                    access_token TEXT NOT NULL,
-                    refresh_token TEXT,
-                    token_expiry TIMESTAMP WITH TIME ZONE,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW(),
-                    UNIQUE(employee_id)
-                )
-            """)
-            cur.execute("""
-                ALTER TABLE master_calendar ADD COLUMN IF NOT EXISTS google_event_id TEXT
-            """)
-            conn.commit()
-        finally:
-            if conn:
-                conn.close()
-    except Exception:
-        pass
-
-
 @app.route('/api/integrations/google-calendar/connect-url', methods=['GET'])
 def api_google_calendar_connect_url():
     """Return Google OAuth URL for calendar.events scope. Frontend opens this in browser."""
@@ -10753,7 +10454,6 @@ def api_google_calendar_callback():
         employee_id = int(state) if state and state.isdigit() else None
         if not employee_id:
             return redirect('/calendar?google=error&msg=invalid_state')
-        _ensure_google_calendar_tokens_table()
         from google_calendar_sync import exchange_code_for_tokens, save_tokens
         redirect_uri = os.environ.get('GOOGLE_CALENDAR_REDIRECT_URI') or (request.host_url.rstrip('/') + '/api/integrations/google-calendar/callback')
         tokens = exchange_code_for_tokens(code, redirect_uri=redirect_uri)
@@ -10769,7 +10469,6 @@ def api_google_calendar_callback():
 def api_google_calendar_status():
     """Return whether the current user has connected Google Calendar."""
     try:
-        _ensure_google_calendar_tokens_table()
         session_token = request.headers.get('Authorization', '').replace('Bearer ', '') or request.args.get('session_token')
         if not session_token:
             return jsonify({'success': True, 'connected': False})
@@ -11203,6 +10902,7 @@ def process_payment():
                         print(f"Accounting journalize_sale error (process_payment order {result['order_id']}): {jr.get('message')}")
             except Exception as je:
                 print(f"Accounting journalize_sale error (process_payment): {je}")
+            enqueue_receipt_prerender(int(result['order_id']), int(data['transaction_id']))
         
         # Emit Socket.IO events for customer display
         if SOCKETIO_AVAILABLE and socketio:
@@ -11288,6 +10988,8 @@ def save_transaction_signature():
             if cursor.rowcount == 0:
                 return jsonify({'success': False, 'message': 'Transaction not found'}), 404
             conn.commit()
+            # The signature is part of the receipt; replace the pre-rendered copy
+            enqueue_receipt_prerender(None, int(transaction_id))
             return jsonify({'success': True, 'message': 'Signature saved successfully'})
         finally:
             conn.close()
@@ -11343,8 +11045,6 @@ def get_display_settings():
 def api_verification_settings():
     """Get or update shipment verification workflow settings"""
     try:
-        from database import ensure_shipment_verification_tables
-        ensure_shipment_verification_tables()
         conn, cursor = _pg_conn()
         
         if request.method == 'POST':
@@ -11390,8 +11090,6 @@ def api_update_workflow_step(shipment_id):
         if not step:
             return jsonify({'success': False, 'message': 'Step is required'}), 400
         
-        from database import ensure_shipment_verification_tables
-        ensure_shipment_verification_tables()
         conn, cursor = _pg_conn()
         cursor.execute("""
             UPDATE pending_shipments 
@@ -11736,6 +11434,7 @@ def api_update_store_location_settings():
                     conn.close()
             except Exception as sync_err:
                 print(f"Receipt settings sync after store update: {sync_err}")
+            invalidate_receipt_settings()
             return jsonify({'success': True, 'message': 'Store location settings updated'})
         else:
             return jsonify({'success': False, 'message': 'Failed to update settings'}), 500
@@ -12135,28 +11834,6 @@ def api_update_customer_rewards_settings():
             if not is_admin and not has_permission:
                 return jsonify({'success': False, 'message': 'Permission denied. Admin access or manage_settings permission required.'}), 403
         
-        # Ensure customer_rewards_settings has points_enabled, percentage_enabled, fixed_enabled (migrate if missing)
-        conn, cursor = _pg_conn()
-        try:
-            for col, typ in [('points_enabled', 'INTEGER DEFAULT 1'), ('percentage_enabled', 'INTEGER DEFAULT 0'), ('fixed_enabled', 'INTEGER DEFAULT 0')]:
-                cursor.execute("""
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = 'customer_rewards_settings' AND column_name = %s
-                """, (col,))
-                if cursor.fetchone() is None:
-                    try:
-                        cursor.execute(f"ALTER TABLE customer_rewards_settings ADD COLUMN {col} {typ}")
-                        conn.commit()
-                    except Exception:
-                        conn.rollback()
-        except Exception as mig_err:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-        finally:
-            conn.close()
-
         # Update settings - run UPDATE here so we never touch database.py (avoids cached code)
         allowed_keys = {
             'enabled', 'require_email', 'require_phone', 'require_both',
@@ -12188,11 +11865,7 @@ def api_update_customer_rewards_settings():
         try:
             cursor.execute("SELECT COUNT(*) AS c FROM customer_rewards_settings")
             count = cursor.fetchone()['c']
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = 'customer_rewards_settings'
-            """)
-            existing_cols = {r['column_name'] for r in cursor.fetchall()}
+            existing_cols = table_columns('customer_rewards_settings')
             # Only columns that exist (no points_enabled etc. unless migrated)
             base_cols = [
                 'enabled', 'require_email', 'require_phone', 'require_both',
@@ -12243,21 +11916,7 @@ def api_update_customer_rewards_settings():
 
 def _require_notification_auth():
     """Require session and admin/manage_settings. Returns (ok, err_response)."""
-    session_token = (request.json or {}).get('session_token') if request.is_json else None
-    session_token = session_token or request.headers.get('X-Session-Token') or request.args.get('session_token')
-    if not session_token:
-        return False, (jsonify({'success': False, 'message': 'Session token required'}), 401)
-    session_result = verify_session(session_token)
-    if not session_result.get('valid'):
-        return False, (jsonify({'success': False, 'message': 'Invalid session'}), 401)
-    employee_id = session_result.get('employee_id')
-    employee = get_employee(employee_id) if employee_id else None
-    is_admin = employee and (employee.get('position') or '').lower() == 'admin'
-    pm = get_permission_manager()
-    has_perm = pm.has_permission(employee_id, 'manage_settings') if employee_id else False
-    if not is_admin and not has_perm:
-        return False, (jsonify({'success': False, 'message': 'Permission denied'}), 403)
-    return True, None
+    return _require_admin_auth()
 
 @app.route('/api/sms/stores', methods=['GET'])
 def api_sms_stores():
@@ -12356,8 +12015,7 @@ def _save_sms_settings(store_id, data):
             data.get('store_phone_number') or None,
         ]
         try:
-            cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'sms_settings' AND column_name = 'email_provider'")
-            if cursor.fetchone():
+            if has_column('sms_settings', 'email_provider'):
                 updates.extend(['email_provider = %s', 'email_from_address = %s', 'notification_preferences = %s::jsonb'])
                 params.extend([(data.get('email_provider') or 'gmail'), data.get('email_from_address') or None, prefs_json])
         except Exception:
@@ -12413,6 +12071,7 @@ def _save_sms_settings(store_id, data):
                     data.get('aws_region') or 'us-east-1'
                 ))
         conn.commit()
+        invalidate_notification_settings(store_id)
         return True, jsonify({'success': True, 'message': 'Settings saved'})
     except Exception as db_err:
         conn.rollback()
@@ -12545,6 +12204,7 @@ def api_sms_migrate_to_aws(store_id):
                 store_id
             ))
             conn.commit()
+            invalidate_notification_settings(store_id)
             return jsonify({'success': True, 'message': 'Migrated to AWS SNS'})
         except Exception as db_err:
             conn.rollback()
@@ -14276,11 +13936,7 @@ if _ACCOUNTING_BACKEND_AVAILABLE:
         end_date = request.args.get('end_date')
         conn, cur = _pg_conn()
         try:
-            cur.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = 'orders'
-            """)
-            cols = [r[0] for r in cur.fetchall()]
+            cols = table_columns('orders')
             has_customer = 'customer_id' in cols
             q = """
                 SELECT o.order_id AS id, o.order_number AS invoice_number,
@@ -14330,8 +13986,7 @@ if _ACCOUNTING_BACKEND_AVAILABLE:
         end_date = request.args.get('end_date')
         conn, cur = _pg_conn()
         try:
-            cur.execute("SELECT 1 FROM information_schema.tables WHERE table_schema = 'public' AND table_name = 'approved_shipments'")
-            if cur.fetchone():
+            if has_table('approved_shipments'):
                 q = """
                     SELECT a.shipment_id AS id, ('BILL-' || a.shipment_id) AS bill_number,
                            a.received_date::text AS bill_date, a.total_cost AS total_amount,
@@ -14384,8 +14039,7 @@ if _ACCOUNTING_BACKEND_AVAILABLE:
     def api_accounting_customers():
         conn, cur = _pg_conn()
         try:
-            cur.execute("SELECT 1 FROM information_schema.tables WHERE table_schema = 'public' AND table_name = 'customers'")
-            if cur.fetchone():
+            if has_table('customers'):
                 cur.execute("""
                     SELECT customer_id AS id, customer_id AS customer_number, customer_name AS name,
                            customer_name AS display_name, email, phone, COALESCE(address, '') AS address,